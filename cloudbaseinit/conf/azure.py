@@ -30,6 +30,28 @@ class AzureOptions(conf_base.Options):
                 "transport_cert_store_name",
                 default="Windows Azure Environment",
                 help="Certificate store name for metadata certificates"),
+            cfg.BoolOpt(
+                "persist_wire_server_state", default=True,
+                help="Save the WireServer endpoint, the negotiated protocol "
+                     "version and the goal state incarnation, in order to "
+                     "reuse them after reboots. They are validated with a "
+                     "single goal state request, the endpoint being "
+                     "discovered again through DHCP only if it fails."),
+            cfg.FloatOpt(
+                "wire_server_validation_timeout", default=5,
+                help="Timeout, in seconds, for validating the saved "
+                     "WireServer endpoint."),
+            cfg.BoolOpt(
+                "async_health_reports", default=True,
+                help="Post the provisioning health reports from a "
+                     "background thread, so that the plugins don't wait "
+                     "for the WireServer. A report not posted yet is "
+                     "dropped when superseded by a newer one."),
+            cfg.FloatOpt(
+                "health_report_flush_timeout", default=30,
+                help="Max. time, in seconds, to wait for the pending "
+                     "health reports to be posted, before rebooting or "
+                     "exiting."),
         ]
 
     def register(self):
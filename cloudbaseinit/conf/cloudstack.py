@@ -31,6 +31,13 @@ class CloudStackOptions(conf_base.Options):
                 help="The base URL where the service looks for metadata",
                 deprecated_name="cloudstack_metadata_ip",
                 deprecated_group="DEFAULT"),
+            cfg.FloatOpt(
+                "metadata_probe_timeout", default=2,
+                help="Timeout, in seconds, for connecting to the candidate "
+                     "metadata hosts, which are the one from the "
+                     "metadata_base_url option and the DHCP servers. "
+                     "The candidates are probed concurrently and the first "
+                     "one answering is used."),
             cfg.IntOpt(
                 "password_server_port", default=8080,
                 help="The port number used by the Password Server."
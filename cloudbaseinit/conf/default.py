@@ -49,14 +49,47 @@ class GlobalOptions(conf_base.Options):
                 'retry_count_interval', default=4,
                 help='Interval between attempts in case of transient errors, '
                      'expressed in seconds'),
+            cfg.FloatOpt(
+                'retry_backoff_multiplier', default=1,
+                help='Factor applied to `retry_count_interval` after every '
+                     'failed attempt. 1 means a constant interval, while '
+                     'e.g. 2 doubles the interval after each attempt'),
+            cfg.FloatOpt(
+                'retry_max_interval', default=60,
+                help='Max. interval between attempts, expressed in seconds'),
+            cfg.BoolOpt(
+                'retry_jitter', default=False,
+                help='Wait a random time between zero and the computed '
+                     'interval, so that many instances booting at the same '
+                     'time do not retry in lockstep'),
+            cfg.FloatOpt(
+                'metadata_retry_budget', default=300,
+                help='Max. time, in seconds, a metadata service can spend '
+                     'on the failed attempts which are retried and on the '
+                     'waits between them. 0 means no limit'),
+            cfg.IntOpt(
+                'metadata_circuit_breaker_threshold', default=0,
+                help='Number of consecutive connection failures after which '
+                     'the requests to a metadata service fail without being '
+                     'attempted. 0 disables the circuit breaker. When '
+                     'enabled, it should not be lower than `retry_count`, '
+                     'so that a network coming up late does not make the '
+                     'metadata unavailable'),
+            cfg.FloatOpt(
+                'metadata_circuit_breaker_reset_time', default=60,
+                help='Time, in seconds, after which a request is attempted '
+                     'again when the circuit breaker is open'),
             cfg.StrOpt(
                 'mtools_path', default=None,
                 help='Path to "mtools" program suite, used for interacting '
-                     'with VFAT filesystems'),
+                     'with VFAT filesystems. The VFAT config drives are '
+                     'now read directly',
+                deprecated_for_removal=True),
             cfg.StrOpt(
                 'bsdtar_path', default='bsdtar.exe',
                 help='Path to "bsdtar", used to extract ISO ConfigDrive '
-                     'files'),
+                     'files. The ISO config drives are now read directly',
+                deprecated_for_removal=True),
             cfg.BoolOpt(
                 'netbios_host_name_compatibility', default=True,
                 help='Truncates the hostname to 15 characters for Netbios '
@@ -174,6 +207,52 @@ class GlobalOptions(conf_base.Options):
                      'to be tested for availability in the provided order. '
                      'The first available service will be used to retrieve '
                      'metadata'),
+            cfg.BoolOpt(
+                'metadata_services_parallel_discovery', default=False,
+                help='Probes all the enabled metadata services concurrently '
+                     'instead of one after another. The service with the '
+                     'highest priority in `metadata_services` which loads '
+                     'successfully is still the one being used'),
+            cfg.FloatOpt(
+                'metadata_service_probe_timeout', default=120,
+                help='Maximum time, in seconds, a metadata service can spend '
+                     'loading when the services are probed concurrently. '
+                     'Services which do not load in time are ignored'),
+            cfg.IntOpt(
+                'metadata_prefetch_workers', default=4,
+                help='Max. number of concurrent requests used for fetching, '
+                     'right after the metadata service is loaded, the '
+                     'metadata needed later by the plugins. Set 0 to '
+                     'disable prefetching'),
+            cfg.StrOpt(
+                'metadata_cache_path', default=None,
+                help='If set, the fetched metadata is saved in the given '
+                     'folder, accessible only to the administrators, and '
+                     'reused after reboots, as long as the instance id does '
+                     'not change. The path can include environment variables '
+                     'that will be expanded, e.g. '
+                     '"%%SYSTEMDRIVE%%\\CloudbaseInit\\cache"'),
+            cfg.IntOpt(
+                'metadata_cache_ttl', default=3600,
+                help='The time, in seconds, the metadata saved in '
+                     '`metadata_cache_path` can be reused'),
+            cfg.IntOpt(
+                'metadata_http_pool_size', default=10,
+                help='Max. number of connections kept alive for each host '
+                     'by the HTTP metadata services'),
+            cfg.FloatOpt(
+                'metadata_http_connect_timeout', default=10,
+                help='Timeout, in seconds, for connecting to the HTTP '
+                     'metadata services. Set 0 to wait indefinitely'),
+            cfg.FloatOpt(
+                'metadata_http_read_timeout', default=60,
+                help='Timeout, in seconds, for receiving data from the HTTP '
+                     'metadata services. Set 0 to wait indefinitely'),
+            cfg.BoolOpt(
+                'metadata_http_trust_env', default=True,
+                help='Use the proxy settings and the netrc file from the '
+                     'environment for the HTTP metadata services. Disabling '
+                     'this avoids looking them up for link-local endpoints'),
             cfg.ListOpt(
                 'plugins',
                 default=[
@@ -204,6 +283,35 @@ class GlobalOptions(conf_base.Options):
                 ],
                 help='List of enabled plugin classes, '
                      'to be executed in the provided order'),
+            cfg.IntOpt(
+                'plugins_max_workers', default=1,
+                help='Max. number of plugins executed concurrently. Plugins '
+                     'are executed concurrently only if they declare the '
+                     'resources they require and provide and none of them '
+                     'is needed by the others. Set 1 (default) to execute '
+                     'all the plugins one after another'),
+            cfg.StrOpt(
+                'plugins_status_store', default=None,
+                help='The class used for keeping the execution status of '
+                     'the plugins. RegistryStatusStore uses the OS config '
+                     'values (the registry on Windows), while '
+                     'JSONFileStatusStore uses the file defined by '
+                     '`plugins_status_file_path`. If not set, '
+                     'RegistryStatusStore is used when the OS supports '
+                     'config values and JSONFileStatusStore otherwise, '
+                     'e.g. on Linux'),
+            cfg.StrOpt(
+                'plugins_status_file_path', default=None,
+                help='The path of the JSON file where the execution status of '
+                     'the plugins is kept, when using JSONFileStatusStore. '
+                     'Defaults to '
+                     '"%%SYSTEMDRIVE%%\\CloudbaseInit\\plugins_status.json" '
+                     'on Windows and to '
+                     '"/var/lib/cloudbase-init/plugins_status.json" '
+                     'elsewhere. '
+                     'The path can include environment variables that will '
+                     'be expanded, e.g. '
+                     '"%%SYSTEMDRIVE%%\\CloudbaseInit\\status.json"'),
             cfg.ListOpt(
                 'user_data_plugins',
                 default=[
@@ -261,6 +369,13 @@ class GlobalOptions(conf_base.Options):
                 'process_userdata', default=True,
                 help='Processes the userdata content based on the type, e.g. '
                      'executing a PowerShell script'),
+            cfg.BoolOpt(
+                'skip_executed_userdata_parts', default=False,
+                help='Keeps the hashes of the multipart userdata parts '
+                     'executed successfully next to the plugins status, so '
+                     'that only the parts that requested to be executed '
+                     'again, failed, or whose content changed, are executed '
+                     'when the userdata is processed again'),
             cfg.StrOpt(
                 'userdata_save_path',
                 default=None,
@@ -295,6 +410,16 @@ class GlobalOptions(conf_base.Options):
                 'user_password_length', default=20,
                 help='The length of the generated password for the user '
                      'defined by the `username` config option.'),
+            cfg.StrOpt(
+                'boot_trace_path', default=None,
+                help='If set, a timeline of the host configuration (stages, '
+                     'plugins, metadata requests, retries and reboot '
+                     'decisions) is saved to the given file path, using the '
+                     'Chrome trace event format. The events of each run, '
+                     'e.g. before and after a reboot, are appended to the '
+                     'same file. The path can include '
+                     'environment variables that will be expanded, e.g. '
+                     '"%%SYSTEMDRIVE%%\\CloudbaseInit\\trace.json"'),
         ]
 
         self._cli_options = [
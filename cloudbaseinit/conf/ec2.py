@@ -44,6 +44,23 @@ class EC2Options(conf_base.Options):
                 "https_ca_bundle", default=None,
                 help="The path to a CA_BUNDLE file or directory with "
                      "certificates of trusted CAs."),
+            cfg.IntOpt(
+                "metadata_token_ttl", default=21600,
+                help="The lifetime, in seconds, of the session token "
+                     "requested for accessing the metadata (IMDSv2). The "
+                     "token is reused until it expires. If the token cannot "
+                     "be obtained, the metadata is accessed without it. "
+                     "0 disables the usage of session tokens."),
+            cfg.IntOpt(
+                "metadata_crawl_depth", default=4,
+                help="The depth up to which the meta-data tree is fetched "
+                     "concurrently, after loading the service. 0 disables "
+                     "the crawling."),
+            cfg.ListOpt(
+                "metadata_crawl_exclude",
+                default=["iam/", "identity-credentials/"],
+                help="The meta-data paths, relative to meta-data/, which "
+                     "are not fetched when crawling."),
         ]
 
     def register(self):
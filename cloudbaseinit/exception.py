@@ -53,6 +53,17 @@ class CertificateVerifyFailed(ServiceException):
     pass
 
 
+class CircuitBreakerOpenException(CloudbaseInitException):
+
+    """Thrown when an action is not attempted, as its target is unavailable.
+
+    The circuit breaker opens after too many consecutive failures and
+    the following attempts fail fast, until its reset time expires.
+    """
+
+    pass
+
+
 class WindowsCloudbaseInitException(CloudbaseInitException):
 
     def __init__(self, msg="%r", error_code=None):
@@ -24,7 +24,10 @@ from cloudbaseinit.metadata import factory as metadata_factory
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base as plugins_base
 from cloudbaseinit.plugins import factory as plugins_factory
+from cloudbaseinit.plugins import scheduler as plugins_scheduler
+from cloudbaseinit.plugins import status as plugins_status
 from cloudbaseinit.utils import log as logging
+from cloudbaseinit.utils import tracing
 from cloudbaseinit import version
 
 
@@ -41,33 +44,32 @@ class InitManager(object):
         else:
             return instance_id + "/" + self._PLUGINS_CONFIG_SECTION
 
-    def _get_plugin_status(self, osutils, instance_id, plugin_name):
-        return osutils.get_config_value(plugin_name,
-                                        self._get_plugins_section(instance_id))
+    def _get_plugins_status_store(self, osutils, instance_id):
+        return plugins_status.get_status_store(
+            osutils, self._get_plugins_section(instance_id))
 
-    def _set_plugin_status(self, osutils, instance_id, plugin_name, status):
-        osutils.set_config_value(plugin_name, status,
-                                 self._get_plugins_section(instance_id))
-
-    def _exec_plugin(self, osutils, service, plugin, instance_id, shared_data):
+    def _exec_plugin(self, status_store, service, plugin, shared_data):
         plugin_name = plugin.get_name()
 
         reboot_required = None
         success = True
         status = None
-        if instance_id is not None:
-            status = self._get_plugin_status(osutils, instance_id, plugin_name)
+        if status_store is not None:
+            status = status_store.get_status(plugin_name)
         if status == plugins_base.PLUGIN_EXECUTION_DONE:
             LOG.debug('Plugin \'%s\' execution already done, skipping',
                       plugin_name)
         else:
             LOG.info('Executing plugin \'%s\'', plugin_name)
             try:
-                (status, reboot_required) = plugin.execute(service,
-                                                           shared_data)
-                if instance_id is not None:
-                    self._set_plugin_status(osutils, instance_id, plugin_name,
-                                            status)
+                with tracing.span(plugin_name, "plugin"):
+                    (status, reboot_required) = plugin.execute(service,
+                                                               shared_data)
+                if status_store is not None:
+                    status_store.set_status(plugin_name, status)
+                    # Saved at once, since the plugins executed next may
+                    # reboot or power off the machine.
+                    status_store.flush()
             except Exception as ex:
                 LOG.error('plugin \'%(plugin_name)s\' failed with error '
                           '\'%(ex)s\'', {'plugin_name': plugin_name, 'ex': ex})
@@ -103,22 +105,46 @@ class InitManager(object):
             version.check_latest_version(log_version)
 
     def _handle_plugins_stage(self, osutils, service, instance_id, stage):
+        with tracing.span(stage, "stage"):
+            return self._exec_plugins_stage(osutils, service, instance_id,
+                                            stage)
+
+    def _exec_plugins_stage(self, osutils, service, instance_id, stage):
         plugins_shared_data = {}
         reboot_required = False
         stage_success = True
         plugins = plugins_factory.load_plugins(stage)
+        status_store = None
+        if instance_id is not None:
+            status_store = self._get_plugins_status_store(osutils,
+                                                          instance_id)
 
         LOG.info('Executing plugins for stage %r:', stage)
 
-        for plugin in plugins:
-            if self._check_plugin_os_requirements(osutils, plugin):
-                success, reboot_required = self._exec_plugin(
-                    osutils, service, plugin, instance_id,
-                    plugins_shared_data)
-                if not success:
-                    stage_success = False
-                if reboot_required and CONF.allow_reboot:
+        try:
+            if CONF.plugins_max_workers > 1:
+                plugins = [
+                    plugin for plugin in plugins
+                    if self._check_plugin_os_requirements(osutils, plugin)]
+                plugin_scheduler = plugins_scheduler.PluginScheduler(
+                    plugins, CONF.plugins_max_workers)
+                return plugin_scheduler.execute(
+                    lambda plugin: self._exec_plugin(
+                        status_store, service, plugin, plugins_shared_data))
+
+            for plugin in plugins:
+                if self._check_plugin_os_requirements(osutils, plugin):
+                    success, reboot_required = self._exec_plugin(
+                        status_store, service, plugin, plugins_shared_data)
+                    if not success:
+                        stage_success = False
+                    if reboot_required and CONF.allow_reboot:
+                        tracing.instant("reboot_required", "reboot",
+                                        plugin=plugin.get_name())
                         break
+        finally:
+            if status_store is not None:
+                status_store.flush()
 
         return stage_success, reboot_required
 
@@ -172,7 +198,8 @@ class InitManager(object):
             self._reset_service_password_and_respawn(osutils)
 
         LOG.info('Cloudbase-Init version: %s', version.get_version())
-        osutils.wait_for_boot_completion()
+        with tracing.span("wait_for_boot_completion", "boot"):
+            osutils.wait_for_boot_completion()
 
         stage_success, reboot_required = self._handle_plugins_stage(
             osutils, None, None,
@@ -187,7 +214,8 @@ class InitManager(object):
 
         if not (reboot_required and CONF.allow_reboot):
             try:
-                service = metadata_factory.get_metadata_service()
+                with tracing.span("get_metadata_service", "metadata"):
+                    service = metadata_factory.get_metadata_service()
             except exception.MetadaNotFoundException:
                 LOG.error("No metadata service found")
         if service:
@@ -216,6 +244,11 @@ class InitManager(object):
                 except Exception as ex:
                     LOG.exception(ex)
 
+        tracing.instant("reboot_decision", "reboot",
+                        reboot_required=bool(reboot_required),
+                        allow_reboot=CONF.allow_reboot)
+        tracing.save()
+
         if reboot_required and CONF.allow_reboot:
             try:
                 LOG.info("Rebooting")
@@ -0,0 +1,127 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import json
+import os
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+import six
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import fileutils
+
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+
+def _get_cache_dir():
+    return os.path.abspath(os.path.expandvars(CONF.metadata_cache_path))
+
+
+def _secure_cache_dir(cache_dir):
+    # The metadata can contain secrets, like the admin password,
+    # so the cache must be accessible only to the administrators,
+    # even if the directory already existed.
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    if os.name == "nt":
+        osutils_factory.get_os_utils().set_path_admin_acls(cache_dir)
+    else:
+        os.chmod(cache_dir, 0o700)
+
+
+def _encode_data(data):
+    if isinstance(data, six.text_type):
+        return {"text": data}
+    return {"base64": base64.b64encode(data).decode()}
+
+
+def _decode_data(entry):
+    if "text" in entry:
+        return entry["text"]
+    return base64.b64decode(entry["base64"].encode())
+
+
+class PersistentMetadataCache(object):
+
+    """Metadata cache kept on disk, in order to be reused across reboots.
+
+    The entries are kept in a file per metadata service class and they are
+    discarded when the instance id changes or when they are older than
+    `metadata_cache_ttl` seconds.
+    """
+
+    def __init__(self, service_name, instance_id):
+        self._instance_id = instance_id
+        self._path = os.path.join(_get_cache_dir(), "%s.json" % service_name)
+        self._lock = threading.Lock()
+        self._dir_secured = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return {}
+
+        try:
+            with open(self._path) as stream:
+                content = json.load(stream)
+        except (IOError, ValueError) as ex:
+            LOG.warning("Ignoring invalid metadata cache '%(path)s': "
+                        "%(ex)s", {"path": self._path, "ex": ex})
+            return {}
+
+        if content.get("instance_id") != self._instance_id:
+            LOG.debug("Ignoring the metadata cache of another instance")
+            return {}
+
+        min_timestamp = time.time() - CONF.metadata_cache_ttl
+        return dict((path, entry)
+                    for path, entry in content.get("entries", {}).items()
+                    if entry["timestamp"] >= min_timestamp)
+
+    def _save(self):
+        if not self._dir_secured:
+            _secure_cache_dir(os.path.dirname(self._path))
+            self._dir_secured = True
+
+        content = {"instance_id": self._instance_id,
+                   "entries": self._entries}
+        fileutils.write_file_atomically(self._path, json.dumps(content))
+
+    def get_entries(self):
+        """Return a dict with the cached data, by metadata path."""
+        with self._lock:
+            return dict((path, _decode_data(entry))
+                        for path, entry in self._entries.items())
+
+    def set(self, path, data):
+        self.update({path: data})
+
+    def update(self, entries):
+        """Save the given data, by metadata path, with a single write."""
+        timestamp = time.time()
+        with self._lock:
+            for path, data in entries.items():
+                entry = _encode_data(data)
+                entry["timestamp"] = timestamp
+                self._entries[path] = entry
+            try:
+                self._save()
+            except Exception as ex:
+                LOG.warning("Failed to save the metadata cache: %s", ex)
@@ -12,6 +12,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
+
 from oslo_log import log as oslo_logging
 
 from cloudbaseinit import conf as cloudbaseinit_conf
@@ -23,15 +26,124 @@ CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 
+class _ServiceProbe(object):
+
+    """Load a metadata service in a separate thread.
+
+    A probe which is no longer needed can be abandoned at any time. If the
+    service was or will be loaded successfully, its resources are released
+    by calling the service's `cleanup` method.
+    """
+
+    def __init__(self, class_path, service):
+        self.class_path = class_path
+        self.service = service
+        self.loaded = False
+        self._done = False
+        self._abandoned = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._load)
+        self._thread.daemon = True
+
+    def _load(self):
+        loaded = False
+        try:
+            loaded = bool(self.service.load())
+        except Exception as ex:
+            LOG.error("Failed to load metadata service '%s'" %
+                      self.class_path)
+            LOG.exception(ex)
+
+        with self._lock:
+            self._done = True
+            self.loaded = loaded
+            cleanup = loaded and self._abandoned
+        if cleanup:
+            self._cleanup()
+
+    def _cleanup(self):
+        LOG.debug("Cleaning up unused metadata service '%s'",
+                  self.class_path)
+        try:
+            self.service.cleanup()
+        except Exception as ex:
+            LOG.exception(ex)
+
+    def start(self):
+        self._thread.start()
+
+    def wait(self, timeout):
+        """Wait for the service to load and return True if it finished."""
+        self._thread.join(timeout)
+        with self._lock:
+            return self._done
+
+    def abandon(self):
+        with self._lock:
+            self._abandoned = True
+            cleanup = self._done and self.loaded
+        if cleanup:
+            self._cleanup()
+
+
+def _prepare_service(class_path, service):
+    """Load the cached metadata and prefetch the rest of it.
+
+    Both are optimizations, so the loaded service is used even if they fail.
+    """
+    try:
+        service.load_persistent_cache()
+        service.prefetch()
+    except Exception as ex:
+        LOG.error("Failed to prepare the metadata of service '%s'" %
+                  class_path)
+        LOG.exception(ex)
+    return service
+
+
+def _get_metadata_service_parallel():
+    # Probe all the services at once, but return the first service,
+    # in the configured order, that loads correctly
+    cl = classloader.ClassLoader()
+    probes = [_ServiceProbe(class_path, cl.load_class(class_path)())
+              for class_path in CONF.metadata_services]
+    for probe in probes:
+        probe.start()
+
+    deadline = time.time() + CONF.metadata_service_probe_timeout
+    selected = None
+    for probe in probes:
+        if not probe.wait(max(deadline - time.time(), 0)):
+            LOG.warning("Metadata service '%s' did not load in %s seconds",
+                        probe.class_path,
+                        CONF.metadata_service_probe_timeout)
+        elif probe.loaded:
+            selected = probe
+            break
+
+    for probe in probes:
+        if probe is not selected:
+            probe.abandon()
+
+    if not selected:
+        raise exception.MetadaNotFoundException("No available service found")
+    return _prepare_service(selected.class_path, selected.service)
+
+
 def get_metadata_service():
+    if CONF.metadata_services_parallel_discovery:
+        return _get_metadata_service_parallel()
+
     # Return the first service that loads correctly
     cl = classloader.ClassLoader()
     for class_path in CONF.metadata_services:
         service = cl.load_class(class_path)()
         try:
-            if service.load():
-                return service
+            loaded = service.load()
         except Exception as ex:
             LOG.error("Failed to load metadata service '%s'" % class_path)
             LOG.exception(ex)
+            continue
+        if loaded:
+            return _prepare_service(class_path, service)
     raise exception.MetadaNotFoundException("No available service found")
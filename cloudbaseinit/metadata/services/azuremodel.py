@@ -0,0 +1,268 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Streaming parsers for the Azure WireServer and ovf-env.xml documents.
+
+Only the fields used by the Azure metadata service are extracted, into
+records with slots, instead of building a tree for the whole document.
+"""
+
+from xml.etree import ElementTree
+
+import six
+
+GOAL_STATE = "GoalState/"
+ROLE_INSTANCE = GOAL_STATE + "Container/RoleInstanceList/RoleInstance/"
+WINDOWS_PROVISIONING = ("Environment/ProvisioningSection/"
+                        "WindowsProvisioningConfigurationSet/")
+WINRM_LISTENER = WINDOWS_PROVISIONING + "WinRM/Listeners/Listener"
+PLATFORM_SETTINGS = "Environment/PlatformSettingsSection/PlatformSettings/"
+
+
+class _Record(object):
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name))
+            for name in self.__slots__))
+
+
+class RoleInstanceConfig(_Record):
+
+    """The URLs of the configuration documents of the role instance."""
+
+    __slots__ = ("hosting_environment_config", "shared_config",
+                 "extensions_config", "full_config", "certificates")
+
+
+class GoalState(_Record):
+
+    __slots__ = ("incarnation", "expected_state", "container_id",
+                 "role_instance_id", "role_instance_config")
+
+
+class StoredCertificate(_Record):
+
+    __slots__ = ("store_name", "configuration_level", "certificate_id",
+                 "name")
+
+
+class CertificateFile(_Record):
+
+    __slots__ = ("data", "format")
+
+
+class SharedConfig(_Record):
+
+    __slots__ = ("deployment_name", "role_name")
+
+
+class ExtensionPlugin(_Record):
+
+    __slots__ = ("name", "version", "location")
+
+
+class ExtensionsConfig(_Record):
+
+    __slots__ = ("plugins", "status_upload_blob")
+
+
+class OvfEnv(_Record):
+
+    __slots__ = ("admin_username", "admin_password", "computer_name",
+                 "enable_automatic_updates", "has_custom_data",
+                 "winrm_listeners", "provision_guest_agent",
+                 "guest_agent_package_name", "kms_server_hostname",
+                 "use_avma")
+
+
+def _get_local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iterparse(data):
+    """Yield the (path, element) tuples of the given XML document.
+
+    The elements are yielded once completely parsed, the path being
+    made of the tag names from the root, without namespaces, joined
+    by "/". The elements are cleared afterwards, so that the memory
+    used doesn't grow with the size of the document.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode("utf-8")
+    path = []
+    parents = []
+    for event, element in ElementTree.iterparse(
+            six.BytesIO(data), events=("start", "end")):
+        if event == "start":
+            path.append(_get_local_name(element.tag))
+            parents.append(element)
+        else:
+            yield "/".join(path), element
+            path.pop()
+            parents.pop()
+            if parents:
+                # Being processed in order, the element is the only
+                # child left in its parent.
+                parents[-1].remove(element)
+
+
+def _get_text(element):
+    return element.text or ""
+
+
+def _is_true(value):
+    return value is not None and value.strip().lower() == "true"
+
+
+def _parse_fields(data, fields):
+    """Get the text of the elements with the given paths, by field name."""
+    values = {}
+    for path, element in _iterparse(data):
+        field = fields.get(path)
+        if field:
+            values[field] = _get_text(element)
+    return values
+
+
+def _parse_records(data, record_path, record_cls, attributes):
+    """Get a record for each element with the given path.
+
+    :param attributes: Maps the XML attributes to the record fields.
+    """
+    records = []
+    for path, element in _iterparse(data):
+        if path == record_path:
+            records.append(record_cls(**dict(
+                (field, element.get(attribute))
+                for attribute, field in attributes.items())))
+    return records
+
+
+def parse_versions(data):
+    """Get the WireServer versions supported."""
+    return [_get_text(element) for path, element in _iterparse(data)
+            if path == "Versions/Supported/Version"]
+
+
+def parse_goal_state(data):
+    values = _parse_fields(data, {
+        GOAL_STATE + "Incarnation": "incarnation",
+        GOAL_STATE + "Machine/ExpectedState": "expected_state",
+        GOAL_STATE + "Container/ContainerId": "container_id",
+        ROLE_INSTANCE + "InstanceId": "role_instance_id",
+        ROLE_INSTANCE + "Configuration/HostingEnvironmentConfig":
+            "hosting_environment_config",
+        ROLE_INSTANCE + "Configuration/SharedConfig": "shared_config",
+        ROLE_INSTANCE + "Configuration/ExtensionsConfig":
+            "extensions_config",
+        ROLE_INSTANCE + "Configuration/FullConfig": "full_config",
+        ROLE_INSTANCE + "Configuration/Certificates": "certificates",
+    })
+    values["role_instance_config"] = RoleInstanceConfig(**values)
+    return GoalState(**values)
+
+
+def parse_hosting_environment(data):
+    """Get the certificates to be stored, from HostingEnvironmentConfig."""
+    return _parse_records(
+        data, "HostingEnvironmentConfig/StoredCertificates/StoredCertificate",
+        StoredCertificate,
+        {"storeName": "store_name",
+         "configurationLevel": "configuration_level",
+         "certificateId": "certificate_id",
+         "name": "name"})
+
+
+def parse_shared_config(data):
+    values = {}
+    for path, element in _iterparse(data):
+        if path == "SharedConfig/Deployment":
+            values["deployment_name"] = element.get("name")
+        elif path == "SharedConfig/Role":
+            values["role_name"] = element.get("name")
+    return SharedConfig(**values)
+
+
+def parse_extensions_config(data):
+    plugins = []
+    status_upload_blob = None
+    for path, element in _iterparse(data):
+        if path == "Extensions/Plugins/Plugin":
+            plugins.append(ExtensionPlugin(
+                name=element.get("name"), version=element.get("version"),
+                location=element.get("location")))
+        elif path == "Extensions/StatusUploadBlob":
+            status_upload_blob = _get_text(element)
+    return ExtensionsConfig(plugins=plugins,
+                            status_upload_blob=status_upload_blob)
+
+
+def parse_certificates(data):
+    return CertificateFile(**_parse_fields(data, {
+        "CertificateFile/Data": "data",
+        "CertificateFile/Format": "format",
+    }))
+
+
+def parse_ovf_env(data):
+    values = {}
+    texts = {}
+    listeners = []
+    listener = {}
+    for path, element in _iterparse(data):
+        if path.startswith(WINRM_LISTENER):
+            field = path[len(WINRM_LISTENER):]
+            if field == "/Protocol":
+                listener["protocol"] = _get_text(element)
+            elif field == "/CertificateThumbprint":
+                listener["certificate_thumbprint"] = _get_text(element)
+            elif not field:
+                listeners.append(listener)
+                listener = {}
+        elif path == WINDOWS_PROVISIONING + "WinRM":
+            values["winrm_listeners"] = listeners
+        elif path == WINDOWS_PROVISIONING + "CustomData":
+            values["has_custom_data"] = True
+        elif (path.startswith(WINDOWS_PROVISIONING) or
+                path.startswith(PLATFORM_SETTINGS)):
+            texts[path.rsplit("/", 1)[-1]] = _get_text(element)
+
+    provision_guest_agent = texts.get("ProvisionGuestAgent")
+    return OvfEnv(
+        admin_username=texts.get("AdminUsername"),
+        admin_password=texts.get("AdminPassword"),
+        computer_name=texts.get("ComputerName"),
+        enable_automatic_updates=_is_true(
+            texts.get("EnableAutomaticUpdates")),
+        has_custom_data=values.get("has_custom_data", False),
+        winrm_listeners=values.get("winrm_listeners", []),
+        provision_guest_agent=_is_true(provision_guest_agent),
+        guest_agent_package_name=texts.get("GuestAgentPackageName"),
+        kms_server_hostname=texts.get("KmsServerHostname"),
+        use_avma=_is_true(texts.get("UseAVMA")))
@@ -15,20 +15,21 @@
 import contextlib
 import os
 import socket
+import threading
 import time
 from xml.etree import ElementTree
 
 from oslo_log import log as oslo_logging
 import six
-import untangle
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import constant
 from cloudbaseinit import exception
+from cloudbaseinit.metadata.services import azuremodel
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.utils import dhcp
-from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import retry
 from cloudbaseinit.utils.windows import x509
 
 CONF = cloudbaseinit_conf.CONF
@@ -53,6 +54,73 @@ DATALOSS_WARNING_PATH = '$$\\OEM\\DATALOSS_WARNING_README.txt'
 
 DEFAULT_KMS_HOST = "kms.core.windows.net"
 
+WIRE_SERVER_STATE_SECTION = "AzureWireServer"
+WIRE_SERVER_STATE_ENDPOINT = "Endpoint"
+WIRE_SERVER_STATE_VERSION = "Version"
+WIRE_SERVER_STATE_INCARNATION = "GoalStateIncarnation"
+
+
+class HealthReporter(object):
+
+    """Post the health reports from a background thread.
+
+    The reports are posted in order, by a single thread. A report which
+    was not posted yet is dropped once a newer one is queued, as only
+    the latest health state matters to the fabric.
+
+    :param post_function: Called with the arguments of each report.
+    """
+
+    def __init__(self, post_function):
+        self._post_function = post_function
+        self._condition = threading.Condition()
+        self._pending = None
+        self._posting = False
+        self._thread = None
+
+    def report(self, *args):
+        with self._condition:
+            if self._pending is not None:
+                LOG.debug("Dropping the superseded health report: %s",
+                          self._pending)
+            self._pending = args
+            if not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run, name="AzureHealthReporter")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                args, self._pending = self._pending, None
+                self._posting = True
+            try:
+                self._post_function(*args)
+            except Exception as ex:
+                LOG.exception("Failed to post the health report: %s", ex)
+            finally:
+                with self._condition:
+                    self._posting = False
+                    self._condition.notify_all()
+
+    def flush(self, timeout):
+        """Wait for the queued report to be posted.
+
+        :returns: False if the report is still pending after the timeout.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._pending is not None or self._posting:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
 
 class AzureService(base.BaseHTTPMetadataService):
 
@@ -60,44 +128,57 @@ class AzureService(base.BaseHTTPMetadataService):
         super(AzureService, self).__init__(base_url=None)
         self._enable_retry = True
         self._goal_state = None
+        self._saved_incarnation = None
+        self._configs = {}
         self._config_set_drive_path = None
         self._ovf_env = None
+        self._health_reporter = None
         self._headers = {"x-ms-guest-agent-name": "cloudbase-init"}
         self._osutils = osutils_factory.get_os_utils()
 
     def _get_wire_server_endpoint_address(self):
         total_time = 300
         poll_time = 5
-        retries = total_time / poll_time
 
-        while True:
-            try:
-                options = dhcp.get_dhcp_options()
-                endpoint = (options or {}).get(WIRESERVER_DHCP_OPTION)
-                if not endpoint:
-                    raise exception.MetadaNotFoundException(
-                        "Cannot find Azure WireServer endpoint address")
-                return socket.inet_ntoa(endpoint)
-            except Exception:
-                if not retries:
-                    raise
-                time.sleep(poll_time)
-                retries -= 1
+        def _get_endpoint_address():
+            options = dhcp.get_dhcp_options()
+            endpoint = (options or {}).get(WIRESERVER_DHCP_OPTION)
+            if not endpoint:
+                raise exception.MetadaNotFoundException(
+                    "Cannot find Azure WireServer endpoint address")
+            return socket.inet_ntoa(endpoint)
+
+        # The DHCP lease is usually obtained soon after boot, so start
+        # polling often and back off up to the previous polling interval.
+        retrier = retry.Retrier(
+            retry.RetryPolicy(max_attempts=total_time // poll_time + 1,
+                              interval=1,
+                              max_interval=poll_time,
+                              multiplier=CONF.retry_backoff_multiplier,
+                              jitter=CONF.retry_jitter),
+            budget=total_time, name="Azure WireServer discovery")
+        return retrier.execute(_get_endpoint_address)
 
     def _check_version_header(self):
         if "x-ms-version" not in self._headers:
             versions = self._get_versions()
-            if WIRE_SERVER_VERSION not in versions.Versions.Supported.Version:
+            if WIRE_SERVER_VERSION not in versions:
                 raise exception.MetadaNotFoundException(
                     "Unsupported Azure WireServer version: %s" %
                     WIRE_SERVER_VERSION)
             self._headers["x-ms-version"] = WIRE_SERVER_VERSION
 
     def _get_versions(self):
-        return self._wire_server_request("?comp=Versions")
+        return self._wire_server_request(
+            "?comp=Versions", parser=azuremodel.parse_versions)
 
     def _wire_server_request(self, path, data_xml=None, headers=None,
-                             parse_xml=True):
+                             parser=None, retry=True, timeout=None):
+        """Send a request to the WireServer.
+
+        The response is returned as is, unless a parser from
+        :mod:`azuremodel` is given.
+        """
         if not self._base_url:
             raise exception.CloudbaseInitException(
                 "Azure WireServer base url not set")
@@ -108,14 +189,15 @@ class AzureService(base.BaseHTTPMetadataService):
         if headers:
             all_headers.update(headers)
 
-        data = self._exec_with_retry(
-            lambda: super(AzureService, self)._http_request(
-                path, data_xml, headers=all_headers))
+        def _request():
+            return super(AzureService, self)._http_request(
+                path, data_xml, headers=all_headers, timeout=timeout)
 
-        if parse_xml:
-            return untangle.parse(six.StringIO(encoding.get_as_string(data)))
-        else:
-            return data
+        data = self._exec_with_retry(_request) if retry else _request()
+
+        if parser:
+            return parser(data)
+        return data
 
     @staticmethod
     def _encode_xml(xml_root):
@@ -172,12 +254,28 @@ class AzureService(base.BaseHTTPMetadataService):
 
         return self._encode_xml(xml_root)
 
+    def _update_goal_state(self, **request_args):
+        goal_state = self._wire_server_request(
+            "machine?comp=goalstate", parser=azuremodel.parse_goal_state,
+            **request_args)
+        if (self._goal_state and
+                self._goal_state.incarnation != goal_state.incarnation):
+            # The configuration documents depend on the incarnation.
+            self._configs = {}
+        self._goal_state = goal_state
+
+        if goal_state.incarnation != self._saved_incarnation:
+            LOG.debug("Azure goal state incarnation: %s",
+                      goal_state.incarnation)
+            self._saved_incarnation = goal_state.incarnation
+            self._save_wire_server_state(
+                {WIRE_SERVER_STATE_INCARNATION: goal_state.incarnation})
+
     def _get_goal_state(self, force_update=False):
         if not self._goal_state or force_update:
-            self._goal_state = self._wire_server_request(
-                "machine?comp=goalstate").GoalState
+            self._update_goal_state()
 
-        expected_state = self._goal_state.Machine.ExpectedState
+        expected_state = self._goal_state.expected_state
         if expected_state != GOAL_STATE_STARTED:
             raise exception.CloudbaseInitException(
                 "Invalid machine expected state: %s" % expected_state)
@@ -185,49 +283,66 @@ class AzureService(base.BaseHTTPMetadataService):
         return self._goal_state
 
     def _get_incarnation(self):
-        goal_state = self._get_goal_state()
-        return goal_state.Incarnation.cdata
+        return self._get_goal_state().incarnation
 
     def _get_container_id(self):
-        goal_state = self._get_goal_state()
-        return goal_state.Container.ContainerId.cdata
+        return self._get_goal_state().container_id
 
     def _get_role_instance_config(self):
-        goal_state = self._get_goal_state()
-        role_instance = goal_state.Container.RoleInstanceList.RoleInstance
-        return role_instance.Configuration
+        return self._get_goal_state().role_instance_config
 
     def _get_role_instance_id(self):
-        goal_state = self._get_goal_state()
-        role_instance = goal_state.Container.RoleInstanceList.RoleInstance
-        return role_instance.InstanceId.cdata
+        return self._get_goal_state().role_instance_id
 
     def _post_health_status(self, state, sub_status=None, description=None):
         health_report_xml = self._get_health_report_xml(
             state, sub_status, description)
         LOG.debug("Health data: %s", health_report_xml)
-        self._wire_server_request(
-            "machine?comp=health", health_report_xml, parse_xml=False)
+        self._wire_server_request("machine?comp=health", health_report_xml)
+
+    def _report_health_status(self, state, sub_status=None,
+                              description=None):
+        if not CONF.azure.async_health_reports:
+            self._post_health_status(state, sub_status, description)
+            return
+
+        if not self._health_reporter:
+            self._health_reporter = HealthReporter(self._post_health_status)
+        self._health_reporter.report(state, sub_status, description)
+
+    def _flush_health_reports(self):
+        if not self._health_reporter:
+            return
+        timeout = CONF.azure.health_report_flush_timeout
+        if not self._health_reporter.flush(timeout):
+            LOG.warning("The Azure health report was not posted in %s "
+                        "seconds", timeout)
+
+    def cleanup(self):
+        super(AzureService, self).cleanup()
+        # The service reboots or terminates next.
+        self._flush_health_reports()
 
     def provisioning_started(self):
-        self._post_health_status(
+        self._report_health_status(
             HEALTH_STATE_NOT_READY, HEALTH_SUBSTATE_PROVISIONING,
             "Cloudbase-Init is preparing your computer for first use...")
 
     def provisioning_completed(self):
-        self._post_health_status(HEALTH_STATE_READY)
+        self._report_health_status(HEALTH_STATE_READY)
+        self._flush_health_reports()
 
     def provisioning_failed(self):
-        self._post_health_status(
+        self._report_health_status(
             HEALTH_STATE_NOT_READY, HEALTH_SUBSTATE_PROVISIONING_FAILED,
             "Provisioning failed")
+        self._flush_health_reports()
 
     def _post_role_properties(self, properties):
         role_properties_xml = self._get_role_properties_xml(properties)
         LOG.debug("Role properties data: %s", role_properties_xml)
         self._wire_server_request(
-            "machine?comp=roleProperties", role_properties_xml,
-            parse_xml=False)
+            "machine?comp=roleProperties", role_properties_xml)
 
     @property
     def can_post_rdp_cert_thumbprint(self):
@@ -237,21 +352,32 @@ class AzureService(base.BaseHTTPMetadataService):
         properties = {ROLE_PROPERTY_CERT_THUMB: thumbprint}
         self._post_role_properties(properties)
 
+    def _get_config(self, url, parser=None):
+        """Get a configuration document, cached for the incarnation."""
+        if url not in self._configs:
+            self._configs[url] = self._wire_server_request(
+                url, parser=parser)
+        return self._configs[url]
+
     def _get_hosting_environment(self):
         config = self._get_role_instance_config()
-        return self._wire_server_request(config.HostingEnvironmentConfig.cdata)
+        return self._get_config(config.hosting_environment_config,
+                                azuremodel.parse_hosting_environment)
 
     def _get_shared_config(self):
         config = self._get_role_instance_config()
-        return self._wire_server_request(config.SharedConfig.cdata)
+        return self._get_config(config.shared_config,
+                                azuremodel.parse_shared_config)
 
     def _get_extensions_config(self):
         config = self._get_role_instance_config()
-        return self._wire_server_request(config.ExtensionsConfig.cdata)
+        return self._get_config(config.extensions_config,
+                                azuremodel.parse_extensions_config)
 
     def _get_full_config(self):
+        # None of its fields is used, so the document is not parsed.
         config = self._get_role_instance_config()
-        return self._wire_server_request(config.FullConfig.cdata)
+        return self._get_config(config.full_config)
 
     @contextlib.contextmanager
     def _create_transport_cert(self, cert_mgr):
@@ -267,13 +393,11 @@ class AzureService(base.BaseHTTPMetadataService):
                 store_name=CONF.azure.transport_cert_store_name)
 
     def _get_encoded_cert(self, cert_url, transport_cert):
-        cert_config = self._wire_server_request(
+        cert_file = self._wire_server_request(
             cert_url, headers={"x-ms-guest-agent-public-x509-cert":
-                               transport_cert.replace("\r\n", "")})
-
-        cert_data = cert_config.CertificateFile.Data.cdata
-        cert_format = cert_config.CertificateFile.Format.cdata
-        return cert_data, cert_format
+                               transport_cert.replace("\r\n", "")},
+            parser=azuremodel.parse_certificates)
+        return cert_file.data, cert_file.format
 
     def get_server_certs(self):
         def _get_store_location(store_location):
@@ -284,29 +408,26 @@ class AzureService(base.BaseHTTPMetadataService):
 
         certs_info = []
         config = self._get_role_instance_config()
-        if not hasattr(config, 'Certificates'):
+        if not config.certificates:
             return certs_info
 
         cert_mgr = x509.CryptoAPICertManager()
         with self._create_transport_cert(cert_mgr) as (
                 transport_cert_thumbprint, transport_cert):
 
-            cert_url = config.Certificates.cdata
             cert_data, cert_format = self._get_encoded_cert(
-                cert_url, transport_cert)
+                config.certificates, transport_cert)
             pfx_data = cert_mgr.decode_pkcs7_base64_blob(
                 cert_data, transport_cert_thumbprint, machine_keyset=True,
                 store_name=CONF.azure.transport_cert_store_name)
 
-        host_env = self._get_hosting_environment()
-        host_env_config = host_env.HostingEnvironmentConfig
-        for cert in host_env_config.StoredCertificates.StoredCertificate:
+        for cert in self._get_hosting_environment():
             certs_info.append({
-                "store_name": cert["storeName"],
+                "store_name": cert.store_name,
                 "store_location": _get_store_location(
-                    cert["configurationLevel"]),
-                "certificate_id": cert["certificateId"],
-                "name": cert["name"],
+                    cert.configuration_level),
+                "certificate_id": cert.certificate_id,
+                "name": cert.name,
                 "pfx_data": pfx_data,
             })
         return certs_info
@@ -342,87 +463,40 @@ class AzureService(base.BaseHTTPMetadataService):
     def _get_ovf_env(self):
         if not self._ovf_env:
             ovf_env_path = self._get_ovf_env_path()
-            self._ovf_env = untangle.parse(ovf_env_path)
+            with open(ovf_env_path, "rb") as f:
+                self._ovf_env = azuremodel.parse_ovf_env(f.read())
         return self._ovf_env
 
     def get_admin_username(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.AdminUsername.cdata
+        return self._get_ovf_env().admin_username
 
     def get_admin_password(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.AdminPassword.cdata
+        return self._get_ovf_env().admin_password
 
     def get_host_name(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.ComputerName.cdata
+        return self._get_ovf_env().computer_name
 
     def get_enable_automatic_updates(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "EnableAutomaticUpdates"):
-            auto_updates = win_prov_conf_set.EnableAutomaticUpdates.cdata
-            return auto_updates.lower() == "true"
-        return False
+        return self._get_ovf_env().enable_automatic_updates
 
     def get_winrm_listeners_configuration(self):
-        listeners_config = []
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "WinRM"):
-            for listener in win_prov_conf_set.WinRM.Listeners.Listener:
-                protocol = listener.Protocol.cdata
-                config = {"protocol": protocol}
-                if hasattr(listener, "CertificateThumbprint"):
-                    cert_thumbprint = listener.CertificateThumbprint.cdata
-                    config["certificate_thumbprint"] = cert_thumbprint
-                listeners_config.append(config)
-        return listeners_config
+        return [dict(listener)
+                for listener in self._get_ovf_env().winrm_listeners]
 
     def get_vm_agent_package_provisioning_data(self):
         ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        plat_sett = plat_sett_section.PlatformSettings
-        prov_ga = False
-        ga_package_name = None
-        if hasattr(plat_sett, "ProvisionGuestAgent"):
-            prov_ga = plat_sett.ProvisionGuestAgent.cdata.lower() == "true"
-        if hasattr(plat_sett, "GuestAgentPackageName"):
-            ga_package_name = plat_sett.GuestAgentPackageName.cdata
-        return {"provision": prov_ga,
-                "package_name": ga_package_name}
+        return {"provision": ovf_env.provision_guest_agent,
+                "package_name": ovf_env.guest_agent_package_name}
 
     def get_kms_host(self):
-        ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        host = None
-        if hasattr(plat_sett_section.PlatformSettings, "KmsServerHostname"):
-            host = plat_sett_section.PlatformSettings.KmsServerHostname.cdata
-        return host or DEFAULT_KMS_HOST
+        return self._get_ovf_env().kms_server_hostname or DEFAULT_KMS_HOST
 
     def get_use_avma_licensing(self):
-        ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        if hasattr(plat_sett_section.PlatformSettings, "UseAVMA"):
-            use_avma = plat_sett_section.PlatformSettings.UseAVMA.cdata
-            return use_avma.lower() == "true"
-        return False
+        return self._get_ovf_env().use_avma
 
     def _check_ovf_env_custom_data(self):
         # If the custom data file is missing, ensure the configuration matches
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "CustomData"):
-            return True
+        return self._get_ovf_env().has_custom_data
 
     def get_user_data(self):
         try:
@@ -449,18 +523,74 @@ class AzureService(base.BaseHTTPMetadataService):
     def get_ephemeral_disk_data_loss_warning(self):
         return self.get_content(DATALOSS_WARNING_PATH)
 
-    def load(self):
+    def _get_wire_server_state(self):
         try:
-            wire_server_endpoint = self._get_wire_server_endpoint_address()
-            self._base_url = "http://%s" % wire_server_endpoint
-        except Exception:
-            LOG.debug("Azure WireServer endpoint not found")
-            return False
+            return self._osutils.get_config_values(
+                WIRE_SERVER_STATE_SECTION) or {}
+        except Exception as ex:
+            LOG.debug("Failed to read the saved Azure WireServer state: %s",
+                      ex)
+            return {}
+
+    def _save_wire_server_state(self, values):
+        if not CONF.azure.persist_wire_server_state:
+            return
+        try:
+            self._osutils.set_config_values(values, WIRE_SERVER_STATE_SECTION)
+        except Exception as ex:
+            LOG.warning("Failed to save the Azure WireServer state: %s", ex)
+
+    def _revalidate_wire_server(self):
+        """Reuse the WireServer endpoint and version saved by a previous boot.
+
+        A single goal state request, without retries, validates both of
+        them, the goal state being needed anyway. The endpoint is returned
+        if it is still valid.
+        """
+        if not CONF.azure.persist_wire_server_state:
+            return None
+
+        state = self._get_wire_server_state()
+        endpoint = state.get(WIRE_SERVER_STATE_ENDPOINT)
+        self._saved_incarnation = state.get(WIRE_SERVER_STATE_INCARNATION)
+        if (not endpoint or
+                state.get(WIRE_SERVER_STATE_VERSION) != WIRE_SERVER_VERSION):
+            return None
+
+        self._base_url = "http://%s" % endpoint
+        self._headers["x-ms-version"] = WIRE_SERVER_VERSION
+        try:
+            self._update_goal_state(
+                retry=False, timeout=CONF.azure.wire_server_validation_timeout)
+        except Exception as ex:
+            LOG.debug("The saved Azure WireServer endpoint %(endpoint)s is "
+                      "not valid anymore: %(ex)s",
+                      {"endpoint": endpoint, "ex": ex})
+            self._base_url = None
+            self._headers.pop("x-ms-version", None)
+            return None
+
+        LOG.debug("Reusing the saved Azure WireServer endpoint: %s", endpoint)
+        return endpoint
+
+    def load(self):
+        wire_server_endpoint = self._revalidate_wire_server()
+        if not wire_server_endpoint:
+            try:
+                wire_server_endpoint = (
+                    self._get_wire_server_endpoint_address())
+                self._base_url = "http://%s" % wire_server_endpoint
+            except Exception:
+                LOG.debug("Azure WireServer endpoint not found")
+                return False
 
         try:
             super(AzureService, self).load()
             self._check_version_header()
             self._get_ovf_env()
+            self._save_wire_server_state({
+                WIRE_SERVER_STATE_ENDPOINT: wire_server_endpoint,
+                WIRE_SERVER_STATE_VERSION: self._headers["x-ms-version"]})
             return True
         except Exception as ex:
             LOG.exception(ex)
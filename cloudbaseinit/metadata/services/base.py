@@ -17,7 +17,7 @@ import abc
 import collections
 import gzip
 import io
-import time
+import threading
 
 from oslo_log import log as oslo_logging
 import requests
@@ -25,7 +25,11 @@ import six
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
+from cloudbaseinit.metadata import cache
+from cloudbaseinit.utils import concurrency
 from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import retry
+from cloudbaseinit.utils import tracing
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
@@ -49,41 +53,183 @@ NetworkDetails = collections.namedtuple(
 )
 
 
+_HTTP_SESSION = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+
 class NotExistingMetadataException(Exception):
     pass
 
 
+def _get_http_session():
+    """Get the HTTP session shared by all the HTTP metadata services.
+
+    The session keeps the connections alive, avoiding a new TCP and
+    TLS handshake for every request.
+    """
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            session = requests.Session()
+            session.trust_env = CONF.metadata_http_trust_env
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=CONF.metadata_http_pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+
+def _get_http_timeout():
+    return (CONF.metadata_http_connect_timeout or None,
+            CONF.metadata_http_read_timeout or None)
+
+
+def _is_http_client_error(ex):
+    """Check if the error is a HTTP 4xx one, not fixed by retrying."""
+    response = getattr(ex, "response", None)
+    if not isinstance(ex, requests.HTTPError) or response is None:
+        return False
+    # Request Timeout and Too Many Requests are transient errors.
+    return (400 <= response.status_code < 500 and
+            response.status_code not in (408, 429))
+
+
 @six.add_metaclass(abc.ABCMeta)
 class BaseMetadataService(object):
     _GZIP_MAGIC_NUMBER = b'\x1f\x8b'
 
     def __init__(self):
         self._cache = {}
+        self._missing_paths = set()
+        self._persistent_cache = None
         self._enable_retry = False
+        self._retrier = None
 
     def get_name(self):
         return self.__class__.__name__
 
     def load(self):
         self._cache = {}
+        self._missing_paths = set()
+        self._persistent_cache = None
+
+    def load_persistent_cache(self):
+        """Reuse the metadata saved on disk during a previous boot.
+
+        The instance id is always obtained from the metadata source, in
+        order to validate the saved data. The data already fetched, and
+        the data fetched from now on, is saved as well.
+        """
+        if not CONF.metadata_cache_path:
+            return
+
+        instance_id = self.get_instance_id()
+        if not instance_id:
+            LOG.debug("Persistent metadata cache not used, as the "
+                      "instance id is not available")
+            return
+
+        fetched_data = dict((path, data)
+                            for (path, decode), data in self._cache.items()
+                            if not decode and data is not None)
+        self._persistent_cache = cache.PersistentMetadataCache(
+            self.get_name(), instance_id)
+        for path, data in self._persistent_cache.get_entries().items():
+            self._cache.setdefault((path, False), data)
+        if fetched_data:
+            self._persistent_cache.update(fetched_data)
+
+    def _get_prefetch_paths(self):
+        """Get the metadata paths which will be needed by the plugins.
+
+        The services can override this in order to have the data
+        fetched concurrently by :meth:`~prefetch`, after loading.
+        """
+        return []
+
+    def prefetch(self):
+        """Fetch concurrently the metadata needed by the plugins.
+
+        The data is stored in the cache and the missing paths are recorded,
+        so that later accesses don't hit the metadata source again.
+        Other errors are ignored, as the data will be fetched again
+        (with retries) when it is actually needed.
+        """
+        self._fetch_concurrently(self._get_prefetch_paths())
+
+    def _fetch_concurrently(self, paths):
+        """Fetch the given paths into the cache, as done by prefetch."""
+        paths = [path for path in paths
+                 if (path, False) not in self._cache and
+                 path not in self._missing_paths]
+        if not paths or CONF.metadata_prefetch_workers < 1:
+            return
+
+        LOG.debug("Prefetching metadata: %s", ", ".join(paths))
+        results = concurrency.map_concurrently(
+            self._get_traced_data, paths, CONF.metadata_prefetch_workers)
+        fetched_data = {}
+        for path, (data, error) in zip(paths, results):
+            if error is None:
+                self._cache[(path, False)] = data
+                if data is not None:
+                    fetched_data[path] = data
+            elif isinstance(error, NotExistingMetadataException):
+                self._missing_paths.add(path)
+            else:
+                LOG.debug("Failed to prefetch metadata '%(path)s': "
+                          "%(error)s", {"path": path, "error": error})
+        if self._persistent_cache and fetched_data:
+            # Saved with a single write.
+            self._persistent_cache.update(fetched_data)
 
     @abc.abstractmethod
     def _get_data(self, path):
         pass
 
+    def _get_retry_error_policies(self):
+        """Get the (matcher, policy) tuples used for specific errors.
+
+        The errors not matched are retried according to the
+        retry config options.
+        """
+        return []
+
+    def _get_circuit_breaker_errors(self):
+        """Get the errors showing that the metadata source is absent."""
+        return ()
+
+    def _get_retrier(self):
+        if self._retrier is None:
+            circuit_breaker = None
+            errors = self._get_circuit_breaker_errors()
+            if errors and CONF.metadata_circuit_breaker_threshold > 0:
+                circuit_breaker = retry.CircuitBreaker(
+                    CONF.metadata_circuit_breaker_threshold,
+                    CONF.metadata_circuit_breaker_reset_time, errors)
+            self._retrier = retry.Retrier(
+                retry.get_default_policy(),
+                error_policies=self._get_retry_error_policies(),
+                no_retry_errors=(NotExistingMetadataException,),
+                budget=CONF.metadata_retry_budget or None,
+                circuit_breaker=circuit_breaker,
+                name=self.get_name())
+        return self._retrier
+
     def _exec_with_retry(self, action):
-        i = 0
-        while True:
-            try:
-                return action()
-            except NotExistingMetadataException:
-                raise
-            except Exception:
-                if self._enable_retry and i < CONF.retry_count:
-                    i += 1
-                    time.sleep(CONF.retry_count_interval)
-                else:
-                    raise
+        if not self._enable_retry:
+            return action()
+        return self._get_retrier().execute(action)
+
+    def _get_traced_data(self, path):
+        with tracing.span("_get_data", "metadata",
+                          service=self.get_name(), path=path):
+            return self._get_data(path)
+
+    def _persist_data(self, path, data):
+        if self._persistent_cache and data is not None:
+            self._persistent_cache.set(path, data)
 
     def _get_cache_data(self, path, decode=False):
         """Get meta data with caching and decoding support."""
@@ -91,12 +237,27 @@ class BaseMetadataService(object):
         if key in self._cache:
             LOG.debug("Using cached copy of metadata: '%s'" % path)
             return self._cache[key]
+        if path in self._missing_paths:
+            LOG.debug("Metadata known to be missing: '%s'" % path)
+            raise NotExistingMetadataException(
+                "Metadata not found: %s" % path)
+
+        raw_key = (path, False)
+        if raw_key in self._cache:
+            data = self._cache[raw_key]
         else:
-            data = self._exec_with_retry(lambda: self._get_data(path))
-            if decode:
-                data = encoding.get_as_string(data)
-            self._cache[key] = data
-            return data
+            try:
+                data = self._exec_with_retry(
+                    lambda: self._get_traced_data(path))
+            except NotExistingMetadataException:
+                self._missing_paths.add(path)
+                raise
+            self._cache[raw_key] = data
+            self._persist_data(path, data)
+        if decode:
+            data = encoding.get_as_string(data)
+        self._cache[key] = data
+        return data
 
     def get_instance_id(self):
         pass
@@ -264,21 +425,39 @@ class BaseHTTPMetadataService(BaseMetadataService):
         else:
             return self._https_allow_insecure
 
-    def _http_request(self, url, data=None, headers=None):
-        """Get content for received url."""
+    def _http_request(self, url, data=None, headers=None, method=None,
+                      timeout=None):
+        """Get content for received url.
+
+        The request is a GET, or a POST if data is given, unless the
+        HTTP method is specified. The timeout defaults to the one
+        from the config options.
+        """
         if not url.startswith("http"):
             url = requests.compat.urljoin(self._base_url, url)
-        request_action = requests.get if not data else requests.post
-        if not data:
+        if not method:
+            method = "POST" if data else "GET"
+        session = _get_http_session()
+        request_action = getattr(session, method.lower())
+        if method == "GET":
             LOG.debug('Getting metadata from: %s', url)
         else:
-            LOG.debug('Posting data to %s', url)
+            LOG.debug('Sending %(method)s request to %(url)s',
+                      {"method": method, "url": url})
 
         response = request_action(url=url, data=data, headers=headers,
-                                  verify=self._verify_https_request())
+                                  verify=self._verify_https_request(),
+                                  timeout=timeout or _get_http_timeout())
         response.raise_for_status()
         return response.content
 
+    def _get_retry_error_policies(self):
+        return [(exception.CertificateVerifyFailed, retry.NO_RETRY),
+                (_is_http_client_error, retry.NO_RETRY)]
+
+    def _get_circuit_breaker_errors(self):
+        return (requests.exceptions.ConnectionError,)
+
     def _get_data(self, path):
         """Getting the required information ussing metadata service."""
         try:
@@ -30,15 +30,29 @@ LOG = oslo_logging.getLogger(__name__)
 
 class BaseOpenStackService(base.BaseMetadataService):
 
-    def get_content(self, name):
-        path = posixpath.normpath(
+    @staticmethod
+    def _get_content_path(name):
+        return posixpath.normpath(
             posixpath.join('openstack', 'content', name))
-        return self._get_cache_data(path)
 
-    def get_user_data(self):
-        path = posixpath.normpath(
+    @staticmethod
+    def _get_user_data_path():
+        return posixpath.normpath(
             posixpath.join('openstack', 'latest', 'user_data'))
-        return self._get_cache_data(path)
+
+    def _get_prefetch_paths(self):
+        paths = [self._get_user_data_path()]
+        network_config = (self._get_meta_data() or {}).get('network_config')
+        if network_config and "content_path" in network_config:
+            content_name = network_config["content_path"].rsplit("/", 1)[-1]
+            paths.append(self._get_content_path(content_name))
+        return paths
+
+    def get_content(self, name):
+        return self._get_cache_data(self._get_content_path(name))
+
+    def get_user_data(self):
+        return self._get_cache_data(self._get_user_data_path())
 
     def _get_meta_data(self, version='latest'):
         path = posixpath.normpath(
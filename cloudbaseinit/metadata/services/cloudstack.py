@@ -12,26 +12,129 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import contextlib
 import posixpath
+import socket
+import threading
+import time
 
 from oslo_log import log as oslo_logging
+import requests
 from six.moves import http_client
 from six.moves import urllib
 
 from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import concurrency
 from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import retry
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 BAD_REQUEST = "bad_request"
 SAVED_PASSWORD = "saved_password"
+SEND_MY_PASSWORD = "send_my_password"
 TIMEOUT = 10
 
 
+class PasswordServerClient(object):
+
+    """Client for the CloudStack Password Server.
+
+    A single connection is used for all the requests, as long as the
+    server keeps it alive, and the failed requests are retried with
+    backoff. The answers are memoized for the current boot, so that the
+    Password Server is asked at most once for each kind of request.
+
+    :param host: The Password Server host, usually the DHCP server.
+    :param port: The Password Server port.
+    """
+
+    def __init__(self, host, port, timeout=TIMEOUT):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._connection = None
+        self._retrier = None
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def _get_retrier(self):
+        """Get the retrier used for the Password Server requests.
+
+        The connection errors open a circuit breaker, so that the
+        following requests fail fast if the Password Server is absent.
+        """
+        if self._retrier is None:
+            circuit_breaker = None
+            if CONF.metadata_circuit_breaker_threshold > 0:
+                circuit_breaker = retry.CircuitBreaker(
+                    CONF.metadata_circuit_breaker_threshold,
+                    CONF.metadata_circuit_breaker_reset_time,
+                    errors=(socket.error,))
+            self._retrier = retry.Retrier(
+                retry.get_default_policy(max_attempts=CONF.retry_count),
+                budget=CONF.metadata_retry_budget or None,
+                circuit_breaker=circuit_breaker,
+                name="CloudStack Password Server")
+        return self._retrier
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = http_client.HTTPConnection(
+                self._host, self._port, timeout=self._timeout)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _send(self, request):
+        """Send a single request to the Password Server."""
+        connection = self._get_connection()
+        try:
+            connection.request("GET", "/",
+                               headers={"DomU_Request": request})
+            response = connection.getresponse()
+            content = response.read()
+        except (http_client.HTTPException, socket.error) as exc:
+            LOG.error("Request failed: %s", exc)
+            # A new connection is used by the next attempt.
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+
+        content = encoding.get_as_string(content)
+        if response.status != 200:
+            raise http_client.HTTPException(
+                "%(status)s %(reason)s - %(message)r" %
+                {"status": response.status, "reason": response.reason,
+                 "message": content})
+        return content.strip()
+
+    def request(self, request):
+        """Send the given request, unless it was already answered.
+
+        The `bad_request` answers are not memoized, as they can be
+        given by a Password Server which is not ready yet.
+        """
+        with self._lock:
+            if request in self._responses:
+                LOG.debug("Using the memoized Password Server answer "
+                          "for: %s", request)
+                return self._responses[request]
+
+            content = self._get_retrier().execute(
+                lambda: self._send(request))
+            if content != BAD_REQUEST:
+                self._responses[request] = content
+            return content
+
+
 class CloudStack(base.BaseHTTPMetadataService):
 
     """Metadata service for Apache CloudStack.
@@ -45,13 +148,14 @@ class CloudStack(base.BaseHTTPMetadataService):
     def __init__(self):
         super(CloudStack, self).__init__(
             # Note(alexcoman): The base url used by the current metadata
-            # service will be updated later by the `_test_api` method.
+            # service will be updated later by the `load` method.
             base_url=None,
             https_allow_insecure=CONF.cloudstack.https_allow_insecure,
             https_ca_bundle=CONF.cloudstack.https_ca_bundle)
 
         self._osutils = osutils_factory.get_os_utils()
         self._metadata_host = None
+        self._password_client = None
 
     @staticmethod
     def _get_path(resource, version="latest"):
@@ -60,42 +164,66 @@ class CloudStack(base.BaseHTTPMetadataService):
             posixpath.join(version, "meta-data", resource))
 
     def _test_api(self, metadata_url):
-        """Test if the CloudStack API is responding properly."""
-        self._base_url = metadata_url
+        """Test if the CloudStack API is responding properly.
+
+        The service state is not changed, so that multiple hosts can
+        be tested concurrently. Only a short time is spent connecting,
+        as the DHCP servers tested can be stale.
+        """
+        url = requests.compat.urljoin(metadata_url,
+                                      self._get_path("service-offering"))
+        timeout = (CONF.cloudstack.metadata_probe_timeout or None,
+                   CONF.metadata_http_read_timeout or None)
         try:
-            response = self._get_data(self._get_path("service-offering"))
-        except urllib.error.HTTPError as exc:
-            LOG.debug('Error response code: %s', exc.code)
+            response = self._http_request(url, timeout=timeout)
+        except (urllib.error.HTTPError, requests.HTTPError) as exc:
+            LOG.debug('Error response from %(url)s: %(error)s',
+                      {'url': metadata_url, 'error': exc})
             return False
         except base.NotExistingMetadataException:
             LOG.debug('Invalid service response.')
             return False
         except Exception as exc:
-            LOG.debug('Something went wrong.')
-            LOG.exception(exc)
+            LOG.debug('Failed to reach %(url)s: %(error)s',
+                      {'url': metadata_url, 'error': exc})
             return False
 
         LOG.debug('Available services: %s', response)
+        return True
+
+    def _set_metadata_url(self, metadata_url):
+        self._base_url = metadata_url
         netloc = urllib.parse.urlparse(metadata_url).netloc
         self._metadata_host = netloc.split(":")[0]
-        return True
+        self._close_password_client()
+
+    def _close_password_client(self):
+        if self._password_client is not None:
+            self._password_client.close()
+            self._password_client = None
 
     def load(self):
         """Obtain all the required informations."""
         super(CloudStack, self).load()
-        if self._test_api(CONF.cloudstack.metadata_base_url):
-            return True
-
+        metadata_urls = [CONF.cloudstack.metadata_base_url]
         dhcp_servers = self._osutils.get_dhcp_hosts_in_use()
         if not dhcp_servers:
             LOG.debug('No DHCP server was found.')
+        for _, ip_address in dhcp_servers or []:
+            metadata_url = 'http://%s/' % ip_address
+            if metadata_url not in metadata_urls:
+                metadata_urls.append(metadata_url)
+
+        LOG.debug('Testing: %s', ", ".join(metadata_urls))
+        found = concurrency.get_first_result(
+            self._test_api, metadata_urls, len(metadata_urls))
+        if not found:
             return False
-        for _, ip_address in dhcp_servers:
-            LOG.debug('Testing: %s', ip_address)
-            if self._test_api('http://%s/' % ip_address):
-                return True
 
-        return False
+        metadata_url, _ = found
+        LOG.debug('Using the metadata service from: %s', metadata_url)
+        self._set_metadata_url(metadata_url)
+        return True
 
     def get_instance_id(self):
         """Instance name of the virtual machine."""
@@ -123,29 +251,15 @@ class CloudStack(base.BaseHTTPMetadataService):
             ssh_keys.append(ssh_key)
         return ssh_keys
 
-    def _password_client(self, body=None, headers=None, decode=True):
-        """Client for the Password Server."""
-        port = CONF.cloudstack.password_server_port
-        with contextlib.closing(http_client.HTTPConnection(
-                self._metadata_host, port, timeout=TIMEOUT)) as connection:
-            try:
-                connection.request("GET", "/", body=body, headers=headers)
-                response = connection.getresponse()
-            except http_client.HTTPException as exc:
-                LOG.error("Request failed: %s", exc)
-                raise
-
-            content = response.read()
-            if decode:
-                content = encoding.get_as_string(content)
-
-            if response.status != 200:
-                raise http_client.HTTPException(
-                    "%(status)s %(reason)s - %(message)r",
-                    {"status": response.status, "reason": response.reason,
-                     "message": content})
+    def cleanup(self):
+        super(CloudStack, self).cleanup()
+        self._close_password_client()
 
-        return content
+    def _get_password_client(self):
+        if self._password_client is None:
+            self._password_client = PasswordServerClient(
+                self._metadata_host, CONF.cloudstack.password_server_port)
+        return self._password_client
 
     def _get_password(self):
         """Get the password from the Password Server.
@@ -162,35 +276,29 @@ class CloudStack(base.BaseHTTPMetadataService):
                 * the password
         """
         LOG.debug("Try to get password from the Password Server.")
-        headers = {"DomU_Request": "send_my_password"}
         password = None
 
-        for _ in range(CONF.retry_count):
-            try:
-                content = self._password_client(headers=headers).strip()
-            except http_client.HTTPConnection as exc:
-                LOG.error("Getting password failed: %s", exc)
-                continue
-
-            if not content:
-                LOG.warning("The Password Server did not have any "
-                            "password for the current instance.")
-                continue
-
-            if content == BAD_REQUEST:
-                LOG.error("The Password Server did not recognize the "
-                          "request.")
-                break
-
-            if content == SAVED_PASSWORD:
-                LOG.warning("The password was already taken from the "
-                            "Password Server for the current instance.")
-                break
-
+        try:
+            content = self._get_password_client().request(
+                SEND_MY_PASSWORD)
+        except (http_client.HTTPException, socket.error,
+                exception.CircuitBreakerOpenException) as exc:
+            LOG.error("Getting password failed: %s", exc)
+            return None
+
+        if not content:
+            LOG.warning("The Password Server did not have any "
+                        "password for the current instance.")
+        elif content == BAD_REQUEST:
+            LOG.error("The Password Server did not recognize the "
+                      "request.")
+        elif content == SAVED_PASSWORD:
+            LOG.warning("The password was already taken from the "
+                        "Password Server for the current instance.")
+        else:
             LOG.info("The password server returned a valid password "
                      "for the current instance.")
             password = content
-            break
 
         return password
 
@@ -202,18 +310,22 @@ class CloudStack(base.BaseHTTPMetadataService):
         """
         LOG.debug("Remove the password for this instance from the "
                   "Password Server.")
-        headers = {"DomU_Request": "saved_password"}
+        policy = retry.get_default_policy(max_attempts=CONF.retry_count)
 
-        for _ in range(CONF.retry_count):
+        for attempt in range(1, CONF.retry_count + 1):
             try:
-                content = self._password_client(headers=headers).strip()
-            except http_client.HTTPConnection as exc:
+                content = self._get_password_client().request(
+                    SAVED_PASSWORD)
+            except (http_client.HTTPException, socket.error,
+                    exception.CircuitBreakerOpenException) as exc:
                 LOG.error("Removing password failed: %s", exc)
-                continue
+                break
 
             if content != BAD_REQUEST:
                 LOG.info("The password was removed from the Password Server.")
                 break
+            if attempt < CONF.retry_count:
+                time.sleep(policy.get_delay(attempt))
         else:
             LOG.warning("Fail to remove the password from the "
                         "Password Server.")
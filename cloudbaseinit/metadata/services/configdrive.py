@@ -12,9 +12,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import os
-import shutil
-
 from oslo_log import log as oslo_logging
 
 from cloudbaseinit import conf as cloudbaseinit_conf
@@ -35,7 +32,7 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
 
     def __init__(self):
         super(ConfigDriveService, self).__init__()
-        self._metadata_path = None
+        self._mgr = None
 
     def _preprocess_options(self):
         self._searched_types = set(CONF.config_drive.types)
@@ -70,19 +67,20 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
             searched_locations=self._searched_locations)
 
         if found:
-            self._metadata_path = self._mgr.target_path
-            LOG.debug('Metadata copied to folder: %r', self._metadata_path)
+            if self._mgr.volume_reader:
+                LOG.debug('Reading the metadata from the %s volume',
+                          self._mgr.volume_reader.filesystem)
+            else:
+                LOG.debug('Reading the metadata from folder: %r',
+                          self._mgr.metadata_path)
         return found
 
     def _get_data(self, path):
-        norm_path = os.path.normpath(os.path.join(self._metadata_path, path))
         try:
-            with open(norm_path, 'rb') as stream:
-                return stream.read()
+            return self._mgr.read_file(path)
         except IOError:
             raise base.NotExistingMetadataException()
 
     def cleanup(self):
-        LOG.debug('Deleting metadata folder: %r', self._mgr.target_path)
-        shutil.rmtree(self._mgr.target_path, ignore_errors=True)
-        self._metadata_path = None
+        LOG.debug('Closing the config drive')
+        self._mgr.cleanup()
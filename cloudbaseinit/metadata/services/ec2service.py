@@ -13,15 +13,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
+
 from oslo_log import log as oslo_logging
+import requests
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.utils import concurrency
+from cloudbaseinit.utils import encoding
 from cloudbaseinit.utils import network
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
+TOKEN_PATH = "latest/api/token"
+TOKEN_HEADER = "X-aws-ec2-metadata-token"
+TOKEN_TTL_HEADER = "X-aws-ec2-metadata-token-ttl-seconds"
+
 
 class EC2Service(base.BaseHTTPMetadataService):
     _metadata_version = '2009-04-04'
@@ -32,6 +42,68 @@ class EC2Service(base.BaseHTTPMetadataService):
             https_allow_insecure=CONF.ec2.https_allow_insecure,
             https_ca_bundle=CONF.ec2.https_ca_bundle)
         self._enable_retry = True
+        self._token = None
+        self._token_expires_at = None
+        self._token_unsupported = False
+        self._token_lock = threading.Lock()
+
+    def _request_token(self):
+        headers = {TOKEN_TTL_HEADER: str(CONF.ec2.metadata_token_ttl)}
+        try:
+            token = super(EC2Service, self)._http_request(
+                TOKEN_PATH, headers=headers, method="PUT")
+        except requests.HTTPError as ex:
+            if ex.response.status_code not in (403, 404, 405):
+                raise
+            LOG.debug("Session tokens are not supported by the metadata "
+                      "service: %s", ex)
+            self._token_unsupported = True
+            return
+
+        self._token = encoding.get_as_string(token).strip()
+        # Renew the token before it actually expires.
+        self._token_expires_at = (time.time() +
+                                  CONF.ec2.metadata_token_ttl * 0.9)
+
+    def _get_token(self):
+        """Get the IMDSv2 session token, requesting it only if needed."""
+        if not CONF.ec2.metadata_token_ttl:
+            return None
+
+        with self._token_lock:
+            if (not self._token_unsupported and
+                    (self._token is None or
+                     time.time() >= self._token_expires_at)):
+                self._request_token()
+            return self._token
+
+    def _invalidate_token(self, token):
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    def _http_request(self, url, data=None, headers=None, method=None,
+                      timeout=None):
+        token = self._get_token()
+        if not token:
+            return super(EC2Service, self)._http_request(
+                url, data, headers, method=method, timeout=timeout)
+
+        token_headers = dict(headers or {})
+        token_headers[TOKEN_HEADER] = token
+        try:
+            return super(EC2Service, self)._http_request(
+                url, data, token_headers, method=method, timeout=timeout)
+        except requests.HTTPError as ex:
+            if ex.response.status_code != 401:
+                raise
+            # The token was not accepted, most probably as it expired.
+            LOG.debug("Renewing the metadata session token")
+            self._invalidate_token(token)
+            token_headers = dict(token_headers)
+            token_headers[TOKEN_HEADER] = self._get_token()
+            return super(EC2Service, self)._http_request(
+                url, data, token_headers, method=method, timeout=timeout)
 
     def load(self):
         super(EC2Service, self).load()
@@ -47,6 +119,87 @@ class EC2Service(base.BaseHTTPMetadataService):
                       CONF.ec2.metadata_base_url)
             return False
 
+    def _get_prefetch_paths(self):
+        return ['%s/%s' % (self._metadata_version, path)
+                for path in ('meta-data/instance-id',
+                             'meta-data/public-keys',
+                             'user-data')]
+
+    @staticmethod
+    def _get_listing_entries(data):
+        """Get the relative paths listed by a meta-data directory."""
+        entries = []
+        for line in encoding.get_as_string(data).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if "=" in line:
+                # The public keys are listed as "<index>=<name>", each
+                # one being a directory containing the key formats.
+                line = line.split("=", 1)[0] + "/"
+            entries.append(line)
+        return entries
+
+    def _is_crawl_excluded(self, path):
+        meta_data_path = '%s/meta-data/' % self._metadata_version
+        if not path.startswith(meta_data_path):
+            return False
+        relative_path = path[len(meta_data_path):]
+        return any(relative_path.startswith(excluded)
+                   for excluded in CONF.ec2.metadata_crawl_exclude)
+
+    def _crawl_meta_data(self):
+        """Fetch the meta-data tree concurrently, level by level.
+
+        The directories are cached without their trailing slash,
+        as they are requested by the getters. The prefetched paths
+        outside of the meta-data tree (the user data) are fetched
+        along with the first level, saving a round trip.
+        """
+        meta_data_path = '%s/meta-data/' % self._metadata_version
+        paths = [meta_data_path] + [
+            path for path in self._get_prefetch_paths()
+            if not path.startswith(meta_data_path)]
+        for _ in range(CONF.ec2.metadata_crawl_depth):
+            paths = [path for path in paths
+                     if (path.rstrip("/"), False) not in self._cache and
+                     path.rstrip("/") not in self._missing_paths and
+                     not self._is_crawl_excluded(path)]
+            if not paths:
+                break
+
+            LOG.debug("Crawling metadata: %s", ", ".join(paths))
+            results = concurrency.map_concurrently(
+                self._get_traced_data, paths,
+                CONF.metadata_prefetch_workers)
+            next_paths = []
+            fetched_data = {}
+            for path, (data, error) in zip(paths, results):
+                cache_path = path.rstrip("/")
+                if error is None:
+                    self._cache[(cache_path, False)] = data
+                    if data is not None:
+                        fetched_data[cache_path] = data
+                    if path.endswith("/"):
+                        next_paths.extend(
+                            path + entry
+                            for entry in self._get_listing_entries(data))
+                elif isinstance(error, base.NotExistingMetadataException):
+                    self._missing_paths.add(cache_path)
+                else:
+                    LOG.debug("Failed to crawl metadata '%(path)s': "
+                              "%(error)s", {"path": path, "error": error})
+            if self._persistent_cache and fetched_data:
+                # Each level is saved with a single write.
+                self._persistent_cache.update(fetched_data)
+            paths = next_paths
+
+    def prefetch(self):
+        if (CONF.ec2.metadata_crawl_depth > 0 and
+                CONF.metadata_prefetch_workers > 0):
+            self._crawl_meta_data()
+        super(EC2Service, self).prefetch()
+
     def get_host_name(self):
         return self._get_cache_data('%s/meta-data/local-hostname' %
                                     self._metadata_version, decode=True)
@@ -60,18 +213,20 @@ class EC2Service(base.BaseHTTPMetadataService):
                                     self._metadata_version)
 
     def get_public_keys(self):
-        ssh_keys = []
-
         keys_info = self._get_cache_data(
             '%s/meta-data/public-keys' %
             self._metadata_version, decode=True).splitlines()
+        paths = ['%(version)s/meta-data/public-keys/%(idx)s/openssh-key' %
+                 {'version': self._metadata_version,
+                  'idx': key_info.split('=')[0]}
+                 for key_info in keys_info]
 
-        for key_info in keys_info:
-            (idx, key_name) = key_info.split('=')
-
-            ssh_key = self._get_cache_data(
-                '%(version)s/meta-data/public-keys/%(idx)s/openssh-key' %
-                {'version': self._metadata_version, 'idx': idx}, decode=True)
+        ssh_keys = []
+        results = concurrency.map_concurrently(
+            lambda path: self._get_cache_data(path, decode=True), paths,
+            CONF.metadata_prefetch_workers)
+        for ssh_key, error in results:
+            if error is not None:
+                raise error
             ssh_keys.append(ssh_key.strip())
-
         return ssh_keys
@@ -47,6 +47,7 @@ class MaaSHttpService(base.BaseHTTPMetadataService):
             https_ca_bundle=CONF.maas.https_ca_bundle)
         self._enable_retry = True
         self._metadata_version = self._METADATA_2012_03_01
+        self._oauth_client = None
 
     def load(self):
         super(MaaSHttpService, self).load()
@@ -55,6 +56,8 @@ class MaaSHttpService(base.BaseHTTPMetadataService):
             LOG.debug('MaaS metadata url not set')
         else:
             try:
+                # The data needed by the plugins is fetched by prefetch,
+                # once the persistent cache is loaded.
                 self._get_cache_data('%s/meta-data/' % self._metadata_version)
                 return True
             except Exception as ex:
@@ -63,26 +66,41 @@ class MaaSHttpService(base.BaseHTTPMetadataService):
                           CONF.maas.metadata_base_url)
         return False
 
+    def _get_oauth_client(self):
+        # The client only holds the credentials, each request being
+        # signed with its own nonce and timestamp.
+        if self._oauth_client is None:
+            self._oauth_client = oauth1.Client(
+                CONF.maas.oauth_consumer_key,
+                client_secret=CONF.maas.oauth_consumer_secret,
+                resource_owner_key=CONF.maas.oauth_token_key,
+                resource_owner_secret=CONF.maas.oauth_token_secret,
+                signature_method=oauth1.SIGNATURE_PLAINTEXT,
+                realm=_Realm(""))
+        return self._oauth_client
+
     def _get_oauth_headers(self, url):
         LOG.debug("Getting authorization headers for %s.", url)
-        client = oauth1.Client(
-            CONF.maas.oauth_consumer_key,
-            client_secret=CONF.maas.oauth_consumer_secret,
-            resource_owner_key=CONF.maas.oauth_token_key,
-            resource_owner_secret=CONF.maas.oauth_token_secret,
-            signature_method=oauth1.SIGNATURE_PLAINTEXT)
-        realm = _Realm("")
-        headers = client.sign(url, realm=realm)[1]
-        return headers
-
-    def _http_request(self, url, data=None, headers=None):
+        return self._get_oauth_client().sign(url)[1]
+
+    def _http_request(self, url, data=None, headers=None, method=None,
+                      timeout=None):
         """Get content for received url."""
         if not url.startswith("http"):
             url = requests.compat.urljoin(self._base_url, url)
-        headers = {} if headers is None else headers
+        headers = dict(headers or {})
         headers.update(self._get_oauth_headers(url))
 
-        return super(MaaSHttpService, self)._http_request(url, data, headers)
+        return super(MaaSHttpService, self)._http_request(
+            url, data, headers, method=method, timeout=timeout)
+
+    def _get_prefetch_paths(self):
+        return ['%s/%s' % (self._metadata_version, path)
+                for path in ('meta-data/local-hostname',
+                             'meta-data/instance-id',
+                             'meta-data/public-keys',
+                             'meta-data/x509',
+                             'user-data')]
 
     def get_host_name(self):
         return self._get_cache_data('%s/meta-data/local-hostname' %
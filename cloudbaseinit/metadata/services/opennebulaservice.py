@@ -45,6 +45,120 @@ ADDRESS = ["ETH{iid}_IP"]
 NETMASK = ["ETH{iid}_MASK"]
 GATEWAY = ["ETH{iid}_GATEWAY"]
 DNSNS = ["ETH{iid}_DNS"]
+ADDRESS6 = ["ETH{iid}_IP6"]
+PREFIX_LENGTH6 = ["ETH{iid}_IP6_PREFIX_LENGTH"]
+GATEWAY6 = ["ETH{iid}_IP6_GATEWAY", "ETH{iid}_GATEWAY6"]
+MTU = ["ETH{iid}_MTU"]
+
+DEFAULT_PREFIX_LENGTH6 = "64"
+NIC_VARIABLE = re.compile(r"^ETH(?P<iid>\d+)_(?P<name>\w+)$")
+
+# context.sh tokens
+_SEPARATORS = b" \t\r\n\f\v;"
+_SEPARATOR = re.compile(br"[\s;]+")
+_COMMENT = re.compile(br"#[^\n]*")
+_ASSIGNMENT = re.compile(br"([A-Za-z_][A-Za-z0-9_]*)=")
+# The values written by OpenNebula: single quoted, with the single
+# quotes escaped as '\''.
+_SINGLE_QUOTED_WORD = re.compile(br"'([^']*(?:'\\''[^']*)*)'(?=[\s;]|\Z)")
+_WORD_PART = re.compile(br"""
+    '(?P<single>[^']*)(?:'|\Z)
+  | \$'(?P<ansi_c>[^'\\]*(?:\\[\s\S][^'\\]*)*)(?:'|\Z)
+  | "(?P<double>[^"\\]*(?:\\[\s\S][^"\\]*)*)(?:"|\Z)
+  | (?P<unquoted>(?:[^\s;'"\\$]|\$(?!'))+)
+  | \\(?P<escaped>[\s\S]?)
+""", re.VERBOSE)
+_DOUBLE_QUOTED_ESCAPE = re.compile(br'\\([$`"\\\n])')
+_ANSI_C_ESCAPE = re.compile(br"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|[\s\S])")
+_ANSI_C_CHARS = {
+    b"a": b"\a", b"b": b"\b", b"e": b"\x1b", b"E": b"\x1b", b"f": b"\f",
+    b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v", b"\\": b"\\",
+    b"'": b"'", b"\"": b"\"", b"?": b"?",
+}
+
+
+def _unescape_double_quoted(match):
+    char = match.group(1)
+    # A backslash followed by a newline continues the line.
+    return b"" if char == b"\n" else char
+
+
+def _unescape_ansi_c(match):
+    escape = match.group(1)
+    if escape[:1] == b"x":
+        return six.int2byte(int(escape[1:], 16))
+    if escape[:1] in b"01234567":
+        return six.int2byte(int(escape, 8) & 0xFF)
+    return _ANSI_C_CHARS.get(escape, b"\\" + escape)
+
+
+def _parse_word(content, pos):
+    """Get the value of the shell word starting at the given position.
+
+    A word is made of adjacent single quoted, double quoted, $'...'
+    and unquoted parts. Only the words made of digits are integers.
+
+    :returns: a (value, end position) tuple.
+    """
+    match = _SINGLE_QUOTED_WORD.match(content, pos)
+    if match:
+        return match.group(1).replace(b"'\\''", b"'"), match.end()
+
+    parts = []
+    kinds = []
+    end = len(content)
+    while pos < end and content[pos:pos + 1] not in _SEPARATORS:
+        match = _WORD_PART.match(content, pos)
+        if not match:
+            # A dangling backslash in an unterminated quote.
+            parts.append(content[pos:pos + 1])
+            kinds.append(None)
+            pos += 1
+            continue
+        kind = match.lastgroup
+        part = match.group(kind)
+        if kind == "double":
+            part = _DOUBLE_QUOTED_ESCAPE.sub(_unescape_double_quoted, part)
+        elif kind == "ansi_c":
+            part = _ANSI_C_ESCAPE.sub(_unescape_ansi_c, part)
+        elif kind == "escaped" and part == b"\n":
+            part = b""
+        parts.append(part)
+        kinds.append(kind)
+        pos = match.end()
+
+    value = b"".join(parts)
+    if kinds == ["unquoted"] and value.isdigit():
+        value = int(value)
+    return value, pos
+
+
+def parse_shell_variables(content):
+    """Get the variables assigned in an OpenNebula context.sh file.
+
+    The content is tokenized in a single pass, following the shell
+    quoting rules. The commands which are not assignments, like
+    "export", are skipped.
+
+    :param content: The context file content, as bytes.
+    :returns: a dict with the values as bytes, or as integers for the
+              unquoted numbers.
+    """
+    pairs = {}
+    pos = 0
+    end = len(content)
+    while pos < end:
+        match = _SEPARATOR.match(content, pos) or _COMMENT.match(content, pos)
+        if match:
+            pos = match.end()
+            continue
+        match = _ASSIGNMENT.match(content, pos)
+        if match:
+            pos = match.end()
+        value, pos = _parse_word(content, pos)
+        if match:
+            pairs[encoding.get_as_string(match.group(1))] = value
+    return pairs
 
 
 class OpenNebulaService(base.BaseMetadataService):
@@ -60,40 +174,39 @@ class OpenNebulaService(base.BaseMetadataService):
         self._context_path = None
         self._raw_content = None
         self._dict_content = {}
+        self._nics = None
 
-    def _nic_count(self):
-        """Return the number of available interfaces."""
-        mac = MAC[0]
-        iid = 0
-        while self._dict_content.get(mac.format(iid=iid)):
-            iid += 1
-        return iid
+    def _get_nics(self):
+        """Get the variables of each NIC, by interface number.
+
+        The context is indexed once, the variables of each NIC being
+        keyed by their template, like ETH{iid}_MAC.
+        """
+        if self._nics is None:
+            nics = {}
+            for key, value in self._dict_content.items():
+                match = NIC_VARIABLE.match(key)
+                if match:
+                    nic = nics.setdefault(int(match.group("iid")), {})
+                    nic["ETH{iid}_" + match.group("name")] = value
+            self._nics = nics
+        return self._nics
 
     @staticmethod
-    def _parse_shell_variables(content):
-        """Returns a dictionary with variables and their values.
+    def _get_nic_value(nic, names):
+        """Get the first NIC variable found, as a string, or None."""
+        for name in names:
+            value = nic.get(name)
+            if value is not None:
+                if isinstance(value, six.integer_types):
+                    return str(value)
+                return encoding.get_as_string(value)
+        return None
 
-        This is a dummy approach, because it works only with simple literals.
-        """
-        # preprocess the content
-        lines = []
-        for line in content.splitlines():
-            if not line or line.startswith(b"#"):
-                continue
-            lines.append(line)
-        # for cleaner pattern matching
-        lines.append(b"__REGEX_DUMMY__='__regex_dummy__'")
-        sep = b"\r\n" if b"\r\n" in content else b"\n"
-        new_content = sep.join(lines)
-        # get pairs
-        pairs = {}
-        pattern = (br"(?P<key>\w+)=(['\"](?P<str_value>[\s\S]+?)['\"]|"
-                   br"(?P<int_value>\d+))(?=\s+\w+=)")
-        for match in re.finditer(pattern, new_content):
-            key = encoding.get_as_string(match.group("key"))
-            pairs[key] = (match.group("str_value") or
-                          int(match.group("int_value")))
-        return pairs
+    @staticmethod
+    def _parse_shell_variables(content):
+        """Returns a dictionary with variables and their values."""
+        return parse_shell_variables(content)
 
     @staticmethod
     def _calculate_netmask(address, gateway):
@@ -137,6 +250,7 @@ class OpenNebulaService(base.BaseMetadataService):
                 self._raw_content
             )
             self._dict_content.update(vardict)
+            self._nics = None
 
     def _get_data(self, name):
         # Return the requested field's value or raise an error if not found.
@@ -210,43 +324,42 @@ class OpenNebulaService(base.BaseMetadataService):
         this is handled by DHCP (user didn't provide sufficient data).
         """
         network_details = []
-        ncount = self._nic_count()
-        # for every interface
-        for iid in range(ncount):
-            try:
-                # get existing values
-                mac = self._get_cache_data(MAC, iid=iid, decode=True).upper()
-                address = self._get_cache_data(ADDRESS, iid=iid, decode=True)
-                # try to find/predict and compute the rest
-                try:
-                    gateway = self._get_cache_data(GATEWAY, iid=iid,
-                                                   decode=True)
-                except base.NotExistingMetadataException:
-                    gateway = None
-                try:
-                    netmask = self._get_cache_data(NETMASK, iid=iid,
-                                                   decode=True)
-                except base.NotExistingMetadataException:
-                    if not gateway:
-                        raise
+        nics = self._get_nics()
+        for iid in sorted(nics):
+            nic = nics[iid]
+            mac = self._get_nic_value(nic, MAC)
+            address = self._get_nic_value(nic, ADDRESS)
+            address6 = self._get_nic_value(nic, ADDRESS6)
+            gateway = self._get_nic_value(nic, GATEWAY)
+            # try to find/predict and compute the rest
+            netmask = self._get_nic_value(nic, NETMASK)
+            if address and not netmask:
+                if gateway:
                     netmask = self._calculate_netmask(address, gateway)
-                broadcast = self._compute_broadcast(address, netmask)
-                # gather them as namedtuple objects
-                details = base.NetworkDetails(
-                    name=IF_FORMAT.format(iid=iid),
-                    mac=mac,
-                    address=address,
-                    address6=None,
-                    netmask=netmask,
-                    netmask6=None,
-                    broadcast=broadcast,
-                    gateway=gateway,
-                    gateway6=None,
-                    dnsnameservers=self._get_cache_data(
-                        DNSNS, iid=iid, decode=True).split(" ")
-                )
-            except base.NotExistingMetadataException:
+                else:
+                    address = None
+            if not (mac and (address or address6)):
                 LOG.debug("Incomplete NIC details")
-            else:
-                network_details.append(details)
+                continue
+
+            netmask6 = None
+            if address6:
+                netmask6 = (self._get_nic_value(nic, PREFIX_LENGTH6) or
+                            DEFAULT_PREFIX_LENGTH6)
+            dnsns = self._get_nic_value(nic, DNSNS)
+            # gather them as namedtuple objects
+            details = base.NetworkDetails(
+                name=IF_FORMAT.format(iid=iid),
+                mac=mac.upper(),
+                address=address,
+                address6=address6,
+                netmask=netmask if address else None,
+                netmask6=netmask6,
+                broadcast=(self._compute_broadcast(address, netmask)
+                           if address else None),
+                gateway=gateway if address else None,
+                gateway6=self._get_nic_value(nic, GATEWAY6),
+                dnsnameservers=dnsns.split() if dnsns else []
+            )
+            network_details.append(details)
         return network_details
@@ -13,7 +13,7 @@
 #    under the License.
 
 import abc
-import tempfile
+import os
 
 import six
 
@@ -22,8 +22,27 @@ import six
 class BaseConfigDriveManager(object):
 
     def __init__(self):
-        self.target_path = tempfile.mkdtemp()
+        # The folder with the config drive files, unless they are
+        # read straight from a raw volume by the volume_reader.
+        self.metadata_path = None
+        self.volume_reader = None
 
     @abc.abstractmethod
     def get_config_drive_files(self, check_types=None, check_locations=None):
         pass
+
+    def read_file(self, path):
+        """Get the content of a file from the config drive found.
+
+        :raises: IOError if the file doesn't exist.
+        """
+        if self.volume_reader:
+            return self.volume_reader.read_file(path)
+
+        norm_path = os.path.normpath(os.path.join(self.metadata_path, path))
+        with open(norm_path, 'rb') as stream:
+            return stream.read()
+
+    def cleanup(self):
+        self.metadata_path = None
+        self.volume_reader = None
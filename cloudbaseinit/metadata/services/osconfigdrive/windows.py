@@ -13,35 +13,63 @@
 #    under the License.
 
 
+import collections
 import itertools
 import os
-import shutil
-import struct
-import tempfile
-import uuid
 
 from oslo_log import log as oslo_logging
 
-from cloudbaseinit import conf as cloudbaseinit_conf
-from cloudbaseinit import exception
 from cloudbaseinit.metadata.services.osconfigdrive import base
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import fat
+from cloudbaseinit.utils import iso9660
 from cloudbaseinit.utils.windows import disk
 from cloudbaseinit.utils.windows import vfat
 
-CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 CONFIG_DRIVE_LABEL = 'config-2'
-MAX_SECTOR_SIZE = 4096
-# Absolute offset values and the ISO magic string.
-OFFSET_BOOT_RECORD = 0x8000
-OFFSET_ISO_ID = OFFSET_BOOT_RECORD + 1
-ISO_ID = b'CD001'
-# Little-endian unsigned short size values.
-OFFSET_VOLUME_SIZE = OFFSET_BOOT_RECORD + 80
-OFFSET_BLOCK_SIZE = OFFSET_BOOT_RECORD + 128
-PEEK_SIZE = 2
+# The volume descriptors, followed by at least a block.
+MIN_ISO_SIZE = iso9660.VOLUME_DESCRIPTORS_OFFSET + 2 * iso9660.SECTOR_SIZE
+# The read-ahead window of the block sources, read at once when probing.
+# It covers the boot sector, the partition tables and the first ISO9660
+# volume descriptors.
+PROBE_SIZE = 64 * 1024
+GPT_HEADER_OFFSET = 512
+GPT_SIGNATURE = b'EFI PART'
+MBR_SIGNATURE_OFFSET = 510
+MBR_SIGNATURE = b'\x55\xaa'
+
+SIGNATURE_ISO = 'iso'
+SIGNATURE_VFAT = 'vfat'
+SIGNATURE_GPT = 'gpt'
+SIGNATURE_MBR = 'mbr'
+PARTITION_TABLE_SIGNATURES = frozenset([SIGNATURE_GPT, SIGNATURE_MBR])
+
+_BlockSource = collections.namedtuple(
+    '_BlockSource', ['device', 'stream', 'signatures'])
+
+
+def _has_gpt(stream):
+    stream.seek(GPT_HEADER_OFFSET)
+    return stream.read(len(GPT_SIGNATURE)) == GPT_SIGNATURE
+
+
+def _has_mbr(stream):
+    # The FAT boot sectors end with the same signature.
+    stream.seek(MBR_SIGNATURE_OFFSET)
+    return (stream.read(len(MBR_SIGNATURE)) == MBR_SIGNATURE and
+            not fat.is_fat(stream))
+
+
+# The checks of the signatures of the block sources, which only read
+# from their heads.
+SIGNATURES = (
+    (SIGNATURE_ISO, iso9660.is_iso9660),
+    (SIGNATURE_VFAT, fat.is_fat),
+    (SIGNATURE_GPT, _has_gpt),
+    (SIGNATURE_MBR, _has_mbr),
+)
 
 
 class WindowsConfigDriveManager(base.BaseConfigDriveManager):
@@ -49,6 +77,9 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
     def __init__(self):
         super(WindowsConfigDriveManager, self).__init__()
         self._osutils = osutils_factory.get_os_utils()
+        self._volume_device = None
+        self._disk_sources = None
+        self._partition_sources = None
 
     def _check_for_config_drive(self, drive):
         label = self._osutils.get_volume_label(drive)
@@ -60,118 +91,125 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
             return True
         return False
 
-    def _get_iso_file_size(self, device):
-        if not device.fixed:
+    def _probe(self, device):
+        """Open the device and classify it by the signatures found.
+
+        Only the head of the device is read, at once.
+        """
+        try:
+            device.open()
+            stream = device.get_block_reader(PROBE_SIZE)
+            stream.prefetch(0)
+            signatures = set(name for name, has_signature in SIGNATURES
+                             if has_signature(stream))
+        except Exception as exc:
+            LOG.warning('Probing failed on %(device)s with %(error)r',
+                        {"device": device, "error": exc})
+            device.close()
             return None
 
-        if not device.size > (OFFSET_BLOCK_SIZE + PEEK_SIZE):
+        LOG.debug('Signatures found on %(device)s: %(signatures)s',
+                  {"device": device, "signatures": sorted(signatures)})
+        return _BlockSource(device, stream, signatures)
+
+    def _probe_devices(self, devices):
+        sources = [self._probe(device) for device in devices]
+        return [source for source in sources if source]
+
+    def _get_disk_sources(self):
+        if self._disk_sources is None:
+            disks = map(disk.Disk, self._osutils.get_physical_disks())
+            self._disk_sources = self._probe_devices(disks)
+        return self._disk_sources
+
+    def _get_partition_sources(self):
+        if self._partition_sources is None:
+            self._partition_sources = []
+            for source in self._get_disk_sources():
+                if not source.signatures & PARTITION_TABLE_SIGNATURES:
+                    continue
+                try:
+                    partitions = source.device.partitions()
+                except Exception as exc:
+                    LOG.warning('Cannot get the partitions of %(device)s: '
+                                '%(error)r',
+                                {"device": source.device, "error": exc})
+                    continue
+                self._partition_sources.extend(
+                    self._probe_devices(partitions))
+        return self._partition_sources
+
+    def _close_sources(self):
+        """Close the probed devices, except the config drive one."""
+        for source in ((self._disk_sources or []) +
+                       (self._partition_sources or [])):
+            if source.device is not self._volume_device:
+                source.device.close()
+        self._disk_sources = None
+        self._partition_sources = None
+
+    def _get_iso_reader(self, source):
+        device = source.device
+        if not device.fixed or device.size < MIN_ISO_SIZE:
             return None
+        return iso9660.ISO9660Reader(source.stream)
 
-        off = device.seek(OFFSET_ISO_ID)
-        magic = device.read(len(ISO_ID), skip=OFFSET_ISO_ID - off)
-        if ISO_ID != magic:
-            return None
+    @staticmethod
+    def _get_vfat_reader(source):
+        return vfat.get_vfat_reader(source.stream)
+
+    def _open_volume_from_sources(self, sources, signature, get_reader):
+        """Search the probed sources with the signature for a volume.
 
-        off = device.seek(OFFSET_VOLUME_SIZE)
-        volume_size_bytes = device.read(PEEK_SIZE,
-                                        skip=OFFSET_VOLUME_SIZE - off)
-        off = device.seek(OFFSET_BLOCK_SIZE)
-        block_size_bytes = device.read(PEEK_SIZE,
-                                       skip=OFFSET_BLOCK_SIZE - off)
-        volume_size = struct.unpack("<H", volume_size_bytes)[0]
-        block_size = struct.unpack("<H", block_size_bytes)[0]
-
-        return volume_size * block_size
-
-    def _write_iso_file(self, device, iso_file_path, iso_file_size):
-        with open(iso_file_path, 'wb') as stream:
-            offset = 0
-            # Read multiples of the sector size bytes
-            # until the entire ISO content is written.
-            while offset < iso_file_size:
-                real_offset = device.seek(offset)
-                bytes_to_read = min(MAX_SECTOR_SIZE, iso_file_size - offset)
-                data = device.read(bytes_to_read, skip=offset - real_offset)
-                stream.write(data)
-                offset += bytes_to_read
-
-    def _extract_files_from_iso(self, iso_file_path):
-        args = [CONF.bsdtar_path, '-xf', iso_file_path,
-                '-C', self.target_path]
-        (out, err, exit_code) = self._osutils.execute_process(args, False)
-
-        if exit_code:
-            raise exception.CloudbaseInitException(
-                'Failed to execute "bsdtar" from path "%(bsdtar_path)s" with '
-                'exit code: %(exit_code)s\n%(out)s\n%(err)s' % {
-                    'bsdtar_path': CONF.bsdtar_path,
-                    'exit_code': exit_code,
-                    'out': out, 'err': err})
-
-    def _extract_iso_from_devices(self, devices):
-        """Search across multiple devices for a raw ISO."""
-        extracted = False
-        iso_file_path = os.path.join(tempfile.gettempdir(),
-                                     str(uuid.uuid4()) + '.iso')
-
-        for device in devices:
+        The device with the volume is kept open, in order to read the
+        files straight from it.
+        """
+        for source in sources:
+            if signature not in source.signatures:
+                continue
             try:
-                with device:
-                    iso_file_size = self._get_iso_file_size(device)
-                    if iso_file_size:
-                        LOG.info('ISO9660 disk found on %s', device)
-                        self._write_iso_file(device, iso_file_path,
-                                             iso_file_size)
-                        self._extract_files_from_iso(iso_file_path)
-                        extracted = True
-                        break
+                volume_reader = get_reader(source)
             except Exception as exc:
-                LOG.warning('ISO extraction failed on %(device)s with '
-                            '%(error)r', {"device": device, "error": exc})
-
-        if os.path.isfile(iso_file_path):
-            os.remove(iso_file_path)
-        return extracted
+                LOG.warning('Volume reading failed on %(device)s with '
+                            '%(error)r',
+                            {"device": source.device, "error": exc})
+                continue
+            if volume_reader:
+                LOG.info('%(filesystem)s disk found on %(device)s',
+                         {"filesystem": volume_reader.filesystem,
+                          "device": source.device})
+                self.volume_reader = volume_reader
+                self._volume_device = source.device
+                return True
+        return False
 
     def _get_config_drive_from_cdrom_drive(self):
         for drive_letter in self._osutils.get_cdrom_drives():
             if self._check_for_config_drive(drive_letter):
-                os.rmdir(self.target_path)
-                shutil.copytree(drive_letter, self.target_path)
+                self.metadata_path = drive_letter
                 return True
 
         return False
 
     def _get_config_drive_from_raw_hdd(self):
-        disks = map(disk.Disk, self._osutils.get_physical_disks())
-        return self._extract_iso_from_devices(disks)
+        return self._open_volume_from_sources(
+            self._get_disk_sources(), SIGNATURE_ISO, self._get_iso_reader)
 
     def _get_config_drive_from_vfat(self):
-        for drive_path in self._osutils.get_physical_disks():
-            if vfat.is_vfat_drive(self._osutils, drive_path):
-                LOG.info('Config Drive found on disk %r', drive_path)
-                vfat.copy_from_vfat_drive(self._osutils, drive_path,
-                                          self.target_path)
-                return True
-        return False
+        return self._open_volume_from_sources(
+            self._get_disk_sources(), SIGNATURE_VFAT, self._get_vfat_reader)
 
     def _get_config_drive_from_partition(self):
-        for disk_path in self._osutils.get_physical_disks():
-            physical_drive = disk.Disk(disk_path)
-            with physical_drive:
-                partitions = physical_drive.partitions()
-            extracted = self._extract_iso_from_devices(partitions)
-            if extracted:
-                return True
-        return False
+        return self._open_volume_from_sources(
+            self._get_partition_sources(), SIGNATURE_ISO,
+            self._get_iso_reader)
 
     def _get_config_drive_from_volume(self):
         """Look through all the volumes for config drive."""
         volumes = self._osutils.get_volumes()
         for volume in volumes:
             if self._check_for_config_drive(volume):
-                os.rmdir(self.target_path)
-                shutil.copytree(volume, self.target_path)
+                self.metadata_path = volume
                 return True
         return False
 
@@ -191,12 +229,18 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
         searched_types = searched_types or []
         searched_locations = searched_locations or []
 
-        for cd_type, cd_location in itertools.product(searched_types,
-                                                      searched_locations):
-            LOG.debug('Looking for Config Drive %(type)s in %(location)s',
-                      {"type": cd_type, "location": cd_location})
-            if self._get_config_drive_files(cd_type, cd_location):
-                return True
+        # The disks and the partitions are probed once, when first
+        # searched, for all the types and locations.
+        try:
+            for cd_type, cd_location in itertools.product(
+                    searched_types, searched_locations):
+                LOG.debug('Looking for Config Drive %(type)s in '
+                          '%(location)s',
+                          {"type": cd_type, "location": cd_location})
+                if self._get_config_drive_files(cd_type, cd_location):
+                    return True
+        finally:
+            self._close_sources()
 
         return False
 
@@ -209,3 +253,9 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
             "partition_iso": self._get_config_drive_from_partition,
             "partition_vfat": self._get_config_drive_from_volume,
         }
+
+    def cleanup(self):
+        super(WindowsConfigDriveManager, self).cleanup()
+        if self._volume_device:
+            self._volume_device.close()
+            self._volume_device = None
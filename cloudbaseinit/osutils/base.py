@@ -88,6 +88,12 @@ class BaseOSUtils(object):
     def get_config_value(self, name, section=None):
         raise NotImplementedError()
 
+    def set_config_values(self, values, section=None):
+        raise NotImplementedError()
+
+    def get_config_values(self, section=None):
+        raise NotImplementedError()
+
     def wait_for_boot_completion(self):
         pass
 
@@ -871,6 +871,38 @@ class WindowsUtils(base.BaseOSUtils):
         except WindowsError:
             return None
 
+    def set_config_values(self, values, section=None):
+        key_name = self._get_config_key_name(section)
+
+        with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE,
+                              key_name) as key:
+            for name, value in values.items():
+                if (isinstance(value, six.integer_types) and
+                        not isinstance(value, bool)):
+                    regtype = winreg.REG_DWORD
+                else:
+                    regtype = winreg.REG_SZ
+                winreg.SetValueEx(key, name, 0, regtype, value)
+
+    def get_config_values(self, section=None):
+        key_name = self._get_config_key_name(section)
+
+        values = {}
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
+                                key_name) as key:
+                index = 0
+                while True:
+                    try:
+                        name, value = winreg.EnumValue(key, index)[:2]
+                    except WindowsError:
+                        break
+                    values[name] = value
+                    index += 1
+        except WindowsError:
+            pass
+        return values
+
     def wait_for_boot_completion(self):
         try:
             with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
@@ -23,6 +23,13 @@ PLUGIN_STAGE_MAIN = "MAIN"
 class BasePlugin(object):
     execution_stage = PLUGIN_STAGE_MAIN
 
+    # The resources (e.g. shared data keys) needed, respectively produced
+    # or modified by the plugin, used for running plugins concurrently.
+    # Plugins which don't declare them are always executed alone,
+    # in the configured order.
+    requires = None
+    provides = None
+
     def get_name(self):
         return self.__class__.__name__
 
@@ -14,3 +14,9 @@
 
 SHARED_DATA_USERNAME = "admin_user"
 SHARED_DATA_PASSWORD = "admin_password"
+
+# Resources which are not shared data, but can still be required
+# or provided by plugins, in order to order their execution.
+NETWORK_CONFIGURED = "network_configured"
+WINRM_LISTENER = "winrm_listener"
+STORAGE = "storage"
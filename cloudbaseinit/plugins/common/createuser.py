@@ -30,6 +30,9 @@ LOG = oslo_logging.getLogger(__name__)
 class BaseCreateUserPlugin(base.BasePlugin):
     """This is a base class for creating or modifying an user."""
 
+    requires = ()
+    provides = (constants.SHARED_DATA_USERNAME, constants.SHARED_DATA_PASSWORD)
+
     @abc.abstractmethod
     def create_user(self, username, password, osutils):
         """Create a new username, with the given *username*.
@@ -21,12 +21,16 @@ from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base as metadata_services_base
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 
 class EphemeralDiskPlugin(base.BasePlugin):
+    requires = ()
+    provides = (constants.STORAGE, )
+
     @staticmethod
     def _get_ephemeral_disk_volume_by_mount_point(osutils):
         if CONF.ephemeral_disk_volume_mount_point:
@@ -21,6 +21,7 @@ from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base as service_base
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base as plugin_base
+from cloudbaseinit.plugins.common import constants
 from cloudbaseinit.utils import network
 
 
@@ -120,6 +121,8 @@ def _preprocess_nics(network_details, network_adapters):
 
 
 class NetworkConfigPlugin(plugin_base.BasePlugin):
+    requires = ()
+    provides = (constants.NETWORK_CONFIGURED, )
 
     def execute(self, service, shared_data):
         osutils = osutils_factory.get_os_utils()
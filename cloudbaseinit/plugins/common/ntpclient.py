@@ -27,6 +27,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 class NTPClientPlugin(base.BasePlugin):
     execution_stage = base.PLUGIN_STAGE_PRE_NETWORKING
+    requires = ()
+    provides = ()
 
     def verify_time_service(self, osutils):
         """Verify that the time service is up.
@@ -29,6 +29,9 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class SetUserPasswordPlugin(base.BasePlugin):
+    requires = (plugin_constant.SHARED_DATA_USERNAME,
+                plugin_constant.SHARED_DATA_PASSWORD)
+    provides = (plugin_constant.SHARED_DATA_PASSWORD, )
 
     def _encrypt_password(self, ssh_pub_key, password):
         cm = crypt.CryptManager()
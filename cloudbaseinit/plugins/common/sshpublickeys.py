@@ -20,6 +20,7 @@ from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 
 
 CONF = cloudbaseinit_conf.CONF
@@ -27,6 +28,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class SetUserSSHPublicKeysPlugin(base.BasePlugin):
+    requires = (constants.SHARED_DATA_USERNAME, )
+    provides = ()
 
     def execute(self, service, shared_data):
         public_keys = service.get_public_keys()
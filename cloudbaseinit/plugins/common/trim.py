@@ -24,6 +24,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class TrimConfigPlugin(plugin_base.BasePlugin):
+    requires = ()
+    provides = ()
 
     def execute(self, service, shared_data):
         osutils = osutils_factory.get_os_utils()
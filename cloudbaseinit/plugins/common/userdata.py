@@ -12,7 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import email
+import hashlib
 import os
 
 from oslo_log import log as oslo_logging
@@ -25,7 +25,9 @@ from cloudbaseinit.plugins.common import base
 from cloudbaseinit.plugins.common import execcmd
 from cloudbaseinit.plugins.common.userdataplugins import factory
 from cloudbaseinit.plugins.common import userdatautils
+from cloudbaseinit.plugins import status as plugins_status
 from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import mime
 from cloudbaseinit.utils import x509constants
 
 
@@ -35,6 +37,7 @@ LOG = oslo_logging.getLogger(__name__)
 
 class UserDataPlugin(base.BasePlugin):
     _PART_HANDLER_CONTENT_TYPE = "text/part-handler"
+    _LEDGER_CONFIG_SECTION = "UserDataParts"
     _GZIP_MAGIC_NUMBER = b'\x1f\x8b'
 
     def execute(self, service, shared_data):
@@ -53,7 +56,8 @@ class UserDataPlugin(base.BasePlugin):
             self._write_userdata(user_data, user_data_path)
 
         if CONF.process_userdata:
-            return self._process_user_data(user_data)
+            return self._process_user_data(user_data,
+                                           self._get_ledger(service))
         return base.PLUGIN_EXECUTION_DONE, False
 
     @staticmethod
@@ -77,11 +81,40 @@ class UserDataPlugin(base.BasePlugin):
         with open(user_data_path, 'wb') as file:
             file.write(user_data)
 
+    def _get_ledger(self, service):
+        """Get the status store of the executed user data parts, if any.
+
+        Like the plugins status, it is kept per instance.
+        """
+        if not CONF.skip_executed_userdata_parts:
+            return None
+        instance_id = service.get_instance_id()
+        if instance_id is None:
+            return None
+        section = self._LEDGER_CONFIG_SECTION
+        if instance_id:
+            section = instance_id + "/" + section
+        return plugins_status.get_status_store(
+            osutils_factory.get_os_utils(), section)
+
+    def _get_part_hash(self, part):
+        """Get the ledger key of the given part, if it can be skipped.
+
+        The multipart and the part handler parts are processed every
+        time, since the parts after them depend on them.
+        """
+        content_type = part.get_content_type()
+        if (part.is_multipart() or
+                content_type == self._PART_HANDLER_CONTENT_TYPE):
+            return None
+        part_hash = hashlib.sha256(content_type.encode() + b"\0")
+        part_hash.update(part.get_body())
+        return part_hash.hexdigest()
+
     @staticmethod
     def _parse_mime(user_data):
-        user_data_str = encoding.get_as_string(user_data)
-        LOG.debug('User data content:\n%s', user_data_str)
-        return email.message_from_string(user_data_str).walk()
+        """Generate the parts of the user data, decoded when processed."""
+        return mime.walk(user_data)
 
     @staticmethod
     def _get_headers(user_data):
@@ -91,16 +124,16 @@ class UserDataPlugin(base.BasePlugin):
         :rtype: A string chunk containing the header or None.
         .. note :: In case the content type is not valid,
                    None will be returned.
+        .. note :: Only the beginning of the user data is searched.
         """
-        content = encoding.get_as_string(user_data)
-        if content:
-            return content.split("\n\n")[0]
+        if user_data:
+            return encoding.get_as_string(mime.get_header_block(user_data))
         else:
             raise exception.CloudbaseInitException("No header could be found."
                                                    "The user data content is "
                                                    "either invalid or empty.")
 
-    def _process_user_data(self, user_data):
+    def _process_user_data(self, user_data, ledger=None):
         plugin_status = base.PLUGIN_EXECUTION_DONE
         reboot = False
         headers = self._get_headers(user_data)
@@ -109,12 +142,40 @@ class UserDataPlugin(base.BasePlugin):
             user_data_plugins = factory.load_plugins()
             user_handlers = {}
 
-            for part in self._parse_mime(user_data):
-                (plugin_status, reboot) = self._process_part(part,
-                                                             user_data_plugins,
-                                                             user_handlers)
-                if reboot:
-                    break
+            # The statuses are recorded after the parts are processed, so
+            # that identical parts are only skipped based on the previous
+            # executions. None marks the parts whose processing failed.
+            part_statuses = {}
+            failed_parts = []
+            try:
+                for part in self._parse_mime(user_data):
+                    part_hash = None
+                    if ledger is not None:
+                        part_hash = self._get_part_hash(part)
+                    if part_hash and (ledger.get_status(part_hash) ==
+                                      base.PLUGIN_EXECUTION_DONE):
+                        LOG.info("Skipping the already executed userdata "
+                                 "part: %(content_type)s, %(filename)s",
+                                 {'content_type': part.get_content_type(),
+                                  'filename': part.get_filename()})
+                        continue
+
+                    (plugin_status, reboot) = self._process_part(
+                        part, user_data_plugins, user_handlers, failed_parts)
+                    # An identical part not done yet keeps its status.
+                    if part_hash and part_statuses.get(
+                            part_hash, base.PLUGIN_EXECUTION_DONE) == (
+                                base.PLUGIN_EXECUTION_DONE):
+                        part_statuses[part_hash] = (
+                            None if part in failed_parts else plugin_status)
+                    if reboot:
+                        break
+            finally:
+                if ledger is not None:
+                    for part_hash, status in part_statuses.items():
+                        if status is not None:
+                            ledger.set_status(part_hash, status)
+                    ledger.flush()
 
             if not reboot:
                 for handler_func in list(set(user_handlers.values())):
@@ -124,7 +185,13 @@ class UserDataPlugin(base.BasePlugin):
         else:
             return self._process_non_multi_part(user_data)
 
-    def _process_part(self, part, user_data_plugins, user_handlers):
+    def _process_part(self, part, user_data_plugins, user_handlers,
+                      failed_parts=None):
+        """Process the given part, returning its plugin status.
+
+        The exceptions are logged and the parts which raised them are
+        appended to `failed_parts`, if given.
+        """
         ret_val = None
         try:
             content_type = part.get_content_type()
@@ -157,6 +224,8 @@ class UserDataPlugin(base.BasePlugin):
                       {'content_type': part.get_content_type(),
                        'filename': part.get_filename()})
             LOG.exception(ex)
+            if failed_parts is not None:
+                failed_parts.append(part)
 
         return execcmd.get_plugin_return_value(ret_val)
 
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 from cloudbaseinit.utils import classloader
 
 
@@ -31,7 +33,17 @@ PLUGINS = {
 }
 
 
+_PLUGINS = None
+_PLUGINS_LOCK = threading.Lock()
+
+
 def load_plugins():
-    loader = classloader.ClassLoader()
-    return {section: loader.load_class(class_path)().process
-            for section, class_path in PLUGINS.items()}
+    """Get the cloud-config plugins, instantiated once per process."""
+    global _PLUGINS
+    with _PLUGINS_LOCK:
+        if _PLUGINS is None:
+            loader = classloader.ClassLoader()
+            _PLUGINS = {section: loader.load_class(class_path)()
+                        for section, class_path in PLUGINS.items()}
+        return {section: plugin.process
+                for section, plugin in _PLUGINS.items()}
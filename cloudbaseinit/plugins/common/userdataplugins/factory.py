@@ -12,16 +12,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.utils import classloader
 
 CONF = cloudbaseinit_conf.CONF
 
+# The loaded plugins, by the tuple of class paths they were loaded from.
+_PLUGINS = {}
+_PLUGINS_LOCK = threading.Lock()
+
 
 def load_plugins():
-    plugins = {}
-    cl = classloader.ClassLoader()
-    for class_path in CONF.user_data_plugins:
-        plugin = cl.load_class(class_path)()
-        plugins[plugin.get_mime_type()] = plugin
-    return plugins
+    """Get the user data plugins, by MIME type.
+
+    The plugins are instantiated once per process.
+    """
+    class_paths = tuple(CONF.user_data_plugins)
+    with _PLUGINS_LOCK:
+        if class_paths not in _PLUGINS:
+            plugins = {}
+            cl = classloader.ClassLoader()
+            for class_path in class_paths:
+                plugin = cl.load_class(class_path)()
+                plugins[plugin.get_mime_type()] = plugin
+            _PLUGINS[class_paths] = plugins
+        return dict(_PLUGINS[class_paths])
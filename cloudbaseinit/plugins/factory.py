@@ -12,9 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 from oslo_log import log as oslo_logging
 
 from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.plugins.common import base
 from cloudbaseinit.utils import classloader
 
 
@@ -53,23 +56,106 @@ OLD_PLUGINS = {
 }
 
 
+# The execution stage of the bundled plugins which are not executed in
+# the main stage, as declared by their `execution_stage` attribute.
+# This way, only the modules of the plugins executed in a stage are
+# imported. The other plugins are imported in order to find out their
+# execution stage.
+PLUGIN_STAGES = {
+    'cloudbaseinit.plugins.common.mtu.MTUPlugin':
+    base.PLUGIN_STAGE_PRE_METADATA_DISCOVERY,
+
+    'cloudbaseinit.plugins.common.ntpclient.NTPClientPlugin':
+    base.PLUGIN_STAGE_PRE_NETWORKING,
+
+    'cloudbaseinit.plugins.windows.ntpclient.NTPClientPlugin':
+    base.PLUGIN_STAGE_PRE_NETWORKING,
+}
+BUNDLED_PLUGINS_PREFIX = 'cloudbaseinit.plugins.'
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_plugin_stage(class_path):
+    """Get the execution stage of a plugin, without importing it.
+
+    None is returned if the stage cannot be known in advance.
+    """
+    if class_path in PLUGIN_STAGES:
+        return PLUGIN_STAGES[class_path]
+    if class_path.startswith(BUNDLED_PLUGINS_PREFIX):
+        return base.PLUGIN_STAGE_MAIN
+
+
+def _get_class_path(class_path):
+    if class_path in OLD_PLUGINS:
+        new_class_path = OLD_PLUGINS[class_path]
+        LOG.warn("Old plugin module %r was found. The new name is %r. "
+                 "The old name will not be supported starting with "
+                 "cloudbaseinit 1.0", class_path, new_class_path)
+        class_path = new_class_path
+    return class_path
+
+
+class PluginRegistry(object):
+
+    """Load the configured plugins, once per process.
+
+    The plugin classes and instances are cached, so each plugin module
+    is imported only when a stage needing it is loaded and each plugin
+    is instantiated only once.
+    """
+
+    def __init__(self):
+        self._classloader = classloader.ClassLoader()
+        self._classes = {}
+        self._plugins = {}
+        self._lock = threading.Lock()
+
+    def _load_class(self, class_path):
+        plugin_cls = self._classes.get(class_path)
+        if plugin_cls is None:
+            plugin_cls = self._classloader.load_class(class_path)
+            self._classes[class_path] = plugin_cls
+        return plugin_cls
+
+    def _get_plugin(self, class_path):
+        plugin = self._plugins.get(class_path)
+        if plugin is None:
+            plugin = self._load_class(class_path)()
+            self._plugins[class_path] = plugin
+        return plugin
+
+    def get_plugins(self, stage):
+        """Get the plugins of the given stage, or all of them if None."""
+        plugins = []
+        with self._lock:
+            for class_path in CONF.plugins:
+                class_path = _get_class_path(class_path)
+                known_stage = get_plugin_stage(class_path)
+                if stage and known_stage and known_stage != stage:
+                    continue
+
+                try:
+                    plugin_cls = self._load_class(class_path)
+                except ImportError:
+                    LOG.error("Could not import plugin module %r",
+                              class_path)
+                    continue
+
+                if not stage or plugin_cls.execution_stage == stage:
+                    plugins.append(self._get_plugin(class_path))
+        return plugins
+
+
+def get_plugin_registry():
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = PluginRegistry()
+        return _REGISTRY
+
+
 def load_plugins(stage):
-    plugins = []
-    cl = classloader.ClassLoader()
-    for class_path in CONF.plugins:
-        if class_path in OLD_PLUGINS:
-            new_class_path = OLD_PLUGINS[class_path]
-            LOG.warn("Old plugin module %r was found. The new name is %r. "
-                     "The old name will not be supported starting with "
-                     "cloudbaseinit 1.0", class_path, new_class_path)
-            class_path = new_class_path
-
-        try:
-            plugin_cls = cl.load_class(class_path)
-            if not stage or plugin_cls.execution_stage == stage:
-                plugin = plugin_cls()
-                plugins.append(plugin)
-        except ImportError:
-            LOG.error("Could not import plugin module %r", class_path)
-            continue
-    return plugins
+    return get_plugin_registry().get_plugins(stage)
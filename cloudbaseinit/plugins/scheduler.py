@@ -0,0 +1,127 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from oslo_log import log as oslo_logging
+from six.moves import queue
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.utils import tracing
+
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+
+def _conflicts(plugin, previous_plugin):
+    if plugin.requires is None or previous_plugin.requires is None:
+        return True
+
+    requires = set(plugin.requires)
+    provides = set(plugin.provides or ())
+    previous_requires = set(previous_plugin.requires)
+    previous_provides = set(previous_plugin.provides or ())
+    return bool(previous_provides & (requires | provides) or
+                previous_requires & provides)
+
+
+def get_dependencies(plugins):
+    """Get the plugins each plugin must wait for before being executed.
+
+    A plugin depends on a previous one, in the given order, if the
+    latter provides a resource which is required or provided by the
+    former, or if it requires a resource provided by the former.
+    Plugins which don't declare their requirements depend on all the
+    previous plugins and all the next plugins depend on them.
+
+    :returns: a list with the set of dependency indexes for each plugin.
+    """
+    dependencies = []
+    for index, plugin in enumerate(plugins):
+        dependencies.append(set(
+            previous_index for previous_index in range(index)
+            if _conflicts(plugin, plugins[previous_index])))
+    return dependencies
+
+
+class PluginScheduler(object):
+
+    """Execute independent plugins concurrently.
+
+    The plugins are started in the given order, as soon as all the
+    plugins they depend on finished and a worker is available.
+    After a plugin requests a reboot, no other plugin is started
+    if reboots are allowed, but the running ones are waited for.
+    """
+
+    def __init__(self, plugins, max_workers):
+        self._plugins = plugins
+        self._max_workers = max(max_workers, 1)
+        self._dependencies = get_dependencies(plugins)
+
+    def _run_plugin(self, index, exec_plugin, results):
+        success, reboot_required = False, None
+        try:
+            success, reboot_required = exec_plugin(self._plugins[index])
+        except Exception as ex:
+            LOG.exception(ex)
+        finally:
+            results.put((index, success, reboot_required))
+
+    def execute(self, exec_plugin):
+        """Execute the plugins using the given callable.
+
+        :param exec_plugin:
+            A callable receiving a plugin and returning a tuple with
+            the execution success and whether a reboot is required.
+        :returns: a tuple with the stage success and whether a reboot
+            is required.
+        """
+        results = queue.Queue()
+        pending = list(range(len(self._plugins)))
+        finished = set()
+        running = 0
+        stage_success = True
+        reboot_required = False
+
+        while pending or running:
+            if not (reboot_required and CONF.allow_reboot):
+                for index in list(pending):
+                    if running >= self._max_workers:
+                        break
+                    if self._dependencies[index] <= finished:
+                        pending.remove(index)
+                        thread = threading.Thread(
+                            target=self._run_plugin,
+                            args=(index, exec_plugin, results))
+                        thread.daemon = True
+                        thread.start()
+                        running += 1
+
+            if not running:
+                break
+
+            index, success, plugin_reboot_required = results.get()
+            running -= 1
+            finished.add(index)
+            if not success:
+                stage_success = False
+            if plugin_reboot_required:
+                reboot_required = True
+                if CONF.allow_reboot:
+                    tracing.instant("reboot_required", "reboot",
+                                    plugin=self._plugins[index].get_name())
+
+        return stage_success, reboot_required
@@ -0,0 +1,151 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+import json
+import os
+import threading
+
+from oslo_log import log as oslo_logging
+import six
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.osutils import base as osutils_base
+from cloudbaseinit.utils import classloader
+from cloudbaseinit.utils import fileutils
+
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+if os.name == "nt":
+    DEFAULT_STATUS_FILE_PATH = (
+        "%SYSTEMDRIVE%\\CloudbaseInit\\plugins_status.json")
+else:
+    DEFAULT_STATUS_FILE_PATH = "/var/lib/cloudbase-init/plugins_status.json"
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseStatusStore(object):
+
+    """Contract class for the plugins execution status stores.
+
+    The whole section is loaded once, at the first access, and kept in
+    memory. The changed statuses are saved together, when flushing.
+    """
+
+    def __init__(self, osutils, section):
+        self._osutils = osutils
+        self._section = section
+        self._statuses = None
+        self._changes = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _load(self):
+        """Return a dict with the statuses saved in the current section."""
+
+    @abc.abstractmethod
+    def _save(self, changes):
+        """Save the given statuses in the current section."""
+
+    def _get_statuses(self):
+        if self._statuses is None:
+            self._statuses = self._load()
+        return self._statuses
+
+    def get_status(self, plugin_name):
+        with self._lock:
+            return self._get_statuses().get(plugin_name)
+
+    def set_status(self, plugin_name, status):
+        with self._lock:
+            self._get_statuses()[plugin_name] = status
+            self._changes[plugin_name] = status
+
+    def flush(self):
+        with self._lock:
+            if not self._changes:
+                return
+            LOG.debug("Saving the status of the plugins: %s",
+                      ", ".join(sorted(self._changes)))
+            self._save(self._changes)
+            self._changes = {}
+
+
+class RegistryStatusStore(BaseStatusStore):
+
+    """Store the statuses as OS config values (the registry on Windows)."""
+
+    def _load(self):
+        return self._osutils.get_config_values(self._section)
+
+    def _save(self, changes):
+        self._osutils.set_config_values(changes, self._section)
+
+
+class JSONFileStatusStore(BaseStatusStore):
+
+    """Store the statuses of all the sections in a JSON file.
+
+    The file is replaced as a whole, so it is never left partially written.
+    """
+
+    def __init__(self, osutils, section):
+        super(JSONFileStatusStore, self).__init__(osutils, section)
+        self._path = os.path.abspath(os.path.expandvars(
+            CONF.plugins_status_file_path or DEFAULT_STATUS_FILE_PATH))
+
+    def _read_file(self):
+        if not os.path.exists(self._path):
+            return {}
+        with open(self._path) as stream:
+            return json.load(stream)
+
+    def _load(self):
+        return self._read_file().get(self._section, {})
+
+    def _save(self, changes):
+        content = self._read_file()
+        content.setdefault(self._section, {}).update(changes)
+
+        base_dir = os.path.dirname(self._path)
+        if not os.path.exists(base_dir):
+            os.makedirs(base_dir)
+
+        fileutils.write_file_atomically(
+            self._path, json.dumps(content, indent=2, sort_keys=True))
+
+
+def _has_config_values(osutils):
+    # The OS utils without config values keep the base implementation,
+    # which raises NotImplementedError.
+    return (getattr(type(osutils), "get_config_values", None) is not
+            osutils_base.BaseOSUtils.get_config_values)
+
+
+def get_status_store(osutils, section):
+    """Get the plugins status store for the given section.
+
+    If no store is configured, the OS config values are used when the
+    given OS utils support them, a JSON file otherwise.
+    """
+    if CONF.plugins_status_store:
+        store_cls = classloader.ClassLoader().load_class(
+            CONF.plugins_status_store)
+    elif _has_config_values(osutils):
+        store_cls = RegistryStatusStore
+    else:
+        store_cls = JSONFileStatusStore
+    return store_cls(osutils, section)
@@ -14,12 +14,16 @@
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 from cloudbaseinit.utils.windows.storage import factory as storage_factory
 
 CONF = cloudbaseinit_conf.CONF
 
 
 class ExtendVolumesPlugin(base.BasePlugin):
+    requires = ()
+    provides = (constants.STORAGE, )
+
     def _get_volumes_to_extend(self):
         if CONF.volumes_to_extend is not None:
             return list(map(int, CONF.volumes_to_extend))
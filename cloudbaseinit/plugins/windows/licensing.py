@@ -18,6 +18,7 @@ from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import constant
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 from cloudbaseinit.utils.windows import licensing
 
 CONF = cloudbaseinit_conf.CONF
@@ -25,6 +26,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class WindowsLicensingPlugin(base.BasePlugin):
+    requires = (constants.NETWORK_CONFIGURED, )
+    provides = ()
 
     def _set_product_key(self, service, manager):
         if not CONF.set_kms_product_key and not CONF.set_avma_product_key:
@@ -20,12 +20,15 @@ from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 
 class PageFilesPlugin(base.BasePlugin):
+    requires = ()
+    provides = (constants.STORAGE, )
 
     def _get_page_file_volumes_by_mount_point(self, osutils):
         page_file_volume_paths = []
@@ -23,6 +23,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class RDPSettingsPlugin(base.BasePlugin):
+    requires = ()
+    provides = ()
 
     def execute(self, service, shared_data):
         LOG.info("Setting RDP KeepAlive: %s", CONF.rdp_set_keepalive)
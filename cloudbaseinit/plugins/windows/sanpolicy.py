@@ -17,6 +17,7 @@ from oslo_log import log as oslo_logging
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import constant
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 from cloudbaseinit.utils.windows.storage import base as storage_base
 from cloudbaseinit.utils.windows.storage import factory as storage_factory
 
@@ -25,6 +26,8 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class SANPolicyPlugin(base.BasePlugin):
+    requires = ()
+    provides = (constants.STORAGE, )
 
     def execute(self, service, shared_data):
         san_policy_map = {
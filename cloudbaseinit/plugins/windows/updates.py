@@ -23,6 +23,9 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class WindowsAutoUpdatesPlugin(base.BasePlugin):
+    requires = ()
+    provides = ()
+
     def execute(self, service, shared_data):
         enable_updates = service.get_enable_automatic_updates()
 
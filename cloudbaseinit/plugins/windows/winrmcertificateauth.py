@@ -29,6 +29,9 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class ConfigWinRMCertificateAuthPlugin(base.BasePlugin):
+    requires = (constants.SHARED_DATA_USERNAME, constants.SHARED_DATA_PASSWORD,
+                constants.WINRM_LISTENER)
+    provides = (constants.SHARED_DATA_PASSWORD, )
 
     @staticmethod
     def _get_credentials(service, shared_data):
@@ -19,6 +19,7 @@ from oslo_log import log as oslo_logging
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
+from cloudbaseinit.plugins.common import constants
 from cloudbaseinit.utils.windows import security
 from cloudbaseinit.utils.windows import winrmconfig
 from cloudbaseinit.utils.windows import x509
@@ -31,6 +32,8 @@ LOG = oslo_logging.getLogger(__name__)
 class ConfigWinRMListenerPlugin(base.BasePlugin):
     _cert_subject = "CN=Cloudbase-Init WinRM"
     _winrm_service_name = "WinRM"
+    requires = ()
+    provides = (constants.WINRM_LISTENER, )
 
     def _check_winrm_service(self, osutils):
         if not osutils.check_service_exists(self._winrm_service_name):
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from cloudbaseinit.osutils import base
+
 
 class FakeComError(Exception):
 
@@ -25,3 +27,85 @@ class FakeError(Exception):
     def __init__(self, msg="Fake error."):
         super(FakeError, self).__init__(msg)
         self.winerror = None
+
+
+class FakeOSUtils(base.BaseOSUtils):
+
+    """In-memory OS utils, recording the calls which change the system.
+
+    Used for running the plugins without touching the host, e.g. in
+    the boot benchmarks.
+    """
+
+    def __init__(self, user_home=None, network_adapters=None):
+        self.calls = []
+        self.config_values = {}
+        self._user_home = user_home
+        self._network_adapters = network_adapters or []
+
+    def _record(self, name, *args):
+        self.calls.append((name, args))
+
+    def reboot(self):
+        self._record("reboot")
+
+    def user_exists(self, username):
+        return True
+
+    def execute_process(self, args, shell=True, decode_output=False):
+        self._record("execute_process", args)
+        return b"", b"", 0
+
+    def execute_powershell_script(self, script_path, sysnative=True):
+        self._record("execute_powershell_script", script_path)
+        return b"", b"", 0
+
+    def set_host_name(self, new_host_name):
+        self._record("set_host_name", new_host_name)
+        return False
+
+    def get_user_home(self, username):
+        return self._user_home
+
+    def get_network_adapters(self):
+        return list(self._network_adapters)
+
+    def set_static_network_config(self, *args, **kwargs):
+        self._record("set_static_network_config", *args)
+        return False
+
+    def set_config_value(self, name, value, section=None):
+        self.config_values.setdefault(section, {})[name] = value
+
+    def get_config_value(self, name, section=None):
+        return self.config_values.get(section, {}).get(name)
+
+    def set_config_values(self, values, section=None):
+        self.config_values.setdefault(section, {}).update(values)
+
+    def get_config_values(self, section=None):
+        return dict(self.config_values.get(section, {}))
+
+    def get_dhcp_hosts_in_use(self):
+        return []
+
+    def set_network_adapter_mtu(self, mac_address, mtu):
+        self._record("set_network_adapter_mtu", mac_address, mtu)
+
+    def check_os_version(self, major, minor, build=0):
+        return True
+
+    def is_real_time_clock_utc(self):
+        return True
+
+    def set_real_time_clock_utc(self, utc):
+        self._record("set_real_time_clock_utc", utc)
+
+    def set_ntp_client_config(self, ntp_hosts):
+        self._record("set_ntp_client_config", ntp_hosts)
+
+    def set_path_admin_acls(self, path):
+        self._record("set_path_admin_acls", path)
+
+    def take_path_ownership(self, path, username=None):
+        self._record("take_path_ownership", path, username)
@@ -14,8 +14,10 @@
 
 
 import importlib
+import io
 import itertools
 import os
+import struct
 import unittest
 
 try:
@@ -23,14 +25,57 @@ try:
 except ImportError:
     import mock
 
-from cloudbaseinit import conf as cloudbaseinit_conf
-from cloudbaseinit import exception
 from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import blockio
 
+_DEVICE_SIZE = 64 * 1024
 
-CONF = cloudbaseinit_conf.CONF
 
-OPEN = mock.mock_open()
+def _get_fat_head():
+    head = bytearray(_DEVICE_SIZE)
+    head[:11] = b"\xeb\x3c\x90mkfs.fat"
+    struct.pack_into("<HBHBHHBH", head, 11, 512, 1, 1, 2, 224, 2880, 0xF8,
+                     9)
+    head[510:512] = b"\x55\xaa"
+    return head
+
+
+class _RecordingStream(io.BytesIO):
+
+    def __init__(self, data, reads):
+        super(_RecordingStream, self).__init__(data)
+        self._reads = reads
+
+    def readinto(self, buffer):
+        self._reads.append((self.tell(), len(buffer)))
+        return super(_RecordingStream, self).readinto(buffer)
+
+
+class _FakeDevice(object):
+
+    """A disk with the given content, recording the accesses to it."""
+
+    fixed = True
+
+    def __init__(self, data, sector_size=512):
+        self._data = bytes(data)
+        self._sector_size = sector_size
+        self.size = len(self._data)
+        self.opens = 0
+        self.closed = True
+        self.reads = []
+
+    def open(self):
+        self.opens += 1
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def get_block_reader(self, window_size):
+        return blockio.FileBlockReader(
+            _RecordingStream(self._data, self.reads), self._sector_size,
+            window_size)
 
 
 class TestWindowsConfigDriveManager(unittest.TestCase):
@@ -50,14 +95,8 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
 
         self.conf_module.osutils_factory = mock.Mock()
         self.conf_module.disk.Disk = mock.MagicMock()
-        self.conf_module.tempfile = mock.Mock()
-        self.mock_gettempdir = self.conf_module.tempfile.gettempdir
-        self.mock_gettempdir.return_value = "tempdir"
-        self.conf_module.uuid = mock.Mock()
-        self.mock_uuid4 = self.conf_module.uuid.uuid4
-        self.mock_uuid4.return_value = "uuid"
         self._config_manager = self.conf_module.WindowsConfigDriveManager()
-        self.addCleanup(os.rmdir, self._config_manager.target_path)
+        self.addCleanup(self._config_manager.cleanup)
         self.osutils = mock.Mock()
         self._config_manager._osutils = self.osutils
         self.snatcher = testutils.LogSnatcher(module_path)
@@ -90,154 +129,207 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
     def test_check_for_config_drive_wrong_label(self):
         self._test_check_for_config_drive(label="config-3", fail=True)
 
-    def _test_get_iso_file_size(self, fixed=True, small=False,
-                                found_iso=True):
-        device = mock.Mock()
-        device.fixed = fixed
-        device.size = (self.conf_module.OFFSET_BLOCK_SIZE +
-                       self.conf_module.PEEK_SIZE + int(not small))
-        iso_id = self.conf_module.ISO_ID
-        if not found_iso:
-            iso_id = b"pwned"
-        iso_off = self.conf_module.OFFSET_ISO_ID - 1
-        volume_off = self.conf_module.OFFSET_VOLUME_SIZE - 1
-        block_off = self.conf_module.OFFSET_BLOCK_SIZE - 1
-        volume_bytes = b'd\x00'      # 100
-        block_bytes = b'\x00\x02'    # 512
-        device.seek.side_effect = [iso_off, volume_off, block_off]
-        device.read.side_effect = [iso_id, volume_bytes, block_bytes]
-
-        response = self._config_manager._get_iso_file_size(device)
-        if not fixed or small or not found_iso:
-            self.assertIsNone(response)
-            return
+    def _get_source(self, signatures=(), **device_attributes):
+        device = mock.Mock(**device_attributes)
+        return self.conf_module._BlockSource(device, mock.sentinel.stream,
+                                             set(signatures))
 
-        seek_calls = [
-            mock.call(self.conf_module.OFFSET_ISO_ID),
-            mock.call(self.conf_module.OFFSET_VOLUME_SIZE),
-            mock.call(self.conf_module.OFFSET_BLOCK_SIZE)]
-        read_calls = [
-            mock.call(len(iso_id),
-                      skip=self.conf_module.OFFSET_ISO_ID - iso_off),
-            mock.call(self.conf_module.PEEK_SIZE,
-                      skip=self.conf_module.OFFSET_VOLUME_SIZE - volume_off),
-            mock.call(self.conf_module.PEEK_SIZE,
-                      skip=self.conf_module.OFFSET_BLOCK_SIZE - block_off)]
-        device.seek.assert_has_calls(seek_calls)
-        device.read.assert_has_calls(read_calls)
-        self.assertEqual(100 * 512, response)
-
-    def test_get_iso_file_size_not_fixed(self):
-        self._test_get_iso_file_size(fixed=False)
-
-    def test_get_iso_file_size_small(self):
-        self._test_get_iso_file_size(small=True)
-
-    def test_get_iso_file_size_not_found(self):
-        self._test_get_iso_file_size(found_iso=False)
-
-    def test_get_iso_file_size(self):
-        self._test_get_iso_file_size()
-
-    @mock.patch("six.moves.builtins.open", new=OPEN)
-    def test_write_iso_file(self):
-        file_path = "fake\\path"
-        file_size = 100 * 512
-        sector_size = self.conf_module.MAX_SECTOR_SIZE
-        offsets = list(range(0, file_size, sector_size))
-        remain = file_size % sector_size
-        reads = ([b"\x00" * sector_size] *
-                 (len(offsets) - int(bool(remain))) +
-                 ([b"\x00" * remain] if remain else []))
+    def _test_probe(self, head, expected_signatures):
+        device = _FakeDevice(head)
 
+        with self.snatcher:
+            source = self._config_manager._probe(device)
+
+        self.assertEqual(device, source.device)
+        self.assertEqual(set(expected_signatures), source.signatures)
+        # The signatures are checked against the head read at once.
+        self.assertEqual(1, device.opens)
+        self.assertEqual([(0, self.conf_module.PROBE_SIZE)], device.reads)
+        self.assertFalse(device.closed)
+        self.assertEqual(
+            ["Signatures found on %(device)s: %(signatures)s" %
+             {"device": device, "signatures": sorted(expected_signatures)}],
+            self.snatcher.output)
+
+    def test_probe_iso(self):
+        head = bytearray(_DEVICE_SIZE)
+        head[32769:32774] = b"CD001"
+        self._test_probe(head, ["iso"])
+
+    def test_probe_vfat(self):
+        self._test_probe(_get_fat_head(), ["vfat"])
+
+    def test_probe_gpt(self):
+        head = bytearray(_DEVICE_SIZE)
+        head[510:512] = b"\x55\xaa"
+        head[512:520] = b"EFI PART"
+        self._test_probe(head, ["gpt", "mbr"])
+
+    def test_probe_mbr(self):
+        head = bytearray(_DEVICE_SIZE)
+        head[510:512] = b"\x55\xaa"
+        self._test_probe(head, ["mbr"])
+
+    def test_probe_unknown(self):
+        self._test_probe(bytearray(_DEVICE_SIZE), [])
+
+    def test_probe_fails(self):
         device = mock.Mock()
-        device_seek_calls = [mock.call(off) for off in offsets]
-        device_read_calls = [
-            mock.call(min(sector_size, file_size - off), skip=0)
-            for off in offsets]
-        stream_write_calls = [mock.call(read) for read in reads]
-        device.seek.side_effect = offsets
-        device.read.side_effect = reads
-
-        self._config_manager._write_iso_file(device, file_path, file_size)
-        device.seek.assert_has_calls(device_seek_calls)
-        device.read.assert_has_calls(device_read_calls)
-        OPEN.return_value.write.assert_has_calls(stream_write_calls)
-
-    def _test_extract_files_from_iso(self, exit_code):
-        fake_path = os.path.join('fake', 'path')
-        fake_target_path = os.path.join(fake_path, 'target')
-        self._config_manager.target_path = fake_target_path
-        args = [CONF.bsdtar_path, '-xf', fake_path, '-C', fake_target_path]
-
-        self.osutils.execute_process.return_value = ('fake out', 'fake err',
-                                                     exit_code)
-        if exit_code:
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._config_manager._extract_files_from_iso,
-                              fake_path)
-        else:
-            self._config_manager._extract_files_from_iso(fake_path)
-
-        self.osutils.execute_process.assert_called_once_with(args, False)
+        device.open.side_effect = Exception
 
-    def test_extract_files_from_iso(self):
-        self._test_extract_files_from_iso(exit_code=0)
+        with self.snatcher:
+            response = self._config_manager._probe(device)
 
-    def test_extract_files_from_iso_fail(self):
-        self._test_extract_files_from_iso(exit_code=1)
+        self.assertIsNone(response)
+        device.close.assert_called_once_with()
+        self.assertEqual(
+            ["Probing failed on %(device)s with %(error)r" %
+             {"device": device, "error": Exception()}],
+            self.snatcher.output)
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._extract_files_from_iso')
+                'WindowsConfigDriveManager._probe')
+    def test_get_disk_sources(self, mock_probe):
+        Disk = self.conf_module.disk.Disk
+        Disk.side_effect = lambda path: "disk_" + path
+        self.osutils.get_physical_disks.return_value = ["0", "1", "2"]
+        mock_probe.side_effect = ["source0", None, "source2"]
+
+        response = self._config_manager._get_disk_sources()
+        # The disks are probed only once.
+        self._config_manager._get_disk_sources()
+
+        self.assertEqual(["source0", "source2"], response)
+        self.osutils.get_physical_disks.assert_called_once_with()
+        self.assertEqual([mock.call("disk_0"), mock.call("disk_1"),
+                          mock.call("disk_2")], mock_probe.mock_calls)
+
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._write_iso_file')
+                'WindowsConfigDriveManager._probe')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._get_iso_file_size')
-    def _test_extract_iso_from_devices(self, mock_get_iso_file_size,
-                                       mock_write_iso_file,
-                                       mock_extract_files_from_iso,
-                                       found=True):
-        # For every device (mock) in the list of available devices:
-        #   first - skip (no size)
-        #   second - error (throws Exception)
-        #   third - extract (is ok)
-        #   fourth - unreachable (already found ok device)
-        size = 100 * 512
-        devices = [mock.MagicMock() for _ in range(4)]
-        devices[1].__enter__.side_effect = [Exception]
-        rest = [size] if found else [None]
-        mock_get_iso_file_size.side_effect = [None] + rest * 2
-        file_path = os.path.join("tempdir", "uuid.iso")
+                'WindowsConfigDriveManager._get_disk_sources')
+    def test_get_partition_sources(self, mock_get_disk_sources, mock_probe):
+        sources = [self._get_source(["mbr"]), self._get_source(["iso"]),
+                   self._get_source(["gpt", "mbr"]),
+                   self._get_source(["gpt"])]
+        sources[0].device.partitions.return_value = ["part0", "part1"]
+        sources[2].device.partitions.side_effect = Exception
+        sources[3].device.partitions.return_value = ["part3"]
+        mock_get_disk_sources.return_value = sources
+        mock_probe.side_effect = lambda device: "source_" + device
+
+        with self.snatcher:
+            response = self._config_manager._get_partition_sources()
+        self._config_manager._get_partition_sources()
+
+        self.assertEqual(["source_part0", "source_part1", "source_part3"],
+                         response)
+        self.assertFalse(sources[1].device.partitions.called)
+        sources[3].device.partitions.assert_called_once_with()
+        self.assertEqual(
+            ["Cannot get the partitions of %(device)s: %(error)r" %
+             {"device": sources[2].device, "error": Exception()}],
+            self.snatcher.output)
+
+    def test_close_sources(self):
+        disk_sources = [self._get_source(), self._get_source()]
+        partition_sources = [self._get_source()]
+        self._config_manager._disk_sources = disk_sources
+        self._config_manager._partition_sources = partition_sources
+        self._config_manager._volume_device = partition_sources[0].device
+
+        self._config_manager._close_sources()
+
+        for source in disk_sources:
+            source.device.close.assert_called_once_with()
+        self.assertFalse(partition_sources[0].device.close.called)
+        self.assertIsNone(self._config_manager._disk_sources)
+        self.assertIsNone(self._config_manager._partition_sources)
+
+    def _test_get_iso_reader(self, fixed=True, small=False):
+        mock_iso9660 = mock.patch.object(self.conf_module, 'iso9660').start()
+        self.addCleanup(mock.patch.stopall)
+        mock_volume_reader = mock_iso9660.ISO9660Reader
+        source = self._get_source(
+            ["iso"], fixed=fixed,
+            size=self.conf_module.MIN_ISO_SIZE - int(small))
+
+        response = self._config_manager._get_iso_reader(source)
+
+        if not fixed or small:
+            self.assertIsNone(response)
+            self.assertFalse(mock_volume_reader.called)
+            return
+
+        mock_volume_reader.assert_called_once_with(source.stream)
+        self.assertEqual(mock_volume_reader.return_value, response)
+
+    def test_get_iso_reader_not_fixed(self):
+        self._test_get_iso_reader(fixed=False)
+
+    def test_get_iso_reader_small(self):
+        self._test_get_iso_reader(small=True)
+
+    def test_get_iso_reader(self):
+        self._test_get_iso_reader()
+
+    @mock.patch('cloudbaseinit.utils.windows.vfat.get_vfat_reader')
+    def test_get_vfat_reader(self, mock_get_vfat_reader):
+        source = self._get_source(["vfat"])
+
+        response = self._config_manager._get_vfat_reader(source)
+
+        mock_get_vfat_reader.assert_called_once_with(source.stream)
+        self.assertEqual(mock_get_vfat_reader.return_value, response)
+
+    def _test_open_volume_from_sources(self, found=True):
+        # For every source in the list of probed sources:
+        #   first - skip (other signature)
+        #   second - skip (no volume)
+        #   third - error (throws Exception)
+        #   fourth - open (is ok)
+        #   fifth - unreachable (already found ok source)
+        volume_reader = mock.Mock()
+        volume_reader.filesystem = "ISO9660"
+        sources = ([self._get_source(["vfat"])] +
+                   [self._get_source(["iso", "mbr"]) for _ in range(4)])
+        rest = [volume_reader] if found else [None]
+        mock_get_reader = mock.Mock(
+            side_effect=[None, Exception] + rest * 2)
 
         with self.snatcher:
-            response = self._config_manager._extract_iso_from_devices(devices)
-        self.mock_gettempdir.assert_called_once_with()
-        mock_get_iso_file_size.assert_has_calls([
-            mock.call(devices[0]), mock.call(devices[2])])
+            response = self._config_manager._open_volume_from_sources(
+                sources, "iso", mock_get_reader)
+
         expected_log = [
-            "ISO extraction failed on %(device)s with %(error)r" %
-            {"device": devices[1], "error": Exception()}]
+            "Volume reading failed on %(device)s with %(error)r" %
+            {"device": sources[2].device, "error": Exception()}]
         if found:
-            mock_write_iso_file.assert_called_once_with(devices[2],
-                                                        file_path, size)
-            mock_extract_files_from_iso.assert_called_once_with(file_path)
-            expected_log.append("ISO9660 disk found on %s" % devices[2])
+            self.assertEqual([mock.call(source) for source in sources[1:4]],
+                             mock_get_reader.mock_calls)
+            expected_log.append("ISO9660 disk found on %s" %
+                                sources[3].device)
+            self.assertEqual(volume_reader, self._config_manager.volume_reader)
+
+            self._config_manager.cleanup()
+            sources[3].device.close.assert_called_once_with()
+        else:
+            self.assertEqual([mock.call(source) for source in sources[1:]],
+                             mock_get_reader.mock_calls)
+        self.assertIsNone(self._config_manager.volume_reader)
         self.assertEqual(expected_log, self.snatcher.output)
         self.assertEqual(found, response)
 
-    def test_extract_iso_from_devices_not_found(self):
-        self._test_extract_iso_from_devices(found=False)
+    def test_open_volume_from_sources_not_found(self):
+        self._test_open_volume_from_sources(found=False)
 
-    def test_extract_iso_from_devices(self):
-        self._test_extract_iso_from_devices()
+    def test_open_volume_from_sources(self):
+        self._test_open_volume_from_sources()
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager.'
                 '_check_for_config_drive')
-    @mock.patch('shutil.copytree')
-    @mock.patch('os.rmdir')
-    def _test_get_config_drive_from_cdrom_drive(self, mock_os_rmdir,
-                                                mock_copytree,
+    def _test_get_config_drive_from_cdrom_drive(self,
                                                 mock_check_for_config_drive,
                                                 found=True):
         drives = ["C:\\", "M:\\", "I:\\", "N:\\"]
@@ -254,10 +346,9 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         check_calls = [mock.call(drive) for drive in drives[:idx]]
         mock_check_for_config_drive.assert_has_calls(check_calls)
         if found:
-            mock_os_rmdir.assert_called_once_with(
-                self._config_manager.target_path)
-            mock_copytree.assert_called_once_with(
-                drives[2], self._config_manager.target_path)
+            self.assertEqual(drives[2], self._config_manager.metadata_path)
+        else:
+            self.assertIsNone(self._config_manager.metadata_path)
 
         self.assertEqual(found, response)
 
@@ -268,87 +359,46 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         self._test_get_config_drive_from_cdrom_drive()
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager.'
-                '_extract_iso_from_devices')
-    @mock.patch("six.moves.builtins.map")
-    def test_get_config_drive_from_raw_hdd(self, mock_map,
-                                           mock_extract_iso_from_devices):
-        Disk = self.conf_module.disk.Disk
-        paths = [mock.Mock() for _ in range(3)]
-        self.osutils.get_physical_disks.return_value = paths
-        mock_extract_iso_from_devices.return_value = True
-
-        response = self._config_manager._get_config_drive_from_raw_hdd()
-        mock_map.assert_called_once_with(Disk, paths)
-        self.osutils.get_physical_disks.assert_called_once_with()
-        mock_extract_iso_from_devices.assert_called_once_with(
-            mock_map.return_value)
-        self.assertTrue(response)
-
-    @mock.patch('cloudbaseinit.utils.windows.vfat.copy_from_vfat_drive')
-    @mock.patch('cloudbaseinit.utils.windows.vfat.is_vfat_drive')
-    def test_get_config_drive_from_vfat(self, mock_is_vfat_drive,
-                                        mock_copy_from_vfat_drive):
-        self.osutils.get_physical_disks.return_value = (
-            mock.sentinel.drive1,
-            mock.sentinel.drive2,
-        )
-        mock_is_vfat_drive.side_effect = (None, True)
-
-        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
-                                   'osconfigdrive.windows') as snatcher:
-            response = self._config_manager._get_config_drive_from_vfat()
-
-        self.assertTrue(response)
-        self.osutils.get_physical_disks.assert_called_once_with()
-
-        expected_is_vfat_calls = [
-            mock.call(self.osutils, mock.sentinel.drive1),
-            mock.call(self.osutils, mock.sentinel.drive2),
-        ]
-        self.assertEqual(expected_is_vfat_calls, mock_is_vfat_drive.mock_calls)
-        mock_copy_from_vfat_drive.assert_called_once_with(
-            self.osutils,
-            mock.sentinel.drive2,
-            self._config_manager.target_path)
-
-        expected_logging = [
-            'Config Drive found on disk %r' % mock.sentinel.drive2,
-        ]
-        self.assertEqual(expected_logging, snatcher.output)
-
+                'WindowsConfigDriveManager._open_volume_from_sources')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager.'
-                '_extract_iso_from_devices')
-    def _test_get_config_drive_from_partition(self,
-                                              mock_extract_iso_from_devices,
-                                              found=True):
-        paths = [mock.Mock() for _ in range(3)]
-        self.osutils.get_physical_disks.return_value = paths
-        disks = list(map(self.conf_module.disk.Disk, paths))
-        mock_extract_iso_from_devices.side_effect = [False, found, found]
-        idx = 3 - int(found)
-        extract_calls = [mock.call(disk.partitions())
-                         for disk in disks[:idx]]
-
-        response = self._config_manager._get_config_drive_from_partition()
-        self.osutils.get_physical_disks.assert_called_once_with()
-        mock_extract_iso_from_devices.assert_has_calls(extract_calls)
-        self.assertEqual(found, response)
-
-    def test_get_config_drive_from_partition_not_found(self):
-        self._test_get_config_drive_from_partition(found=False)
+                'WindowsConfigDriveManager._get_partition_sources')
+    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
+                'WindowsConfigDriveManager._get_disk_sources')
+    def _test_get_config_drive_from_sources(self, get_config_drive,
+                                            mock_get_disk_sources,
+                                            mock_get_partition_sources,
+                                            mock_open_volume_from_sources,
+                                            partitions=False,
+                                            signature="iso"):
+        response = get_config_drive()
+
+        sources = (mock_get_partition_sources if partitions else
+                   mock_get_disk_sources).return_value
+        get_reader = {"iso": self._config_manager._get_iso_reader,
+                      "vfat": self._config_manager._get_vfat_reader}
+        mock_open_volume_from_sources.assert_called_once_with(
+            sources, signature, get_reader[signature])
+        self.assertEqual(mock_open_volume_from_sources.return_value,
+                         response)
+
+    def test_get_config_drive_from_raw_hdd(self):
+        self._test_get_config_drive_from_sources(
+            self._config_manager._get_config_drive_from_raw_hdd)
+
+    def test_get_config_drive_from_vfat(self):
+        self._test_get_config_drive_from_sources(
+            self._config_manager._get_config_drive_from_vfat,
+            signature="vfat")
 
     def test_get_config_drive_from_partition(self):
-        self._test_get_config_drive_from_partition()
+        self._test_get_config_drive_from_sources(
+            self._config_manager._get_config_drive_from_partition,
+            partitions=True)
 
-    @mock.patch('os.rmdir')
-    @mock.patch('shutil.copytree')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager.'
                 '_check_for_config_drive')
     def _test_get_config_drive_from_volume(self, mock_check_for_config_drive,
-                                           mock_copytree, mock_os_rmdir,
                                            found=True):
         volumes = [mock.Mock() for _ in range(3)]
         self.osutils.get_volumes.return_value = volumes
@@ -361,10 +411,7 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         self.osutils.get_volumes.assert_called_once_with()
         mock_check_for_config_drive.assert_has_calls(check_calls)
         if found:
-            mock_os_rmdir.assert_called_once_with(
-                self._config_manager.target_path)
-            mock_copytree.assert_called_once_with(
-                volumes[1], self._config_manager.target_path)
+            self.assertEqual(volumes[1], self._config_manager.metadata_path)
         self.assertEqual(found, response)
 
     def test_get_config_drive_from_volume_not_found(self):
@@ -454,3 +501,75 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
 
     def test_get_config_drive_files(self):
         self._test_get_config_drive_files()
+
+    def test_get_config_drive_files_probes_once(self):
+        mock_iso_reader = mock.patch.object(
+            self.conf_module.iso9660, 'ISO9660Reader').start()
+        mock_get_vfat_reader = mock.patch.object(
+            self.conf_module.vfat, 'get_vfat_reader').start()
+        self.addCleanup(mock.patch.stopall)
+        mock_get_vfat_reader.return_value = None
+        iso_head = bytearray(_DEVICE_SIZE)
+        iso_head[32769:32774] = b"CD001"
+        mbr_head = bytearray(_DEVICE_SIZE)
+        mbr_head[510:512] = b"\x55\xaa"
+        disks = {"disk0": _FakeDevice(_get_fat_head()),
+                 "disk1": _FakeDevice(mbr_head),
+                 "disk2": _FakeDevice(bytearray(_DEVICE_SIZE))}
+        partitions = [_FakeDevice(bytearray(_DEVICE_SIZE)),
+                      _FakeDevice(iso_head)]
+        disks["disk1"].partitions = mock.Mock(return_value=partitions)
+        self.conf_module.disk.Disk.side_effect = disks.get
+        self.osutils.get_physical_disks.return_value = sorted(disks)
+        self.osutils.get_cdrom_drives.return_value = []
+        self.osutils.get_volumes.return_value = []
+
+        response = self._config_manager.get_config_drive_files(
+            ["vfat", "iso"], ["cdrom", "hdd", "partition"])
+
+        self.assertTrue(response)
+        self.osutils.get_physical_disks.assert_called_once_with()
+        devices = list(disks.values()) + partitions
+        for device in devices:
+            self.assertEqual(1, device.opens)
+            self.assertEqual(1, len(device.reads))
+        # Only the device with the config drive is kept open.
+        self.assertEqual([partitions[1]],
+                         [device for device in devices if not device.closed])
+        mock_get_vfat_reader.assert_called_once_with(mock.ANY)
+        self.assertEqual(mock_iso_reader.return_value,
+                         self._config_manager.volume_reader)
+
+    @mock.patch('six.moves.builtins.open', new_callable=mock.mock_open,
+                read_data=b"fake data")
+    def test_read_file(self, mock_open):
+        self._config_manager.metadata_path = "fake_path"
+
+        response = self._config_manager.read_file("openstack/latest/data")
+
+        mock_open.assert_called_once_with(
+            os.path.normpath(os.path.join("fake_path", "openstack", "latest",
+                                          "data")), "rb")
+        self.assertEqual(b"fake data", response)
+
+    def test_read_file_missing(self):
+        self._config_manager.metadata_path = "missing_path"
+        self.assertRaises(IOError, self._config_manager.read_file, "missing")
+
+    def test_read_file_volume(self):
+        volume_reader = mock.Mock()
+        self._config_manager.volume_reader = volume_reader
+
+        response = self._config_manager.read_file("fake/path")
+
+        volume_reader.read_file.assert_called_once_with("fake/path")
+        self.assertEqual(volume_reader.read_file.return_value, response)
+
+    def test_cleanup(self):
+        self._config_manager.metadata_path = "fake_path"
+        self._config_manager.volume_reader = mock.Mock()
+
+        self._config_manager.cleanup()
+
+        self.assertIsNone(self._config_manager.metadata_path)
+        self.assertIsNone(self._config_manager.volume_reader)
@@ -0,0 +1,234 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cloudbaseinit.metadata.services import azuremodel
+
+VERSIONS = b"""<?xml version="1.0" encoding="utf-8"?>
+<Versions>
+  <Preferred><Version>2015-04-05</Version></Preferred>
+  <Supported>
+    <Version>2015-04-05</Version>
+    <Version>2012-11-30</Version>
+  </Supported>
+</Versions>"""
+
+GOAL_STATE = b"""<?xml version="1.0" encoding="utf-8"?>
+<GoalState xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Version>2015-04-05</Version>
+  <Incarnation>2</Incarnation>
+  <Machine>
+    <ExpectedState>Started</ExpectedState>
+  </Machine>
+  <Container>
+    <ContainerId>fake-container-id</ContainerId>
+    <RoleInstanceList>
+      <RoleInstance>
+        <InstanceId>fake-instance-id</InstanceId>
+        <State>Started</State>
+        <Configuration>
+          <HostingEnvironmentConfig>http://host/env</HostingEnvironmentConfig>
+          <SharedConfig>http://host/shared</SharedConfig>
+          <ExtensionsConfig>http://host/extensions</ExtensionsConfig>
+          <FullConfig>http://host/full</FullConfig>
+          <Certificates>http://host/certificates</Certificates>
+        </Configuration>
+      </RoleInstance>
+    </RoleInstanceList>
+  </Container>
+</GoalState>"""
+
+HOSTING_ENVIRONMENT = b"""<?xml version="1.0" encoding="utf-8"?>
+<HostingEnvironmentConfig version="1.0.0.0" goalStateIncarnation="2">
+  <StoredCertificates>
+    <StoredCertificate name="Stored0" certificateId="sha1:ABC"
+                       storeName="My" configurationLevel="System" />
+    <StoredCertificate name="Stored1" certificateId="sha1:DEF"
+                       storeName="Root" configurationLevel="User" />
+  </StoredCertificates>
+</HostingEnvironmentConfig>"""
+
+SHARED_CONFIG = b"""<?xml version="1.0" encoding="utf-8"?>
+<SharedConfig version="1.0.0.0" goalStateIncarnation="2">
+  <Deployment name="fake-deployment" guid="{guid}" incarnation="0">
+    <Service name="fake-service" guid="{guid}" />
+  </Deployment>
+  <Incarnation number="1" instance="fake-role_IN_0" guid="{guid}" />
+  <Role guid="{guid}" name="fake-role" settleTimeSeconds="0" />
+</SharedConfig>"""
+
+EXTENSIONS_CONFIG = b"""<?xml version="1.0" encoding="utf-8"?>
+<Extensions version="1.0.0.0" goalStateIncarnation="2">
+  <Plugins>
+    <Plugin name="Fake.Extension" version="1.0" location="http://ext/1" />
+    <Plugin name="Other.Extension" version="2.1" location="http://ext/2" />
+  </Plugins>
+  <StatusUploadBlob statusBlobType="BlockBlob">http://blob</StatusUploadBlob>
+</Extensions>"""
+
+CERTIFICATES = b"""<?xml version="1.0" encoding="utf-8"?>
+<CertificateFile>
+  <Version>2012-11-30</Version>
+  <Format>Pkcs7BlobWithPfxContents</Format>
+  <Data>fake-data</Data>
+</CertificateFile>"""
+
+OVF_ENV = b"""<?xml version="1.0" encoding="utf-8"?>
+<Environment xmlns="http://schemas.dmtf.org/ovf/environment/1"
+             xmlns:wa="http://schemas.microsoft.com/windowsazure">
+  <wa:ProvisioningSection>
+    <wa:Version>1.0</wa:Version>
+    <WindowsProvisioningConfigurationSet
+        xmlns="http://schemas.microsoft.com/windowsazure">
+      <ConfigurationSetType>
+        WindowsProvisioningConfiguration
+      </ConfigurationSetType>
+      <ComputerName>fake-host</ComputerName>
+      <AdminPassword>fake-password</AdminPassword>
+      <AdminUsername>fake-user</AdminUsername>
+      <EnableAutomaticUpdates>True</EnableAutomaticUpdates>
+      <WinRM>
+        <Listeners>
+          <Listener><Protocol>Http</Protocol></Listener>
+          <Listener>
+            <Protocol>Https</Protocol>
+            <CertificateThumbprint>fake-thumbprint</CertificateThumbprint>
+          </Listener>
+        </Listeners>
+      </WinRM>
+      <CustomData>ZmFrZQ==</CustomData>
+    </WindowsProvisioningConfigurationSet>
+  </wa:ProvisioningSection>
+  <wa:PlatformSettingsSection>
+    <wa:Version>1.0</wa:Version>
+    <PlatformSettings xmlns="http://schemas.microsoft.com/windowsazure">
+      <KmsServerHostname>kms.fake</KmsServerHostname>
+      <ProvisionGuestAgent>true</ProvisionGuestAgent>
+      <GuestAgentPackageName>fake-package.zip</GuestAgentPackageName>
+      <UseAVMA>false</UseAVMA>
+    </PlatformSettings>
+  </wa:PlatformSettingsSection>
+</Environment>"""
+
+OVF_ENV_MINIMAL = b"""<?xml version="1.0" encoding="utf-8"?>
+<Environment xmlns:wa="http://schemas.microsoft.com/windowsazure">
+  <wa:ProvisioningSection>
+    <WindowsProvisioningConfigurationSet>
+      <ComputerName>fake-host</ComputerName>
+    </WindowsProvisioningConfigurationSet>
+  </wa:ProvisioningSection>
+  <wa:PlatformSettingsSection><PlatformSettings /></wa:PlatformSettingsSection>
+</Environment>"""
+
+
+class AzureModelTest(unittest.TestCase):
+
+    def test_iterparse(self):
+        response = [(path, element.text) for path, element in
+                    azuremodel._iterparse(u"<a><b>1</b><b>2</b><c/></a>")]
+        self.assertEqual(
+            [("a/b", "1"), ("a/b", "2"), ("a/c", None), ("a", None)],
+            response)
+
+    def test_iterparse_releases_elements(self):
+        for path, element in azuremodel._iterparse(
+                b"<a><b><c/></b><b><c/></b></a>"):
+            # The processed elements are not kept in the tree.
+            self.assertLessEqual(len(element), 1)
+
+    def test_parse_versions(self):
+        self.assertEqual(["2015-04-05", "2012-11-30"],
+                         azuremodel.parse_versions(VERSIONS))
+
+    def test_parse_goal_state(self):
+        response = azuremodel.parse_goal_state(GOAL_STATE)
+        self.assertEqual(azuremodel.GoalState(
+            incarnation="2", expected_state="Started",
+            container_id="fake-container-id",
+            role_instance_id="fake-instance-id",
+            role_instance_config=azuremodel.RoleInstanceConfig(
+                hosting_environment_config="http://host/env",
+                shared_config="http://host/shared",
+                extensions_config="http://host/extensions",
+                full_config="http://host/full",
+                certificates="http://host/certificates")), response)
+
+    def test_parse_goal_state_no_certificates(self):
+        response = azuremodel.parse_goal_state(
+            GOAL_STATE.replace(b"<Certificates>http://host/certificates"
+                               b"</Certificates>", b""))
+        self.assertIsNone(response.role_instance_config.certificates)
+
+    def test_parse_hosting_environment(self):
+        self.assertEqual(
+            [azuremodel.StoredCertificate(
+                store_name="My", configuration_level="System",
+                certificate_id="sha1:ABC", name="Stored0"),
+             azuremodel.StoredCertificate(
+                store_name="Root", configuration_level="User",
+                certificate_id="sha1:DEF", name="Stored1")],
+            azuremodel.parse_hosting_environment(HOSTING_ENVIRONMENT))
+
+    def test_parse_shared_config(self):
+        self.assertEqual(
+            azuremodel.SharedConfig(deployment_name="fake-deployment",
+                                    role_name="fake-role"),
+            azuremodel.parse_shared_config(SHARED_CONFIG))
+
+    def test_parse_extensions_config(self):
+        response = azuremodel.parse_extensions_config(EXTENSIONS_CONFIG)
+        self.assertEqual(
+            [azuremodel.ExtensionPlugin(name="Fake.Extension", version="1.0",
+                                        location="http://ext/1"),
+             azuremodel.ExtensionPlugin(name="Other.Extension",
+                                        version="2.1",
+                                        location="http://ext/2")],
+            response.plugins)
+        self.assertEqual("http://blob", response.status_upload_blob)
+
+    def test_parse_certificates(self):
+        self.assertEqual(
+            azuremodel.CertificateFile(data="fake-data",
+                                       format="Pkcs7BlobWithPfxContents"),
+            azuremodel.parse_certificates(CERTIFICATES))
+
+    def test_parse_ovf_env(self):
+        self.assertEqual(azuremodel.OvfEnv(
+            admin_username="fake-user", admin_password="fake-password",
+            computer_name="fake-host", enable_automatic_updates=True,
+            has_custom_data=True,
+            winrm_listeners=[
+                {"protocol": "Http"},
+                {"protocol": "Https",
+                 "certificate_thumbprint": "fake-thumbprint"}],
+            provision_guest_agent=True,
+            guest_agent_package_name="fake-package.zip",
+            kms_server_hostname="kms.fake", use_avma=False),
+            azuremodel.parse_ovf_env(OVF_ENV))
+
+    def test_parse_ovf_env_minimal(self):
+        self.assertEqual(azuremodel.OvfEnv(
+            computer_name="fake-host", enable_automatic_updates=False,
+            has_custom_data=False, winrm_listeners=[],
+            provision_guest_agent=False, use_avma=False),
+            azuremodel.parse_ovf_env(OVF_ENV_MINIMAL))
+
+    def test_record(self):
+        record = azuremodel.CertificateFile(data="fake-data")
+        self.assertIsNone(record.format)
+        self.assertNotEqual(azuremodel.CertificateFile(), record)
+        self.assertEqual("CertificateFile(data='fake-data', format=None)",
+                         repr(record))
+        self.assertRaises(AttributeError, setattr, record, "other", None)
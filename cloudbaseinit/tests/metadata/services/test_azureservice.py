@@ -14,6 +14,7 @@
 
 import importlib
 import os
+import threading
 import unittest
 try:
     import unittest.mock as mock
@@ -34,15 +35,13 @@ class AzureServiceTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
     def setUp(self, mock_osutils):
         self._mock_osutils = mock_osutils
-        self._mock_untangle = mock.MagicMock()
         self._mock_ctypes = mock.MagicMock()
         self._mock_wintypes = mock.MagicMock()
         self._moves_mock = mock.MagicMock()
 
         self._module_patcher = mock.patch.dict(
             'sys.modules',
-            {'untangle': self._mock_untangle,
-             'ctypes': self._mock_ctypes,
+            {'ctypes': self._mock_ctypes,
              'ctypes.wintypes': self._mock_wintypes,
              'six.moves': self._moves_mock
              })
@@ -50,6 +49,8 @@ class AzureServiceTest(unittest.TestCase):
         self._azureservice_module = importlib.import_module(
             'cloudbaseinit.metadata.services.azureservice')
 
+        self._azuremodel = self._azureservice_module.azuremodel
+
         self._azureservice = self._azureservice_module.AzureService()
         self._logsnatcher = testutils.LogSnatcher(
             'cloudbaseinit.metadata.services.azureservice')
@@ -88,7 +89,7 @@ class AzureServiceTest(unittest.TestCase):
     def _test_wire_server_request(self,
                                   mock_http_request, mock_base_url=None,
                                   path=None, data_xml=None, headers=None,
-                                  parse_xml=True):
+                                  parser=None):
         self._azureservice._base_url = mock_base_url
         if not mock_base_url:
             self.assertRaises(exception.CloudbaseInitException,
@@ -99,18 +100,18 @@ class AzureServiceTest(unittest.TestCase):
             expected_headers["Content-Type"] = "text/xml; charset=utf-8"
             expected_headers.update(headers)
             self._azureservice._wire_server_request(path, data_xml, headers,
-                                                    parse_xml)
-            mock_http_request.assert_called_once_with(path, data_xml,
-                                                      headers=expected_headers)
+                                                    parser)
+            mock_http_request.assert_called_once_with(
+                path, data_xml, headers=expected_headers, timeout=None)
             return
         mock_http_request.return_value = str(mock.sentinel.data)
         res = self._azureservice._wire_server_request(path, data_xml,
-                                                      headers, parse_xml)
+                                                      headers, parser)
         self.assertEqual(mock_http_request.call_count, 1)
 
-        if parse_xml:
-            self.assertEqual(self._mock_untangle.parse.call_count, 1)
-            self.assertEqual(res, self._mock_untangle.parse.return_value)
+        if parser:
+            parser.assert_called_once_with(str(mock.sentinel.data))
+            self.assertEqual(res, parser.return_value)
         else:
             self.assertEqual(res, str(mock.sentinel.data))
 
@@ -119,19 +120,33 @@ class AzureServiceTest(unittest.TestCase):
 
     def test_wire_server_request_url_set_no_parse(self):
         mock_base_url = "fake-url"
-        self._test_wire_server_request(mock_base_url=mock_base_url,
-                                       parse_xml=False)
+        self._test_wire_server_request(mock_base_url=mock_base_url)
 
     def test_wire_server_request_url_set_with_headers(self):
         mock_base_url = "fake-url"
         self._test_wire_server_request(mock_base_url=mock_base_url,
-                                       parse_xml=False,
                                        headers={"fake-header": "fake-value"},
                                        data_xml="fake-data")
 
     def test_wire_server_request_parse_xml(self):
         mock_base_url = "fake-url"
-        self._test_wire_server_request(mock_base_url=mock_base_url)
+        self._test_wire_server_request(mock_base_url=mock_base_url,
+                                       parser=mock.Mock())
+
+    @mock.patch(MODPATH + "._exec_with_retry")
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_wire_server_request_no_retry(self, mock_http_request,
+                                          mock_exec_with_retry):
+        self._azureservice._base_url = "fake-url"
+        res = self._azureservice._wire_server_request(
+            mock.sentinel.path, retry=False, timeout=mock.sentinel.timeout)
+
+        self.assertFalse(mock_exec_with_retry.called)
+        mock_http_request.assert_called_once_with(
+            mock.sentinel.path, None, headers=self._azureservice._headers,
+            timeout=mock.sentinel.timeout)
+        self.assertEqual(mock_http_request.return_value, res)
 
     def test_encode_xml(self):
         fake_root_xml = self._azureservice_module.ElementTree.Element(
@@ -173,85 +188,98 @@ class AzureServiceTest(unittest.TestCase):
                              mock_substatus,
                              mock_description))
 
+    def _get_goal_state(self, incarnation="1", expected_state=None):
+        return self._azuremodel.GoalState(
+            incarnation=incarnation,
+            expected_state=(expected_state or
+                            self._azureservice_module.GOAL_STATE_STARTED),
+            container_id=mock.sentinel.container_id,
+            role_instance_id=mock.sentinel.role_instance_id,
+            role_instance_config=self._azuremodel.RoleInstanceConfig(
+                hosting_environment_config=mock.sentinel.hosting_env_url,
+                shared_config=mock.sentinel.shared_config_url,
+                extensions_config=mock.sentinel.extensions_config_url,
+                full_config=mock.sentinel.full_config_url,
+                certificates=mock.sentinel.certificates_url))
+
+    @mock.patch(MODPATH + "._save_wire_server_state")
     @mock.patch(MODPATH + "._wire_server_request")
-    def _test_get_goal_state(self, mock_wire_server_request,
-                             goal_state=True, invalid_state=False):
-        mock_goalstate = mock.Mock()
-        mock_goalstate.GoalState = mock.Mock()
-        mock_goalstate.GoalState.Machine = mock.Mock()
-        mock_wire_server_request.return_value = mock_goalstate
-        if goal_state:
-            self._azureservice._goal_state = mock_goalstate
-        else:
-            self._azureservice._goal_state = False
-        if invalid_state:
-            mock_goalstate.GoalState.Machine.ExpectedState = \
-                not self._azureservice_module.GOAL_STATE_STARTED
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._azureservice._get_goal_state)
-        else:
-            if not goal_state:
-                mock_goalstate.GoalState.Machine.ExpectedState = \
-                    self._azureservice_module.GOAL_STATE_STARTED
-            else:
-                self._azureservice._goal_state.Machine.ExpectedState = \
-                    self._azureservice_module.GOAL_STATE_STARTED
-            res = self._azureservice._get_goal_state()
-            self.assertEqual(res, mock_goalstate.GoalState)
-
-        if not goal_state:
-            mock_wire_server_request.assert_called_once_with(
-                "machine?comp=goalstate")
+    def test_get_goal_state_exception(self, mock_wire_server_request,
+                                      mock_save_wire_server_state):
+        mock_wire_server_request.return_value = self._get_goal_state(
+            expected_state="Stopped")
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._azureservice._get_goal_state)
+
+    @mock.patch(MODPATH + "._save_wire_server_state")
+    @mock.patch(MODPATH + "._wire_server_request")
+    def test_get_goal_state(self, mock_wire_server_request,
+                            mock_save_wire_server_state):
+        goal_state = self._get_goal_state()
+        mock_wire_server_request.return_value = goal_state
 
-    def test_get_goal_state_exception(self):
-        self._test_get_goal_state(invalid_state=True)
+        self.assertEqual(goal_state, self._azureservice._get_goal_state())
+        self.assertEqual(goal_state, self._azureservice._get_goal_state())
+        mock_wire_server_request.assert_called_once_with(
+            "machine?comp=goalstate",
+            parser=self._azuremodel.parse_goal_state)
 
-    def test_get_goal_state(self):
-        self._test_get_goal_state(goal_state=False)
+    @mock.patch(MODPATH + "._save_wire_server_state")
+    @mock.patch(MODPATH + "._wire_server_request")
+    def test_get_goal_state_force_update(self, mock_wire_server_request,
+                                         mock_save_wire_server_state):
+        mock_wire_server_request.side_effect = [
+            self._get_goal_state(), self._get_goal_state(),
+            self._get_goal_state(incarnation="2")]
+        self._azureservice._get_goal_state()
+        self._azureservice._configs = {"url": mock.sentinel.config}
+
+        # The cached configs are dropped only if the incarnation changes.
+        self._azureservice._get_goal_state(force_update=True)
+        self.assertEqual({"url": mock.sentinel.config},
+                         self._azureservice._configs)
+        self._azureservice._get_goal_state(force_update=True)
+        self.assertEqual({}, self._azureservice._configs)
+        self.assertEqual(3, mock_wire_server_request.call_count)
+
+        # The incarnation is saved only when it changes.
+        mock_save_wire_server_state.assert_has_calls([
+            mock.call({"GoalStateIncarnation": "1"}),
+            mock.call({"GoalStateIncarnation": "2"})])
+        self.assertEqual(2, mock_save_wire_server_state.call_count)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_incarnation(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Incarnation.cdata = mock.sentinel.cdata
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_incarnation()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, "1")
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_container_id(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.ContainerId.cdata = mock.sentinel.cdata
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_container_id()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, mock.sentinel.container_id)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_role_instance_config(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_role = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.RoleInstanceList.RoleInstance = mock_role
-        mock_role.Configuration = mock.sentinel.config_role
+        goal_state = self._get_goal_state()
+        mock_get_goal_state.return_value = goal_state
 
         res = self._azureservice._get_role_instance_config()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.config_role)
+        self.assertEqual(res, goal_state.role_instance_config)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_role_instance_id(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_role = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.RoleInstanceList.RoleInstance = mock_role
-        mock_role.InstanceId.cdata = mock.sentinel.config_role
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_role_instance_id()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.config_role)
+        self.assertEqual(res, mock.sentinel.role_instance_id)
 
     @mock.patch(MODPATH + "._wire_server_request")
     @mock.patch(MODPATH + "._get_health_report_xml")
@@ -266,29 +294,74 @@ class AzureServiceTest(unittest.TestCase):
         mock_get_health_report_xml.assert_called_once_with(mock_state,
                                                            None, None)
         mock_wire_server_request.assert_called_once_with(
-            "machine?comp=health", mock.sentinel.report_xml, parse_xml=False)
+            "machine?comp=health", mock.sentinel.report_xml)
 
     @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_started(self, mock_post_health_status):
-        self._azureservice.provisioning_started()
+    def test_report_health_status_sync(self, mock_post_health_status):
+        with testutils.ConfPatcher("async_health_reports", False, "azure"):
+            self._azureservice._report_health_status(
+                mock.sentinel.state, mock.sentinel.sub_status)
         mock_post_health_status.assert_called_once_with(
+            mock.sentinel.state, mock.sentinel.sub_status, None)
+        self.assertIsNone(self._azureservice._health_reporter)
+
+    @mock.patch(MODPATH + "._post_health_status")
+    def test_report_health_status(self, mock_post_health_status):
+        self._azureservice._report_health_status(mock.sentinel.state)
+        self._azureservice._report_health_status(mock.sentinel.other_state)
+        self._azureservice._flush_health_reports()
+
+        mock_post_health_status.assert_called_with(
+            mock.sentinel.other_state, None, None)
+
+    def test_flush_health_reports_no_reporter(self):
+        self._azureservice._flush_health_reports()
+        self.assertIsNone(self._azureservice._health_reporter)
+
+    def test_flush_health_reports_timeout(self):
+        self._azureservice._health_reporter = mock.Mock()
+        self._azureservice._health_reporter.flush.return_value = False
+        with testutils.ConfPatcher("health_report_flush_timeout", 1.5,
+                                   "azure"):
+            with self._logsnatcher:
+                self._azureservice._flush_health_reports()
+        self._azureservice._health_reporter.flush.assert_called_once_with(1.5)
+        self.assertEqual(
+            ["The Azure health report was not posted in 1.5 seconds"],
+            self._logsnatcher.output)
+
+    @mock.patch(MODPATH + "._report_health_status")
+    def test_provisioning_started(self, mock_report_health_status):
+        self._azureservice.provisioning_started()
+        mock_report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_NOT_READY,
             self._azureservice_module.HEALTH_SUBSTATE_PROVISIONING,
             "Cloudbase-Init is preparing your computer for first use...")
 
-    @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_completed(self, mock_post_health_status):
+    @mock.patch(MODPATH + "._flush_health_reports")
+    @mock.patch(MODPATH + "._report_health_status")
+    def test_provisioning_completed(self, mock_report_health_status,
+                                    mock_flush_health_reports):
         self._azureservice.provisioning_completed()
-        mock_post_health_status.assert_called_once_with(
+        mock_report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_READY)
+        mock_flush_health_reports.assert_called_once_with()
 
-    @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_failed(self, mock_post_health_status):
+    @mock.patch(MODPATH + "._flush_health_reports")
+    @mock.patch(MODPATH + "._report_health_status")
+    def test_provisioning_failed(self, mock_report_health_status,
+                                 mock_flush_health_reports):
         self._azureservice.provisioning_failed()
-        mock_post_health_status.assert_called_once_with(
+        mock_report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_NOT_READY,
             self._azureservice_module.HEALTH_SUBSTATE_PROVISIONING_FAILED,
             "Provisioning failed")
+        mock_flush_health_reports.assert_called_once_with()
+
+    @mock.patch(MODPATH + "._flush_health_reports")
+    def test_cleanup(self, mock_flush_health_reports):
+        self._azureservice.cleanup()
+        mock_flush_health_reports.assert_called_once_with()
 
     @mock.patch(MODPATH + "._wire_server_request")
     @mock.patch(MODPATH + "._get_role_properties_xml")
@@ -302,7 +375,7 @@ class AzureServiceTest(unittest.TestCase):
         self.assertEqual(self._logsnatcher.output, expected_logging)
         mock_get_role_properties_xml.assert_called_once_with(mock_properties)
         mock_wire_server_request.assert_called_once_with(
-            "machine?comp=roleProperties", mock_properties, parse_xml=False)
+            "machine?comp=roleProperties", mock_properties)
 
     def test_can_post_rdp_cert_thumbprint(self):
         self.assertTrue(self._azureservice.can_post_rdp_cert_thumbprint)
@@ -318,51 +391,39 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + "._wire_server_request")
     @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_hosting_environment(self, mock_get_role_instance_config,
-                                      mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.HostingEnvironmentConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_hosting_environment()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_shared_config(self, mock_get_role_instance_config,
-                                mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.SharedConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_shared_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_extensions_config(self, mock_get_role_instance_config,
-                                    mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.ExtensionsConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_extensions_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_full_config(self, mock_get_role_instance_config,
-                              mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.FullConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_full_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
+    def _test_get_config(self, mock_get_role_instance_config,
+                         mock_wire_server_request, method, url, parser):
+        mock_get_role_instance_config.return_value = (
+            self._get_goal_state().role_instance_config)
+
+        res = method()
+        # The documents are cached for the current incarnation.
+        self.assertEqual(res, method())
+        mock_wire_server_request.assert_called_once_with(url, parser=parser)
+        self.assertEqual(res, mock_wire_server_request.return_value)
+
+    def test__get_hosting_environment(self):
+        self._test_get_config(
+            method=self._azureservice._get_hosting_environment,
+            url=mock.sentinel.hosting_env_url,
+            parser=self._azuremodel.parse_hosting_environment)
+
+    def test__get_shared_config(self):
+        self._test_get_config(
+            method=self._azureservice._get_shared_config,
+            url=mock.sentinel.shared_config_url,
+            parser=self._azuremodel.parse_shared_config)
+
+    def test__get_extensions_config(self):
+        self._test_get_config(
+            method=self._azureservice._get_extensions_config,
+            url=mock.sentinel.extensions_config_url,
+            parser=self._azuremodel.parse_extensions_config)
+
+    def test__get_full_config(self):
+        self._test_get_config(
+            method=self._azureservice._get_full_config,
+            url=mock.sentinel.full_config_url, parser=None)
 
     def test__create_transport_cert(self):
         mock_cert_mgr = mock.Mock()
@@ -385,14 +446,13 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + "._wire_server_request")
     def test__get_encoded_cert(self, mock_wire_server_request):
-        mock_cert_config = mock.Mock()
         mock_transport_cert = mock.Mock()
         mock_cert_url = mock.sentinel.cert_url
 
         mock_transport_cert.replace.return_value = mock.sentinel.transport_cert
-        mock_wire_server_request.return_value = mock_cert_config
-        mock_cert_config.CertificateFile.Data.cdata = mock.sentinel.cert_data
-        mock_cert_config.CertificateFile.Format.cdata = mock.sentinel.cert_fmt
+        mock_wire_server_request.return_value = (
+            self._azuremodel.CertificateFile(data=mock.sentinel.cert_data,
+                                             format=mock.sentinel.cert_fmt))
 
         expected_headers = {
             "x-ms-guest-agent-public-x509-cert": mock.sentinel.transport_cert}
@@ -400,14 +460,14 @@ class AzureServiceTest(unittest.TestCase):
         res = self._azureservice._get_encoded_cert(mock_cert_url,
                                                    mock_transport_cert)
         (mock_wire_server_request.
-            assert_called_once_with(mock_cert_url, headers=expected_headers))
+            assert_called_once_with(
+                mock_cert_url, headers=expected_headers,
+                parser=self._azuremodel.parse_certificates))
         self.assertEqual(res, expected_result)
 
     @mock.patch(MODPATH + "._get_versions")
     def _test__check_version_header(self, mock_get_versions, version):
-        mock_version = mock.Mock()
-        mock_get_versions.return_value = mock_version
-        mock_version.Versions.Supported.Version = [version]
+        mock_get_versions.return_value = [version]
         if self._azureservice_module.WIRE_SERVER_VERSION is not version:
             self.assertRaises(exception.MetadaNotFoundException,
                               self._azureservice._check_version_header)
@@ -428,7 +488,8 @@ class AzureServiceTest(unittest.TestCase):
     def test__get_versions(self, mock_server_request):
         mock_server_request.return_value = mock.sentinel.version
         res = self._azureservice._get_versions()
-        mock_server_request.assert_called_once_with("?comp=Versions")
+        mock_server_request.assert_called_once_with(
+            "?comp=Versions", parser=self._azuremodel.parse_versions)
         self.assertEqual(res, mock.sentinel.version)
 
     @mock.patch(MODPATH + "._get_role_instance_id")
@@ -463,135 +524,108 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + "._get_ovf_env_path")
     def test_get_ovf_env(self, mock_get_ovf_env_path):
-        fake_xml = '<?xml version="1.0"?><root><child name="fake"/></root>'
-        mock_get_ovf_env_path.return_value = fake_xml
-        res = self._azureservice._get_ovf_env()
-        self.assertIsNotNone(res)
+        fake_xml = (b'<?xml version="1.0"?><Environment><ProvisioningSection>'
+                    b'<WindowsProvisioningConfigurationSet><ComputerName>'
+                    b'fake-host</ComputerName>'
+                    b'</WindowsProvisioningConfigurationSet>'
+                    b'</ProvisioningSection></Environment>')
+        mock_open = mock.mock_open(read_data=fake_xml)
+        with mock.patch.object(self._azureservice_module, 'open', mock_open,
+                               create=True):
+            res = self._azureservice._get_ovf_env()
+            self.assertIs(res, self._azureservice._get_ovf_env())
+
+        self.assertEqual("fake-host", res.computer_name)
         mock_get_ovf_env_path.assert_called_once_with()
+        mock_open.assert_called_once_with(
+            mock_get_ovf_env_path.return_value, "rb")
 
     @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_username(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.AdminUsername.cdata = mock.sentinel.cdata
-        res = self._azureservice.get_admin_username()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_password(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.AdminPassword.cdata = mock.sentinel.cdata
-        res = self._azureservice.get_admin_password()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_host_name(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.ComputerName.cdata = mock.sentinel.cdata
-        res = self._azureservice.get_host_name()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_enable_automatic_updates(self, mock_get_ovf_env,
-                                          enable_updates=True):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        if not enable_updates:
-            mock_win_prov = mock.MagicMock(spec="")
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        res = self._azureservice.get_enable_automatic_updates()
+    def _test_ovf_env_getter(self, mock_get_ovf_env, method, expected,
+                             **fields):
+        mock_get_ovf_env.return_value = self._azuremodel.OvfEnv(**fields)
+        res = method()
         mock_get_ovf_env.assert_called_once_with()
-        self.assertFalse(res)
+        self.assertEqual(expected, res)
+
+    def test_get_admin_username(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_admin_username,
+            expected=mock.sentinel.username,
+            admin_username=mock.sentinel.username)
+
+    def test_get_admin_password(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_admin_password,
+            expected=mock.sentinel.password,
+            admin_password=mock.sentinel.password)
+
+    def test_get_host_name(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_host_name,
+            expected=mock.sentinel.host_name,
+            computer_name=mock.sentinel.host_name)
+
+    def test_get_enable_automatic_updates(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_enable_automatic_updates,
+            expected=True, enable_automatic_updates=True)
 
     def test_get_enable_automatic_updates_no_updates(self):
-        self.test_get_enable_automatic_updates(enable_updates=False)
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_enable_automatic_updates,
+            expected=False, enable_automatic_updates=False)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_winrm_listeners_configuration(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_listener = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.WinRM.Listeners.Listener = [mock_listener]
-        mock_listener.Protocol.cdata = mock.sentinel.fake_protocol
-        (mock_listener.CertificateThumbprint.
-            cdata) = mock.sentinel.fake_thumbprint
-
-        expected_result = [
+    def test_get_winrm_listeners_configuration(self):
+        listeners = [
             {
                 'certificate_thumbprint': mock.sentinel.fake_thumbprint,
                 'protocol': mock.sentinel.fake_protocol,
             }]
-        res = self._azureservice.get_winrm_listeners_configuration()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, expected_result)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_vm_agent_package_provisioning_data(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_package_name = mock.sentinel.package_name
-        mock_get_ovf_env.return_value = mock_ovf_env
-        (mock_ovf_env.Environment.wa_PlatformSettingsSection.
-            PlatformSettings.GuestAgentPackageName.cdata) = mock_package_name
-        res = self._azureservice.get_vm_agent_package_provisioning_data()
-        expected_provisioning_data = {
-            'provision': False, 'package_name': mock_package_name}
-        self.assertEqual(res, expected_provisioning_data)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_kms_host(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        self.assertTrue(self._azureservice.get_kms_host())
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def _test_get_use_avma_licensing(self, mock_get_ovf_env, use_avma):
-        mock_ovf_env = mock.Mock()
-        mock_ovf_env.Environment = mock.Mock()
-        plat_sett_section = mock.Mock()
-        if not use_avma:
-            plat_sett_section.PlatformSettings = mock.MagicMock(spec="")
-        mock_ovf_env.Environment.wa_PlatformSettingsSection = plat_sett_section
-        mock_get_ovf_env.return_value = mock_ovf_env
-
-        self.assertFalse(self._azureservice.get_use_avma_licensing())
-        mock_get_ovf_env.assert_called_once_with()
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_winrm_listeners_configuration,
+            expected=listeners, winrm_listeners=listeners)
+
+    def test_get_vm_agent_package_provisioning_data(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_vm_agent_package_provisioning_data,
+            expected={'provision': False,
+                      'package_name': mock.sentinel.package_name},
+            provision_guest_agent=False,
+            guest_agent_package_name=mock.sentinel.package_name)
+
+    def test_get_kms_host(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_kms_host,
+            expected=mock.sentinel.kms_host,
+            kms_server_hostname=mock.sentinel.kms_host)
+
+    def test_get_kms_host_default(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_kms_host,
+            expected=self._azureservice_module.DEFAULT_KMS_HOST)
 
     def test_get_use_avma_licensing(self):
-        self._test_get_use_avma_licensing(use_avma=True)
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_use_avma_licensing,
+            expected=True, use_avma=True)
 
     def test_get_use_avma_licensing_no_use_avma(self):
-        self._test_get_use_avma_licensing(use_avma=False)
+        self._test_ovf_env_getter(
+            method=self._azureservice.get_use_avma_licensing,
+            expected=False, use_avma=False)
 
+    @mock.patch(MODPATH + "._save_wire_server_state")
+    @mock.patch(MODPATH + "._revalidate_wire_server")
     @mock.patch(MODPATH + "._get_ovf_env")
     @mock.patch(MODPATH + "._check_version_header")
     @mock.patch(MODPATH + "._get_wire_server_endpoint_address")
     def _test_load(self, mock_get_endpoint_address,
                    mock_check_version_header, mock_get_ovf_env,
-                   endpoint_side_effect=None, load_side_effect=None):
+                   mock_revalidate_wire_server, mock_save_wire_server_state,
+                   endpoint_side_effect=None, load_side_effect=None,
+                   saved_endpoint=None):
+        mock_revalidate_wire_server.return_value = saved_endpoint
         if endpoint_side_effect:
             mock_get_endpoint_address.side_effect = endpoint_side_effect
             expected_logging = ["Azure WireServer endpoint not found"]
@@ -604,19 +638,32 @@ class AzureServiceTest(unittest.TestCase):
 
         mock_endpoint = mock.sentinel.endpoint
         mock_get_endpoint_address.return_value = mock_endpoint
+        self._azureservice._headers["x-ms-version"] = mock.sentinel.version
         if load_side_effect:
             mock_check_version_header.side_effect = load_side_effect
             res = self._azureservice.load()
             self.assertFalse(res)
+            self.assertFalse(mock_save_wire_server_state.called)
             return
         else:
             res = self._azureservice.load()
             self.assertTrue(res)
-            self.assertIn(str(mock_endpoint), self._azureservice._base_url)
+            if saved_endpoint:
+                self.assertFalse(mock_get_endpoint_address.called)
+                mock_endpoint = saved_endpoint
+            else:
+                self.assertIn(str(mock_endpoint),
+                              self._azureservice._base_url)
             mock_check_version_header.assert_called_once_with()
             mock_get_ovf_env.assert_called_once_with()
+            mock_save_wire_server_state.assert_called_once_with(
+                {"Endpoint": mock_endpoint,
+                 "Version": mock.sentinel.version})
             return
 
+    def test_load_saved_endpoint(self):
+        self._test_load(saved_endpoint=mock.sentinel.saved_endpoint)
+
     def test_load_no_endpoint(self):
         self._test_load(endpoint_side_effect=Exception)
 
@@ -649,21 +696,10 @@ class AzureServiceTest(unittest.TestCase):
     def test_get_config_set_drive_path_not_exists(self):
         self._test_get_config_set_drive_path(path_exists=False)
 
-    @mock.patch(MODPATH + '._get_ovf_env')
-    def test_check_ovf_env_custom_data(self, mock_get_ovf_env,
-                                       custom_data=True):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_win_prov.PlatformSettings = mock.Mock()
-        if not custom_data:
-            mock_win_prov.PlatformSettings = mock.MagicMock(spec="")
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        res = self._azureservice._check_ovf_env_custom_data()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertTrue(res)
+    def test_check_ovf_env_custom_data(self):
+        self._test_ovf_env_getter(
+            method=self._azureservice._check_ovf_env_custom_data,
+            expected=True, has_custom_data=True)
 
     @mock.patch(MODPATH + '._check_ovf_env_custom_data')
     def test_get_user_data_ItemNotFound(self, mock_check_custom_data):
@@ -682,7 +718,8 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + '._get_role_instance_config')
     def test_get_server_certs_no_certs(self, mock_get_instance_config):
-        mock_get_instance_config.return_value = mock.MagicMock(spec="")
+        mock_get_instance_config.return_value = (
+            self._azuremodel.RoleInstanceConfig())
         res = self._azureservice.get_server_certs()
         self.assertEqual(res, [])
 
@@ -694,12 +731,13 @@ class AzureServiceTest(unittest.TestCase):
     def test_get_server_certs(self, mock_cert_manager, mock_create_cert,
                               mock_get_config, mock_get_encoded_cert,
                               mock_get_hosting_env):
-        cert_model = {
-            "storeName": mock.sentinel.storeName,
-            "configurationLevel": mock.sentinel.configurationLevel,
-            "certificateId": mock.sentinel.certificateId,
-            "name": mock.sentinel.name
-        }
+        cert_model = self._azuremodel.StoredCertificate(
+            store_name=mock.sentinel.storeName,
+            configuration_level=mock.sentinel.configurationLevel,
+            certificate_id=mock.sentinel.certificateId,
+            name=mock.sentinel.name)
+        mock_get_config.return_value = (
+            self._get_goal_state().role_instance_config)
         mock_cert_mgr = mock.Mock()
         mock_cert_mgr.decode_pkcs7_base64_blob.return_value = \
             mock.sentinel.pfx_data
@@ -708,11 +746,7 @@ class AzureServiceTest(unittest.TestCase):
             (mock.sentinel.thumbprint, mock.sentinel.cert)
         mock_get_encoded_cert.return_value = \
             (mock.sentinel.cert_data, mock.sentinel.cert_format)
-        mock_host_env = mock.Mock()
-        mock_host_env_config = mock_host_env.HostingEnvironmentConfig
-        mock_host_env_config.StoredCertificates.StoredCertificate = \
-            [cert_model]
-        mock_get_hosting_env.return_value = mock_host_env
+        mock_get_hosting_env.return_value = [cert_model]
 
         res = self._azureservice.get_server_certs()
         expected_result = [{
@@ -724,7 +758,8 @@ class AzureServiceTest(unittest.TestCase):
         }]
         self.assertEqual(res, expected_result)
         self.assertEqual(mock_create_cert.call_count, 1)
-        self.assertEqual(mock_get_encoded_cert.call_count, 1)
+        mock_get_encoded_cert.assert_called_once_with(
+            mock.sentinel.certificates_url, mock.sentinel.cert)
         self.assertEqual(mock_cert_mgr.decode_pkcs7_base64_blob.call_count, 1)
         mock_cert_manager.assert_called_once_with()
         mock_get_config.assert_called_once_with()
@@ -786,3 +821,136 @@ class AzureServiceTest(unittest.TestCase):
             "fake property 2": "fake value 2"
         }
         self._test_get_role_properties_xml(properties=properties)
+
+    def _test_revalidate_wire_server(self, state, goal_state_error=None,
+                                     persist=True):
+        self._azureservice._osutils.get_config_values.return_value = state
+        with mock.patch.object(self._azureservice,
+                               "_update_goal_state") as mock_update:
+            mock_update.side_effect = goal_state_error
+            with testutils.ConfPatcher("persist_wire_server_state", persist,
+                                       "azure"):
+                res = self._azureservice._revalidate_wire_server()
+        return res, mock_update
+
+    def test_revalidate_wire_server(self):
+        state = {"Endpoint": "10.0.0.1",
+                 "Version": self._azureservice_module.WIRE_SERVER_VERSION,
+                 "GoalStateIncarnation": "3"}
+        res, mock_update = self._test_revalidate_wire_server(state)
+
+        self.assertEqual("10.0.0.1", res)
+        self.assertEqual("http://10.0.0.1", self._azureservice._base_url)
+        self.assertEqual(self._azureservice_module.WIRE_SERVER_VERSION,
+                         self._azureservice._headers["x-ms-version"])
+        self.assertEqual("3", self._azureservice._saved_incarnation)
+        mock_update.assert_called_once_with(
+            retry=False, timeout=CONF.azure.wire_server_validation_timeout)
+        self._azureservice._osutils.get_config_values.assert_called_once_with(
+            self._azureservice_module.WIRE_SERVER_STATE_SECTION)
+
+    def test_revalidate_wire_server_invalid(self):
+        state = {"Endpoint": "10.0.0.1",
+                 "Version": self._azureservice_module.WIRE_SERVER_VERSION}
+        with self._logsnatcher:
+            res, mock_update = self._test_revalidate_wire_server(
+                state, goal_state_error=Exception("fake error"))
+
+        self.assertIsNone(res)
+        self.assertIsNone(self._azureservice._base_url)
+        self.assertNotIn("x-ms-version", self._azureservice._headers)
+
+    def test_revalidate_wire_server_other_version(self):
+        state = {"Endpoint": "10.0.0.1", "Version": "fake-version"}
+        res, mock_update = self._test_revalidate_wire_server(state)
+        self.assertIsNone(res)
+        self.assertFalse(mock_update.called)
+
+    def test_revalidate_wire_server_disabled(self):
+        res, mock_update = self._test_revalidate_wire_server(
+            {}, persist=False)
+        self.assertIsNone(res)
+        self.assertFalse(
+            self._azureservice._osutils.get_config_values.called)
+
+    def test_save_wire_server_state(self):
+        self._azureservice._save_wire_server_state(mock.sentinel.values)
+        self._azureservice._osutils.set_config_values.assert_called_once_with(
+            mock.sentinel.values,
+            self._azureservice_module.WIRE_SERVER_STATE_SECTION)
+
+    def test_save_wire_server_state_error(self):
+        set_config_values = self._azureservice._osutils.set_config_values
+        set_config_values.side_effect = Exception("fake error")
+        with self._logsnatcher:
+            self._azureservice._save_wire_server_state(mock.sentinel.values)
+        self.assertEqual(
+            ["Failed to save the Azure WireServer state: fake error"],
+            self._logsnatcher.output)
+
+    def test_save_wire_server_state_disabled(self):
+        with testutils.ConfPatcher("persist_wire_server_state", False,
+                                   "azure"):
+            self._azureservice._save_wire_server_state(mock.sentinel.values)
+        self.assertFalse(
+            self._azureservice._osutils.set_config_values.called)
+
+
+class HealthReporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._module_patcher = mock.patch.dict(
+            'sys.modules',
+            {'ctypes': mock.MagicMock(),
+             'ctypes.wintypes': mock.MagicMock(),
+             'six.moves': mock.MagicMock()})
+        self._module_patcher.start()
+        self.addCleanup(self._module_patcher.stop)
+        azureservice = importlib.import_module(
+            'cloudbaseinit.metadata.services.azureservice')
+        self._posted = []
+        self._release = threading.Event()
+        self._reporter = azureservice.HealthReporter(self._post)
+
+    def _post(self, *args):
+        self._release.wait()
+        self._posted.append(args)
+        if args[0] == "error":
+            raise Exception("fake error")
+
+    def test_report(self):
+        self._release.set()
+        self._reporter.report("NotReady", "Provisioning")
+        self.assertTrue(self._reporter.flush(5))
+        self._reporter.report("Ready")
+        self.assertTrue(self._reporter.flush(5))
+        self.assertEqual([("NotReady", "Provisioning"), ("Ready",)],
+                         self._posted)
+
+    def test_report_superseded(self):
+        self._reporter.report("NotReady", "Provisioning")
+        self._reporter.report("NotReady", "ProvisioningFailed")
+        self._reporter.report("Ready")
+        self._release.set()
+        self.assertTrue(self._reporter.flush(5))
+        # The first report may have been taken by the thread already,
+        # but the intermediate one is always dropped.
+        self.assertNotIn(("NotReady", "ProvisioningFailed"), self._posted)
+        self.assertEqual(("Ready",), self._posted[-1])
+
+    def test_report_error(self):
+        self._release.set()
+        self._reporter.report("error")
+        self.assertTrue(self._reporter.flush(5))
+        self._reporter.report("Ready")
+        self.assertTrue(self._reporter.flush(5))
+        self.assertEqual([("error",), ("Ready",)], self._posted)
+
+    def test_flush_timeout(self):
+        self._reporter.report("Ready")
+        self.assertFalse(self._reporter.flush(0.01))
+        self._release.set()
+        self.assertTrue(self._reporter.flush(5))
+
+    def test_flush_nothing_reported(self):
+        self.assertTrue(self._reporter.flush(0))
@@ -16,8 +16,12 @@ import mock
 import requests
 import unittest
 
+from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.tests import testutils
+
+CONF = cloudbaseinit_conf.CONF
 
 
 class FakeService(base.BaseMetadataService):
@@ -55,6 +59,180 @@ class TestBase(unittest.TestCase):
         self.assertFalse(self._service.is_password_changed())
 
 
+class TestBaseMetadataServiceCache(unittest.TestCase):
+
+    def setUp(self):
+        self._service = FakeService()
+        self._service._get_data = mock.Mock()
+
+    def test_get_cache_data(self):
+        self._service._get_data.return_value = b"fake data"
+
+        response = self._service._get_cache_data("fake path")
+        decoded_response = self._service._get_cache_data("fake path",
+                                                         decode=True)
+
+        self.assertEqual(b"fake data", response)
+        self.assertEqual("fake data", decoded_response)
+        self._service._get_data.assert_called_once_with("fake path")
+
+    def test_get_cache_data_missing(self):
+        self._service._get_data.side_effect = (
+            base.NotExistingMetadataException)
+
+        for _ in range(2):
+            self.assertRaises(base.NotExistingMetadataException,
+                              self._service._get_cache_data, "fake path")
+        self._service._get_data.assert_called_once_with("fake path")
+
+        self._service.load()
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._service._get_cache_data, "fake path")
+        self.assertEqual(2, self._service._get_data.call_count)
+
+    @mock.patch.object(FakeService, '_get_prefetch_paths')
+    def test_prefetch(self, mock_get_prefetch_paths):
+        mock_get_prefetch_paths.return_value = ["found", "missing", "error"]
+
+        def _get_data(path):
+            if path == "missing":
+                raise base.NotExistingMetadataException()
+            elif path == "error":
+                raise Exception()
+            return b"fake data"
+
+        self._service._get_data.side_effect = _get_data
+        self._service._persistent_cache = mock.Mock()
+        self._service.prefetch()
+
+        self.assertEqual(3, self._service._get_data.call_count)
+        self._service._persistent_cache.update.assert_called_once_with(
+            {"found": b"fake data"})
+        self.assertFalse(self._service._persistent_cache.set.called)
+        self._service._get_data.side_effect = Exception
+        self.assertEqual(b"fake data",
+                         self._service._get_cache_data("found"))
+        self.assertEqual("fake data",
+                         self._service._get_cache_data("found", decode=True))
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._service._get_cache_data, "missing")
+        self.assertRaises(Exception, self._service._get_cache_data, "error")
+        self.assertEqual(4, self._service._get_data.call_count)
+
+        self._service.prefetch()
+        self.assertEqual(5, self._service._get_data.call_count)
+
+    @mock.patch.object(FakeService, '_get_prefetch_paths')
+    def test_prefetch_disabled(self, mock_get_prefetch_paths):
+        mock_get_prefetch_paths.return_value = ["fake path"]
+
+        with testutils.ConfPatcher('metadata_prefetch_workers', 0):
+            self._service.prefetch()
+
+        self.assertFalse(self._service._get_data.called)
+
+    def test_get_prefetch_paths(self):
+        self.assertEqual([], self._service._get_prefetch_paths())
+
+    def test_load_persistent_cache_disabled(self):
+        with testutils.ConfPatcher('metadata_cache_path', None):
+            self._service.load_persistent_cache()
+
+        self.assertIsNone(self._service._persistent_cache)
+
+    @mock.patch.object(FakeService, 'get_instance_id')
+    def test_load_persistent_cache_no_instance_id(self,
+                                                  mock_get_instance_id):
+        mock_get_instance_id.return_value = None
+
+        with testutils.ConfPatcher('metadata_cache_path', 'fake path'):
+            self._service.load_persistent_cache()
+
+        self.assertIsNone(self._service._persistent_cache)
+
+    @mock.patch('cloudbaseinit.metadata.cache.PersistentMetadataCache')
+    @mock.patch.object(FakeService, 'get_instance_id')
+    def test_load_persistent_cache(self, mock_get_instance_id,
+                                   mock_persistent_cache):
+        persistent_cache = mock_persistent_cache.return_value
+        persistent_cache.get_entries.return_value = {"saved": b"saved data"}
+        self._service._get_data.return_value = b"new data"
+
+        with testutils.ConfPatcher('metadata_cache_path', 'fake path'):
+            self._service.load_persistent_cache()
+
+        mock_persistent_cache.assert_called_once_with(
+            "FakeService", mock_get_instance_id.return_value)
+        self.assertEqual(b"saved data",
+                         self._service._get_cache_data("saved"))
+        self.assertFalse(persistent_cache.set.called)
+        self.assertEqual(b"new data", self._service._get_cache_data("new"))
+        persistent_cache.set.assert_called_once_with("new", b"new data")
+        self._service._get_data.assert_called_once_with("new")
+        self.assertFalse(persistent_cache.update.called)
+
+    @mock.patch('cloudbaseinit.metadata.cache.PersistentMetadataCache')
+    @mock.patch.object(FakeService, 'get_instance_id')
+    def test_load_persistent_cache_fetched_data(self, mock_get_instance_id,
+                                                mock_persistent_cache):
+        persistent_cache = mock_persistent_cache.return_value
+        persistent_cache.get_entries.return_value = {"saved": b"old data"}
+        self._service._get_data.return_value = b"new data"
+        self._service._get_cache_data("saved", decode=True)
+
+        with testutils.ConfPatcher('metadata_cache_path', 'fake path'):
+            self._service.load_persistent_cache()
+
+        persistent_cache.update.assert_called_once_with(
+            {"saved": b"new data"})
+        self.assertEqual(b"new data", self._service._get_cache_data("saved"))
+
+
+@mock.patch('time.sleep')
+class TestBaseMetadataServiceRetry(unittest.TestCase):
+
+    def setUp(self):
+        self._service = FakeService()
+        self._service._enable_retry = True
+        self._action = mock.Mock()
+
+    def test_exec_with_retry_disabled(self, mock_sleep):
+        self._service._enable_retry = False
+        self._action.side_effect = IOError
+        self.assertRaises(IOError, self._service._exec_with_retry,
+                          self._action)
+        self.assertEqual(1, self._action.call_count)
+
+    @testutils.ConfPatcher('retry_count', 2)
+    def test_exec_with_retry(self, mock_sleep):
+        self._action.side_effect = [IOError, mock.sentinel.data]
+        response = self._service._exec_with_retry(self._action)
+        self.assertEqual(mock.sentinel.data, response)
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @testutils.ConfPatcher('retry_count', 2)
+    def test_exec_with_retry_fails(self, mock_sleep):
+        self._action.side_effect = IOError
+        self.assertRaises(IOError, self._service._exec_with_retry,
+                          self._action)
+        self.assertEqual(3, self._action.call_count)
+
+    def test_exec_with_retry_not_existing(self, mock_sleep):
+        self._action.side_effect = base.NotExistingMetadataException
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._service._exec_with_retry, self._action)
+        self.assertEqual(1, self._action.call_count)
+
+    @testutils.ConfPatcher('metadata_retry_budget', 0)
+    @testutils.ConfPatcher('metadata_circuit_breaker_threshold', 2)
+    def test_get_retrier(self, mock_sleep):
+        retrier = self._service._get_retrier()
+        self.assertIs(retrier, self._service._get_retrier())
+        self.assertIsNone(retrier._budget)
+        # No circuit breaker errors are defined by default.
+        self.assertIsNone(retrier._circuit_breaker)
+
+
 class TestBaseHTTPMetadataService(unittest.TestCase):
 
     def setUp(self):
@@ -80,12 +258,13 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
     def test_verify_https_request_with_ca_bundle(self):
         self._test_verify_https_request(https_ca_bundle="/path/to/resource")
 
-    @mock.patch('requests.post')
-    @mock.patch('requests.get')
+    @mock.patch('cloudbaseinit.metadata.services.base._get_http_session')
     @mock.patch("cloudbaseinit.metadata.services.base.BaseHTTPMetadataService."
                 "_verify_https_request")
-    def _test_http_request(self, mock_verify, mock_get, mock_post,
+    def _test_http_request(self, mock_verify, mock_get_http_session,
                            mock_url, mock_data=None, mock_headers=None):
+        mock_get = mock_get_http_session.return_value.get
+        mock_post = mock_get_http_session.return_value.post
         if not mock_url.startswith('http'):
             mock_url = requests.compat.urljoin(self._mock_base_url, mock_url)
 
@@ -101,15 +280,17 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
         response = self._service._http_request(url=mock_url, data=mock_data,
                                                headers=mock_headers)
 
+        timeout = (CONF.metadata_http_connect_timeout,
+                   CONF.metadata_http_read_timeout)
         if mock_data:
             mock_post.assert_called_once_with(
                 url=mock_url, data=mock_data, headers=mock_headers,
-                verify=mock.sentinel.verify
+                verify=mock.sentinel.verify, timeout=timeout
             )
         else:
             mock_get.assert_called_once_with(
                 url=mock_url, data=mock_data, headers=mock_headers,
-                verify=mock.sentinel.verify
+                verify=mock.sentinel.verify, timeout=timeout
             )
 
         mock_response_status.assert_called_once_with()
@@ -120,11 +301,46 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
                                 mock_data=None,
                                 mock_headers={})
 
+    @mock.patch('cloudbaseinit.metadata.services.base._HTTP_SESSION', None)
+    @mock.patch('requests.adapters.HTTPAdapter')
+    @mock.patch('requests.Session')
+    def test_get_http_session(self, mock_session, mock_adapter):
+        with testutils.ConfPatcher('metadata_http_trust_env', False):
+            with testutils.ConfPatcher('metadata_http_pool_size', 5):
+                response = base._get_http_session()
+                self.assertIs(response, base._get_http_session())
+
+        session = mock_session.return_value
+        self.assertIs(session, response)
+        mock_session.assert_called_once_with()
+        self.assertFalse(session.trust_env)
+        mock_adapter.assert_called_once_with(pool_maxsize=5)
+        session.mount.assert_has_calls(
+            [mock.call("http://", mock_adapter.return_value),
+             mock.call("https://", mock_adapter.return_value)])
+
+    def test_get_http_timeout(self):
+        with testutils.ConfPatcher('metadata_http_connect_timeout', 0):
+            with testutils.ConfPatcher('metadata_http_read_timeout', 5):
+                self.assertEqual((None, 5), base._get_http_timeout())
+
     def test_http_post_request(self):
         self._test_http_request(mock_url="/path/to/resource",
                                 mock_data={"X-Cloudbase-Init", True},
                                 mock_headers={})
 
+    @mock.patch('cloudbaseinit.metadata.services.base._get_http_session')
+    def test_http_put_request(self, mock_get_http_session):
+        mock_put = mock_get_http_session.return_value.put
+        response = self._service._http_request(
+            url="http://fake/token", headers={"ttl": "60"}, method="PUT")
+
+        mock_put.assert_called_once_with(
+            url="http://fake/token", data=None, headers={"ttl": "60"},
+            verify=mock.ANY, timeout=mock.ANY)
+        mock_put.return_value.raise_for_status.assert_called_once_with()
+        self.assertEqual(mock_put.return_value.content, response)
+
     @mock.patch('requests.compat.urljoin')
     @mock.patch("cloudbaseinit.metadata.services.base."
                 "BaseHTTPMetadataService._http_request")
@@ -163,6 +379,46 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
         self._test_get_data(expected_response=http_error,
                             expected_value=requests.HTTPError)
 
+    def _get_http_error(self, status_code):
+        fake_response = mock.Mock()
+        fake_response.status_code = status_code
+        http_error = requests.HTTPError()
+        http_error.response = fake_response
+        return http_error
+
+    def test_is_http_client_error(self):
+        self.assertTrue(base._is_http_client_error(
+            self._get_http_error(403)))
+        self.assertFalse(base._is_http_client_error(
+            self._get_http_error(429)))
+        self.assertFalse(base._is_http_client_error(
+            self._get_http_error(503)))
+        self.assertFalse(base._is_http_client_error(IOError()))
+
+    @mock.patch('time.sleep')
+    @testutils.ConfPatcher('metadata_circuit_breaker_threshold', 2)
+    def test_exec_with_retry_circuit_breaker(self, mock_sleep):
+        self._service._enable_retry = True
+        action = mock.Mock(side_effect=requests.exceptions.ConnectionError)
+        self.assertRaises(exception.CircuitBreakerOpenException,
+                          self._service._exec_with_retry, action)
+        self.assertRaises(exception.CircuitBreakerOpenException,
+                          self._service._exec_with_retry, action)
+        self.assertEqual(2, action.call_count)
+
+    def test_get_retrier_circuit_breaker_disabled(self):
+        # Disabled by default, so that the network coming up late
+        # only delays the metadata.
+        self.assertIsNone(self._service._get_retrier()._circuit_breaker)
+
+    @mock.patch('time.sleep')
+    def test_exec_with_retry_client_error(self, mock_sleep):
+        self._service._enable_retry = True
+        action = mock.Mock(side_effect=self._get_http_error(403))
+        self.assertRaises(requests.HTTPError,
+                          self._service._exec_with_retry, action)
+        self.assertEqual(1, action.call_count)
+
     def test_get_response_ssl_error(self):
         ssl_error = requests.exceptions.SSLError()
         self._test_get_data(expected_response=ssl_error,
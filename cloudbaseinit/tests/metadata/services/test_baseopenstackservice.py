@@ -73,6 +73,25 @@ class TestBaseOpenStackService(unittest.TestCase):
         mock_get_cache_data.assert_called_once_with(path)
         self.assertEqual(mock_get_cache_data.return_value, response)
 
+    @mock.patch(MODPATH +
+                ".BaseOpenStackService._get_meta_data")
+    def _test_get_prefetch_paths(self, mock_get_meta_data, meta_data,
+                                 expected_paths):
+        mock_get_meta_data.return_value = meta_data
+        response = self._service._get_prefetch_paths()
+        self.assertEqual(expected_paths, response)
+
+    def test_get_prefetch_paths(self):
+        self._test_get_prefetch_paths(
+            meta_data={
+                "network_config": {"content_path": "/content/0000"}},
+            expected_paths=["openstack/latest/user_data",
+                            "openstack/content/0000"])
+
+    def test_get_prefetch_paths_no_network_config(self):
+        self._test_get_prefetch_paths(
+            meta_data={}, expected_paths=["openstack/latest/user_data"])
+
     @mock.patch(MODPATH +
                 ".BaseOpenStackService._get_cache_data")
     def test_get_meta_data(self, mock_get_cache_data):
@@ -20,6 +20,7 @@ try:
     import unittest.mock as mock
 except ImportError:
     import mock
+from six.moves import http_client
 from six.moves import urllib
 
 from cloudbaseinit import conf as cloudbaseinit_conf
@@ -45,7 +46,7 @@ class CloudStackTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
                 '._http_request')
     def test_test_api(self, mock_http_request):
-        url = '127.0.0.1'
+        url = 'http://127.0.0.1/'
         mock_http_request.side_effect = [
             '200 OK. Successfully!',    # Request to Web Service
             urllib.error.HTTPError(url=url, code=404, hdrs={}, fp=None,
@@ -56,59 +57,85 @@ class CloudStackTest(unittest.TestCase):
             socket.error,
         ]
 
-        self.assertTrue(self._service._test_api(url))
-        for _ in range(4):
-            self.assertFalse(self._service._test_api(url))
-
-    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._test_api')
-    def test_load(self, mock_test_api, mock_os_util):
-        self._service._osutils.get_dhcp_hosts_in_use = mock.Mock()
-        self._service._osutils.get_dhcp_hosts_in_use.side_effect = [
-            [(mock.sentinel.mac_address, '10.10.0.1'),
-             (mock.sentinel.mac_address, '10.10.0.2'),
-             (mock.sentinel.mac_address, '10.10.0.3')]
-        ]
-        mock_test_api.side_effect = [False, False, False, True]
-
-        self.assertTrue(self._service.load())
-        self.assertEqual(4, mock_test_api.call_count)
-
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._test_api')
-    def test_load_default(self, mock_test_api):
-        mock_test_api.side_effect = [True]
-        self._service._test_api = mock_test_api
-
-        self.assertTrue(self._service.load())
-        mock_test_api.assert_called_once_with(
-            CONF.cloudstack.metadata_base_url)
-
-    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._test_api')
-    def test_load_fail(self, mock_test_api, mock_os_util):
-        self._service._osutils.get_dhcp_hosts_in_use.side_effect = [None]
-        mock_test_api.side_effect = [False]
-
-        self.assertFalse(self._service.load())  # No DHCP server was found.
-        mock_test_api.assert_called_once_with(
-            CONF.cloudstack.metadata_base_url)
-
-    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._test_api')
-    def test_load_no_service(self, mock_test_api, mock_os_util):
-        self._service._osutils.get_dhcp_hosts_in_use = mock.Mock()
-        self._service._osutils.get_dhcp_hosts_in_use.side_effect = [
-            [(mock.sentinel.mac_address, CONF.cloudstack.metadata_base_url)]
-        ]
-        mock_test_api.side_effect = [False, False]
-
-        # No service
-        self.assertFalse(self._service.load())
-        self.assertEqual(2, mock_test_api.call_count)
+        with testutils.ConfPatcher('metadata_probe_timeout', 3,
+                                   'cloudstack'):
+            self.assertTrue(self._service._test_api(url))
+            for _ in range(4):
+                self.assertFalse(self._service._test_api(url))
+
+        mock_http_request.assert_called_with(
+            'http://127.0.0.1/latest/meta-data/service-offering',
+            timeout=(3, CONF.metadata_http_read_timeout))
+        # The service is not changed by testing the hosts.
+        self.assertIsNone(self._service._base_url)
+
+    def _test_load(self, dhcp_servers, available_urls, expected_url=None):
+        self._service._osutils.get_dhcp_hosts_in_use = mock.Mock(
+            return_value=dhcp_servers)
+        tested_urls = []
+
+        def _test_api(url):
+            tested_urls.append(url)
+            return url in available_urls
+
+        self._service._test_api = _test_api
+        response = self._service.load()
+
+        self.assertEqual(expected_url is not None, response)
+        self.assertEqual(expected_url, self._service._base_url)
+        return tested_urls
+
+    def test_load(self):
+        tested_urls = self._test_load(
+            dhcp_servers=[(mock.sentinel.mac_address, '10.10.0.1'),
+                          (mock.sentinel.mac_address, '10.10.0.2'),
+                          (mock.sentinel.mac_address, '10.10.0.3')],
+            available_urls=['http://10.10.0.3/'],
+            expected_url='http://10.10.0.3/')
+
+        self.assertEqual(
+            sorted([CONF.cloudstack.metadata_base_url, 'http://10.10.0.1/',
+                    'http://10.10.0.2/', 'http://10.10.0.3/']),
+            sorted(tested_urls))
+        self.assertEqual('10.10.0.3', self._service._metadata_host)
+
+    def test_set_metadata_url_closes_password_client(self):
+        password_client = mock.Mock()
+        self._service._password_client = password_client
+
+        self._service._set_metadata_url('http://10.10.0.4:80/')
+
+        password_client.close.assert_called_once_with()
+        self.assertIsNone(self._service._password_client)
+        self.assertEqual('10.10.0.4', self._service._metadata_host)
+
+    def test_cleanup(self):
+        password_client = mock.Mock()
+        self._service._password_client = password_client
+
+        self._service.cleanup()
+        self._service.cleanup()
+
+        password_client.close.assert_called_once_with()
+        self.assertIsNone(self._service._password_client)
+
+    def test_load_default(self):
+        self._test_load(
+            dhcp_servers=[(mock.sentinel.mac_address, '10.10.0.1')],
+            available_urls=[CONF.cloudstack.metadata_base_url],
+            expected_url=CONF.cloudstack.metadata_base_url)
+
+    def test_load_fail(self):
+        # No DHCP server was found.
+        tested_urls = self._test_load(dhcp_servers=None, available_urls=[])
+        self.assertEqual([CONF.cloudstack.metadata_base_url], tested_urls)
+
+    def test_load_no_service(self):
+        tested_urls = self._test_load(
+            dhcp_servers=[(mock.sentinel.mac_address, '10.1.1.1')],
+            available_urls=[])
+        # The DHCP server matching the configured URL is tested only once.
+        self.assertEqual([CONF.cloudstack.metadata_base_url], tested_urls)
 
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
                 '._get_data')
@@ -170,10 +197,9 @@ class CloudStackTest(unittest.TestCase):
             response = self._service.get_public_keys()
             self.assertEqual([], response)
 
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._password_client')
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
     def test_get_password(self, mock_password_client):
-        headers = {"DomU_Request": "send_my_password"}
         expected_password = "password"
         mock_password_client.return_value = expected_password
         expected_output = [
@@ -186,12 +212,18 @@ class CloudStackTest(unittest.TestCase):
                                    'cloudstack') as snatcher:
             password = self._service._get_password()
 
-        mock_password_client.assert_called_once_with(headers=headers)
+        mock_password_client.assert_called_once_with(
+            cloudstack.SEND_MY_PASSWORD)
         self.assertEqual(expected_password, password)
         self.assertEqual(expected_output, snatcher.output)
 
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._password_client')
+        # The answer is memoized for the current boot.
+        self.assertEqual(expected_password, self._service._get_password())
+        self.assertTrue(self._service.is_password_changed())
+        self.assertEqual(1, mock_password_client.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
     def test_get_password_fail(self, mock_password_client):
         mock_password_client.side_effect = ["", cloudstack.BAD_REQUEST,
                                             cloudstack.SAVED_PASSWORD]
@@ -208,6 +240,7 @@ class CloudStackTest(unittest.TestCase):
              "current instance."],
         ]
         for _ in range(3):
+            self._service._password_client = None
             with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
                                        'cloudstack') as snatcher:
                 self.assertIsNone(self._service._get_password())
@@ -215,8 +248,40 @@ class CloudStackTest(unittest.TestCase):
 
         self.assertEqual(3, mock_password_client.call_count)
 
-    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
-                '._password_client')
+    @mock.patch('time.sleep')
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
+    def test_get_password_connection_error(self, mock_password_client,
+                                           mock_sleep):
+        mock_password_client.side_effect = socket.error
+        with testutils.ConfPatcher('retry_count', 3):
+            with testutils.ConfPatcher('metadata_circuit_breaker_threshold',
+                                       0):
+                with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                           'cloudstack') as snatcher:
+                    self.assertIsNone(self._service._get_password())
+
+        self.assertEqual(3, mock_password_client.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertTrue(snatcher.output[-1].startswith(
+            "Getting password failed"))
+
+    @mock.patch('time.sleep')
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
+    def test_get_password_circuit_breaker(self, mock_password_client,
+                                          mock_sleep):
+        mock_password_client.side_effect = socket.error
+        with testutils.ConfPatcher('retry_count', 5):
+            with testutils.ConfPatcher('metadata_circuit_breaker_threshold',
+                                       2):
+                self.assertIsNone(self._service._get_password())
+                self._service._delete_password()
+
+        self.assertEqual(2, mock_password_client.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
     def test_delete_password(self, mock_password_client):
         mock_password_client.side_effect = [cloudstack.BAD_REQUEST,
                                             cloudstack.SAVED_PASSWORD]
@@ -239,6 +304,26 @@ class CloudStackTest(unittest.TestCase):
         for expected, output in zip(expected_output, snatcher.output):
             self.assertTrue(output.startswith(expected))
 
+        # The password is not removed again.
+        self._service._delete_password()
+        self.assertEqual(2, mock_password_client.call_count)
+
+    @mock.patch('time.sleep')
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.'
+                'PasswordServerClient._send')
+    def test_delete_password_backoff(self, mock_password_client,
+                                     mock_sleep):
+        mock_password_client.side_effect = [cloudstack.BAD_REQUEST,
+                                            cloudstack.BAD_REQUEST,
+                                            cloudstack.SAVED_PASSWORD]
+        with testutils.ConfPatcher('retry_count', 3):
+            with testutils.ConfPatcher('retry_count_interval', 1):
+                with testutils.ConfPatcher('retry_backoff_multiplier', 2):
+                    self._service._delete_password()
+
+        self.assertEqual(3, mock_password_client.call_count)
+        mock_sleep.assert_has_calls([mock.call(1), mock.call(2)])
+
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack.'
                 '_delete_password')
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack.'
@@ -271,3 +356,84 @@ class CloudStackTest(unittest.TestCase):
     def test_is_password_changed(self, mock_get_password):
         mock_get_password.return_value = True
         self.assertTrue(self._service.is_password_changed())
+
+
+@mock.patch('six.moves.http_client.HTTPConnection')
+class PasswordServerClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self._client = cloudstack.PasswordServerClient(
+            mock.sentinel.host, mock.sentinel.port)
+
+    def _get_response(self, content, status=200, will_close=False):
+        return mock.Mock(status=status, reason=mock.sentinel.reason,
+                         will_close=will_close,
+                         read=mock.Mock(return_value=content))
+
+    def test_send(self, mock_connection):
+        connection = mock_connection.return_value
+        connection.getresponse.side_effect = [
+            self._get_response(b"password\n"),
+            self._get_response(b"saved_password")]
+
+        self.assertEqual("password", self._client._send("send_my_password"))
+        self.assertEqual("saved_password",
+                         self._client._send("saved_password"))
+
+        # The connection is kept alive between the requests.
+        mock_connection.assert_called_once_with(
+            mock.sentinel.host, mock.sentinel.port,
+            timeout=cloudstack.TIMEOUT)
+        connection.request.assert_called_with(
+            "GET", "/", headers={"DomU_Request": "saved_password"})
+        self.assertFalse(connection.close.called)
+
+    def test_send_will_close(self, mock_connection):
+        connection = mock_connection.return_value
+        connection.getresponse.return_value = self._get_response(
+            b"", will_close=True)
+
+        self._client._send("send_my_password")
+        self._client._send("send_my_password")
+
+        self.assertEqual(2, mock_connection.call_count)
+        self.assertEqual(2, connection.close.call_count)
+
+    def test_send_connection_error(self, mock_connection):
+        connection = mock_connection.return_value
+        connection.request.side_effect = [socket.error, None]
+        connection.getresponse.return_value = self._get_response(b"")
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'cloudstack'):
+            self.assertRaises(socket.error, self._client._send,
+                              "send_my_password")
+        self._client._send("send_my_password")
+
+        # A new connection is opened after the error.
+        connection.close.assert_called_once_with()
+        self.assertEqual(2, mock_connection.call_count)
+
+    def test_send_http_error(self, mock_connection):
+        connection = mock_connection.return_value
+        connection.getresponse.return_value = self._get_response(
+            b"error", status=500)
+        self.assertRaises(http_client.HTTPException, self._client._send,
+                          "send_my_password")
+
+    @mock.patch('time.sleep')
+    def test_request(self, mock_sleep, mock_connection):
+        connection = mock_connection.return_value
+        connection.getresponse.side_effect = [
+            self._get_response(b"bad_request"),
+            self._get_response(b"password")]
+
+        with testutils.ConfPatcher('retry_count', 3):
+            self.assertEqual(cloudstack.BAD_REQUEST,
+                             self._client.request("send_my_password"))
+            self.assertEqual("password",
+                             self._client.request("send_my_password"))
+            self.assertEqual("password",
+                             self._client.request("send_my_password"))
+
+        self.assertEqual(2, connection.request.call_count)
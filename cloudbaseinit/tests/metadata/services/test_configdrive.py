@@ -88,14 +88,20 @@ class TestConfigDriveService(unittest.TestCase):
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.factory.'
                 'get_config_drive_manager')
-    def test_load(self, mock_get_config_drive_manager):
+    def _test_load(self, mock_get_config_drive_manager, volume=False):
         mock_manager = mock.MagicMock()
         mock_manager.get_config_drive_files.return_value = True
         fake_path = "fake\\fake_id"
-        mock_manager.target_path = fake_path
+        mock_manager.metadata_path = fake_path
+        mock_manager.volume_reader = None
+        if volume:
+            mock_manager.volume_reader = mock.Mock(filesystem="FAT16")
         mock_get_config_drive_manager.return_value = mock_manager
-        expected_log = [
-            "Metadata copied to folder: %r" % fake_path]
+        if volume:
+            expected_log = ["Reading the metadata from the FAT16 volume"]
+        else:
+            expected_log = [
+                "Reading the metadata from folder: %r" % fake_path]
 
         with self.snatcher:
             response = self._config_drive.load()
@@ -106,31 +112,36 @@ class TestConfigDriveService(unittest.TestCase):
             searched_locations=self.configdrive_module.CD_LOCATIONS)
         self.assertEqual(expected_log, self.snatcher.output)
         self.assertTrue(response)
-        self.assertEqual(fake_path, self._config_drive._metadata_path)
 
-    @mock.patch('os.path.normpath')
-    @mock.patch('os.path.join')
-    def test_get_data(self, mock_join, mock_normpath):
-        fake_path = os.path.join('fake', 'path')
-        with mock.patch('six.moves.builtins.open',
-                        mock.mock_open(read_data='fake data'), create=True):
-            response = self._config_drive._get_data(fake_path)
-            self.assertEqual('fake data', response)
-            mock_join.assert_called_with(
-                self._config_drive._metadata_path, fake_path)
-            mock_normpath.assert_called_once_with(mock_join.return_value)
-
-    @mock.patch('shutil.rmtree')
-    def test_cleanup(self, mock_rmtree):
+    def test_load(self):
+        self._test_load()
+
+    def test_load_volume(self):
+        self._test_load(volume=True)
+
+    def test_get_data(self):
+        mock_mgr = mock.Mock()
+        self._config_drive._mgr = mock_mgr
         fake_path = os.path.join('fake', 'path')
-        self._config_drive._metadata_path = fake_path
+
+        response = self._config_drive._get_data(fake_path)
+
+        mock_mgr.read_file.assert_called_once_with(fake_path)
+        self.assertEqual(mock_mgr.read_file.return_value, response)
+
+    def test_get_data_missing(self):
+        mock_mgr = mock.Mock()
+        mock_mgr.read_file.side_effect = IOError
+        self._config_drive._mgr = mock_mgr
+
+        self.assertRaises(
+            self.configdrive_module.base.NotExistingMetadataException,
+            self._config_drive._get_data, "fake_path")
+
+    def test_cleanup(self):
         mock_mgr = mock.Mock()
         self._config_drive._mgr = mock_mgr
-        mock_mgr.target_path = fake_path
         with self.snatcher:
             self._config_drive.cleanup()
-        self.assertEqual(["Deleting metadata folder: %r" % fake_path],
-                         self.snatcher.output)
-        mock_rmtree.assert_called_once_with(fake_path,
-                                            ignore_errors=True)
-        self.assertEqual(None, self._config_drive._metadata_path)
+        self.assertEqual(["Closing the config drive"], self.snatcher.output)
+        mock_mgr.cleanup.assert_called_once_with()
@@ -18,8 +18,10 @@ try:
     import unittest.mock as mock
 except ImportError:
     import mock
+import requests
 
 from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.metadata.services import base
 from cloudbaseinit.metadata.services import ec2service
 from cloudbaseinit.tests import testutils
 
@@ -89,6 +91,14 @@ class EC2ServiceTest(unittest.TestCase):
         self.assertEqual(expected, mock_get_cache_data.call_args_list)
         self.assertEqual(['fake key'], response)
 
+    def test_get_prefetch_paths(self):
+        response = self._service._get_prefetch_paths()
+        self.assertEqual(
+            ['%s/%s' % (self._service._metadata_version, path)
+             for path in ('meta-data/instance-id', 'meta-data/public-keys',
+                          'user-data')],
+            response)
+
     @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
                 '._get_cache_data')
     def test_get_user_data(self, mock_get_cache_data):
@@ -96,3 +106,190 @@ class EC2ServiceTest(unittest.TestCase):
         path = '%s/user-data' % self._service._metadata_version
         mock_get_cache_data.assert_called_once_with(path)
         self.assertEqual(mock_get_cache_data.return_value, response)
+
+    def _get_http_error(self, status_code):
+        response = mock.Mock(status_code=status_code)
+        return requests.HTTPError(response=response)
+
+    @mock.patch('time.time')
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_get_token(self, mock_http_request, mock_time):
+        mock_http_request.return_value = b'token\n'
+        mock_time.return_value = 100
+        with testutils.ConfPatcher('metadata_token_ttl', 1000, 'ec2'):
+            self.assertEqual('token', self._service._get_token())
+            # The token is reused until it is about to expire.
+            mock_time.return_value = 999
+            self.assertEqual('token', self._service._get_token())
+            mock_time.return_value = 1000
+            self.assertEqual('token', self._service._get_token())
+
+        mock_http_request.assert_called_with(
+            ec2service.TOKEN_PATH,
+            headers={ec2service.TOKEN_TTL_HEADER: '1000'}, method='PUT')
+        self.assertEqual(2, mock_http_request.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_get_token_unsupported(self, mock_http_request):
+        mock_http_request.side_effect = self._get_http_error(404)
+        self.assertIsNone(self._service._get_token())
+        self.assertIsNone(self._service._get_token())
+        self.assertEqual(1, mock_http_request.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_get_token_error(self, mock_http_request):
+        mock_http_request.side_effect = self._get_http_error(500)
+        self.assertRaises(requests.HTTPError, self._service._get_token)
+        self.assertFalse(self._service._token_unsupported)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_get_token_disabled(self, mock_http_request):
+        with testutils.ConfPatcher('metadata_token_ttl', 0, 'ec2'):
+            self.assertIsNone(self._service._get_token())
+        self.assertFalse(mock_http_request.called)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_token')
+    def test_http_request(self, mock_get_token, mock_http_request):
+        mock_get_token.return_value = 'token'
+        response = self._service._http_request('fake_url', headers={'a': 1},
+                                               method='PUT', timeout=5)
+        mock_http_request.assert_called_once_with(
+            'fake_url', None, {'a': 1, ec2service.TOKEN_HEADER: 'token'},
+            method='PUT', timeout=5)
+        self.assertEqual(mock_http_request.return_value, response)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_token')
+    def test_http_request_no_token(self, mock_get_token, mock_http_request):
+        mock_get_token.return_value = None
+        response = self._service._http_request('fake_url')
+        mock_http_request.assert_called_once_with(
+            'fake_url', None, None, method=None, timeout=None)
+        self.assertEqual(mock_http_request.return_value, response)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_http_request_token_renewed(self, mock_http_request):
+        mock_http_request.side_effect = [
+            b'token1', self._get_http_error(401), b'token2',
+            mock.sentinel.data]
+        response = self._service._http_request('fake_url')
+
+        self.assertEqual(mock.sentinel.data, response)
+        self.assertEqual(
+            [mock.call('fake_url', None, {ec2service.TOKEN_HEADER: 'token1'},
+                       method=None, timeout=None),
+             mock.call('fake_url', None, {ec2service.TOKEN_HEADER: 'token2'},
+                       method=None, timeout=None)],
+            [call for call in mock_http_request.call_args_list
+             if call[0][0] == 'fake_url'])
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_token')
+    def test_http_request_error(self, mock_get_token, mock_http_request):
+        mock_get_token.return_value = 'token'
+        mock_http_request.side_effect = self._get_http_error(500)
+        self.assertRaises(requests.HTTPError,
+                          self._service._http_request, 'fake_url')
+        self.assertEqual(1, mock_http_request.call_count)
+
+    def test_get_listing_entries(self):
+        response = self._service._get_listing_entries(
+            b'instance-id\npublic-keys/\n\n0=key-name\n')
+        self.assertEqual(['instance-id', 'public-keys/', '0/'], response)
+
+    def test_is_crawl_excluded(self):
+        meta_data = '%s/meta-data/' % self._service._metadata_version
+        self.assertTrue(self._service._is_crawl_excluded(
+            meta_data + 'iam/info'))
+        self.assertFalse(self._service._is_crawl_excluded(
+            meta_data + 'instance-id'))
+        self.assertFalse(self._service._is_crawl_excluded('iam/'))
+
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_traced_data')
+    def test_crawl_meta_data(self, mock_get_traced_data):
+        version = self._service._metadata_version
+        content = {
+            '%s/meta-data/' % version: b'instance-id\nhostname\n'
+                                       b'public-keys/\niam/',
+            '%s/meta-data/instance-id' % version: b'fake-id',
+            '%s/meta-data/public-keys/' % version: b'0=key',
+            '%s/meta-data/public-keys/0/' % version: b'openssh-key',
+            '%s/user-data' % version: b'fake-user-data',
+        }
+
+        def get_data(path):
+            if path not in content:
+                raise base.NotExistingMetadataException()
+            return content[path]
+
+        mock_get_traced_data.side_effect = get_data
+        self._service._persistent_cache = mock.Mock()
+        with testutils.ConfPatcher('metadata_crawl_depth', 3, 'ec2'):
+            self._service._crawl_meta_data()
+
+        self.assertEqual(b'fake-id', self._service._cache[
+            ('%s/meta-data/instance-id' % version, False)])
+        self.assertEqual(b'0=key', self._service._cache[
+            ('%s/meta-data/public-keys' % version, False)])
+        self.assertEqual(b'fake-user-data', self._service._cache[
+            ('%s/user-data' % version, False)])
+        self.assertEqual(set(['%s/meta-data/hostname' % version]),
+                         self._service._missing_paths)
+        # The excluded paths and the ones deeper than the max. depth
+        # are not fetched.
+        self.assertEqual(6, mock_get_traced_data.call_count)
+        for path in ('meta-data/iam/', 'meta-data/public-keys/0/openssh-key'):
+            self.assertNotIn(mock.call('%s/%s' % (version, path)),
+                             mock_get_traced_data.call_args_list)
+        # Each level is saved with a single write.
+        self._service._persistent_cache.update.assert_has_calls([
+            mock.call({
+                '%s/meta-data' % version:
+                    content['%s/meta-data/' % version],
+                '%s/user-data' % version: b'fake-user-data'}),
+            mock.call({
+                '%s/meta-data/instance-id' % version: b'fake-id',
+                '%s/meta-data/public-keys' % version: b'0=key'}),
+            mock.call({
+                '%s/meta-data/public-keys/0' % version: b'openssh-key'})])
+        self.assertEqual(3, self._service._persistent_cache.update.call_count)
+        self.assertFalse(self._service._persistent_cache.set.called)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService.prefetch')
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._crawl_meta_data')
+    def _test_prefetch(self, mock_crawl_meta_data, mock_prefetch,
+                       crawl_depth=4):
+        with testutils.ConfPatcher('metadata_crawl_depth', crawl_depth,
+                                   'ec2'):
+            self._service.prefetch()
+        self.assertEqual(bool(crawl_depth), mock_crawl_meta_data.called)
+        mock_prefetch.assert_called_once_with()
+
+    def test_prefetch(self):
+        self._test_prefetch()
+
+    def test_prefetch_no_crawl(self):
+        self._test_prefetch(crawl_depth=0)
+
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_cache_data')
+    def test_get_public_keys_error(self, mock_get_cache_data):
+        mock_get_cache_data.side_effect = [
+            '0=key\n1=other', 'fake key', base.NotExistingMetadataException]
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._service.get_public_keys)
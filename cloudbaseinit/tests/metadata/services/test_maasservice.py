@@ -33,9 +33,12 @@ class MaaSHttpServiceTest(unittest.TestCase):
     def setUp(self):
         self._maasservice = maasservice.MaaSHttpService()
 
+    @mock.patch("cloudbaseinit.metadata.services.maasservice.MaaSHttpService"
+                "._fetch_concurrently")
     @mock.patch("cloudbaseinit.metadata.services.maasservice.MaaSHttpService"
                 "._get_cache_data")
-    def _test_load(self, mock_get_cache_data, ip, cache_data_fails=False):
+    def _test_load(self, mock_get_cache_data, mock_fetch_concurrently, ip,
+                   cache_data_fails=False):
         if cache_data_fails:
             mock_get_cache_data.side_effect = Exception
 
@@ -54,6 +57,7 @@ class MaaSHttpServiceTest(unittest.TestCase):
                     self.assertEqual(expected_logging, snatcher.output[-1])
             else:
                 self.assertFalse(response)
+            self.assertFalse(mock_fetch_concurrently.called)
 
     def test_load(self):
         self._test_load(ip='196.254.196.254')
@@ -90,6 +94,24 @@ class MaaSHttpServiceTest(unittest.TestCase):
         self.assertEqual('"consumer_key"', auth_parts['oauth_consumer_key'])
         self.assertEqual('"consumer_secret%26token_secret"',
                          auth_parts['oauth_signature'])
+        self.assertEqual('""', auth_parts['realm'])
+
+    @mock.patch("oauthlib.oauth1.Client")
+    def test_get_oauth_headers_client_reused(self, mock_client):
+        mock_client.return_value.sign.return_value = (
+            None, mock.sentinel.headers, None)
+        for url in ("fake.url", "other.url"):
+            self.assertEqual(mock.sentinel.headers,
+                             self._maasservice._get_oauth_headers(url))
+        mock_client.assert_called_once_with(
+            CONF.maas.oauth_consumer_key,
+            client_secret=CONF.maas.oauth_consumer_secret,
+            resource_owner_key=CONF.maas.oauth_token_key,
+            resource_owner_secret=CONF.maas.oauth_token_secret,
+            signature_method=maasservice.oauth1.SIGNATURE_PLAINTEXT,
+            realm="")
+        mock_client.return_value.sign.assert_has_calls(
+            [mock.call("fake.url"), mock.call("other.url")])
 
     @mock.patch('cloudbaseinit.metadata.services.base.'
                 'BaseHTTPMetadataService._http_request')
@@ -97,8 +119,15 @@ class MaaSHttpServiceTest(unittest.TestCase):
                 '._get_oauth_headers')
     def test_http_request(self, mock_ouath_headers, mock_http_request):
         mock_url = "fake.url"
-        self._maasservice._http_request(mock_url)
-        mock_http_request.assert_called_once_with(mock_url, None, {})
+        mock_ouath_headers.return_value = {"Authorization": "fake"}
+        headers = {"fake-header": "fake-value"}
+        self._maasservice._http_request(mock_url, headers=headers,
+                                        timeout=mock.sentinel.timeout)
+        mock_http_request.assert_called_once_with(
+            mock_url, None, {"fake-header": "fake-value",
+                             "Authorization": "fake"},
+            method=None, timeout=mock.sentinel.timeout)
+        self.assertEqual({"fake-header": "fake-value"}, headers)
 
     @mock.patch("cloudbaseinit.metadata.services.maasservice.MaaSHttpService"
                 "._get_cache_data")
@@ -151,6 +180,15 @@ class MaaSHttpServiceTest(unittest.TestCase):
             decode=True)
         self.assertEqual(certs, response)
 
+    def test_get_prefetch_paths(self):
+        response = self._maasservice._get_prefetch_paths()
+        self.assertEqual(
+            ['%s/%s' % (self._maasservice._metadata_version, path)
+             for path in ('meta-data/local-hostname', 'meta-data/instance-id',
+                          'meta-data/public-keys', 'meta-data/x509',
+                          'user-data')],
+            response)
+
     @mock.patch("cloudbaseinit.metadata.services.maasservice.MaaSHttpService"
                 "._get_cache_data")
     def test_get_user_data(self, mock_get_cache_data):
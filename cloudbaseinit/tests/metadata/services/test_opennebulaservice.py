@@ -58,7 +58,7 @@ write_files:
     content: RG9lcyBpdCB3b3JrPwo=
     owner: root:root
     path: /etc/test_file
-    permissions: '\''0644'\''
+    permissions: '0644'
 packages:
   - ruby2.0"""
 
@@ -83,7 +83,8 @@ USER_DATA='{user_data}'
     mac=MAC.lower(),    # warning: mac is in lowercase
     host_name=HOST_NAME,
     public_key=PUBLIC_KEY,
-    user_data=USER_DATA
+    # the single quotes are escaped as in the shell
+    user_data=USER_DATA.replace("'", "'\\''")
 )
 
 CONTEXT2 = ("""
@@ -173,6 +174,26 @@ class TestOpenNebulaService(_TestOpenNebulaService):
                 (False, True)):
             self._test_parse_shell_variables(crlf=crlf, comment=comment)
 
+    def test_parse_shell_variables_quoting(self):
+        content = textwrap.dedent("""
+            export VAR1='it'\\''s' VAR2="a \\"b\\" \\$c \\d\\
+            e"; VAR3=$'f\\tg\\x41\\101\\'\\q'
+            VAR4=h\\ i VAR5= VAR6='10' VAR7=10$'0' VAR8='j # k' # l
+            VAR9='unterminated
+        """)
+        pairs = self._service._parse_shell_variables(content.encode())
+        self.assertEqual({
+            "VAR1": b"it's",
+            "VAR2": b'a "b" $c \\de',
+            "VAR3": b"f\tgAA'\\q",
+            "VAR4": b"h i",
+            "VAR5": b"",
+            "VAR6": b"10",
+            "VAR7": b"100",
+            "VAR8": b"j # k",
+            "VAR9": b"unterminated\n",
+        }, pairs)
+
     def test_calculate_netmask(self):
         address, gateway, _netmask = (
             "192.168.0.10",
@@ -276,6 +297,7 @@ class TestLoadedOpenNebulaService(_TestOpenNebulaService):
             self._service._raw_content
         )
         self._service._dict_content = vardict
+        self._service._nics = None
 
     def test_get_cache_data(self):
         names = ["smt"]
@@ -335,13 +357,37 @@ class TestLoadedOpenNebulaService(_TestOpenNebulaService):
             self._service.get_network_details()
         )
 
-    @mock.patch("cloudbaseinit.metadata.services"
-                ".opennebulaservice.OpenNebulaService._get_cache_data")
-    def test_get_network_details_exception(self, mock_get_cache):
-        mock_mac = mock_address = mock.MagicMock()
-        mock_mac.upper.return_value = None
-        mock_address.side_effect = None
-        exc = base.NotExistingMetadataException
-        mock_get_cache.side_effect = [mock_mac, mock_address, exc, exc]
-        result_details = self._service.get_network_details()
-        self.assertEqual(result_details, [])
+    def test_get_network_details_incomplete(self):
+        self.load_context(context=(
+            "ETH0_IP='{address}'\nETH0_MASK='{netmask}'\n"
+            "ETH1_MAC='{mac}'\nETH1_IP='{address}'\n"
+            "ETH2_MAC='{mac}'\n".format(address=ADDRESS, netmask=NETMASK,
+                                        mac=MAC)))
+        self.assertEqual([], self._service.get_network_details())
+
+    def test_get_network_details_ipv6(self):
+        self.load_context(context=(
+            "ETH3_MAC='{mac}'\nETH3_IP6='fd00::10'\n"
+            "ETH3_IP6_GATEWAY='fd00::1'\nETH3_MTU=9000\n"
+            "ETH4_MAC='{mac}'\nETH4_IP6='fd01::10'\n"
+            "ETH4_IP6_PREFIX_LENGTH=48\nETH4_GATEWAY6='fd01::1'\n"
+            "ETH4_IP='{address}'\nETH4_GATEWAY='{gateway}'\n".format(
+                mac=MAC.lower(), address=ADDRESS, gateway=GATEWAY)))
+        self.assertEqual([
+            base.NetworkDetails(
+                "eth3", MAC, None, "fd00::10", None, "64", None, None,
+                "fd00::1", []),
+            base.NetworkDetails(
+                "eth4", MAC, ADDRESS, "fd01::10", NETMASK, "48", BROADCAST,
+                GATEWAY, "fd01::1", [])],
+            self._service.get_network_details())
+        self.assertEqual(
+            "9000", self._service._get_nic_value(
+                self._service._get_nics()[3], opennebulaservice.MTU))
+
+    def test_get_nics(self):
+        nics = self._service._get_nics()
+        self.assertEqual([0], list(nics))
+        self.assertEqual(MAC.lower().encode(),
+                         nics[0][opennebulaservice.MAC[0]])
+        self.assertIs(nics, self._service._get_nics())
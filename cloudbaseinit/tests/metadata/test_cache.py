@@ -0,0 +1,162 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import stat
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.metadata import cache
+from cloudbaseinit.tests import testutils
+
+
+class PersistentMetadataCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir_context = testutils.create_tempdir()
+        tempdir = self._tempdir_context.__enter__()
+        self.addCleanup(self._tempdir_context.__exit__, None, None, None)
+        self._cache_dir = os.path.join(tempdir, "cache")
+        self._conf_patcher = testutils.ConfPatcher('metadata_cache_path',
+                                                   self._cache_dir)
+        self._conf_patcher.__enter__()
+        self.addCleanup(self._conf_patcher.__exit__, None, None, None)
+
+    def test_set_and_get_entries(self):
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+        metadata_cache.set("binary", b"\x00fake data")
+        metadata_cache.set("text", u"fake text")
+
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+
+        self.assertEqual({"binary": b"\x00fake data", "text": u"fake text"},
+                         metadata_cache.get_entries())
+        if os.name != "nt":
+            mode = stat.S_IMODE(os.stat(self._cache_dir).st_mode)
+            self.assertEqual(0o700, mode)
+
+    @mock.patch('cloudbaseinit.utils.fileutils.write_file_atomically')
+    def test_update(self, mock_write_file):
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+        metadata_cache.update({"binary": b"fake data", "text": u"fake text"})
+
+        self.assertEqual({"binary": b"fake data", "text": u"fake text"},
+                         metadata_cache.get_entries())
+        self.assertEqual(1, mock_write_file.call_count)
+
+    def test_other_instance(self):
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+        metadata_cache.set("path", b"fake data")
+
+        metadata_cache = cache.PersistentMetadataCache("FakeService",
+                                                       "other id")
+        self.assertEqual({}, metadata_cache.get_entries())
+        metadata_cache = cache.PersistentMetadataCache("OtherService", "id")
+        self.assertEqual({}, metadata_cache.get_entries())
+
+    @mock.patch('time.time')
+    def test_expired_entries(self, mock_time):
+        mock_time.return_value = 1000
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+        metadata_cache.set("old", b"old data")
+        mock_time.return_value = 2000
+        metadata_cache.set("new", b"new data")
+
+        mock_time.return_value = 4000
+        with testutils.ConfPatcher('metadata_cache_ttl', 2500):
+            metadata_cache = cache.PersistentMetadataCache("FakeService",
+                                                           "id")
+
+        self.assertEqual({"new": b"new data"}, metadata_cache.get_entries())
+
+    def test_invalid_file(self):
+        os.makedirs(self._cache_dir)
+        with open(os.path.join(self._cache_dir, "FakeService.json"),
+                  "w") as stream:
+            stream.write("invalid")
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.'
+                                   'cache') as snatcher:
+            metadata_cache = cache.PersistentMetadataCache("FakeService",
+                                                           "id")
+
+        self.assertEqual({}, metadata_cache.get_entries())
+        self.assertEqual(1, len(snatcher.output))
+
+    @mock.patch('cloudbaseinit.utils.fileutils.write_file_atomically')
+    def test_set_save_fails(self, mock_write_file):
+        mock_write_file.side_effect = IOError("fake error")
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.'
+                                   'cache') as snatcher:
+            metadata_cache.set("path", b"fake data")
+
+        self.assertEqual(["Failed to save the metadata cache: fake error"],
+                         snatcher.output)
+        self.assertEqual({"path": b"fake data"},
+                         metadata_cache.get_entries())
+
+    def test_existing_dir_secured(self):
+        os.makedirs(self._cache_dir)
+        os.chmod(self._cache_dir, 0o755)
+        metadata_cache = cache.PersistentMetadataCache("FakeService", "id")
+
+        metadata_cache.set("path", b"fake data")
+        with mock.patch('cloudbaseinit.metadata.cache.'
+                        '_secure_cache_dir') as mock_secure_cache_dir:
+            metadata_cache.set("other path", b"fake data")
+
+        # Secured once, at the first write.
+        self.assertFalse(mock_secure_cache_dir.called)
+        if os.name != "nt":
+            mode = stat.S_IMODE(os.stat(self._cache_dir).st_mode)
+            self.assertEqual(0o700, mode)
+
+    @mock.patch('os.path.exists')
+    @mock.patch('os.makedirs')
+    @mock.patch('os.chmod')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def _test_secure_cache_dir(self, mock_get_os_utils, mock_chmod,
+                               mock_makedirs, mock_exists, os_name,
+                               exists=False):
+        mock_exists.return_value = exists
+        with mock.patch('os.name', os_name):
+            cache._secure_cache_dir(mock.sentinel.path)
+
+        if exists:
+            self.assertFalse(mock_makedirs.called)
+        else:
+            mock_makedirs.assert_called_once_with(mock.sentinel.path)
+        if os_name == "nt":
+            (mock_get_os_utils.return_value.set_path_admin_acls.
+                assert_called_once_with(mock.sentinel.path))
+            self.assertFalse(mock_chmod.called)
+        else:
+            mock_chmod.assert_called_once_with(mock.sentinel.path, 0o700)
+            self.assertFalse(mock_get_os_utils.called)
+
+    def test_secure_cache_dir_windows(self):
+        self._test_secure_cache_dir(os_name="nt")
+
+    def test_secure_cache_dir_posix(self):
+        self._test_secure_cache_dir(os_name="posix")
+
+    def test_secure_cache_dir_existing(self):
+        self._test_secure_cache_dir(os_name="nt", exists=True)
+        self._test_secure_cache_dir(os_name="posix", exists=True)
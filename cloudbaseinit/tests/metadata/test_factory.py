@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
 import unittest
 
 try:
@@ -42,6 +44,8 @@ class MetadataServiceFactoryTests(unittest.TestCase):
         else:
             response = factory.get_metadata_service()
             self.assertEqual(mock_load_class()(), response)
+            response.load_persistent_cache.assert_called_once_with()
+            response.prefetch.assert_called_once_with()
 
     def test_get_metadata_service(self):
         self._test_get_metadata_service()
@@ -54,3 +58,101 @@ class MetadataServiceFactoryTests(unittest.TestCase):
         with testutils.LogSnatcher('cloudbaseinit.metadata.'
                                    'factory'):
             self._test_get_metadata_service(load_exception=True)
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_get_metadata_service_prefetch_exception(self, mock_load_class):
+        services = [mock.Mock(), mock.Mock()]
+        mock_load_class.side_effect = [
+            mock.Mock(return_value=service) for service in services]
+        services[0].prefetch.side_effect = Exception
+
+        with testutils.ConfPatcher('metadata_services', ["0", "1"]):
+            with testutils.LogSnatcher('cloudbaseinit.metadata.'
+                                       'factory') as snatcher:
+                response = factory.get_metadata_service()
+
+        self.assertIs(services[0], response)
+        self.assertFalse(services[1].load.called)
+        self.assertEqual("Failed to prepare the metadata of service '0'",
+                         snatcher.output[0])
+
+
+class ParallelMetadataServiceFactoryTests(unittest.TestCase):
+
+    def _wait_for(self, predicate, timeout=5):
+        deadline = time.time() + timeout
+        while not predicate() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(predicate())
+
+    def _get_metadata_service(self, services, timeout=600):
+        with mock.patch('cloudbaseinit.utils.classloader.ClassLoader.'
+                        'load_class') as mock_load_class:
+            mock_load_class.side_effect = [
+                mock.Mock(return_value=service) for service in services]
+            with testutils.ConfPatcher('metadata_services',
+                                       [str(i) for i in range(
+                                           len(services))]):
+                with testutils.ConfPatcher(
+                        'metadata_services_parallel_discovery', True):
+                    with testutils.ConfPatcher(
+                            'metadata_service_probe_timeout', timeout):
+                        return factory.get_metadata_service()
+
+    def test_get_metadata_service_priority(self):
+        services = [mock.Mock(), mock.Mock(), mock.Mock()]
+        services[0].load.return_value = False
+        services[1].load.return_value = True
+        services[2].load.return_value = True
+
+        response = self._get_metadata_service(services)
+
+        self.assertIs(services[1], response)
+        services[1].load_persistent_cache.assert_called_once_with()
+        services[1].prefetch.assert_called_once_with()
+        self._wait_for(lambda: services[2].cleanup.called)
+        self.assertFalse(services[2].prefetch.called)
+        self.assertFalse(services[0].cleanup.called)
+        self.assertFalse(services[1].cleanup.called)
+
+    def test_get_metadata_service_probe_timeout(self):
+        event = threading.Event()
+        services = [mock.Mock(), mock.Mock()]
+        services[0].load.side_effect = lambda: event.wait(5)
+        services[1].load.return_value = True
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.'
+                                   'factory') as snatcher:
+            response = self._get_metadata_service(services, timeout=0.1)
+
+        self.assertIs(services[1], response)
+        self.assertEqual(["Metadata service '0' did not load in 0.1 "
+                          "seconds"], snatcher.output)
+        event.set()
+        self._wait_for(lambda: services[0].cleanup.called)
+        self.assertFalse(services[1].cleanup.called)
+
+    def test_get_metadata_service_cache_exception(self):
+        services = [mock.Mock()]
+        services[0].load.return_value = True
+        services[0].load_persistent_cache.side_effect = Exception
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.'
+                                   'factory') as snatcher:
+            response = self._get_metadata_service(services)
+
+        self.assertIs(services[0], response)
+        self.assertFalse(services[0].prefetch.called)
+        self.assertEqual("Failed to prepare the metadata of service '0'",
+                         snatcher.output[0])
+
+    def test_get_metadata_service_not_found(self):
+        services = [mock.Mock(), mock.Mock()]
+        services[0].load.return_value = False
+        services[1].load.side_effect = Exception
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.factory'):
+            self.assertRaises(exception.MetadaNotFoundException,
+                              self._get_metadata_service, services)
+        self.assertFalse(services[0].cleanup.called)
+        self.assertFalse(services[1].cleanup.called)
@@ -849,6 +849,56 @@ class TestWindowsUtils(testutils.CloudbaseInitTestBase):
     def test_get_config_value_type_error(self):
         self._test_get_config_value(None)
 
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_set_config_values(self, mock_get_config_key_name):
+        values = {'fake int': 1, 'fake str': 'fake value',
+                  'fake bool': True}
+
+        self._winutils.set_config_values(values, self._SECTION)
+
+        key = self._winreg_mock.CreateKey.return_value.__enter__.return_value
+        self._winreg_mock.CreateKey.assert_called_once_with(
+            self._winreg_mock.HKEY_LOCAL_MACHINE,
+            mock_get_config_key_name.return_value)
+        mock_get_config_key_name.assert_called_once_with(self._SECTION)
+        self._winreg_mock.SetValueEx.assert_has_calls([
+            mock.call(key, 'fake int', 0, self._winreg_mock.REG_DWORD, 1),
+            mock.call(key, 'fake str', 0, self._winreg_mock.REG_SZ,
+                      'fake value'),
+            mock.call(key, 'fake bool', 0, self._winreg_mock.REG_SZ,
+                      True)], any_order=True)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values(self, mock_get_config_key_name):
+        self._winreg_mock.EnumValue.side_effect = [
+            ('fake int', 1, self._winreg_mock.REG_DWORD),
+            ('fake str', 'fake value', self._winreg_mock.REG_SZ),
+            OSError]
+
+        with mock.patch.object(self.windows_utils, 'WindowsError', OSError):
+            response = self._winutils.get_config_values(self._SECTION)
+
+        key = self._winreg_mock.OpenKey.return_value.__enter__.return_value
+        self._winreg_mock.OpenKey.assert_called_once_with(
+            self._winreg_mock.HKEY_LOCAL_MACHINE,
+            mock_get_config_key_name.return_value)
+        self._winreg_mock.EnumValue.assert_has_calls(
+            [mock.call(key, index) for index in range(3)])
+        self.assertEqual({'fake int': 1, 'fake str': 'fake value'},
+                         response)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values_no_key(self, mock_get_config_key_name):
+        self._winreg_mock.OpenKey.side_effect = OSError
+
+        with mock.patch.object(self.windows_utils, 'WindowsError', OSError):
+            response = self._winutils.get_config_values(self._SECTION)
+
+        self.assertEqual({}, response)
+
     @mock.patch('time.sleep')
     def _test_wait_for_boot_completion(self, _, ret_vals=None):
         self._winreg_mock.QueryValueEx.side_effect = ret_vals
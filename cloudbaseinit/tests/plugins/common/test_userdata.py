@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
 import pkgutil
 import tempfile
@@ -32,12 +33,16 @@ from cloudbaseinit.tests import testutils
 
 
 class FakeService(object):
-    def __init__(self, user_data):
+    def __init__(self, user_data, instance_id=None):
         self.user_data = user_data
+        self.instance_id = instance_id
 
     def get_decoded_user_data(self):
         return self.user_data.encode()
 
+    def get_instance_id(self):
+        return self.instance_id
+
 
 def _create_tempfile():
     fd, tmp = tempfile.mkstemp()
@@ -88,9 +93,12 @@ class UserDataPluginTest(unittest.TestCase):
     def test_write_userdata(self):
         self._test_write_userdata(os_exists_effects=(False, True))
 
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._get_ledger')
     @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
                 '._process_user_data')
-    def _test_execute(self, mock_process_user_data, ret_val):
+    def _test_execute(self, mock_process_user_data, mock_get_ledger,
+                      ret_val):
         mock_service = mock.MagicMock()
         mock_service.get_decoded_user_data.side_effect = [ret_val]
 
@@ -98,6 +106,11 @@ class UserDataPluginTest(unittest.TestCase):
                                           shared_data=None)
 
         mock_service.get_decoded_user_data.assert_called_once_with()
+        if ret_val == 'fake_data':
+            mock_get_ledger.assert_called_once_with(mock_service)
+            mock_process_user_data.assert_called_once_with(
+                ret_val, mock_get_ledger.return_value)
+            self.assertEqual(mock_process_user_data.return_value, response)
         if ret_val is metadata_services_base.NotExistingMetadataException:
             self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, False))
         elif ret_val is None:
@@ -116,31 +129,163 @@ class UserDataPluginTest(unittest.TestCase):
     def test_execute_not_user_data(self):
         self._test_execute(ret_val=None)
 
-    @mock.patch('email.message_from_string')
-    @mock.patch('cloudbaseinit.utils.encoding.get_as_string')
-    def test_parse_mime(self, mock_get_as_string,
-                        mock_message_from_string):
-        fake_user_data = textwrap.dedent('''
-        -----BEGIN CERTIFICATE-----
-        MIIDGTCCAgGgAwIBAgIJAN5fj7R5dNrMMA0GCSqGSIb3DQEBCwUAMCExHzAdBgNV
-        BAMTFmNsb3VkYmFzZS1pbml0LWV4YW1wbGUwHhcNMTUwNDA4MTIyNDI1WhcNMjUw
-        ''')
-        expected_logging = ['User data content:\n%s' % fake_user_data]
-        mock_get_as_string.return_value = fake_user_data
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    @mock.patch('cloudbaseinit.plugins.status.get_status_store')
+    def _test_get_ledger(self, mock_get_status_store, mock_get_os_utils,
+                         instance_id, expected_section=None, enabled=True):
+        mock_service = mock.Mock()
+        mock_service.get_instance_id.return_value = instance_id
+
+        with testutils.ConfPatcher('skip_executed_userdata_parts', enabled):
+            response = self._userdata._get_ledger(mock_service)
+
+        if expected_section:
+            mock_get_status_store.assert_called_once_with(
+                mock_get_os_utils.return_value, expected_section)
+            self.assertEqual(mock_get_status_store.return_value, response)
+        else:
+            self.assertFalse(mock_get_status_store.called)
+            self.assertIsNone(response)
+
+    def test_get_ledger(self):
+        self._test_get_ledger(instance_id="fake-id",
+                              expected_section="fake-id/UserDataParts")
+
+    def test_get_ledger_empty_instance_id(self):
+        self._test_get_ledger(instance_id="",
+                              expected_section="UserDataParts")
+
+    def test_get_ledger_no_instance_id(self):
+        self._test_get_ledger(instance_id=None)
+
+    def test_get_ledger_disabled(self):
+        self._test_get_ledger(instance_id="fake-id", enabled=False)
+
+    def test_get_part_hash(self):
+        user_data = (b'Content-Type: multipart/mixed; boundary="b"\n\n'
+                     b'--b\nContent-Type: text/x-shellscript\n\necho 1\n'
+                     b'--b\nContent-Type: text/x-cfninitdata\n\necho 1\n'
+                     b'--b\nContent-Type: text/part-handler\n\npass\n'
+                     b'--b--\n')
+        parts = list(self._userdata._parse_mime(user_data))
+
+        hashes = [self._userdata._get_part_hash(part) for part in parts]
+
+        self.assertIsNone(hashes[0])
+        self.assertEqual(
+            hashlib.sha256(b"text/x-shellscript\0echo 1").hexdigest(),
+            hashes[1])
+        self.assertNotEqual(hashes[1], hashes[2])
+        self.assertIsNone(hashes[3])
+
+    @mock.patch('cloudbaseinit.plugins.common.userdataplugins.factory.'
+                'load_plugins')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._get_part_hash')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._parse_mime')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._process_part')
+    def test_process_user_data_ledger(self, mock_process_part,
+                                      mock_parse_mime, mock_get_part_hash,
+                                      mock_load_plugins):
+        parts = [mock.Mock(), mock.Mock(), mock.Mock()]
+        mock_parse_mime.return_value = parts
+        mock_get_part_hash.side_effect = ["done", None, "rerun"]
+        mock_process_part.return_value = (
+            base.PLUGIN_EXECUTE_ON_NEXT_BOOT, True)
+        ledger = mock.Mock()
+        ledger.get_status.side_effect = {
+            "done": base.PLUGIN_EXECUTION_DONE,
+            "rerun": base.PLUGIN_EXECUTE_ON_NEXT_BOOT}.get
 
         with testutils.LogSnatcher('cloudbaseinit.plugins.common.'
                                    'userdata') as snatcher:
-            response = self._userdata._parse_mime(user_data=fake_user_data)
+            response = self._userdata._process_user_data(
+                b'Content-Type: multipart', ledger)
+
+        self.assertEqual((base.PLUGIN_EXECUTE_ON_NEXT_BOOT, True), response)
+        # The part without a hash is always processed, asking for a reboot.
+        mock_process_part.assert_called_once_with(
+            parts[1], mock_load_plugins.return_value, {}, [])
+        self.assertFalse(ledger.set_status.called)
+        ledger.flush.assert_called_once_with()
+        self.assertEqual(
+            ["Skipping the already executed userdata part: %s, %s" %
+             (parts[0].get_content_type(), parts[0].get_filename())],
+            snatcher.output[1:])
+
+        mock_parse_mime.return_value = parts[2:]
+        mock_get_part_hash.side_effect = ["rerun"]
+        mock_process_part.return_value = (base.PLUGIN_EXECUTION_DONE, False)
+
+        response = self._userdata._process_user_data(
+            b'Content-Type: multipart', ledger)
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        ledger.set_status.assert_called_once_with(
+            "rerun", base.PLUGIN_EXECUTION_DONE)
 
-        mock_get_as_string.assert_called_once_with(fake_user_data)
-        mock_message_from_string.assert_called_once_with(
-            mock_get_as_string.return_value)
-        self.assertEqual(response, mock_message_from_string().walk())
-        self.assertEqual(expected_logging, snatcher.output)
+    @mock.patch('cloudbaseinit.plugins.common.userdataplugins.factory.'
+                'load_plugins')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._get_part_hash')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._parse_mime')
+    @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
+                '._process_part')
+    def test_process_user_data_ledger_same_run(self, mock_process_part,
+                                               mock_parse_mime,
+                                               mock_get_part_hash,
+                                               mock_load_plugins):
+        parts = [mock.Mock() for _ in range(5)]
+        mock_parse_mime.return_value = parts
+        mock_get_part_hash.side_effect = [
+            "same", "same", "failed", "rerun", "rerun"]
+
+        def _process_part(part, user_data_plugins, user_handlers,
+                          failed_parts):
+            if part is parts[2]:
+                failed_parts.append(part)
+            elif part is parts[3]:
+                return base.PLUGIN_EXECUTE_ON_NEXT_BOOT, False
+            return base.PLUGIN_EXECUTION_DONE, False
+
+        mock_process_part.side_effect = _process_part
+        statuses = {}
+        ledger = mock.Mock()
+        ledger.get_status.side_effect = statuses.get
+        ledger.set_status.side_effect = statuses.__setitem__
+
+        response = self._userdata._process_user_data(
+            b'Content-Type: multipart', ledger)
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        # The identical parts are all processed, the failed one is not
+        # recorded and the part to be executed again keeps its status.
+        self.assertEqual(
+            parts, [args[0][0] for args in mock_process_part.call_args_list])
+        self.assertEqual({"same": base.PLUGIN_EXECUTION_DONE,
+                          "rerun": base.PLUGIN_EXECUTE_ON_NEXT_BOOT},
+                         statuses)
+        ledger.flush.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.utils.mime.walk')
+    def test_parse_mime(self, mock_walk):
+        fake_user_data = mock.sentinel.user_data
+
+        response = self._userdata._parse_mime(user_data=fake_user_data)
+
+        mock_walk.assert_called_once_with(fake_user_data)
+        self.assertEqual(mock_walk.return_value, response)
 
     def test_get_header(self):
-        fake_data = "fake-user-data"
-        self.assertEqual(fake_data, self._userdata._get_headers(fake_data))
+        fake_data = b"fake-user-data"
+        self.assertEqual("fake-user-data",
+                         self._userdata._get_headers(fake_data))
+        fake_data = b"Content-Type: multipart/mixed\r\n\r\nContent-Type: x"
+        self.assertEqual("Content-Type: multipart/mixed\r\n",
+                         self._userdata._get_headers(fake_data))
         fake_data = None
         with self.assertRaises(exception.CloudbaseInitException):
             self._userdata._get_headers(fake_data)
@@ -168,8 +313,8 @@ class UserDataPluginTest(unittest.TestCase):
         if user_data.startswith(b'Content-Type: multipart'):
             mock_load_plugins.assert_called_once_with()
             mock_parse_mime.assert_called_once_with(user_data)
-            mock_process_part.assert_called_once_with(mock_part,
-                                                      mock_load_plugins(), {})
+            mock_process_part.assert_called_once_with(
+                mock_part, mock_load_plugins(), {}, [])
             self.assertEqual((base.PLUGIN_EXECUTION_DONE, reboot), response)
         else:
             mock_process_non_multi_part.assert_called_once_with(user_data)
@@ -257,11 +402,14 @@ class UserDataPluginTest(unittest.TestCase):
         mock_part = mock_handlers = mock.MagicMock()
         mock_handlers.get.side_effect = Exception
         mock_part.get_content_type().side_effect = Exception
+        failed_parts = []
         self.assertEqual((1, False),
                          self._userdata._process_part(
                          part=mock_part,
                          user_data_plugins=None,
-                         user_handlers=mock_handlers))
+                         user_handlers=mock_handlers,
+                         failed_parts=failed_parts))
+        self.assertEqual([mock_part], failed_parts)
 
     @mock.patch('cloudbaseinit.plugins.common.userdata.UserDataPlugin'
                 '._begin_part_process_event')
@@ -400,3 +548,32 @@ class TestCloudConfig(unittest.TestCase):
             'Fail to process permissions None, assuming 420'
         ]
         self.assertEqual(expected_logging, snatcher.output)
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_cloud_config_multipart_executed_once(self, mock_get_os_utils):
+        status_file = _create_tempfile()
+        self.addCleanup(os.remove, status_file)
+        os.remove(status_file)
+        paths = list(self.create_tempfiles(4))
+        service = FakeService(self.userdata.format(b64=paths[0],
+                                                   b64_binary=paths[1],
+                                                   gzip=paths[2],
+                                                   gzip_binary=paths[3]),
+                              instance_id="fake-id")
+
+        with testutils.ConfPatcher('plugins_status_store',
+                                   'cloudbaseinit.plugins.status.'
+                                   'JSONFileStatusStore'), \
+                testutils.ConfPatcher('plugins_status_file_path',
+                                      status_file), \
+                testutils.ConfPatcher('skip_executed_userdata_parts', True):
+            self.plugin.execute(service, {})
+            for path in paths:
+                os.remove(path)
+            status, reboot = self.plugin.execute(service, {})
+
+        self.assertEqual((1, False), (status, reboot))
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+            # Restored for the cleanup.
+            open(path, "w").close()
@@ -0,0 +1,38 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.plugins.common.userdataplugins.cloudconfigplugins import (
+    factory
+)
+
+
+class CloudConfigPluginsFactoryTests(unittest.TestCase):
+
+    @mock.patch.object(factory, '_PLUGINS', None)
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_load_plugins(self, mock_load_class):
+        response = factory.load_plugins()
+
+        self.assertEqual(sorted(factory.PLUGINS), sorted(response))
+        self.assertEqual(mock_load_class.return_value.return_value.process,
+                         response['write_files'])
+        self.assertEqual(response, factory.load_plugins())
+        self.assertEqual(len(factory.PLUGINS), mock_load_class.call_count)
@@ -19,12 +19,28 @@ try:
 except ImportError:
     import mock
 
+from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.plugins.common.userdataplugins import factory
 
+CONF = cloudbaseinit_conf.CONF
+
 
 class UserDataPluginsFactoryTests(unittest.TestCase):
 
+    @mock.patch.object(factory, '_PLUGINS', {})
     @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
     def test_process(self, mock_load_class):
         response = factory.load_plugins()
         self.assertTrue(response is not None)
+
+    @mock.patch.object(factory, '_PLUGINS', {})
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_load_plugins_cached(self, mock_load_class):
+        response = factory.load_plugins()
+        self.assertEqual(response, factory.load_plugins())
+        self.assertEqual(len(CONF.user_data_plugins),
+                         mock_load_class.call_count)
+
+        # The callers can't alter the cached plugins.
+        response.clear()
+        self.assertNotEqual({}, factory.load_plugins())
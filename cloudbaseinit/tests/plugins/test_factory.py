@@ -12,7 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import importlib
+import inspect
 import itertools
+import pkgutil
 import unittest
 
 try:
@@ -21,6 +24,7 @@ except ImportError:
     import mock
 
 from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import plugins
 from cloudbaseinit.plugins.common import base
 from cloudbaseinit.plugins import factory
 from cloudbaseinit.tests import testutils
@@ -56,23 +60,29 @@ STAGE = {
 
 class TestPluginFactory(unittest.TestCase):
 
+    def setUp(self):
+        registry_patcher = mock.patch.object(factory, '_REGISTRY', None)
+        registry_patcher.start()
+        self.addCleanup(registry_patcher.stop)
+
     @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
     def _test_load_plugins(self, mock_load_class, stage=None):
         if stage:
             expected_plugins = STAGE.get(stage, [])
         else:
             expected_plugins = list(itertools.chain(*STAGE.values()))
-        expected_load = [mock.call(path) for path in CONF.plugins]
-        side_effect = []
-        for path in expected_plugins:
+        # Only the modules of the plugins executed in the given
+        # stage are imported.
+        expected_load = [mock.call(path) for path in CONF.plugins
+                         if path in expected_plugins]
+
+        def _load_class(class_path):
             plugin = mock.Mock()
-            plugin.execution_stage = (stage if stage in STAGE.keys() else
-                                      None)
-            plugin.return_value = path
-            side_effect.append(plugin)
-        mock_load_class.side_effect = (
-            side_effect + [mock.Mock() for _ in range(len(expected_load) -
-                                                      len(side_effect))])
+            plugin.execution_stage = factory.get_plugin_stage(class_path)
+            plugin.return_value = class_path
+            return plugin
+
+        mock_load_class.side_effect = _load_class
 
         response = factory.load_plugins(stage)
         self.assertEqual(expected_load, mock_load_class.call_args_list)
@@ -123,3 +133,68 @@ class TestPluginFactory(unittest.TestCase):
         self.assertEqual(expected, snatcher.output)
         called = mock_load_class.mock_calls[0]
         self.assertEqual(expected_call, called)
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_load_plugins_cached(self, mock_load_class):
+        plugin_classes = []
+
+        def _load_class(class_path):
+            plugin_cls = mock.Mock()
+            plugin_cls.execution_stage = factory.get_plugin_stage(class_path)
+            plugin_classes.append(plugin_cls)
+            return plugin_cls
+
+        mock_load_class.side_effect = _load_class
+        for stage in STAGE:
+            factory.load_plugins(stage)
+        main_plugins = factory.load_plugins(base.PLUGIN_STAGE_MAIN)
+
+        self.assertEqual(main_plugins,
+                         factory.load_plugins(base.PLUGIN_STAGE_MAIN))
+        self.assertEqual(len(CONF.plugins), mock_load_class.call_count)
+        for plugin_cls in plugin_classes:
+            plugin_cls.assert_called_once_with()
+
+    @testutils.ConfPatcher('plugins', ['fake.plugin.FakePlugin'])
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_load_plugins_unknown_stage(self, mock_load_class):
+        plugin_cls = mock_load_class.return_value
+        plugin_cls.execution_stage = base.PLUGIN_STAGE_PRE_NETWORKING
+
+        self.assertEqual([], factory.load_plugins(base.PLUGIN_STAGE_MAIN))
+        self.assertEqual(
+            [plugin_cls.return_value],
+            factory.load_plugins(base.PLUGIN_STAGE_PRE_NETWORKING))
+        mock_load_class.assert_called_once_with('fake.plugin.FakePlugin')
+        plugin_cls.assert_called_once_with()
+
+    def test_get_plugin_stage(self):
+        self.assertEqual(
+            base.PLUGIN_STAGE_PRE_NETWORKING,
+            factory.get_plugin_stage('cloudbaseinit.plugins.windows.'
+                                     'ntpclient.NTPClientPlugin'))
+        self.assertEqual(
+            base.PLUGIN_STAGE_MAIN,
+            factory.get_plugin_stage('cloudbaseinit.plugins.common.'
+                                     'userdata.UserDataPlugin'))
+        self.assertIsNone(factory.get_plugin_stage('fake.FakePlugin'))
+
+    def test_plugin_stages_match_classes(self):
+        # The stages known in advance must match the ones declared
+        # by the bundled plugin classes.
+        for _, module_name, _ in pkgutil.walk_packages(
+                plugins.__path__, plugins.__name__ + '.'):
+            try:
+                module = importlib.import_module(module_name)
+            except Exception:
+                # Some modules can be imported only on Windows.
+                continue
+
+            for name, value in vars(module).items():
+                if (inspect.isclass(value) and
+                        issubclass(value, base.BasePlugin) and
+                        value.__module__ == module_name):
+                    class_path = '%s.%s' % (module_name, name)
+                    self.assertEqual(value.execution_stage,
+                                     factory.get_plugin_stage(class_path),
+                                     class_path)
@@ -0,0 +1,122 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.plugins import scheduler
+from cloudbaseinit.tests import testutils
+
+
+def _make_plugin(name, requires=(), provides=()):
+    plugin = mock.Mock()
+    plugin.name = name
+    plugin.requires = requires
+    plugin.provides = provides
+    return plugin
+
+
+class TestPluginScheduler(unittest.TestCase):
+
+    def test_get_dependencies(self):
+        plugins = [
+            _make_plugin("createuser", provides=("user", "password")),
+            _make_plugin("ntp"),
+            _make_plugin("setpassword", requires=("user", "password"),
+                         provides=("password", )),
+            _make_plugin("network", provides=("network", )),
+            _make_plugin("licensing", requires=("network", )),
+            _make_plugin("userdata", requires=None, provides=None),
+            _make_plugin("rdp"),
+        ]
+
+        dependencies = scheduler.get_dependencies(plugins)
+
+        self.assertEqual([set(), set(), {0}, set(), {3},
+                          {0, 1, 2, 3, 4}, {5}], dependencies)
+
+    def test_get_dependencies_write_after_read(self):
+        plugins = [_make_plugin("reader", requires=("password", )),
+                   _make_plugin("writer", provides=("password", ))]
+
+        dependencies = scheduler.get_dependencies(plugins)
+
+        self.assertEqual([set(), {0}], dependencies)
+
+    def test_execute_concurrently(self):
+        barrier = threading.Event()
+        executed = []
+        plugins = [_make_plugin("first"), _make_plugin("second"),
+                   _make_plugin("third", requires=("first", ))]
+        plugins[0].provides = ("first", )
+
+        def exec_plugin(plugin):
+            # The first plugin finishes only after the second one
+            # started, which is possible only if they run concurrently.
+            if plugin.name == "first":
+                self.assertTrue(barrier.wait(5))
+            elif plugin.name == "second":
+                barrier.set()
+            executed.append(plugin.name)
+            return True, False
+
+        plugin_scheduler = scheduler.PluginScheduler(plugins, 2)
+        response = plugin_scheduler.execute(exec_plugin)
+
+        self.assertEqual((True, False), response)
+        self.assertEqual(["second", "first", "third"], executed)
+
+    def test_execute_failure(self):
+        plugins = [_make_plugin("first"), _make_plugin("second")]
+
+        def exec_plugin(plugin):
+            if plugin.name == "first":
+                raise Exception("fake error")
+            return True, False
+
+        plugin_scheduler = scheduler.PluginScheduler(plugins, 2)
+        with testutils.LogSnatcher('cloudbaseinit.plugins.scheduler'):
+            response = plugin_scheduler.execute(exec_plugin)
+
+        self.assertEqual((False, False), response)
+
+    def _test_execute_reboot(self, allow_reboot):
+        executed = []
+        plugins = [_make_plugin("first", provides=("reboot", )),
+                   _make_plugin("second", requires=("reboot", )),
+                   _make_plugin("third")]
+
+        def exec_plugin(plugin):
+            executed.append(plugin.name)
+            return True, plugin.name == "first"
+
+        plugin_scheduler = scheduler.PluginScheduler(plugins, 1)
+        with testutils.ConfPatcher('allow_reboot', allow_reboot):
+            response = plugin_scheduler.execute(exec_plugin)
+
+        self.assertEqual((True, True), response)
+        return executed
+
+    def test_execute_reboot(self):
+        executed = self._test_execute_reboot(allow_reboot=True)
+        self.assertEqual(["first"], executed)
+
+    def test_execute_reboot_not_allowed(self):
+        executed = self._test_execute_reboot(allow_reboot=False)
+        self.assertEqual(["first", "second", "third"], executed)
@@ -0,0 +1,134 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.osutils import base as osutils_base
+from cloudbaseinit.plugins import status
+from cloudbaseinit.tests import testutils
+
+
+class TestRegistryStatusStore(unittest.TestCase):
+
+    def setUp(self):
+        self._osutils = mock.Mock()
+        self._osutils.get_config_values.return_value = {'FakePlugin': 1}
+        self._store = status.RegistryStatusStore(self._osutils,
+                                                 'fake section')
+
+    def test_get_status(self):
+        self.assertEqual(1, self._store.get_status('FakePlugin'))
+        self.assertIsNone(self._store.get_status('OtherPlugin'))
+        self._osutils.get_config_values.assert_called_once_with(
+            'fake section')
+
+    def test_set_status(self):
+        self._store.set_status('OtherPlugin', 2)
+
+        self.assertEqual(2, self._store.get_status('OtherPlugin'))
+        self.assertFalse(self._osutils.set_config_values.called)
+
+    def test_flush(self):
+        self._store.set_status('OtherPlugin', 2)
+        self._store.set_status('FakePlugin', 2)
+
+        self._store.flush()
+        self._store.flush()
+
+        self._osutils.set_config_values.assert_called_once_with(
+            {'OtherPlugin': 2, 'FakePlugin': 2}, 'fake section')
+
+    def test_flush_no_changes(self):
+        self._store.flush()
+
+        self.assertFalse(self._osutils.set_config_values.called)
+
+
+class TestJSONFileStatusStore(unittest.TestCase):
+
+    def test_default_path(self):
+        with testutils.ConfPatcher('plugins_status_file_path', None):
+            store = status.JSONFileStatusStore(mock.sentinel.osutils,
+                                               'fake section')
+
+        self.assertEqual(
+            os.path.abspath(os.path.expandvars(
+                status.DEFAULT_STATUS_FILE_PATH)),
+            store._path)
+
+    def test_save_and_load(self):
+        with testutils.create_tempdir() as tempdir:
+            path = os.path.join(tempdir, 'status', 'status.json')
+            with testutils.ConfPatcher('plugins_status_file_path', path):
+                store = status.JSONFileStatusStore(mock.sentinel.osutils,
+                                                   'id/Plugins')
+                self.assertIsNone(store.get_status('FakePlugin'))
+                store.set_status('FakePlugin', 1)
+                store.flush()
+
+                other_store = status.JSONFileStatusStore(
+                    mock.sentinel.osutils, 'other/Plugins')
+                other_store.set_status('FakePlugin', 2)
+                other_store.flush()
+
+                store = status.JSONFileStatusStore(mock.sentinel.osutils,
+                                                   'id/Plugins')
+                self.assertEqual(1, store.get_status('FakePlugin'))
+
+            with open(path) as stream:
+                content = json.load(stream)
+            self.assertFalse(os.path.exists(path + '.tmp'))
+
+        self.assertEqual({'id/Plugins': {'FakePlugin': 1},
+                          'other/Plugins': {'FakePlugin': 2}}, content)
+
+
+class TestGetStatusStore(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_get_status_store(self, mock_load_class):
+        with testutils.ConfPatcher('plugins_status_store', 'fake.Store'):
+            response = status.get_status_store(mock.sentinel.osutils,
+                                               'fake section')
+
+        mock_load_class.assert_called_once_with('fake.Store')
+        mock_load_class.return_value.assert_called_once_with(
+            mock.sentinel.osutils, 'fake section')
+        self.assertEqual(mock_load_class.return_value.return_value,
+                         response)
+
+    def _test_get_status_store_default(self, osutils, expected_cls):
+        with testutils.ConfPatcher('plugins_status_store', None):
+            response = status.get_status_store(osutils, 'fake section')
+
+        self.assertIsInstance(response, expected_cls)
+
+    def test_get_status_store_default_config_values(self):
+        class FakeOSUtils(osutils_base.BaseOSUtils):
+            def get_config_values(self, section=None):
+                return {}
+
+        self._test_get_status_store_default(
+            FakeOSUtils(), status.RegistryStatusStore)
+
+    def test_get_status_store_default_no_config_values(self):
+        self._test_get_status_store_default(
+            osutils_base.BaseOSUtils(), status.JSONFileStatusStore)
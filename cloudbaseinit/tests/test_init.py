@@ -71,49 +71,55 @@ class TestInitManager(unittest.TestCase):
     def test_get_plugin_section_no_id(self):
         self._test_get_plugin_section(instance_id=None)
 
+    @mock.patch('cloudbaseinit.plugins.status.get_status_store')
     @mock.patch('cloudbaseinit.init.InitManager._get_plugins_section')
-    def test_get_plugin_status(self, mock_get_plugins_section):
-        self.osutils.get_config_value.return_value = 1
-        response = self._init._get_plugin_status(self.osutils, 'fake id',
-                                                 'fake plugin')
+    def test_get_plugins_status_store(self, mock_get_plugins_section,
+                                      mock_get_status_store):
+        response = self._init._get_plugins_status_store(self.osutils,
+                                                        'fake id')
         mock_get_plugins_section.assert_called_once_with('fake id')
-        self.osutils.get_config_value.assert_called_once_with(
-            'fake plugin', mock_get_plugins_section())
-        self.assertTrue(response == 1)
+        mock_get_status_store.assert_called_once_with(
+            self.osutils, mock_get_plugins_section.return_value)
+        self.assertEqual(mock_get_status_store.return_value, response)
 
-    @mock.patch('cloudbaseinit.init.InitManager._get_plugins_section')
-    def test_set_plugin_status(self, mock_get_plugins_section):
-        self._init._set_plugin_status(self.osutils, 'fake id',
-                                      'fake plugin', 'status')
-        mock_get_plugins_section.assert_called_once_with('fake id')
-        self.osutils.set_config_value.assert_called_once_with(
-            'fake plugin', 'status', mock_get_plugins_section())
-
-    @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
-    @mock.patch('cloudbaseinit.init.InitManager._set_plugin_status')
-    def _test_exec_plugin(self, status, mock_set_plugin_status,
-                          mock_get_plugin_status):
+    def _test_exec_plugin(self, status):
         fake_name = 'fake name'
+        status_store = mock.Mock()
         self.plugin.get_name.return_value = fake_name
         self.plugin.execute.return_value = (status, True)
-        mock_get_plugin_status.return_value = status
+        status_store.get_status.return_value = status
 
-        response = self._init._exec_plugin(osutils=self.osutils,
+        response = self._init._exec_plugin(status_store=status_store,
                                            service='fake service',
                                            plugin=self.plugin,
-                                           instance_id='fake id',
                                            shared_data='shared data')
 
-        mock_get_plugin_status.assert_called_once_with(self.osutils,
-                                                       'fake id',
-                                                       fake_name)
+        status_store.get_status.assert_called_once_with(fake_name)
         if status is base.PLUGIN_EXECUTE_ON_NEXT_BOOT:
             self.plugin.execute.assert_called_once_with('fake service',
                                                         'shared data')
-            mock_set_plugin_status.assert_called_once_with(self.osutils,
-                                                           'fake id',
-                                                           fake_name, status)
-            self.assertTrue(response)
+            status_store.set_status.assert_called_once_with(fake_name,
+                                                            status)
+            status_store.flush.assert_called_once_with()
+            self.assertEqual((True, True), response)
+        else:
+            self.assertFalse(self.plugin.execute.called)
+            self.assertFalse(status_store.set_status.called)
+            self.assertFalse(status_store.flush.called)
+            self.assertEqual((True, None), response)
+
+    def test_exec_plugin_no_status_store(self):
+        self.plugin.execute.return_value = (base.PLUGIN_EXECUTION_DONE,
+                                            False)
+
+        response = self._init._exec_plugin(status_store=None,
+                                           service='fake service',
+                                           plugin=self.plugin,
+                                           shared_data='shared data')
+
+        self.plugin.execute.assert_called_once_with('fake service',
+                                                    'shared data')
+        self.assertEqual((True, False), response)
 
     def test_exec_plugin_exception_occurs(self):
         fake_name = 'fake name'
@@ -123,10 +129,9 @@ class TestInitManager(unittest.TestCase):
         expected_logging = ["Executing plugin 'fake name'",
                             "plugin 'fake name' failed with error ''"]
         with testutils.LogSnatcher('cloudbaseinit.init') as snatcher:
-            self._init._exec_plugin(osutils=self.osutils,
+            self._init._exec_plugin(status_store=mock.Mock(),
                                     service='fake service',
                                     plugin=mock_plugin,
-                                    instance_id='fake id',
                                     shared_data='shared data')
         self.assertEqual(expected_logging, snatcher.output[:2])
 
@@ -178,6 +183,8 @@ class TestInitManager(unittest.TestCase):
                                                             self.plugin)
         self.assertFalse(response)
 
+    @mock.patch('cloudbaseinit.init.InitManager.'
+                '_get_plugins_status_store')
     @mock.patch('cloudbaseinit.init.InitManager.'
                 '_exec_plugin')
     @mock.patch('cloudbaseinit.init.InitManager.'
@@ -186,6 +193,7 @@ class TestInitManager(unittest.TestCase):
     def _test_handle_plugins_stage(self, mock_load_plugins,
                                    mock_check_plugin_os_requirements,
                                    mock_exec_plugin,
+                                   mock_get_plugins_status_store,
                                    reboot=True, fast_reboot=True,
                                    success=True):
         stage = "fake stage"
@@ -196,8 +204,8 @@ class TestInitManager(unittest.TestCase):
         mock_load_plugins.return_value = plugins
         requirements_calls = [mock.call(self.osutils, plugin)
                               for plugin in plugins]
-        exec_plugin_calls = [mock.call(self.osutils, service, plugin,
-                                       instance_id, {})
+        status_store = mock_get_plugins_status_store.return_value
+        exec_plugin_calls = [mock.call(status_store, service, plugin, {})
                              for plugin in plugins]
 
         with testutils.LogSnatcher('cloudbaseinit.init') as snatcher:
@@ -211,6 +219,9 @@ class TestInitManager(unittest.TestCase):
         mock_check_plugin_os_requirements.assert_has_calls(
             requirements_calls[:idx])
         mock_exec_plugin.assert_has_calls(exec_plugin_calls[:idx])
+        mock_get_plugins_status_store.assert_called_once_with(
+            self.osutils, instance_id)
+        status_store.flush.assert_called_once_with()
         self.assertEqual((success, reboot), response)
 
     def test_handle_plugins_stage(self):
@@ -226,6 +237,57 @@ class TestInitManager(unittest.TestCase):
     def test_handle_plugins_stage_stage_fails(self):
         self._test_handle_plugins_stage(success=False)
 
+    @testutils.ConfPatcher('plugins_max_workers', 4)
+    @mock.patch('cloudbaseinit.plugins.scheduler.PluginScheduler')
+    @mock.patch('cloudbaseinit.init.InitManager.'
+                '_get_plugins_status_store')
+    @mock.patch('cloudbaseinit.init.InitManager._exec_plugin')
+    @mock.patch('cloudbaseinit.init.InitManager.'
+                '_check_plugin_os_requirements')
+    @mock.patch('cloudbaseinit.plugins.factory.load_plugins')
+    def test_handle_plugins_stage_concurrently(
+            self, mock_load_plugins, mock_check_plugin_os_requirements,
+            mock_exec_plugin, mock_get_plugins_status_store,
+            mock_plugin_scheduler):
+        service, instance_id = mock.Mock(), mock.Mock()
+        plugins = [mock.Mock() for _ in range(3)]
+        mock_load_plugins.return_value = plugins
+        mock_check_plugin_os_requirements.side_effect = [True, False, True]
+        mock_execute = mock_plugin_scheduler.return_value.execute
+
+        response = self._init._handle_plugins_stage(
+            self.osutils, service, instance_id, "fake stage")
+
+        self.assertEqual(mock_execute.return_value, response)
+        mock_plugin_scheduler.assert_called_once_with(
+            [plugins[0], plugins[2]], 4)
+        exec_plugin = mock_execute.call_args[0][0]
+        self.assertEqual(mock_exec_plugin.return_value,
+                         exec_plugin(plugins[0]))
+        status_store = mock_get_plugins_status_store.return_value
+        mock_exec_plugin.assert_called_once_with(
+            status_store, service, plugins[0], {})
+        status_store.flush.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.init.InitManager.'
+                '_get_plugins_status_store')
+    @mock.patch('cloudbaseinit.init.InitManager._exec_plugin')
+    @mock.patch('cloudbaseinit.init.InitManager.'
+                '_check_plugin_os_requirements')
+    @mock.patch('cloudbaseinit.plugins.factory.load_plugins')
+    def test_handle_plugins_stage_no_instance_id(
+            self, mock_load_plugins, mock_check_plugin_os_requirements,
+            mock_exec_plugin, mock_get_plugins_status_store):
+        plugins = [mock.Mock()]
+        mock_load_plugins.return_value = plugins
+        mock_exec_plugin.return_value = True, False
+
+        self._init._handle_plugins_stage(
+            self.osutils, None, None, "fake stage")
+
+        self.assertFalse(mock_get_plugins_status_store.called)
+        mock_exec_plugin.assert_called_once_with(None, None, plugins[0], {})
+
     @mock.patch('cloudbaseinit.init.InitManager.'
                 '_reset_service_password_and_respawn')
     @mock.patch('cloudbaseinit.init.InitManager'
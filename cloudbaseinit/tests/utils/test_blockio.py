@@ -0,0 +1,143 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudbaseinit.utils import blockio
+
+_DATA = bytes(bytearray(range(251))) * 41
+
+
+class _FakeBlockReader(blockio.BlockReader):
+
+    """Reader of the given data, of unknown size."""
+
+    def __init__(self, data, block_size=512, window_size=2048):
+        super(_FakeBlockReader, self).__init__(block_size, window_size)
+        self._data = data
+        self.reads = []
+
+    def _read_blocks(self, offset, view):
+        assert not offset % self.block_size
+        assert not len(view) % self.block_size
+        self.reads.append((offset, len(view)))
+        data = self._data[offset:offset + len(view)]
+        view[:len(data)] = data
+        return len(data)
+
+
+class TestBlockReader(unittest.TestCase):
+
+    def setUp(self):
+        self._reader = _FakeBlockReader(_DATA)
+
+    def test_window_size(self):
+        reader = _FakeBlockReader(_DATA, block_size=512, window_size=1000)
+        self.assertEqual(512, len(reader._window))
+
+    def test_read_from_window(self):
+        self._reader.seek(10)
+        self.assertEqual(_DATA[10:20], self._reader.read(10))
+        self._reader.seek(1000)
+        self.assertEqual(_DATA[1000:1100], self._reader.read(100))
+
+        self.assertEqual(1100, self._reader.tell())
+        self.assertEqual([(0, 2048)], self._reader.reads)
+
+    def test_read_over_windows(self):
+        self._reader.seek(2000)
+        self.assertEqual(_DATA[2000:2100], self._reader.read(100))
+        self.assertEqual([(1536, 2048)], self._reader.reads)
+
+        self.assertEqual(_DATA[2100:4000], self._reader.read(1900))
+        self.assertEqual([(1536, 2048), (3584, 2048)], self._reader.reads)
+
+    def test_readinto_large_aligned(self):
+        buffer = bytearray(5000)
+        self._reader.seek(1024)
+
+        self.assertEqual(5000, self._reader.readinto(buffer))
+
+        self.assertEqual(_DATA[1024:6024], bytes(buffer))
+        # The whole blocks are read in the buffer, the rest through the
+        # window.
+        self.assertEqual([(1024, 4608), (5632, 2048)], self._reader.reads)
+
+    def test_readinto_memoryview(self):
+        buffer = bytearray(20)
+        self._reader.seek(5)
+
+        self.assertEqual(10, self._reader.readinto(memoryview(buffer)[5:15]))
+
+        self.assertEqual(b"\x00" * 5 + _DATA[5:15] + b"\x00" * 5,
+                         bytes(buffer))
+
+    def test_read_end(self):
+        self._reader.seek(len(_DATA) - 10)
+        self.assertEqual(_DATA[-10:], self._reader.read(100))
+        self.assertEqual(b"", self._reader.read(100))
+        self._reader.seek(len(_DATA) + 1000)
+        self.assertEqual(b"", self._reader.read(100))
+
+    def test_read_all(self):
+        self._reader.seek(100)
+        self.assertEqual(_DATA[100:], self._reader.read())
+        self.assertEqual(len(_DATA), self._reader.tell())
+
+    def test_prefetch(self):
+        self._reader.prefetch(600)
+        self._reader.seek(700)
+
+        self.assertEqual(_DATA[700:2000], self._reader.read(1300))
+        self.assertEqual([(512, 2048)], self._reader.reads)
+
+    def test_seek(self):
+        self.assertEqual(10, self._reader.seek(10))
+        self.assertEqual(15, self._reader.seek(5, os.SEEK_CUR))
+        self.assertRaises(ValueError, self._reader.seek, -1)
+
+
+class TestFileBlockReader(unittest.TestCase):
+
+    def setUp(self):
+        self._stream = io.BytesIO(_DATA)
+        self._reader = blockio.FileBlockReader(self._stream, 512, 2048)
+
+    def test_size(self):
+        self.assertEqual(len(_DATA), self._reader.size)
+
+    def test_seek_end(self):
+        self._reader.seek(-10, os.SEEK_END)
+        self.assertEqual(_DATA[-10:], self._reader.read(100))
+
+    def test_read(self):
+        self._reader.seek(3000)
+        self.assertEqual(_DATA[3000:9000], self._reader.read(6000))
+        self.assertEqual(_DATA[9000:], self._reader.read(len(_DATA)))
+
+    def test_read_image_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "image")
+        with open(path, "wb") as stream:
+            stream.write(_DATA)
+
+        with open(path, "rb", buffering=0) as stream:
+            reader = blockio.FileBlockReader(stream)
+            reader.seek(513)
+            self.assertEqual(_DATA[513:], reader.read())
@@ -0,0 +1,86 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+from cloudbaseinit.utils import concurrency
+
+
+class ConcurrencyTests(unittest.TestCase):
+
+    def test_map_concurrently(self):
+        def _function(item):
+            if item == 2:
+                raise ValueError(item)
+            return item * 10
+
+        results = concurrency.map_concurrently(_function, [1, 2, 3], 2)
+
+        self.assertEqual((10, None), results[0])
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], ValueError)
+        self.assertEqual((30, None), results[2])
+
+    def test_map_concurrently_bounded(self):
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def _function(item):
+            with lock:
+                running.append(item)
+                max_running.append(len(running))
+            barrier.wait(0.1)
+            with lock:
+                running.remove(item)
+
+        barrier = threading.Event()
+        concurrency.map_concurrently(_function, range(6), 3)
+
+        self.assertEqual(3, max(max_running))
+
+    def test_map_concurrently_no_items(self):
+        self.assertEqual([], concurrency.map_concurrently(None, [], 4))
+
+    def test_get_first_result(self):
+        slow_call = threading.Event()
+
+        def _function(item):
+            if item == "slow":
+                slow_call.wait(5)
+            elif item == "error":
+                raise ValueError(item)
+            return item if item != "false" else None
+
+        try:
+            response = concurrency.get_first_result(
+                _function, ["slow", "error", "false", "fast"], 4)
+        finally:
+            slow_call.set()
+
+        self.assertEqual(("fast", "fast"), response)
+
+    def test_get_first_result_skips_pending_items(self):
+        calls = []
+        response = concurrency.get_first_result(
+            lambda item: calls.append(item) or True, [1, 2, 3], 1)
+
+        self.assertEqual((1, True), response)
+        self.assertEqual([1], calls)
+
+    def test_get_first_result_failed(self):
+        self.assertIsNone(concurrency.get_first_result(
+            lambda item: None, [1, 2], 2))
+        self.assertIsNone(concurrency.get_first_result(None, [], 2))
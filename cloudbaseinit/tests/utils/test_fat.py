@@ -0,0 +1,411 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import io
+import struct
+import threading
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import fat
+
+SECTOR_SIZE = 512
+META_DATA = b'{"uuid": "fake-uuid", "hostname": "fake-host"}'
+USER_DATA = b"#ps1\n" + b"Write-Host fake\n" * 300
+TREE = {
+    "openstack": {
+        "latest": {
+            "meta_data.json": META_DATA,
+            "user_data": USER_DATA,
+            "network_data.json": b"{}",
+        },
+        "content": {"0000": b""},
+    },
+    "ec2": {},
+    "README.TXT": b"fake readme",
+}
+# Cluster counts giving each of the FAT types.
+CLUSTERS = {12: 400, 16: 5000, 32: 66000}
+
+
+def _ceil_div(value, divisor):
+    return -(-value // divisor)
+
+
+class _FATBuilder(object):
+
+    """Generate FAT volumes, like mkfs.vfat and mcopy would.
+
+    The names which don't fit in the 8.3 format get long name entries,
+    while the lower case 8.3 names use the case flags of Windows NT.
+    """
+
+    def __init__(self, tree, fat_bits=12, label=b"config-2",
+                 boot_label=b"NO NAME", fragmented=False, cluster_sectors=1):
+        self._tree = tree
+        self._fat_bits = fat_bits
+        self._label = label
+        self._boot_label = boot_label
+        self._fragmented = fragmented
+        self._cluster_size = cluster_sectors * SECTOR_SIZE
+        self._cluster_sectors = cluster_sectors
+
+        self._clusters = CLUSTERS[fat_bits]
+        self._reserved_sectors = 32 if fat_bits == 32 else 1
+        self._root_entries = 0 if fat_bits == 32 else 512
+        self._fat_sectors = _ceil_div(
+            (self._clusters + 2) * fat_bits // 8 + 1, SECTOR_SIZE)
+        self._root_offset = (self._reserved_sectors +
+                             2 * self._fat_sectors) * SECTOR_SIZE
+        self._data_offset = self._root_offset + self._root_entries * 32
+        self._total_sectors = (self._data_offset // SECTOR_SIZE +
+                               self._clusters * cluster_sectors)
+
+        self._image = bytearray(self._total_sectors * SECTOR_SIZE)
+        self._fat = {}
+        self._next_cluster = 2
+        self._short_names = 0
+
+    def _allocate(self, size):
+        count = max(1, _ceil_div(size, self._cluster_size))
+        clusters = []
+        for _ in range(count):
+            clusters.append(self._next_cluster)
+            # Leaves free clusters between the ones allocated.
+            self._next_cluster += 2 if self._fragmented else 1
+        for cluster, next_cluster in zip(clusters, clusters[1:]):
+            self._fat[cluster] = next_cluster
+        self._fat[clusters[-1]] = (1 << min(self._fat_bits, 28)) - 1
+        return clusters
+
+    def _write_clusters(self, clusters, data):
+        for index, cluster in enumerate(clusters):
+            offset = (self._data_offset +
+                      (cluster - 2) * self._cluster_size)
+            chunk = data[index * self._cluster_size:
+                         (index + 1) * self._cluster_size]
+            self._image[offset:offset + len(chunk)] = chunk
+
+    @staticmethod
+    def _get_entry(short_name, attributes, cluster, size, case=0):
+        return (short_name + struct.pack(
+            "<BBB6xHHHHI", attributes, case, 0, cluster >> 16, 0, 0,
+            cluster & 0xFFFF, size))
+
+    def _get_name_entries(self, name):
+        """Get the short name and the long name entries, if needed."""
+        base, _, extension = name.partition(".")
+        if (len(base) <= 8 and len(extension) <= 3 and
+                "_" not in name and name.count(".") <= 1):
+            case = 0
+            if base.islower():
+                case |= fat.CASE_LOWER_BASE
+            if extension.islower():
+                case |= fat.CASE_LOWER_EXTENSION
+            short_name = (base.upper().ljust(8) +
+                          extension.upper().ljust(3)).encode("ascii")
+            return short_name, case, []
+
+        self._short_names += 1
+        tail = "~%d" % self._short_names
+        short_name = (base.upper().replace("_", "")[:8 - len(tail)] +
+                      tail).ljust(8)
+        short_name = (short_name + extension.upper()[:3].ljust(3)).encode(
+            "ascii")
+        checksum = fat._get_short_name_checksum(short_name)
+
+        encoded = name.encode("utf-16-le") + b"\x00\x00"
+        parts_count = _ceil_div(len(encoded), 26)
+        encoded = encoded.ljust(parts_count * 26, b"\xff")
+        entries = []
+        for index in range(parts_count):
+            part = encoded[index * 26:(index + 1) * 26]
+            order = index + 1
+            if index == parts_count - 1:
+                order |= fat.LONG_NAME_LAST
+            entries.insert(0, struct.pack("B", order) + part[:10] +
+                           struct.pack("BBB", fat.ATTR_LONG_NAME, 0,
+                                       checksum) +
+                           part[10:22] + b"\x00\x00" + part[22:])
+        return short_name, 0, entries
+
+    def _add_directory(self, tree, parent_cluster=None):
+        is_root = parent_cluster is None
+        entries = []
+        if is_root:
+            if self._label:
+                entries.append(self._get_entry(self._label.ljust(11),
+                                               fat.ATTR_VOLUME_ID, 0, 0))
+            # A deleted file, to be skipped.
+            entries.append(self._get_entry(b"\xe5ELETED TXT", 0, 0, 10))
+
+        names = dict((name, self._get_name_entries(name)) for name in tree)
+        entry_count = sum(1 + len(long_name_entries) for _, _,
+                          long_name_entries in names.values())
+        entry_count += len(entries) + 2
+        clusters = None
+        cluster = 0
+        if not is_root or self._fat_bits == 32:
+            clusters = self._allocate(entry_count * 32)
+            cluster = clusters[0]
+        if not is_root:
+            entries.append(self._get_entry(b".          ",
+                                           fat.ATTR_DIRECTORY, cluster, 0))
+            entries.append(self._get_entry(b"..         ",
+                                           fat.ATTR_DIRECTORY,
+                                           parent_cluster, 0))
+
+        for name, content in sorted(tree.items()):
+            short_name, case, long_name_entries = names[name]
+            entries.extend(long_name_entries)
+            if isinstance(content, dict):
+                child_cluster = self._add_directory(content, cluster)
+                entries.append(self._get_entry(
+                    short_name, fat.ATTR_DIRECTORY, child_cluster, 0, case))
+            else:
+                child_cluster = 0
+                if content:
+                    child_clusters = self._allocate(len(content))
+                    self._write_clusters(child_clusters, content)
+                    child_cluster = child_clusters[0]
+                entries.append(self._get_entry(
+                    short_name, 0, child_cluster, len(content), case))
+
+        data = b"".join(entries)
+        if clusters:
+            self._write_clusters(clusters, data)
+        else:
+            self._image[self._root_offset:
+                        self._root_offset + len(data)] = data
+        return cluster
+
+    def _write_fat(self):
+        fat_size = self._fat_sectors * SECTOR_SIZE
+        table = bytearray(fat_size)
+        end_of_chain = (1 << min(self._fat_bits, 28)) - 1
+        values = dict(self._fat)
+        values[0] = end_of_chain & ~0xFF | 0xF8
+        values[1] = end_of_chain
+        for cluster, value in values.items():
+            if self._fat_bits == 12:
+                offset = cluster + cluster // 2
+                word = struct.unpack_from("<H", table, offset)[0]
+                if cluster & 1:
+                    word = (word & 0x000F) | (value << 4)
+                else:
+                    word = (word & 0xF000) | value
+                struct.pack_into("<H", table, offset, word)
+            elif self._fat_bits == 16:
+                struct.pack_into("<H", table, cluster * 2, value)
+            else:
+                struct.pack_into("<I", table, cluster * 4, value)
+        for index in range(2):
+            offset = (self._reserved_sectors * SECTOR_SIZE +
+                      index * fat_size)
+            self._image[offset:offset + fat_size] = table
+
+    def _write_boot_sector(self, root_cluster):
+        total_sectors_16 = 0
+        if self._fat_bits != 32 and self._total_sectors < 0x10000:
+            total_sectors_16 = self._total_sectors
+        boot_sector = b"\xeb\x3c\x90mkfs.fat" + struct.pack(
+            "<HBHBHHBHHHII", SECTOR_SIZE, self._cluster_sectors,
+            self._reserved_sectors, 2, self._root_entries, total_sectors_16,
+            0xF8, 0 if self._fat_bits == 32 else self._fat_sectors, 32, 64,
+            0, self._total_sectors)
+        if self._fat_bits == 32:
+            boot_sector += struct.pack("<IHHIHH12x", self._fat_sectors, 0, 0,
+                                       root_cluster, 1, 6)
+        boot_sector += struct.pack(
+            "<BBBI11s8s", 0x80, 0, fat.EXTENDED_BOOT_SIGNATURE, 0x1234,
+            self._boot_label.ljust(11),
+            ("FAT%d" % self._fat_bits).ljust(8).encode("ascii"))
+        self._image[:len(boot_sector)] = boot_sector
+        self._image[510:512] = b"\x55\xaa"
+
+    def build(self):
+        root_cluster = self._add_directory(self._tree)
+        self._write_fat()
+        self._write_boot_sector(root_cluster)
+        return bytes(self._image)
+
+
+def _build_fat(tree=TREE, **kwargs):
+    return _FATBuilder(tree, **kwargs).build()
+
+
+class FATReaderTests(unittest.TestCase):
+
+    def _get_reader(self, **kwargs):
+        return fat.FATReader(io.BytesIO(_build_fat(**kwargs)))
+
+    def test_is_fat(self):
+        self.assertTrue(fat.is_fat(io.BytesIO(_build_fat())))
+        self.assertFalse(fat.is_fat(io.BytesIO(b"\x00" * 1024)))
+        self.assertFalse(fat.is_fat(io.BytesIO(b"")))
+
+    def test_is_fat_ntfs(self):
+        boot_sector = bytearray(_build_fat()[:SECTOR_SIZE])
+        # NTFS has no reserved sectors, nor FATs.
+        boot_sector[3:11] = b"NTFS    "
+        boot_sector[14:17] = b"\x00\x00\x00"
+        self.assertFalse(fat.is_fat(io.BytesIO(bytes(boot_sector))))
+
+    def _test_read_file(self, fat_bits, **kwargs):
+        reader = self._get_reader(fat_bits=fat_bits, **kwargs)
+
+        self.assertEqual("FAT%d" % fat_bits, reader.filesystem)
+        self.assertEqual(META_DATA, reader.read_file(
+            "openstack/latest/meta_data.json"))
+        self.assertEqual(USER_DATA, reader.read_file(
+            "openstack\\latest\\user_data"))
+        self.assertEqual(b"", reader.read_file("openstack/content/0000"))
+        self.assertEqual(["README.TXT", "ec2", "openstack"],
+                         reader.list_dir())
+        self.assertEqual(["meta_data.json", "network_data.json",
+                          "user_data"], reader.list_dir("openstack/latest"))
+        self.assertEqual("config-2", reader.volume_label)
+        return reader
+
+    def test_read_file_fat12(self):
+        self._test_read_file(12)
+
+    def test_read_file_fat16(self):
+        self._test_read_file(16)
+
+    def test_read_file_fat32(self):
+        self._test_read_file(32)
+
+    def test_read_file_fragmented(self):
+        self._test_read_file(16, fragmented=True)
+
+    def test_read_file_large_clusters(self):
+        self._test_read_file(12, cluster_sectors=4)
+
+    def test_read_file_large_directory(self):
+        tree = dict(("file_%03d.txt" % index, str(index).encode())
+                    for index in range(100))
+        reader = self._get_reader(tree=tree, fat_bits=32, fragmented=True)
+
+        self.assertEqual(sorted(tree), reader.list_dir())
+        self.assertEqual(b"99", reader.read_file("file_099.txt"))
+
+    def test_read_file_case_insensitive(self):
+        reader = self._get_reader()
+        self.assertEqual(META_DATA, reader.read_file(
+            "OpenStack/LATEST/Meta_Data.JSON"))
+        self.assertTrue(reader.exists("readme.txt"))
+
+    def test_volume_label_boot_sector(self):
+        reader = self._get_reader(label=b"", boot_label=b"CONFIG-2")
+        self.assertEqual("CONFIG-2", reader.volume_label)
+
+    def test_volume_label_no_name(self):
+        reader = self._get_reader(label=b"", boot_label=b"NO NAME")
+        self.assertEqual("", reader.volume_label)
+
+    def test_volume_size(self):
+        image = _build_fat(fat_bits=16)
+        reader = fat.FATReader(io.BytesIO(image))
+        self.assertEqual(len(image), reader.volume_size)
+
+    def test_read_file_errors(self):
+        reader = self._get_reader()
+
+        for path, error in [("openstack/latest/missing", errno.ENOENT),
+                            ("missing/meta_data.json", errno.ENOENT),
+                            ("openstack/latest", errno.EISDIR),
+                            ("", errno.EISDIR),
+                            ("DELETED.TXT", errno.ENOENT),
+                            ("ec2/latest/meta_data.json", errno.ENOENT),
+                            ("README.TXT/data", errno.ENOTDIR)]:
+            with self.assertRaises(IOError) as cm:
+                reader.read_file(path)
+            self.assertEqual(error, cm.exception.errno)
+
+    def test_exists(self):
+        reader = self._get_reader()
+
+        self.assertTrue(reader.exists(""))
+        self.assertTrue(reader.exists("openstack/latest"))
+        self.assertTrue(reader.exists("/openstack/./latest/user_data"))
+        self.assertFalse(reader.exists("openstack/missing"))
+
+    def test_reads_only_requested_data(self):
+        stream = io.BytesIO(_build_fat(fat_bits=16))
+        reads = []
+        read = stream.read
+
+        def _read(size):
+            reads.append(size)
+            return read(size)
+
+        stream.read = _read
+        reader = fat.FATReader(stream)
+        # The boot sector and the root directory.
+        self.assertEqual([SECTOR_SIZE, 512 * 32], reads)
+        reader.read_file("openstack/latest/meta_data.json")
+        reads_count = len(reads)
+        reader.read_file("openstack/latest/network_data.json")
+
+        # The directories and the FAT sectors are read once.
+        self.assertEqual([2], reads[reads_count:])
+        self.assertLess(sum(reads), len(stream.getvalue()) // 10)
+
+    def test_no_boot_sector(self):
+        self.assertRaises(exception.CloudbaseInitException,
+                          fat.FATReader, io.BytesIO(b"\x00" * 1024))
+
+    def test_cluster_chain_loop(self):
+        image = bytearray(_build_fat(fat_bits=16))
+        reader = fat.FATReader(io.BytesIO(bytes(image)))
+        cluster = reader._get_directory(["openstack"])["latest"].cluster
+        # Make the cluster of the directory point to itself.
+        struct.pack_into("<H", image, reader._fat_offset + cluster * 2,
+                         cluster)
+        reader = fat.FATReader(io.BytesIO(bytes(image)))
+
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, "openstack/latest/user_data")
+
+    def test_invalid_cluster(self):
+        image = bytearray(_build_fat(fat_bits=16))
+        reader = fat.FATReader(io.BytesIO(bytes(image)))
+        cluster = reader._get_directory(["openstack", "latest"])[
+            "user_data"].cluster
+        struct.pack_into("<H", image, reader._fat_offset + cluster * 2, 1)
+        reader = fat.FATReader(io.BytesIO(bytes(image)))
+
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, "openstack/latest/user_data")
+
+    def test_read_file_concurrently(self):
+        reader = self._get_reader(fragmented=True)
+        paths = ["openstack/latest/meta_data.json",
+                 "openstack/latest/user_data"] * 20
+        results = {}
+
+        def _read(index, path):
+            results[index] = reader.read_file(path)
+
+        threads = [threading.Thread(target=_read, args=(index, path))
+                   for index, path in enumerate(paths)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([META_DATA, USER_DATA] * 20,
+                         [results[index] for index in range(len(paths))])
@@ -0,0 +1,40 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import fileutils
+
+
+class FileUtilsTests(unittest.TestCase):
+
+    def _test_write_file_atomically(self, content, mode):
+        with testutils.create_tempdir() as tempdir:
+            path = os.path.join(tempdir, "fake file")
+            with open(path, "w") as stream:
+                stream.write("old content")
+
+            fileutils.write_file_atomically(path, content)
+
+            with open(path, mode) as stream:
+                self.assertEqual(content, stream.read())
+            self.assertEqual(["fake file"], os.listdir(tempdir))
+
+    def test_write_file_atomically_text(self):
+        self._test_write_file_atomically(u"new content", "r")
+
+    def test_write_file_atomically_binary(self):
+        self._test_write_file_atomically(b"\x00new content", "rb")
@@ -0,0 +1,358 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import io
+import struct
+import threading
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import iso9660
+
+SECTOR_SIZE = iso9660.SECTOR_SIZE
+META_DATA = b'{"uuid": "fake-uuid", "hostname": "fake-host"}'
+USER_DATA = b"#ps1\n" + b"Write-Host fake\n" * 300
+TREE = {
+    "openstack": {
+        "latest": {
+            "meta_data.json": META_DATA,
+            "user_data": USER_DATA,
+            "network_data.json": b"{}",
+        },
+        "content": {"0000": b""},
+    },
+    "ec2": {},
+}
+
+
+def _both_endian(fmt, value):
+    return struct.pack("<" + fmt, value) + struct.pack(">" + fmt, value)
+
+
+def _sectors(size):
+    return (size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+
+class _ISOBuilder(object):
+
+    """Generate ISO9660 images, with the Joliet and Rock Ridge names."""
+
+    def __init__(self, tree, joliet=False, rock_ridge=False,
+                 label=u"config-2", multi_extent=()):
+        self._tree = tree
+        self._joliet = joliet
+        self._rock_ridge = rock_ridge
+        self._label = label
+        self._multi_extent = multi_extent
+        self._next_sector = 18 + int(joliet)
+        self._files = {}
+        self._sectors = {}
+
+    def _allocate(self, sectors):
+        location = self._next_sector
+        self._next_sector += sectors
+        return location
+
+    def _allocate_files(self, tree, path=()):
+        for name, content in sorted(tree.items()):
+            if isinstance(content, dict):
+                self._allocate_files(content, path + (name,))
+            else:
+                location = self._allocate(_sectors(len(content)))
+                self._files[path + (name,)] = location
+                self._sectors[location] = content
+
+    def _get_name(self, name, is_dir, joliet):
+        if joliet:
+            return (name if is_dir else name + u";1").encode("utf-16-be")
+        iso_name = name.upper().encode("ascii")
+        return iso_name if is_dir else iso_name + b";1"
+
+    def _get_system_use(self, name):
+        if not self._rock_ridge:
+            return b""
+        name = name.encode("utf-8")
+        # Long names are split in two entries, to check their joining.
+        parts = [name[:8], name[8:]] if len(name) > 8 else [name]
+        system_use = b""
+        for index, part in enumerate(parts):
+            flags = int(index < len(parts) - 1)
+            system_use += (b"NM" + struct.pack("BBB", 5 + len(part), 1,
+                                               flags) + part)
+        return system_use
+
+    @staticmethod
+    def _get_record(name, location, size, flags, system_use=b""):
+        padding = b"" if len(name) % 2 else b"\x00"
+        length = 33 + len(name) + len(padding) + len(system_use)
+        return (struct.pack("BB", length, 0) +
+                _both_endian("I", location) + _both_endian("I", size) +
+                b"\x00" * 7 + struct.pack("BBB", flags, 0, 0) +
+                _both_endian("H", 1) + struct.pack("B", len(name)) +
+                name + padding + system_use)
+
+    def _get_child_records(self, tree, path, joliet, locations):
+        records = []
+        for name, content in sorted(tree.items()):
+            is_dir = isinstance(content, dict)
+            iso_name = self._get_name(name, is_dir, joliet)
+            system_use = b"" if joliet else self._get_system_use(name)
+            if is_dir:
+                location, size = locations.get(path + (name,), (0, 0))
+                records.append(self._get_record(
+                    iso_name, location, size, iso9660.FLAG_DIRECTORY,
+                    system_use))
+            elif name in self._multi_extent:
+                location = self._files[path + (name,)]
+                first_size = SECTOR_SIZE
+                records.append(self._get_record(
+                    iso_name, location, first_size,
+                    iso9660.FLAG_MULTI_EXTENT, system_use))
+                records.append(self._get_record(
+                    iso_name, location + 1, len(content) - first_size, 0,
+                    system_use))
+            else:
+                records.append(self._get_record(
+                    iso_name, self._files[path + (name,)], len(content), 0,
+                    system_use))
+        return records
+
+    @staticmethod
+    def _pack_records(records):
+        data = b""
+        for record in records:
+            used = len(data) % SECTOR_SIZE
+            if used + len(record) > SECTOR_SIZE:
+                data += b"\x00" * (SECTOR_SIZE - used)
+            data += record
+        return data + b"\x00" * (-len(data) % SECTOR_SIZE)
+
+    def _get_directory(self, tree, path, joliet, locations):
+        location, size = locations[path]
+        parent_location, parent_size = locations[path[:-1] if path else ()]
+        root_system_use = b""
+        if self._rock_ridge and not joliet and not path:
+            root_system_use = b"SP\x07\x01\xbe\xef\x00"
+        records = [
+            self._get_record(b"\x00", location, size,
+                             iso9660.FLAG_DIRECTORY, root_system_use),
+            self._get_record(b"\x01", parent_location, parent_size,
+                             iso9660.FLAG_DIRECTORY),
+        ] + self._get_child_records(tree, path, joliet, locations)
+        return self._pack_records(records)
+
+    def _iter_directories(self, tree, path=()):
+        yield path, tree
+        for name, content in sorted(tree.items()):
+            if isinstance(content, dict):
+                for directory in self._iter_directories(content,
+                                                        path + (name,)):
+                    yield directory
+
+    def _allocate_directories(self, joliet):
+        locations = {}
+        # The record sizes don't depend on the locations.
+        for path, tree in self._iter_directories(self._tree):
+            size = len(self._get_directory(
+                tree, path, joliet, {path: (0, 0), path[:-1]: (0, 0)}))
+            locations[path] = (self._allocate(size // SECTOR_SIZE), size)
+        for path, tree in self._iter_directories(self._tree):
+            self._sectors[locations[path][0]] = self._get_directory(
+                tree, path, joliet, locations)
+        return locations[()]
+
+    def _get_descriptor(self, descriptor_type, root, joliet):
+        label = self._label
+        if joliet:
+            label = label.ljust(16).encode("utf-16-be")
+        else:
+            label = label.upper().encode("ascii").ljust(32, b" ")
+        escape_sequences = b"%/E" if joliet else b""
+        location, size = root
+        return (struct.pack("B", descriptor_type) + iso9660.ISO_ID +
+                b"\x01\x00" + b" " * 32 + label + b"\x00" * 8 +
+                _both_endian("I", self._next_sector) +
+                escape_sequences.ljust(32, b"\x00") +
+                _both_endian("H", 1) + _both_endian("H", 1) +
+                _both_endian("H", SECTOR_SIZE) + b"\x00" * 24 +
+                self._get_record(b"\x00", location, size,
+                                 iso9660.FLAG_DIRECTORY)).ljust(
+            SECTOR_SIZE, b"\x00")
+
+    def build(self):
+        self._allocate_files(self._tree)
+        root = self._allocate_directories(joliet=False)
+        if self._joliet:
+            joliet_root = self._allocate_directories(joliet=True)
+
+        # The descriptors are built last, once the volume size is known.
+        descriptors = [self._get_descriptor(
+            iso9660.VOLUME_DESCRIPTOR_PRIMARY, root, joliet=False)]
+        if self._joliet:
+            descriptors.append(self._get_descriptor(
+                iso9660.VOLUME_DESCRIPTOR_SUPPLEMENTARY, joliet_root,
+                joliet=True))
+        descriptors.append((struct.pack(
+            "B", iso9660.VOLUME_DESCRIPTOR_TERMINATOR) +
+            iso9660.ISO_ID).ljust(SECTOR_SIZE, b"\x00"))
+        image = bytearray(self._next_sector * SECTOR_SIZE)
+        self._sectors[16] = b"".join(descriptors)
+        for location, data in self._sectors.items():
+            offset = location * SECTOR_SIZE
+            image[offset:offset + len(data)] = data
+        return bytes(image)
+
+
+def _build_iso(tree=TREE, **kwargs):
+    return _ISOBuilder(tree, **kwargs).build()
+
+
+class ISO9660ReaderTests(unittest.TestCase):
+
+    def _get_reader(self, **kwargs):
+        return iso9660.ISO9660Reader(io.BytesIO(_build_iso(**kwargs)))
+
+    def test_is_iso9660(self):
+        self.assertTrue(iso9660.is_iso9660(io.BytesIO(_build_iso())))
+        self.assertFalse(iso9660.is_iso9660(io.BytesIO(b"\x00" * 40960)))
+        self.assertFalse(iso9660.is_iso9660(io.BytesIO(b"")))
+
+    def _test_read_file(self, **kwargs):
+        reader = self._get_reader(**kwargs)
+
+        self.assertEqual(META_DATA, reader.read_file(
+            "openstack/latest/meta_data.json"))
+        self.assertEqual(USER_DATA, reader.read_file(
+            "openstack\\latest\\user_data"))
+        self.assertEqual(b"", reader.read_file("openstack/content/0000"))
+        return reader
+
+    def test_read_file_plain(self):
+        reader = self._test_read_file()
+        # The plain ISO9660 names are in upper case, with a version.
+        self.assertEqual(["EC2", "OPENSTACK"], reader.list_dir())
+        self.assertEqual(["CONTENT", "LATEST"], reader.list_dir("openstack"))
+        self.assertEqual(META_DATA, reader.read_file(
+            "OPENSTACK/LATEST/META_DATA.JSON"))
+        self.assertEqual(u"CONFIG-2", reader.volume_label)
+
+    def test_read_file_joliet(self):
+        reader = self._test_read_file(joliet=True)
+        self.assertEqual(["ec2", "openstack"], reader.list_dir())
+        self.assertEqual(["meta_data.json", "network_data.json",
+                          "user_data"], reader.list_dir("openstack/latest"))
+        self.assertEqual(u"config-2", reader.volume_label)
+
+    def test_read_file_rock_ridge(self):
+        reader = self._test_read_file(rock_ridge=True)
+        self.assertEqual(["meta_data.json", "network_data.json",
+                          "user_data"], reader.list_dir("openstack/latest"))
+        self.assertFalse(reader.exists("OPENSTACK"))
+
+    def test_read_file_joliet_rock_ridge(self):
+        reader = self._test_read_file(joliet=True, rock_ridge=True)
+        self.assertEqual(["ec2", "openstack"], reader.list_dir())
+
+    def test_read_file_multi_extent(self):
+        reader = self._get_reader(joliet=True, multi_extent=["user_data"])
+        self.assertEqual(USER_DATA, reader.read_file(
+            "openstack/latest/user_data"))
+        self.assertEqual(["meta_data.json", "network_data.json",
+                          "user_data"], reader.list_dir("openstack/latest"))
+
+    def test_read_file_large_directory(self):
+        tree = dict(("file%03d.txt" % index, str(index).encode())
+                    for index in range(100))
+        reader = self._get_reader(tree=tree, rock_ridge=True)
+
+        self.assertEqual(sorted(tree), reader.list_dir())
+        self.assertEqual(b"99", reader.read_file("file099.txt"))
+
+    def test_read_file_errors(self):
+        reader = self._get_reader(joliet=True)
+
+        for path, error in [("openstack/latest/missing", errno.ENOENT),
+                            ("missing/meta_data.json", errno.ENOENT),
+                            ("openstack/latest", errno.EISDIR),
+                            ("", errno.EISDIR),
+                            ("ec2/latest/meta_data.json", errno.ENOENT),
+                            ("openstack/content/0000/data", errno.ENOTDIR)]:
+            with self.assertRaises(IOError) as cm:
+                reader.read_file(path)
+            self.assertEqual(error, cm.exception.errno)
+
+    def test_exists(self):
+        reader = self._get_reader(joliet=True)
+
+        self.assertTrue(reader.exists(""))
+        self.assertTrue(reader.exists("openstack/latest"))
+        self.assertTrue(reader.exists("/openstack/./latest/user_data"))
+        self.assertFalse(reader.exists("openstack/missing"))
+
+    def test_reads_only_requested_data(self):
+        stream = io.BytesIO(_build_iso(joliet=True))
+        reads = []
+        read = stream.read
+
+        def _read(size):
+            reads.append(size)
+            return read(size)
+
+        stream.read = _read
+        reader = iso9660.ISO9660Reader(stream)
+        reader.read_file("openstack/latest/meta_data.json")
+        reads_count = len(reads)
+        reader.read_file("openstack/latest/network_data.json")
+
+        # The directories are read once, the volume not being scanned.
+        self.assertEqual([2], reads[reads_count:])
+        self.assertLess(sum(reads), len(stream.getvalue()))
+
+    def test_volume_size(self):
+        image = _build_iso(joliet=True)
+        reader = iso9660.ISO9660Reader(io.BytesIO(image))
+        self.assertEqual(len(image), reader.volume_size)
+
+    def test_no_primary_descriptor(self):
+        image = bytearray(_build_iso())
+        image[iso9660.VOLUME_DESCRIPTORS_OFFSET] = (
+            iso9660.VOLUME_DESCRIPTOR_SUPPLEMENTARY)
+        self.assertRaises(exception.CloudbaseInitException,
+                          iso9660.ISO9660Reader, io.BytesIO(bytes(image)))
+
+    def test_truncated_volume(self):
+        image = _build_iso()
+        reader = iso9660.ISO9660Reader(io.BytesIO(image[:-SECTOR_SIZE]))
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, "openstack/latest/user_data")
+
+    def test_read_file_concurrently(self):
+        reader = self._get_reader(joliet=True)
+        paths = ["openstack/latest/meta_data.json",
+                 "openstack/latest/user_data"] * 20
+        results = {}
+
+        def _read(index, path):
+            results[index] = reader.read_file(path)
+
+        threads = [threading.Thread(target=_read, args=(index, path))
+                   for index, path in enumerate(paths)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([META_DATA, USER_DATA] * 20,
+                         [results[index] for index in range(len(paths))])
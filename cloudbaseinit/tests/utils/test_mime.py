@@ -0,0 +1,161 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import email
+import pkgutil
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.utils import mime
+
+_MULTIPART = b"""\
+Content-Type: multipart/mixed; boundary="outer"
+MIME-Version: 1.0
+
+This is the preamble.
+--outer
+Content-Type: text/x-shellscript
+Content-Disposition: attachment; filename="script.sh"
+
+#!/bin/sh
+echo --outer-not-a-delimiter
+--outer
+Content-Type: multipart/mixed; boundary=inner
+
+--inner
+Content-Type: application/octet-stream
+Content-Transfer-Encoding: base64
+Content-Disposition: attachment; filename="data.bin"
+
+AAECAwQ=
+--inner
+Content-Type: text/plain; charset="utf-8"
+Content-Transfer-Encoding: quoted-printable
+
+caf=C3=A9
+--inner--
+--outer
+Content-Type: text/cloud-config
+
+--outer--
+This is the epilogue.
+"""
+
+_PREFIX_BOUNDARIES = b"""\
+Content-Type: multipart/mixed; boundary="A"
+
+--A
+Content-Type: text/x-shellscript
+
+#!/bin/sh
+--AB
+--A--not-a-close-delimiter
+--A \t
+Content-Type: multipart/mixed; boundary="A-inner"
+
+--A-inner
+Content-Type: text/plain
+
+inner
+--A-inner--
+--A--
+"""
+
+
+def _get_parts(parts):
+    return [(part.get_content_type(), part.get_filename(),
+             None if part.is_multipart() else part.get_payload(decode=True))
+            for part in parts]
+
+
+class TestMime(unittest.TestCase):
+
+    def _test_walk(self, data):
+        self.assertEqual(
+            _get_parts(email.message_from_string(data.decode()).walk()),
+            _get_parts(mime.walk(data)))
+
+    def test_walk(self):
+        self._test_walk(_MULTIPART)
+
+    def test_walk_crlf(self):
+        self._test_walk(_MULTIPART.replace(b"\n", b"\r\n"))
+
+    def test_walk_prefix_boundaries(self):
+        self._test_walk(_PREFIX_BOUNDARIES)
+
+    def test_walk_prefix_boundaries_crlf(self):
+        self._test_walk(_PREFIX_BOUNDARIES.replace(b"\n", b"\r\n"))
+
+    def test_walk_prefix_boundaries_parts(self):
+        parts = list(mime.walk(_PREFIX_BOUNDARIES))
+
+        self.assertEqual(
+            ["multipart/mixed", "text/x-shellscript", "multipart/mixed",
+             "text/plain"],
+            [part.get_content_type() for part in parts])
+        self.assertEqual(u"#!/bin/sh\n--AB\n--A--not-a-close-delimiter",
+                         parts[1].get_payload())
+        self.assertEqual(b"inner", parts[3].get_payload(decode=True))
+
+    def test_walk_cloud_config_userdata(self):
+        self._test_walk(pkgutil.get_data('cloudbaseinit.tests.resources',
+                                         'cloud_config_userdata'))
+
+    def test_walk_not_multipart(self):
+        parts = list(mime.walk(b"#!/bin/sh\n\necho 1\n"))
+
+        self.assertEqual(1, len(parts))
+        self.assertEqual("text/plain", parts[0].get_content_type())
+        self.assertEqual(b"echo 1\n", parts[0].get_payload(decode=True))
+
+    def test_walk_parts_are_views(self):
+        parts = list(mime.walk(_MULTIPART))
+
+        self.assertIsInstance(parts[1]._body, memoryview)
+        self.assertEqual(u"#!/bin/sh\necho --outer-not-a-delimiter",
+                         parts[1].get_payload())
+
+    @mock.patch('binascii.a2b_base64')
+    def test_walk_decodes_lazily(self, mock_a2b_base64):
+        parts = list(mime.walk(_MULTIPART))
+        self.assertFalse(mock_a2b_base64.called)
+
+        self.assertEqual(mock_a2b_base64.return_value,
+                         parts[3].get_payload(decode=True))
+        mock_a2b_base64.assert_called_once_with(parts[3]._body)
+
+    def test_get_payload_invalid_base64(self):
+        part = mime.Part(
+            email.message_from_string(
+                "Content-Transfer-Encoding: base64\n\n"),
+            memoryview(b"AAE"))
+
+        self.assertEqual(b"AAE", part.get_payload(decode=True))
+
+    def test_get_header_block(self):
+        self.assertEqual(b"Content-Type: text/plain\n",
+                         mime.get_header_block(
+                             b"Content-Type: text/plain\n\nbody\n\nmore"))
+        self.assertEqual(b"", mime.get_header_block(b"\nbody"))
+        self.assertEqual(b"headers", mime.get_header_block(b"headers"))
+
+    def test_get_header_block_max_size(self):
+        data = b"X-Header: value\n" * 10 + b"\nbody"
+
+        self.assertEqual(data[:100], mime.get_header_block(data, 100))
@@ -0,0 +1,170 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import exception
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import retry
+
+CONF = cloudbaseinit_conf.CONF
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def test_get_delay(self):
+        policy = retry.RetryPolicy(5, interval=1, max_interval=5,
+                                   multiplier=2)
+        self.assertEqual([1, 2, 4, 5],
+                         [policy.get_delay(n) for n in range(1, 5)])
+
+    def test_get_delay_constant(self):
+        policy = retry.RetryPolicy(5, interval=3)
+        self.assertEqual(3, policy.get_delay(4))
+
+    @mock.patch('random.uniform')
+    def test_get_delay_jitter(self, mock_uniform):
+        policy = retry.RetryPolicy(5, interval=2, multiplier=2, jitter=True)
+        response = policy.get_delay(3)
+        mock_uniform.assert_called_once_with(0, 8)
+        self.assertEqual(mock_uniform.return_value, response)
+
+    def test_get_default_policy(self):
+        with testutils.ConfPatcher('retry_count', 3):
+            with testutils.ConfPatcher('retry_count_interval', 2):
+                policy = retry.get_default_policy()
+        self.assertEqual(4, policy.max_attempts)
+        self.assertEqual(2, policy.interval)
+        self.assertEqual(7, retry.get_default_policy(7).max_attempts)
+
+    def test_get_default_policy_constant_interval(self):
+        policy = retry.get_default_policy()
+
+        self.assertEqual([CONF.retry_count_interval] * CONF.retry_count,
+                         [policy.get_delay(retry_number) for retry_number
+                          in range(1, CONF.retry_count + 1)])
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = retry.CircuitBreaker(2, 60, errors=(IOError,))
+        breaker.record_failure(IOError())
+        breaker.check()
+        breaker.record_failure(ValueError())
+        self.assertFalse(breaker.is_open)
+        breaker.record_failure(IOError())
+        self.assertTrue(breaker.is_open)
+        self.assertRaises(exception.CircuitBreakerOpenException,
+                          breaker.check)
+
+    def test_record_success(self):
+        breaker = retry.CircuitBreaker(1, 60)
+        breaker.record_failure(IOError())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+    @mock.patch('time.time')
+    def test_reset_time(self, mock_time):
+        mock_time.return_value = 100
+        breaker = retry.CircuitBreaker(1, 60)
+        breaker.record_failure(IOError())
+        mock_time.return_value = 159
+        self.assertTrue(breaker.is_open)
+        mock_time.return_value = 160
+        self.assertFalse(breaker.is_open)
+
+
+@mock.patch('time.sleep')
+class RetrierTests(unittest.TestCase):
+
+    def test_execute(self, mock_sleep):
+        action = mock.Mock(side_effect=[IOError, IOError, mock.sentinel.res])
+        retrier = retry.Retrier(retry.RetryPolicy(3, interval=1,
+                                                  multiplier=2))
+        self.assertEqual(mock.sentinel.res, retrier.execute(action))
+        self.assertEqual(3, action.call_count)
+        mock_sleep.assert_has_calls([mock.call(1), mock.call(2)])
+
+    def test_execute_attempts_exhausted(self, mock_sleep):
+        action = mock.Mock(side_effect=IOError)
+        retrier = retry.Retrier(retry.RetryPolicy(3))
+        self.assertRaises(IOError, retrier.execute, action)
+        self.assertEqual(3, action.call_count)
+
+    def test_execute_no_retry_errors(self, mock_sleep):
+        action = mock.Mock(side_effect=ValueError)
+        retrier = retry.Retrier(retry.RetryPolicy(3),
+                                no_retry_errors=(ValueError,))
+        self.assertRaises(ValueError, retrier.execute, action)
+        self.assertEqual(1, action.call_count)
+        self.assertFalse(mock_sleep.called)
+
+    def test_execute_error_policies(self, mock_sleep):
+        action = mock.Mock(side_effect=[ValueError, IOError, IOError])
+        retrier = retry.Retrier(
+            retry.RetryPolicy(5),
+            error_policies=[(lambda ex: isinstance(ex, KeyError),
+                             retry.NO_RETRY),
+                            (IOError, retry.RetryPolicy(3, interval=7))])
+        self.assertRaises(IOError, retrier.execute, action)
+        self.assertEqual(3, action.call_count)
+        mock_sleep.assert_has_calls([mock.call(0), mock.call(7)])
+
+    def test_execute_budget(self, mock_sleep):
+        action = mock.Mock(side_effect=IOError)
+        retrier = retry.Retrier(retry.RetryPolicy(10, interval=4),
+                                budget=10)
+        self.assertRaises(IOError, retrier.execute, action)
+        self.assertEqual(3, action.call_count)
+
+        # The budget is shared by all the actions.
+        action.reset_mock()
+        self.assertRaises(IOError, retrier.execute, action)
+        self.assertEqual(1, action.call_count)
+
+    @mock.patch('time.time')
+    def test_execute_budget_not_retried(self, mock_time, mock_sleep):
+        # Each attempt takes 20 seconds.
+        mock_time.side_effect = itertools.count(0, 20)
+        action = mock.Mock(side_effect=[KeyError, KeyError, IOError, None])
+        retrier = retry.Retrier(retry.RetryPolicy(2, interval=1),
+                                error_policies=[(KeyError, retry.NO_RETRY)],
+                                budget=30)
+
+        # The errors which are not retried don't use the budget.
+        self.assertRaises(KeyError, retrier.execute, action)
+        self.assertRaises(KeyError, retrier.execute, action)
+        self.assertEqual(0, retrier._spent)
+
+        retrier.execute(action)
+        self.assertEqual(4, action.call_count)
+        self.assertEqual(21, retrier._spent)
+        mock_sleep.assert_called_once_with(1)
+
+    def test_execute_circuit_breaker(self, mock_sleep):
+        action = mock.Mock(side_effect=IOError)
+        retrier = retry.Retrier(
+            retry.RetryPolicy(5),
+            circuit_breaker=retry.CircuitBreaker(2, 60))
+        self.assertRaises(exception.CircuitBreakerOpenException,
+                          retrier.execute, action)
+        self.assertEqual(2, action.call_count)
@@ -0,0 +1,157 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import tracing
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tracer = tracing.Tracer()
+
+    @mock.patch('time.time')
+    def test_span(self, mock_time):
+        mock_time.side_effect = [1, 3.5]
+
+        with self._tracer.span("fake name", "fake category", key="value"):
+            pass
+
+        event = self._tracer.events[0]
+        self.assertEqual("fake name", event["name"])
+        self.assertEqual("fake category", event["cat"])
+        self.assertEqual("X", event["ph"])
+        self.assertEqual(1000000, event["ts"])
+        self.assertEqual(2500000, event["dur"])
+        self.assertEqual({"key": "value"}, event["args"])
+
+    def test_span_exception(self):
+        with self.assertRaises(ValueError):
+            with self._tracer.span("fake name", "fake category"):
+                raise ValueError()
+
+        self.assertEqual(["fake name"],
+                         [event["name"] for event in self._tracer.events])
+
+    def test_instant(self):
+        self._tracer.instant("fake name", "fake category", key="value")
+
+        event = self._tracer.events[0]
+        self.assertEqual("i", event["ph"])
+        self.assertEqual({"key": "value"}, event["args"])
+
+    def test_save(self):
+        self._tracer.instant("fake name", "fake category")
+
+        with testutils.create_tempdir() as tempdir:
+            path = os.path.join(tempdir, "trace.json")
+            self._tracer.save(path)
+            with open(path) as stream:
+                trace = json.load(stream)
+
+        self.assertEqual(self._tracer.events, trace["traceEvents"])
+
+    def test_save_appends(self):
+        previous_tracer = tracing.Tracer()
+        previous_tracer.instant("previous run", "fake category")
+        self._tracer.instant("first", "fake category")
+
+        with testutils.create_tempdir() as tempdir:
+            path = os.path.join(tempdir, "trace.json")
+            previous_tracer.save(path)
+            self._tracer.save(path)
+            self._tracer.instant("second", "fake category")
+            self._tracer.save(path)
+            with open(path) as stream:
+                trace = json.load(stream)
+
+        self.assertEqual(["previous run", "first", "second"],
+                         [event["name"] for event in trace["traceEvents"]])
+
+    def test_save_invalid_trace(self):
+        self._tracer.instant("fake name", "fake category")
+
+        with testutils.create_tempdir() as tempdir:
+            path = os.path.join(tempdir, "trace.json")
+            with open(path, "w") as stream:
+                stream.write("not json")
+            with testutils.LogSnatcher('cloudbaseinit.utils.'
+                                       'tracing') as snatcher:
+                self._tracer.save(path)
+            with open(path) as stream:
+                trace = json.load(stream)
+
+        self.assertEqual(self._tracer.events, trace["traceEvents"])
+        self.assertEqual(1, len(snatcher.output))
+        self.assertTrue(snatcher.output[0].startswith(
+            "Replacing the invalid boot trace '%s': " % path))
+
+
+class TracingTests(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.utils.tracing._TRACER')
+    def test_disabled(self, mock_tracer):
+        with testutils.ConfPatcher('boot_trace_path', None):
+            with tracing.span("fake name", "fake category"):
+                pass
+            tracing.instant("fake name", "fake category")
+            tracing.save()
+
+        self.assertFalse(mock_tracer.span.called)
+        self.assertFalse(mock_tracer.instant.called)
+        self.assertFalse(mock_tracer.save.called)
+
+    @mock.patch('cloudbaseinit.utils.tracing._TRACER')
+    def test_enabled(self, mock_tracer):
+        with testutils.ConfPatcher('boot_trace_path', 'fake path'):
+            with tracing.span("fake name", "fake category", key="value"):
+                pass
+            tracing.instant("fake name", "fake category")
+            with testutils.LogSnatcher('cloudbaseinit.utils.'
+                                       'tracing') as snatcher:
+                tracing.save()
+
+        mock_tracer.span.assert_called_once_with(
+            "fake name", "fake category", key="value")
+        mock_tracer.instant.assert_called_once_with(
+            "fake name", "fake category")
+        trace_path = os.path.abspath('fake path')
+        mock_tracer.save.assert_called_once_with(trace_path)
+        self.assertEqual(["Boot trace saved to: %s" % trace_path],
+                         snatcher.output)
+
+    @mock.patch('cloudbaseinit.utils.tracing._TRACER')
+    def test_save_fails(self, mock_tracer):
+        mock_tracer.save.side_effect = IOError("fake error")
+
+        with testutils.ConfPatcher('boot_trace_path', 'fake path'):
+            with testutils.LogSnatcher('cloudbaseinit.utils.'
+                                       'tracing') as snatcher:
+                tracing.save()
+
+        self.assertEqual(["Failed to save the boot trace to '%s': "
+                          "fake error" % os.path.abspath('fake path')],
+                         snatcher.output)
+
+    def test_get_tracer(self):
+        self.assertIs(tracing._TRACER, tracing.get_tracer())
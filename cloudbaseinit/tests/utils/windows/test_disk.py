@@ -13,6 +13,7 @@
 #    under the License.
 
 
+import ctypes
 import importlib
 import unittest
 
@@ -58,8 +59,9 @@ class TestBaseDevice(BaseTestDevice, testutils.CloudbaseInitTestBase):
         super(TestBaseDevice, self).setUp()
 
         class FinalBaseDevice(self.disk.BaseDevice):
+            @property
             def size(self):
-                return 0
+                return self._disk_size
 
         self.fake_path = mock.sentinel.fake_path
         self._device_class = FinalBaseDevice(
@@ -173,46 +175,100 @@ class TestBaseDevice(BaseTestDevice, testutils.CloudbaseInitTestBase):
         offset = self._device_class.seek(1025)
         self.assertEqual(1024, offset)
 
-    def _test__read(self, ret_val, last_error=None):
-        bytes_to_read = mock.sentinel.bytes_to_read
+    def _test__readinto(self, ret_val, last_error=None):
+        buffer = bytearray(1024)
         self.disk.kernel32.ReadFile.return_value = ret_val
+        mock_c_buffer_type = self._ctypes_mock.c_char.__mul__.return_value
 
         if not ret_val:
             with self.assert_raises_windows_message(
                     "Read exception: %r", last_error):
-                self._device_class._read(bytes_to_read)
+                self._device_class._readinto(buffer)
         else:
-            response = self._device_class._read(bytes_to_read)
-            mock_buffer = self._ctypes_mock.create_string_buffer
+            response = self._device_class._readinto(buffer)
 
-            mock_buffer.assert_called_once_with(bytes_to_read)
+            self._ctypes_mock.c_char.__mul__.assert_called_once_with(1024)
+            mock_c_buffer_type.from_buffer.assert_called_once_with(buffer)
             self.mock_dword.assert_called_once_with()
             self.disk.kernel32.ReadFile.assert_called_once_with(
                 self._device_class._handle,
-                mock_buffer.return_value,
-                bytes_to_read, self._ctypes_mock.byref.return_value, 0)
+                mock_c_buffer_type.from_buffer.return_value,
+                1024, self._ctypes_mock.byref.return_value, 0)
 
             self._ctypes_mock.byref.assert_called_once_with(
                 self.mock_dword.return_value)
 
-            self.assertEqual(
-                mock_buffer.return_value.raw[
-                    :self.mock_dword.return_value.value], response)
+            self.assertEqual(self.mock_dword.return_value.value, response)
+
+    def test__readinto(self):
+        self._test__readinto(ret_val=mock.sentinel.ret_val)
+
+    def test__readinto_exception(self):
+        self._test__readinto(ret_val=None, last_error=100)
+
+    def _test__readinto_memoryview(self, py2=False):
+        data = bytearray(b"-" * 16)
+        view = memoryview(data)[4:12]
+        self._ctypes_mock.c_char = ctypes.c_char
+
+        def read_file(handle, buff, size, bytes_read, overlapped):
+            buff[:6] = b"x" * 6
+            self.mock_dword.return_value.value = 6
+            return True
+
+        self.disk.kernel32.ReadFile.side_effect = read_file
+        with mock.patch.object(self.disk.six, 'PY2', py2):
+            response = self._device_class._readinto(view)
+
+        self.assertEqual(6, response)
+        self.assertEqual(b"----xxxxxx------", bytes(data))
+        self.assertEqual(8, self.disk.kernel32.ReadFile.call_args[0][2])
+
+    def test__readinto_memoryview(self):
+        self._test__readinto_memoryview()
 
-    def test__read(self):
-        self._test__read(ret_val=mock.sentinel.ret_val)
+    def test__readinto_memoryview_py2(self):
+        self._test__readinto_memoryview(py2=True)
 
-    def test__read_exception(self):
-        self._test__read(ret_val=None, last_error=100)
+    def _fake_readinto(self, data):
+        def _readinto(buffer):
+            buffer[:len(data)] = data
+            return len(data)
+        return mock.Mock(side_effect=_readinto)
 
     def test_read(self):
-        _read_func = mock.Mock()
-        mock_content = mock.MagicMock()
-        _read_func.return_value = mock_content
-        self._device_class._read = _read_func
+        data = bytes(bytearray(range(256))) * 4
+        self._device_class._readinto = self._fake_readinto(data)
+
         response = self._device_class.read(512, 10)
-        self._device_class._read.assert_called_once_with(1024)
-        self.assertEqual(response, mock_content[10, 522])
+
+        self.assertEqual(1, self._device_class._readinto.call_count)
+        self.assertEqual(1024,
+                         len(self._device_class._readinto.call_args[0][0]))
+        self.assertEqual(data[10:522], response)
+
+    def test_read_reuses_buffer(self):
+        self._device_class._readinto = self._fake_readinto(b"data")
+
+        self.assertEqual(b"data", self._device_class.read(1024))
+        read_buffer = self._device_class._read_buffer
+        self.assertEqual(b"ta", self._device_class.read(10, skip=2))
+
+        self.assertIs(read_buffer, self._device_class._read_buffer)
+
+    def test_get_block_reader(self):
+        self._device_class._seek = mock.Mock()
+        self._device_class._readinto = self._fake_readinto(b"x" * 4096)
+
+        reader = self._device_class.get_block_reader(4096)
+        reader.seek(1030)
+
+        self.assertIsInstance(reader, self.disk.DeviceBlockReader)
+        self.assertEqual(b"xxxx", reader.read(4))
+        self.assertEqual(512, reader.block_size)
+        self._device_class._seek.assert_called_once_with(1024)
+        self.assertEqual(4096,
+                         len(self._device_class._readinto.call_args[0][0]))
 
 
 class TestDisk(BaseTestDevice, testutils.CloudbaseInitTestBase):
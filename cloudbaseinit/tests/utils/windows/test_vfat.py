@@ -12,7 +12,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import os
 import unittest
 
 try:
@@ -20,113 +19,52 @@ try:
 except ImportError:
     import mock
 
-from cloudbaseinit import exception
 from cloudbaseinit.tests import testutils
 from cloudbaseinit.utils.windows import vfat
 
-CONF = vfat.CONF
-
 
+@mock.patch('cloudbaseinit.utils.fat.FATReader')
+@mock.patch('cloudbaseinit.utils.fat.is_fat')
 class TestVfat(unittest.TestCase):
 
-    def _test_is_vfat_drive(self, execute_process_value,
-                            expected_logging,
-                            expected_response):
-
-        mock_osutils = mock.Mock()
-        mock_osutils.execute_process.return_value = execute_process_value
+    def _test_get_vfat_reader(self, mock_is_fat, mock_fat_reader,
+                              label=None, expected_response=None):
+        mock_is_fat.return_value = label is not None
+        mock_reader = mock_fat_reader.return_value
+        mock_reader.filesystem = "FAT12"
+        mock_reader.volume_label = label
 
         with testutils.LogSnatcher('cloudbaseinit.utils.windows.'
                                    'vfat') as snatcher:
-            with testutils.ConfPatcher('mtools_path', 'mtools_path'):
-
-                response = vfat.is_vfat_drive(mock_osutils,
-                                              mock.sentinel.drive)
-
-                mdir = os.path.join(CONF.mtools_path, "mlabel.exe")
-                mock_osutils.execute_process.assert_called_once_with(
-                    [mdir, "-i", mock.sentinel.drive, "-s"],
-                    shell=False)
-
-        self.assertEqual(expected_logging, snatcher.output)
-        self.assertEqual(expected_response, response)
-
-    def test_is_vfat_drive_fails(self):
-        test_stderr = b"test stderr"
-
-        expected_logging = [
-            "Could not retrieve label for VFAT drive path %r"
-            % (mock.sentinel.drive),
-            "mlabel failed with error %r" % test_stderr,
-        ]
-        execute_process_value = (None, test_stderr, 1)
-        expected_response = False
-
-        self._test_is_vfat_drive(execute_process_value=execute_process_value,
-                                 expected_logging=expected_logging,
-                                 expected_response=expected_response)
-
-    def test_is_vfat_drive_different_label(self):
-        mock_out = b"Volume label is config"
-        expected_logging = [
-            "Obtained label information for drive %r: %r"
-            % (mock.sentinel.drive, mock_out)
-        ]
-        execute_process_value = (mock_out, None, 0)
-        expected_response = False
-
-        self._test_is_vfat_drive(execute_process_value=execute_process_value,
-                                 expected_logging=expected_logging,
-                                 expected_response=expected_response)
-
-    def test_is_vfat_drive_works(self):
-        mock_out = b"Volume label is config-2   \r\n"
-        expected_logging = [
-            "Obtained label information for drive %r: %r"
-            % (mock.sentinel.drive, mock_out)
-        ]
-        execute_process_value = (mock_out, None, 0)
-        expected_response = True
-
-        self._test_is_vfat_drive(execute_process_value=execute_process_value,
-                                 expected_logging=expected_logging,
-                                 expected_response=expected_response)
-
-    @testutils.ConfPatcher('mtools_path', 'mtools_path')
-    @mock.patch('os.chdir')
-    def test_copy(self, mock_os_chdir):
-        cwd = os.getcwd()
-        mock_osutils = mock.Mock()
-
-        vfat.copy_from_vfat_drive(mock_osutils,
-                                  mock.sentinel.drive,
-                                  mock.sentinel.target_path)
-
-        mock_os_chdir_calls = [
-            mock.call(mock.sentinel.target_path),
-            mock.call(cwd),
-        ]
-        self.assertEqual(mock_os_chdir_calls, mock_os_chdir.mock_calls)
-        self.assertEqual(os.getcwd(), cwd)
-
-        mcopy = os.path.join(CONF.mtools_path, "mcopy.exe")
-        mock_osutils.execute_process.assert_called_once_with(
-            [mcopy, "-s", "-n", "-i", mock.sentinel.drive, "::/", "."],
-            shell=False)
-
-    def test_is_vfat_drive_mtools_not_given(self):
-        with self.assertRaises(exception.CloudbaseInitException) as cm:
-            vfat.is_vfat_drive(mock.sentinel.osutils,
-                               mock.sentinel.target_path)
-        expected_message = ('"mtools_path" needs to be provided in order '
-                            'to access VFAT drives')
-        self.assertEqual(expected_message, str(cm.exception.args[0]))
-
-    def test_copy_from_vfat_drive_mtools_not_given(self):
-        with self.assertRaises(exception.CloudbaseInitException) as cm:
-            vfat.copy_from_vfat_drive(mock.sentinel.osutils,
-                                      mock.sentinel.drive_path,
-                                      mock.sentinel.target_path)
-        expected_message = ('"mtools_path" needs to be provided in order '
-                            'to access VFAT drives')
-        self.assertEqual(expected_message, str(cm.exception.args[0]))
+            response = vfat.get_vfat_reader(mock.sentinel.stream)
+
+        mock_is_fat.assert_called_once_with(mock.sentinel.stream)
+        if label is None:
+            self.assertFalse(mock_fat_reader.called)
+            self.assertEqual([], snatcher.output)
+        else:
+            mock_fat_reader.assert_called_once_with(mock.sentinel.stream)
+            self.assertEqual(
+                ["Obtained label information for FAT12 volume: %r" % label],
+                snatcher.output)
+        if expected_response:
+            self.assertEqual(mock_reader, response)
+        else:
+            self.assertIsNone(response)
+
+    def test_get_vfat_reader_not_fat(self, mock_is_fat, mock_fat_reader):
+        self._test_get_vfat_reader(mock_is_fat, mock_fat_reader)
+
+    def test_get_vfat_reader_different_label(self, mock_is_fat,
+                                             mock_fat_reader):
+        self._test_get_vfat_reader(mock_is_fat, mock_fat_reader,
+                                   label="config")
+
+    def test_get_vfat_reader(self, mock_is_fat, mock_fat_reader):
+        self._test_get_vfat_reader(mock_is_fat, mock_fat_reader,
+                                   label="config-2", expected_response=True)
+
+    def test_get_vfat_reader_upper_label(self, mock_is_fat,
+                                         mock_fat_reader):
+        self._test_get_vfat_reader(mock_is_fat, mock_fat_reader,
+                                   label="CONFIG-2", expected_response=True)
@@ -0,0 +1,175 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Buffered reads from block sources, like disks or image files.
+
+The block sources can only be read in whole, aligned blocks. The
+readers give file like access to them, through a read-ahead window
+held in a buffer allocated once, while the large aligned reads go
+straight into the destination buffer.
+"""
+
+import abc
+import os
+
+import six
+
+DEFAULT_BLOCK_SIZE = 512
+DEFAULT_WINDOW_SIZE = 64 * 1024
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BlockReader(object):
+
+    """Seekable, buffered reader of a block source."""
+
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE,
+                 window_size=DEFAULT_WINDOW_SIZE):
+        self.block_size = block_size
+        window_size = max(window_size, block_size)
+        window_size -= window_size % block_size
+        self._window = bytearray(window_size)
+        self._window_view = memoryview(self._window)
+        self._window_offset = 0
+        self._window_length = 0
+        self._offset = 0
+
+    @abc.abstractmethod
+    def _read_blocks(self, offset, view):
+        """Read whole blocks from the aligned offset into the view.
+
+        :returns: The number of bytes read, 0 at the end of the source.
+        """
+
+    @property
+    def size(self):
+        """The size of the block source, if known."""
+        return None
+
+    def _read_aligned(self, offset, view):
+        size = self.size
+        if size is not None:
+            if offset >= size:
+                return 0
+            # Doesn't read past the end of the source, rounding up to
+            # the block size.
+            remaining = size - offset
+            remaining += -remaining % self.block_size
+            if remaining < len(view):
+                view = view[:remaining]
+        return self._read_blocks(offset, view)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._offset
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek offset: %d" % offset)
+        self._offset = offset
+        return offset
+
+    def tell(self):
+        return self._offset
+
+    def prefetch(self, offset=0):
+        """Fill the read-ahead window from the given offset.
+
+        The reads within the window are then served from memory.
+        """
+        aligned_offset = offset - offset % self.block_size
+        self._window_offset = aligned_offset
+        self._window_length = 0
+        self._window_length = self._read_aligned(aligned_offset,
+                                                 self._window_view)
+
+    def readinto(self, buffer):
+        """Read into the given writable buffer, like a file would.
+
+        :returns: The number of bytes read, less than the buffer size
+                  only at the end of the source.
+        """
+        view = memoryview(buffer)
+        total = 0
+        while total < len(view):
+            remaining = len(view) - total
+            start = self._offset - self._window_offset
+            if not 0 <= start < self._window_length:
+                if (not self._offset % self.block_size and
+                        remaining >= len(self._window)):
+                    # The large aligned reads skip the window.
+                    count = self._read_aligned(
+                        self._offset,
+                        view[total:total + remaining -
+                             remaining % self.block_size])
+                    if not count:
+                        break
+                    total += count
+                    self._offset += count
+                    continue
+
+                self.prefetch(self._offset)
+                start = self._offset - self._window_offset
+                if start >= self._window_length:
+                    break
+
+            count = min(self._window_length - start, remaining)
+            view[total:total + count] = self._window_view[start:start + count]
+            total += count
+            self._offset += count
+        return total
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(len(self._window))
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+
+        buffer = bytearray(size)
+        count = self.readinto(buffer)
+        if count < size:
+            del buffer[count:]
+        return bytes(buffer)
+
+
+class FileBlockReader(BlockReader):
+
+    """Block reader of a file, like a disk image.
+
+    :param stream: A binary file, opened without buffering.
+    """
+
+    def __init__(self, stream, block_size=DEFAULT_BLOCK_SIZE,
+                 window_size=DEFAULT_WINDOW_SIZE):
+        super(FileBlockReader, self).__init__(block_size, window_size)
+        self._stream = stream
+        self._stream.seek(0, os.SEEK_END)
+        self._size = self._stream.tell()
+
+    @property
+    def size(self):
+        return self._size
+
+    def _read_blocks(self, offset, view):
+        self._stream.seek(offset)
+        total = 0
+        while total < len(view):
+            count = self._stream.readinto(view[total:])
+            if not count:
+                break
+            total += count
+        return total
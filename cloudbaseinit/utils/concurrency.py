@@ -0,0 +1,100 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from six.moves import queue
+
+
+def map_concurrently(function, items, max_workers):
+    """Call the given function for each item, using a bounded thread pool.
+
+    :param function: A callable receiving one item.
+    :param items: The items to be processed.
+    :param max_workers: The max. number of threads used.
+    :returns: a list of (result, exception) tuples, in the order of
+              the given items. The exception is None on success.
+    """
+    items = list(items)
+    results = [(None, None)] * len(items)
+    tasks = queue.Queue()
+    for index, item in enumerate(items):
+        tasks.put((index, item))
+
+    def _worker():
+        while True:
+            try:
+                index, item = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = (function(item), None)
+            except Exception as ex:
+                results[index] = (None, ex)
+
+    threads = []
+    for _ in range(min(max(max_workers, 1), len(items))):
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def get_first_result(function, items, max_workers):
+    """Get the first successful result, calling the function concurrently.
+
+    The items not processed yet are skipped once a result was found and
+    the calls still running are abandoned, their threads being daemons.
+
+    :param function: A callable receiving one item. A falsy result
+                     or an exception means failure.
+    :param items: The items to be processed.
+    :param max_workers: The max. number of threads used.
+    :returns: an (item, result) tuple, or None if all the calls failed.
+    """
+    items = list(items)
+    tasks = queue.Queue()
+    for item in items:
+        tasks.put(item)
+    results = queue.Queue()
+    done = threading.Event()
+
+    def _worker():
+        while not done.is_set():
+            try:
+                item = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = function(item)
+            except Exception:
+                result = None
+            if result:
+                done.set()
+            results.put((item, result))
+
+    for _ in range(min(max(max_workers, 1), len(items))):
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+
+    for _ in items:
+        item, result = results.get()
+        if result:
+            return item, result
+    return None
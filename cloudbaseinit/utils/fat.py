@@ -0,0 +1,391 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only access to the files of FAT12, FAT16 and FAT32 volumes.
+
+The boot sector and the root directory give the volume label, while
+the files are read by following their cluster chains, from any
+seekable stream, like a file, a mmap or a device.
+"""
+
+import collections
+import errno
+import re
+import struct
+import threading
+
+import six
+
+from cloudbaseinit import exception
+
+BOOT_SECTOR_SIZE = 512
+BOOT_JUMP_INSTRUCTIONS = (0xEB, 0xE9)
+SECTOR_SIZES = (512, 1024, 2048, 4096)
+EXTENDED_BOOT_SIGNATURE = 0x29
+# The volume labels and the short names are in the OEM code page.
+OEM_ENCODING = "cp437"
+NO_NAME_LABEL = "NO NAME"
+
+# The FAT type is given by the number of clusters only.
+MAX_FAT12_CLUSTERS = 4084
+MAX_FAT16_CLUSTERS = 65524
+FIRST_CLUSTER = 2
+
+DIR_ENTRY_SIZE = 32
+DIR_ENTRY_END = 0x00
+DIR_ENTRY_DELETED = 0xE5
+# Replaces 0xE5 as the first character of the short names.
+DIR_ENTRY_KANJI = 0x05
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_LONG_NAME = 0x0F
+LONG_NAME_LAST = 0x40
+LONG_NAME_ORDER_MASK = 0x1F
+LONG_NAME_OFFSETS = ((1, 11), (14, 26), (28, 32))
+CASE_LOWER_BASE = 0x08
+CASE_LOWER_EXTENSION = 0x10
+
+_BootSector = collections.namedtuple(
+    "_BootSector", ["sector_size", "cluster_sectors", "reserved_sectors",
+                    "fat_count", "root_entries", "total_sectors",
+                    "fat_sectors", "root_cluster", "label"])
+
+
+class _Entry(object):
+
+    __slots__ = ("name", "is_dir", "cluster", "size")
+
+    def __init__(self, name, is_dir, cluster, size):
+        self.name = name
+        self.is_dir = is_dir
+        self.cluster = cluster
+        self.size = size
+
+
+def _parse_boot_sector(data):
+    """Get the BIOS parameter block fields, if the boot sector is valid."""
+    if len(data) < BOOT_SECTOR_SIZE:
+        return None
+    if six.indexbytes(data, 0) not in BOOT_JUMP_INSTRUCTIONS:
+        return None
+
+    (sector_size, cluster_sectors, reserved_sectors, fat_count,
+     root_entries, total_sectors, _, fat_sectors) = struct.unpack_from(
+        "<HBHBHHBH", data, 11)
+    if (sector_size not in SECTOR_SIZES or not cluster_sectors or
+            cluster_sectors & (cluster_sectors - 1) or
+            not reserved_sectors or not fat_count):
+        return None
+
+    root_cluster = None
+    label_offset = 43
+    if not fat_sectors:
+        # FAT32 extended BIOS parameter block
+        fat_sectors, root_cluster = struct.unpack_from("<I4xI", data, 36)
+        label_offset = 71
+    if not fat_sectors:
+        return None
+    total_sectors = total_sectors or struct.unpack_from("<I", data, 32)[0]
+
+    label = None
+    if six.indexbytes(data, label_offset - 5) == EXTENDED_BOOT_SIGNATURE:
+        label = data[label_offset:label_offset + 11]
+    return _BootSector(sector_size, cluster_sectors, reserved_sectors,
+                       fat_count, root_entries, total_sectors, fat_sectors,
+                       root_cluster, label)
+
+
+def is_fat(stream):
+    """Check if the given stream starts with a FAT volume."""
+    stream.seek(0)
+    return _parse_boot_sector(stream.read(BOOT_SECTOR_SIZE)) is not None
+
+
+def _split_path(path):
+    return [part for part in re.split(r"[\\/]+", path)
+            if part and part != "."]
+
+
+def _get_short_name_checksum(short_name):
+    checksum = 0
+    for char in six.iterbytes(short_name):
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + char) & 0xFF
+    return checksum
+
+
+def _decode_label(label):
+    label = label.decode(OEM_ENCODING).rstrip()
+    return "" if label == NO_NAME_LABEL else label
+
+
+class FATReader(object):
+
+    """Read the files of the FAT volume from the given stream.
+
+    The stream must have the `seek` and `read` methods of a binary
+    file. It is accessed under a lock, so that the files can be read
+    from multiple threads.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._directories = {}
+        self._fat_sectors = {}
+
+        boot_sector = _parse_boot_sector(self._read_at(0, BOOT_SECTOR_SIZE))
+        if not boot_sector:
+            raise exception.CloudbaseInitException(
+                "FAT boot sector not found")
+        self._load_layout(boot_sector)
+        self.volume_label = self._get_volume_label(boot_sector)
+
+    def _read_at(self, offset, size):
+        with self._lock:
+            self._stream.seek(offset)
+            data = self._stream.read(size)
+        if len(data) != size:
+            raise exception.CloudbaseInitException(
+                "Unexpected end of the FAT volume at offset %d" % offset)
+        return data
+
+    def _load_layout(self, boot_sector):
+        self._sector_size = boot_sector.sector_size
+        self._cluster_size = (boot_sector.cluster_sectors *
+                              boot_sector.sector_size)
+        self._fat_offset = (boot_sector.reserved_sectors *
+                            boot_sector.sector_size)
+        root_offset = self._fat_offset + (boot_sector.fat_count *
+                                          boot_sector.fat_sectors *
+                                          boot_sector.sector_size)
+        root_size = boot_sector.root_entries * DIR_ENTRY_SIZE
+        root_sectors = -(-root_size // boot_sector.sector_size)
+        self._data_offset = root_offset + (root_sectors *
+                                           boot_sector.sector_size)
+        self.volume_size = (boot_sector.total_sectors *
+                            boot_sector.sector_size)
+
+        data_sectors = (self.volume_size - self._data_offset) // (
+            boot_sector.sector_size)
+        self._cluster_count = data_sectors // boot_sector.cluster_sectors
+        if self._cluster_count <= MAX_FAT12_CLUSTERS:
+            self.fat_bits = 12
+        elif self._cluster_count <= MAX_FAT16_CLUSTERS:
+            self.fat_bits = 16
+        else:
+            self.fat_bits = 32
+        self.filesystem = "FAT%d" % self.fat_bits
+        self._end_of_chain = (1 << min(self.fat_bits, 28)) - 8
+
+        if self.fat_bits == 32:
+            self._root = _Entry(None, True, boot_sector.root_cluster, None)
+            self._root_region = None
+        else:
+            self._root = _Entry(None, True, None, root_size)
+            self._root_region = (root_offset, root_size)
+
+    def _get_volume_label(self, boot_sector):
+        # The label of the root directory is the one updated by the
+        # operating systems, the boot sector one being a copy.
+        for data, offset in self._iter_dir_entries(self._root):
+            attributes = six.indexbytes(data, offset + 11)
+            if (attributes != ATTR_LONG_NAME and
+                    attributes & ATTR_VOLUME_ID):
+                return _decode_label(data[offset:offset + 11])
+        if boot_sector.label:
+            return _decode_label(boot_sector.label)
+        return ""
+
+    def _read_fat(self, offset, size):
+        """Read from the first FAT, one sector at a time."""
+        data = b""
+        while size:
+            sector = offset // self._sector_size
+            sector_data = self._fat_sectors.get(sector)
+            if sector_data is None:
+                sector_data = self._read_at(
+                    self._fat_offset + sector * self._sector_size,
+                    self._sector_size)
+                self._fat_sectors[sector] = sector_data
+            start = offset % self._sector_size
+            chunk = sector_data[start:start + size]
+            data += chunk
+            offset += len(chunk)
+            size -= len(chunk)
+        return data
+
+    def _get_next_cluster(self, cluster):
+        if self.fat_bits == 12:
+            value = struct.unpack("<H", self._read_fat(
+                cluster + cluster // 2, 2))[0]
+            return value >> 4 if cluster & 1 else value & 0xFFF
+        elif self.fat_bits == 16:
+            return struct.unpack("<H", self._read_fat(cluster * 2, 2))[0]
+        return struct.unpack("<I", self._read_fat(
+            cluster * 4, 4))[0] & 0x0FFFFFFF
+
+    def _iter_runs(self, cluster):
+        """Yield the (first cluster, count) runs of contiguous clusters."""
+        max_cluster = self._cluster_count + FIRST_CLUSTER - 1
+        first = cluster
+        count = 0
+        # Limits the chains of corrupted volumes, which could loop.
+        for _ in range(self._cluster_count):
+            if not FIRST_CLUSTER <= cluster <= max_cluster:
+                raise exception.CloudbaseInitException(
+                    "Invalid FAT cluster: %d" % cluster)
+            count += 1
+            next_cluster = self._get_next_cluster(cluster)
+            if next_cluster >= self._end_of_chain:
+                yield first, count
+                return
+            if next_cluster != cluster + 1:
+                yield first, count
+                first = next_cluster
+                count = 0
+            cluster = next_cluster
+        raise exception.CloudbaseInitException("FAT cluster chain loop")
+
+    def _read_chain(self, cluster, size=None):
+        """Read the clusters of the chain, up to the given size."""
+        chunks = []
+        for first, count in self._iter_runs(cluster):
+            run_size = count * self._cluster_size
+            if size is not None:
+                run_size = min(run_size, size)
+                size -= run_size
+            chunks.append(self._read_at(
+                self._data_offset +
+                (first - FIRST_CLUSTER) * self._cluster_size, run_size))
+            if size == 0:
+                break
+        return b"".join(chunks)
+
+    def _read_entry(self, entry):
+        if entry is self._root and self._root_region:
+            return self._read_at(*self._root_region)
+        if not entry.cluster:
+            return b""
+        return self._read_chain(entry.cluster,
+                                None if entry.is_dir else entry.size)
+
+    def _iter_dir_entries(self, entry):
+        data = self._read_entry(entry)
+        for offset in range(0, len(data) - DIR_ENTRY_SIZE + 1,
+                            DIR_ENTRY_SIZE):
+            first = six.indexbytes(data, offset)
+            if first == DIR_ENTRY_END:
+                break
+            if first != DIR_ENTRY_DELETED:
+                yield data, offset
+
+    def _get_short_name(self, data, offset):
+        base = data[offset:offset + 8]
+        if six.indexbytes(base, 0) == DIR_ENTRY_KANJI:
+            base = b"\xe5" + base[1:]
+        base = base.decode(OEM_ENCODING).rstrip()
+        extension = data[offset + 8:offset + 11].decode(OEM_ENCODING).rstrip()
+        case = six.indexbytes(data, offset + 12)
+        if case & CASE_LOWER_BASE:
+            base = base.lower()
+        if case & CASE_LOWER_EXTENSION:
+            extension = extension.lower()
+        return base + "." + extension if extension else base
+
+    def _read_directory(self, entry):
+        entries = collections.OrderedDict()
+        long_name = {}
+        checksum = None
+        for data, offset in self._iter_dir_entries(entry):
+            attributes = six.indexbytes(data, offset + 11)
+            if attributes == ATTR_LONG_NAME:
+                order = six.indexbytes(data, offset)
+                if order & LONG_NAME_LAST:
+                    long_name = {}
+                    checksum = six.indexbytes(data, offset + 13)
+                long_name[order & LONG_NAME_ORDER_MASK] = b"".join(
+                    data[offset + start:offset + end]
+                    for start, end in LONG_NAME_OFFSETS)
+                continue
+
+            name = None
+            if long_name and checksum == _get_short_name_checksum(
+                    data[offset:offset + 11]):
+                name = b"".join(long_name[order] for order in
+                                sorted(long_name)).decode("utf-16-le")
+                name = name.split(u"\x00", 1)[0]
+            long_name = {}
+            if attributes & ATTR_VOLUME_ID:
+                continue
+
+            name = name or self._get_short_name(data, offset)
+            if name in (".", ".."):
+                continue
+            cluster_high, cluster_low, size = struct.unpack_from(
+                "<H4xHI", data, offset + 20)
+            cluster = cluster_low
+            if self.fat_bits == 32:
+                cluster |= cluster_high << 16
+            # The names are case insensitive.
+            entries[name.lower()] = _Entry(
+                name, bool(attributes & ATTR_DIRECTORY), cluster, size)
+        return entries
+
+    def _get_directory(self, parts):
+        key = tuple(part.lower() for part in parts)
+        if key in self._directories:
+            return self._directories[key]
+
+        if parts:
+            entry = self._find_entry(parts)
+            if not entry.is_dir:
+                raise IOError(errno.ENOTDIR, "Not a directory",
+                              "/".join(parts))
+        else:
+            entry = self._root
+        entries = self._read_directory(entry)
+        self._directories[key] = entries
+        return entries
+
+    def _find_entry(self, parts):
+        entry = self._get_directory(parts[:-1]).get(parts[-1].lower())
+        if entry is None:
+            raise IOError(errno.ENOENT, "No such file or directory",
+                          "/".join(parts))
+        return entry
+
+    def list_dir(self, path=""):
+        """Get the names of the entries of the given directory."""
+        return [entry.name for entry in
+                self._get_directory(_split_path(path)).values()]
+
+    def exists(self, path):
+        try:
+            parts = _split_path(path)
+            if parts:
+                self._find_entry(parts)
+            return True
+        except IOError:
+            return False
+
+    def read_file(self, path):
+        """Get the content of the file with the given path.
+
+        :raises: IOError if the file doesn't exist.
+        """
+        parts = _split_path(path)
+        entry = self._find_entry(parts) if parts else self._root
+        if entry.is_dir:
+            raise IOError(errno.EISDIR, "Is a directory", path)
+        return self._read_entry(entry)
@@ -0,0 +1,37 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+
+def write_file_atomically(path, content):
+    """Replace the given file as a whole, never leaving it partially written.
+
+    :param content: A text or binary string.
+    """
+    mode = "wb" if isinstance(content, bytes) else "w"
+    temp_path = path + ".tmp"
+    with open(temp_path, mode) as stream:
+        stream.write(content)
+        stream.flush()
+        os.fsync(stream.fileno())
+
+    replace = getattr(os, "replace", None)
+    if replace:
+        replace(temp_path, path)
+    else:
+        # Python 2 on Windows can't rename over an existing file.
+        if os.name == "nt" and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
@@ -0,0 +1,275 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only access to the files of ISO9660 images.
+
+The Joliet and Rock Ridge file names are used when available. Only the
+directories leading to the requested files and the file extents are
+read, from any seekable stream, like a file, a mmap or a device.
+"""
+
+import collections
+import errno
+import re
+import struct
+import threading
+
+import six
+
+from cloudbaseinit import exception
+
+SECTOR_SIZE = 2048
+VOLUME_DESCRIPTORS_OFFSET = 16 * SECTOR_SIZE
+ISO_ID = b"CD001"
+
+VOLUME_DESCRIPTOR_PRIMARY = 1
+VOLUME_DESCRIPTOR_SUPPLEMENTARY = 2
+VOLUME_DESCRIPTOR_TERMINATOR = 255
+JOLIET_ESCAPE_SEQUENCES = (b"%/@", b"%/C", b"%/E")
+# Limits the descriptors read from invalid images.
+MAX_VOLUME_DESCRIPTORS = 64
+
+FLAG_DIRECTORY = 0x02
+FLAG_MULTI_EXTENT = 0x80
+ROCK_RIDGE_NAME = b"NM"
+ROCK_RIDGE_NAME_CONTINUE = 0x01
+
+_Extent = collections.namedtuple("_Extent", ["location", "size"])
+
+
+class _Entry(object):
+
+    __slots__ = ("name", "is_dir", "extents")
+
+    def __init__(self, name, is_dir, extents):
+        self.name = name
+        self.is_dir = is_dir
+        self.extents = extents
+
+    @property
+    def size(self):
+        return sum(extent.size for extent in self.extents)
+
+
+def is_iso9660(stream):
+    """Check if the given stream starts with an ISO9660 volume."""
+    stream.seek(VOLUME_DESCRIPTORS_OFFSET + 1)
+    return stream.read(len(ISO_ID)) == ISO_ID
+
+
+def _split_path(path):
+    return [part for part in re.split(r"[\\/]+", path)
+            if part and part != "."]
+
+
+class ISO9660Reader(object):
+
+    """Read the files of the ISO9660 volume from the given stream.
+
+    The stream must have the `seek` and `read` methods of a binary
+    file. It is accessed under a lock, so that the files can be read
+    from multiple threads.
+    """
+
+    filesystem = "ISO9660"
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._directories = {}
+        self._joliet = False
+        self._rock_ridge = False
+        self._load_volume_descriptors()
+
+    def _read_at(self, offset, size):
+        with self._lock:
+            self._stream.seek(offset)
+            data = self._stream.read(size)
+        if len(data) != size:
+            raise exception.CloudbaseInitException(
+                "Unexpected end of the ISO9660 volume at offset %d" % offset)
+        return data
+
+    def _load_volume_descriptors(self):
+        primary = None
+        joliet = None
+        for index in range(MAX_VOLUME_DESCRIPTORS):
+            descriptor = self._read_at(
+                VOLUME_DESCRIPTORS_OFFSET + index * SECTOR_SIZE, SECTOR_SIZE)
+            if descriptor[1:6] != ISO_ID:
+                break
+            descriptor_type = six.indexbytes(descriptor, 0)
+            if descriptor_type == VOLUME_DESCRIPTOR_TERMINATOR:
+                break
+            elif descriptor_type == VOLUME_DESCRIPTOR_PRIMARY:
+                primary = primary or descriptor
+            elif (descriptor_type == VOLUME_DESCRIPTOR_SUPPLEMENTARY and
+                    descriptor[88:91] in JOLIET_ESCAPE_SEQUENCES):
+                joliet = joliet or descriptor
+
+        if not primary:
+            raise exception.CloudbaseInitException(
+                "ISO9660 primary volume descriptor not found")
+
+        self._block_size = struct.unpack_from("<H", primary, 128)[0]
+        self.volume_size = (struct.unpack_from("<I", primary, 80)[0] *
+                            self._block_size)
+        descriptor = joliet or primary
+        self._joliet = joliet is not None
+        self.volume_label = self._decode_name(
+            descriptor[40:72]).strip(u" \x00")
+
+        self._root = self._parse_record(descriptor, 156)[0]
+        self._rock_ridge = not self._joliet and self._has_rock_ridge()
+
+    def _decode_name(self, name):
+        if self._joliet:
+            return name.decode("utf-16-be", "replace")
+        return name.decode("latin-1")
+
+    def _has_rock_ridge(self):
+        # The SUSP "SP" entry starts the system use area of the first
+        # record of the root directory, the "." one.
+        extent = self._root.extents[0]
+        data = self._read_at(extent.location * self._block_size,
+                             min(extent.size, self._block_size))
+        name_length = six.indexbytes(data, 32)
+        return data[33 + name_length:35 + name_length] == b"SP"
+
+    def _parse_record(self, data, offset):
+        length = six.indexbytes(data, offset)
+        location, size = struct.unpack_from("<I4xI", data, offset + 2)
+        flags = six.indexbytes(data, offset + 25)
+        name_length = six.indexbytes(data, offset + 32)
+        name = data[offset + 33:offset + 33 + name_length]
+        if name in (b"\x00", b"\x01"):
+            # "." and ".."
+            name = None
+        elif self._rock_ridge:
+            system_use_offset = offset + 33 + name_length + (
+                1 - name_length % 2)
+            name = (self._get_rock_ridge_name(
+                data[system_use_offset:offset + length]) or
+                self._get_iso_name(name))
+        elif self._joliet:
+            name = self._decode_name(name).split(";", 1)[0]
+        else:
+            name = self._get_iso_name(name)
+        return _Entry(name, bool(flags & FLAG_DIRECTORY),
+                      [_Extent(location, size)]), flags
+
+    @staticmethod
+    def _get_iso_name(name):
+        name = name.decode("latin-1").split(";", 1)[0]
+        if name.endswith("."):
+            name = name[:-1]
+        return name
+
+    @staticmethod
+    def _get_rock_ridge_name(system_use):
+        parts = []
+        offset = 0
+        while offset + 4 <= len(system_use):
+            signature = system_use[offset:offset + 2]
+            length = six.indexbytes(system_use, offset + 2)
+            if length < 4:
+                break
+            if signature == ROCK_RIDGE_NAME:
+                flags = six.indexbytes(system_use, offset + 4)
+                parts.append(system_use[offset + 5:offset + length])
+                if not flags & ROCK_RIDGE_NAME_CONTINUE:
+                    break
+            offset += length
+        if parts:
+            return b"".join(parts).decode("utf-8", "replace")
+
+    def _read_directory(self, entry):
+        entries = collections.OrderedDict()
+        data = self._read_extents(entry)
+        offset = 0
+        previous = None
+        while offset < len(data):
+            length = six.indexbytes(data, offset)
+            if not length:
+                # The records don't span over blocks, the rest of the
+                # block being padded with zeros.
+                offset = (offset // self._block_size + 1) * self._block_size
+                continue
+            child, flags = self._parse_record(data, offset)
+            offset += length
+            if previous is not None:
+                previous.extents.extend(child.extents)
+            elif child.name is not None:
+                entries[child.name] = child
+            # The other extents of the file are in the next records.
+            previous = (previous or child) if (
+                flags & FLAG_MULTI_EXTENT) else None
+        return entries
+
+    def _read_extents(self, entry):
+        return b"".join(self._read_at(extent.location * self._block_size,
+                                      extent.size)
+                        for extent in entry.extents if extent.size)
+
+    def _get_directory(self, parts):
+        key = tuple(parts)
+        if key in self._directories:
+            return self._directories[key]
+
+        if parts:
+            entry = self._find_entry(parts)
+            if not entry.is_dir:
+                raise IOError(errno.ENOTDIR, "Not a directory",
+                              "/".join(parts))
+        else:
+            entry = self._root
+        entries = self._read_directory(entry)
+        self._directories[key] = entries
+        return entries
+
+    def _find_entry(self, parts):
+        entries = self._get_directory(parts[:-1])
+        name = parts[-1]
+        entry = entries.get(name)
+        if entry is None and not (self._joliet or self._rock_ridge):
+            # The plain ISO9660 names are in upper case.
+            entry = entries.get(name.upper())
+        if entry is None:
+            raise IOError(errno.ENOENT, "No such file or directory",
+                          "/".join(parts))
+        return entry
+
+    def list_dir(self, path=""):
+        """Get the names of the entries of the given directory."""
+        return list(self._get_directory(_split_path(path)))
+
+    def exists(self, path):
+        try:
+            parts = _split_path(path)
+            if parts:
+                self._find_entry(parts)
+            return True
+        except IOError:
+            return False
+
+    def read_file(self, path):
+        """Get the content of the file with the given path.
+
+        :raises: IOError if the file doesn't exist.
+        """
+        parts = _split_path(path)
+        entry = self._find_entry(parts) if parts else self._root
+        if entry.is_dir:
+            raise IOError(errno.EISDIR, "Is a directory", path)
+        return self._read_extents(entry)
@@ -0,0 +1,182 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Split MIME multipart messages without copying them.
+
+The parts are found by their boundaries in the raw bytes, their bodies
+being memoryview slices of the message. Only the headers of the parts
+are parsed, the bodies are decoded when their payload is requested.
+"""
+
+import binascii
+import email.parser
+
+# The headers of the message and of its parts are searched in this prefix
+# of them only.
+MAX_HEADERS_SIZE = 64 * 1024
+
+_HEADERS_SEPARATORS = (b"\n\n", b"\n\r\n")
+# The whitespace allowed after a delimiter, until the line end.
+_PADDING = b" \t\r"
+
+
+def _find_body(data, start, end):
+    """Get the end of the headers and the start of the body."""
+    if data.startswith(b"\n", start):
+        return start, start + 1
+    if data.startswith(b"\r\n", start):
+        return start, start + 2
+
+    best = None
+    for separator in _HEADERS_SEPARATORS:
+        index = data.find(separator, start, end)
+        if index >= 0 and (best is None or index < best[0]):
+            best = index + 1, index + len(separator)
+    return best or (end, end)
+
+
+def get_header_block(data, max_size=MAX_HEADERS_SIZE):
+    """Get the headers of the message, until the first empty line.
+
+    Only the first `max_size` bytes are searched. If there is no
+    empty line in them, the whole prefix is returned.
+    """
+    return data[:_find_body(data, 0, min(len(data), max_size))[0]]
+
+
+def _parse_headers(data):
+    return email.parser.HeaderParser().parsestr(data.decode("latin-1"))
+
+
+class Part(object):
+
+    """A part of a MIME message, with the API of email.message.Message.
+
+    :param headers: The email.message.Message with the part headers.
+    :param body: The memoryview of the raw part body.
+    """
+
+    def __init__(self, headers, body):
+        self._headers = headers
+        self._body = body
+
+    def get(self, name, failobj=None):
+        return self._headers.get(name, failobj)
+
+    def get_content_type(self):
+        return self._headers.get_content_type()
+
+    def get_content_maintype(self):
+        return self._headers.get_content_maintype()
+
+    def get_filename(self, failobj=None):
+        return self._headers.get_filename(failobj)
+
+    def get_boundary(self, failobj=None):
+        return self._headers.get_boundary(failobj)
+
+    def is_multipart(self):
+        return self.get_content_maintype() == "multipart"
+
+    def get_body(self):
+        """Get the memoryview of the body, before its transfer decoding."""
+        return self._body
+
+    def get_payload(self, decode=False):
+        """Get the body, decoded from its transfer encoding if requested.
+
+        The body of the parts with an invalid encoding is returned as is,
+        like email.message.Message does.
+        """
+        if not decode:
+            return self._body.tobytes().decode("latin-1")
+
+        transfer_encoding = self._headers.get(
+            "Content-Transfer-Encoding", "").strip().lower()
+        try:
+            if transfer_encoding == "base64":
+                return binascii.a2b_base64(self._body)
+            elif transfer_encoding == "quoted-printable":
+                return binascii.a2b_qp(self._body)
+        except (binascii.Error, ValueError):
+            pass
+        return self._body.tobytes()
+
+
+def _find_delimiter(data, delimiter, start, end):
+    """Find the next delimiter line within the given range of data.
+
+    The delimiter must be at the start of a line, followed only by the
+    "--" of the close delimiter and by whitespace until the line end.
+
+    :returns: The index of the delimiter, whether it is the close
+              delimiter and the end of its line, or (-1, False, end).
+    """
+    index = data.find(delimiter, start, end)
+    while index >= 0:
+        if index == start or data[index - 1:index] == b"\n":
+            after = index + len(delimiter)
+            close = data.startswith(b"--", after, end)
+            if close:
+                after += 2
+            line_end = data.find(b"\n", after, end)
+            if line_end < 0:
+                line_end = end
+            if not data[after:line_end].strip(_PADDING):
+                return index, close, line_end
+        index = data.find(delimiter, index + 1, end)
+    return -1, False, end
+
+
+def _split(data, start, end, boundary):
+    """Get the ranges of the parts within the given range of data."""
+    delimiter = b"--" + boundary
+    index, close, line_end = _find_delimiter(data, delimiter, start, end)
+    while index >= 0 and not close and line_end < end:
+        part_start = line_end + 1
+
+        index, close, line_end = _find_delimiter(
+            data, delimiter, part_start, end)
+        part_end = end if index < 0 else index
+        if index > part_start:
+            # The line break before the delimiter belongs to it.
+            part_end -= 1
+            if data[part_end - 1:part_end] == b"\r" and (
+                    part_end > part_start):
+                part_end -= 1
+        yield part_start, part_end
+
+
+def _walk(data, view, start, end):
+    headers_end, body_start = _find_body(
+        data, start, min(end, start + MAX_HEADERS_SIZE))
+    part = Part(_parse_headers(data[start:headers_end]),
+                view[body_start:end])
+    yield part
+
+    boundary = part.get_boundary()
+    if part.is_multipart() and boundary:
+        boundary = boundary.encode("latin-1")
+        for part_start, part_end in _split(data, body_start, end, boundary):
+            for subpart in _walk(data, view, part_start, part_end):
+                yield subpart
+
+
+def walk(data):
+    """Generate the parts of the given MIME message, in depth first order.
+
+    Like email.message.Message.walk, the message itself is the first
+    part, followed by the parts of each multipart part.
+    """
+    return _walk(data, memoryview(data), 0, len(data))
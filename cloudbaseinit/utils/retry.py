@@ -0,0 +1,218 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Retry policies with exponential backoff, time budgets and breakers."""
+
+import random
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import exception
+from cloudbaseinit.utils import tracing
+
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+
+class RetryPolicy(object):
+
+    """Describe how many times and how long to wait before retrying.
+
+    The delay before the n-th retry is ``interval * multiplier ** (n - 1)``,
+    capped to `max_interval`. With `jitter`, a random delay between zero
+    and the computed one is used instead ("full jitter"), so that the
+    clients failing at the same time don't retry in lockstep.
+    """
+
+    def __init__(self, max_attempts, interval=0, max_interval=None,
+                 multiplier=1, jitter=False):
+        self.max_attempts = max_attempts
+        self.interval = interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def get_delay(self, retry_number):
+        delay = self.interval * self.multiplier ** (retry_number - 1)
+        if self.max_interval:
+            delay = min(delay, self.max_interval)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+def get_default_policy(max_attempts=None):
+    """Get the policy described by the retry config options.
+
+    :param max_attempts: The max. number of attempts, defaulting to
+                         one more than the `retry_count` config option.
+    """
+    if max_attempts is None:
+        max_attempts = CONF.retry_count + 1
+    return RetryPolicy(max_attempts, CONF.retry_count_interval,
+                       max_interval=CONF.retry_max_interval,
+                       multiplier=CONF.retry_backoff_multiplier,
+                       jitter=CONF.retry_jitter)
+
+
+class CircuitBreaker(object):
+
+    """Fail fast once a target is clearly unavailable.
+
+    The breaker opens after `threshold` consecutive failures matching
+    `errors`. While open, the actions are not attempted at all. After
+    `reset_time` seconds, a single attempt is allowed again, closing
+    the breaker on success.
+    """
+
+    def __init__(self, threshold, reset_time, errors=(Exception,)):
+        self._threshold = threshold
+        self._reset_time = reset_time
+        self._errors = errors
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return (self._opened_at is not None and
+                    time.time() - self._opened_at < self._reset_time)
+
+    def check(self):
+        if self.is_open:
+            raise exception.CircuitBreakerOpenException(
+                "Giving up after %d consecutive failures" % self._failures)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self, ex):
+        if not isinstance(ex, self._errors):
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._threshold:
+                if self._opened_at is None:
+                    LOG.debug("Circuit breaker opened after %d consecutive "
+                              "failures", self._failures)
+                self._opened_at = time.time()
+
+
+class Retrier(object):
+
+    """Execute actions according to retry policies.
+
+    :param policy: The :class:`RetryPolicy` used by default.
+    :param error_policies: A list of (matcher, policy) tuples, used for
+                           the errors matching the first matcher, which
+                           can be an exception class, a tuple of classes
+                           or a callable receiving the exception.
+    :param no_retry_errors: Errors raised without any retry.
+    :param budget: The max. time, in seconds, which can be spent on
+                   the retried attempts and the waits between them, for
+                   all the actions executed by this object. None means
+                   no limit.
+    :param circuit_breaker: An optional :class:`CircuitBreaker`.
+    :param name: Name used in the logs and the boot traces.
+    """
+
+    def __init__(self, policy, error_policies=None, no_retry_errors=(),
+                 budget=None, circuit_breaker=None, name=None):
+        self._policy = policy
+        self._error_policies = error_policies or []
+        self._no_retry_errors = no_retry_errors
+        self._budget = budget
+        self._circuit_breaker = circuit_breaker
+        self._name = name
+        self._spent = 0
+        self._lock = threading.Lock()
+
+    def _get_policy(self, ex):
+        if isinstance(ex, self._no_retry_errors):
+            return NO_RETRY
+        for matcher, policy in self._error_policies:
+            if isinstance(matcher, (type, tuple)):
+                if isinstance(ex, matcher):
+                    return policy
+            elif matcher(ex):
+                return policy
+        return self._policy
+
+    def _consume_budget(self, seconds, force=False):
+        """Account the given time, returning False if over budget.
+
+        The time is not accounted when over budget, unless `force`
+        is set, for the time already spent.
+        """
+        with self._lock:
+            if (self._budget is not None and not force and
+                    self._spent + seconds > self._budget):
+                return False
+            self._spent += seconds
+            return True
+
+    def execute(self, action):
+        """Call the given action, retrying it on failure.
+
+        The last error is raised when the policy matching it does not
+        allow more attempts or when the time budget is exhausted.
+        """
+        retry_number = 0
+        while True:
+            if self._circuit_breaker:
+                self._circuit_breaker.check()
+
+            start = time.time()
+            try:
+                result = action()
+            except Exception as ex:
+                if self._circuit_breaker:
+                    self._circuit_breaker.record_failure(ex)
+
+                policy = self._get_policy(ex)
+                retry_number += 1
+                if retry_number >= policy.max_attempts:
+                    raise
+
+                # Only the failed attempts followed by a retry are
+                # accounted, the errors which are not retried (e.g. 404)
+                # don't use the budget of the other requests.
+                self._consume_budget(time.time() - start, force=True)
+
+                delay = policy.get_delay(retry_number)
+                if not self._consume_budget(delay):
+                    LOG.debug("Retry time budget exhausted for: %s",
+                              self._name)
+                    raise
+
+                LOG.debug("Retrying %(name)s in %(delay).2f seconds, after "
+                          "error: %(ex)s",
+                          {"name": self._name, "delay": delay, "ex": ex})
+                with tracing.span("retry_sleep", "retry", target=self._name,
+                                  attempt=retry_number):
+                    time.sleep(delay)
+            else:
+                if self._circuit_breaker:
+                    self._circuit_breaker.record_success()
+                return result
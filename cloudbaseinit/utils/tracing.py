@@ -0,0 +1,141 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Boot timeline tracing, saved in the Chrome trace event format."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+
+class Tracer(object):
+
+    """Collect timed spans and instant events.
+
+    The events can be loaded by any tool which understands the
+    Chrome trace event format (e.g. chrome://tracing or Perfetto).
+    """
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._saved_count = 0
+
+    @staticmethod
+    def _now():
+        # Timestamps are expressed in microseconds.
+        return int(time.time() * 1000000)
+
+    def _add_event(self, event):
+        event["pid"] = self._pid
+        event["tid"] = threading.current_thread().ident
+        with self._lock:
+            self._events.append(event)
+
+    @property
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """Record the duration of the code executed in this context."""
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._add_event({"name": name, "cat": category, "ph": "X",
+                             "ts": start, "dur": self._now() - start,
+                             "args": args})
+
+    def instant(self, name, category, **args):
+        """Record an event without duration, like a decision."""
+        self._add_event({"name": name, "cat": category, "ph": "i",
+                         "ts": self._now(), "s": "p", "args": args})
+
+    @staticmethod
+    def _load_events(path):
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as stream:
+                return list(json.load(stream)["traceEvents"])
+        except (ValueError, KeyError, TypeError) as ex:
+            LOG.warning("Replacing the invalid boot trace '%(path)s': "
+                        "%(ex)s", {"path": path, "ex": ex})
+            return []
+
+    def save(self, path):
+        """Append the events not saved yet to the given trace file.
+
+        The events of the previous runs, like the ones before a reboot,
+        are kept, each run being shown as a separate process.
+        """
+        with self._lock:
+            events = self._events[self._saved_count:]
+        trace_events = self._load_events(path) + events
+        with open(path, "w") as stream:
+            json.dump({"traceEvents": trace_events,
+                       "displayTimeUnit": "ms"}, stream, default=str)
+        with self._lock:
+            self._saved_count += len(events)
+
+
+_TRACER = Tracer()
+
+
+def get_tracer():
+    return _TRACER
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    """Record a span on the global tracer, if tracing is enabled."""
+    if not CONF.boot_trace_path:
+        yield
+        return
+
+    with _TRACER.span(name, category, **args):
+        yield
+
+
+def instant(name, category, **args):
+    """Record an instant event on the global tracer, if enabled."""
+    if CONF.boot_trace_path:
+        _TRACER.instant(name, category, **args)
+
+
+def save():
+    """Save the collected events to the configured trace path."""
+    if not CONF.boot_trace_path:
+        return
+
+    trace_path = os.path.abspath(os.path.expandvars(CONF.boot_trace_path))
+    try:
+        _TRACER.save(trace_path)
+        LOG.info("Boot trace saved to: %s", trace_path)
+    except Exception as ex:
+        LOG.error("Failed to save the boot trace to '%(path)s': %(ex)s",
+                  {"path": trace_path, "ex": ex})
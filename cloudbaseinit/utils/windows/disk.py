@@ -24,6 +24,7 @@ import six
 import winioctlcon
 
 from cloudbaseinit import exception
+from cloudbaseinit.utils import blockio
 
 
 kernel32 = windll.kernel32
@@ -171,6 +172,7 @@ class BaseDevice(object):
         self._handle = None
         self._sector_size = None
         self._disk_size = None
+        self._read_buffer = bytearray()
         self._allow_write = allow_write
         self.fixed = None
 
@@ -219,15 +221,26 @@ class BaseDevice(object):
             raise exception.WindowsCloudbaseInitException(
                 "Seek error: %r")
 
-    def _read(self, size):
-        buff = ctypes.create_string_buffer(size)
+    def _readinto(self, buffer):
+        """Read into the given writable buffer, without copying."""
+        if six.PY2 and isinstance(buffer, memoryview):
+            # The Python 2 ctypes only accept the old buffer protocol,
+            # which memoryview lacks, so the data is copied from a
+            # bytearray instead.
+            data = bytearray(len(buffer))
+            bytes_read = self._readinto(data)
+            buffer[:bytes_read] = bytes(data[:bytes_read])
+            return bytes_read
+
+        size = len(buffer)
+        buff = (ctypes.c_char * size).from_buffer(buffer)
         bytes_read = wintypes.DWORD()
         ret_val = kernel32.ReadFile(self._handle, buff, size,
                                     ctypes.byref(bytes_read), 0)
         if not ret_val:
             raise exception.WindowsCloudbaseInitException(
                 "Read exception: %r")
-        return buff.raw[:bytes_read.value]    # all bytes without the null byte
+        return bytes_read.value
 
     def open(self):
         access = self.GENERIC_READ
@@ -278,8 +291,15 @@ class BaseDevice(object):
         total = size + skip
         safe_size = ((int(total / self._sector_size) +
                       bool(total % self._sector_size)) * self._sector_size)
-        content = self._read(safe_size)
-        return content[skip:total]
+        if len(self._read_buffer) < safe_size:
+            self._read_buffer = bytearray(safe_size)
+        view = memoryview(self._read_buffer)[:safe_size]
+        bytes_read = self._readinto(view)
+        return bytes(view[skip:min(total, bytes_read)])
+
+    def get_block_reader(self, window_size=blockio.DEFAULT_WINDOW_SIZE):
+        """Get a buffered reader of the opened device."""
+        return DeviceBlockReader(self, window_size)
 
     @abc.abstractmethod
     def size(self):
@@ -403,3 +423,20 @@ class Partition(BaseDevice):
     @property
     def size(self):
         return self._partition_size
+
+
+class DeviceBlockReader(blockio.BlockReader):
+    """Buffered reader of a device, aligned to its sectors."""
+
+    def __init__(self, device, window_size=blockio.DEFAULT_WINDOW_SIZE):
+        super(DeviceBlockReader, self).__init__(device._sector_size,
+                                                window_size)
+        self._device = device
+
+    @property
+    def size(self):
+        return self._device.size
+
+    def _read_blocks(self, offset, view):
+        self._device._seek(offset)
+        return self._device._readinto(view)
@@ -12,59 +12,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import os
-import re
-
 from oslo_log import log as oslo_logging
 
-from cloudbaseinit import conf as cloudbaseinit_conf
-from cloudbaseinit import exception
+from cloudbaseinit.utils import fat
 
 
-CONF = cloudbaseinit_conf.CONF
 CONFIG_DRIVE_LABEL = 'config-2'
 LOG = oslo_logging.getLogger(__name__)
-VOLUME_LABEL_REGEX = re.compile("Volume label is (.*?)$")
-
-
-def _check_mtools_path():
-    if not CONF.mtools_path:
-        raise exception.CloudbaseInitException(
-            '"mtools_path" needs to be provided in order '
-            'to access VFAT drives')
-
-
-def is_vfat_drive(osutils, drive_path):
-    """Check if the given drive contains a VFAT filesystem."""
-    _check_mtools_path()
-    mlabel = os.path.join(CONF.mtools_path, "mlabel.exe")
-    args = [mlabel, "-i", drive_path, "-s"]
-
-    out, err, exit_code = osutils.execute_process(args, shell=False)
-    if exit_code:
-        LOG.debug("Could not retrieve label for VFAT drive path %r",
-                  drive_path)
-        LOG.debug("mlabel failed with error %r", err)
-        return False
 
-    LOG.debug("Obtained label information for drive %r: %r", drive_path, out)
-    out = out.decode().strip()
-    match = VOLUME_LABEL_REGEX.search(out)
-    return match.group(1) == CONFIG_DRIVE_LABEL
 
+def get_vfat_reader(stream):
+    """Get a reader for the VFAT config drive from the given stream.
 
-def copy_from_vfat_drive(osutils, drive_path, target_path):
-    """Copy everything from the given VFAT drive into the given target."""
-    _check_mtools_path()
-    cwd = os.getcwd()
-    try:
-        os.chdir(target_path)
+    Only the boot sector and the root directory are read in order to
+    check the volume label. None is returned if the stream doesn't
+    contain a VFAT config drive.
+    """
+    if not fat.is_fat(stream):
+        return None
 
-        # A mcopy call looks like this:
-        #
-        # mcopy -n -i \\.\PHYSICALDRIVEx ::/file/path destination/path
-        mcopy = os.path.join(CONF.mtools_path, "mcopy.exe")
-        args = [mcopy, "-s", "-n", "-i", drive_path, "::/", "."]
-        osutils.execute_process(args, shell=False)
-    finally:
-        os.chdir(cwd)
+    reader = fat.FATReader(stream)
+    LOG.debug("Obtained label information for %s volume: %r",
+              reader.filesystem, reader.volume_label)
+    if reader.volume_label.lower() != CONFIG_DRIVE_LABEL:
+        return None
+    return reader
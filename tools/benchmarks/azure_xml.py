@@ -0,0 +1,140 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the Azure XML parsers on large WireServer documents.
+
+The streaming parsers from cloudbaseinit.metadata.services.azuremodel
+are measured against a full untangle tree, if untangle is installed,
+reporting the best parse time and the peak of the allocated memory.
+Example:
+
+    python tools/benchmarks/azure_xml.py --entries 2000 --runs 5
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import six
+
+# Use the cloudbaseinit package from this checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from cloudbaseinit.metadata.services import azuremodel  # noqa
+
+try:
+    import untangle
+except ImportError:
+    untangle = None
+
+_SETTINGS = "".join("%02x" % (i % 256) for i in range(2048))
+
+
+def get_extensions_config(entries):
+    plugins = "".join(
+        '<Plugin name="Fake.Extension%(i)d" version="1.%(i)d" '
+        'location="http://fake/%(i)d" state="enabled" autoUpgrade="true" '
+        'failoverlocation="http://failover/%(i)d" runAsStartupTask="false" '
+        'isJson="true" />' % {"i": i} for i in range(entries))
+    settings = "".join(
+        '<Plugin name="Fake.Extension%(i)d" version="1.%(i)d">'
+        '<RuntimeSettings seqNo="0">{"runtimeSettings": "%(s)s"}'
+        '</RuntimeSettings></Plugin>' % {"i": i, "s": _SETTINGS}
+        for i in range(entries))
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<Extensions version="1.0.0.0" goalStateIncarnation="1">'
+            '<GuestAgentExtension><GAFamilies><GAFamily><Name>Win7</Name>'
+            '<Uris><Uri>http://fake/ga</Uri></Uris></GAFamily></GAFamilies>'
+            '</GuestAgentExtension><Plugins>%s</Plugins>'
+            '<PluginSettings>%s</PluginSettings>'
+            '<StatusUploadBlob statusBlobType="BlockBlob">http://blob'
+            '</StatusUploadBlob></Extensions>' %
+            (plugins, settings)).encode()
+
+
+def get_hosting_environment(entries):
+    certificates = "".join(
+        '<StoredCertificate name="Stored%(i)d" '
+        'certificateId="sha1:%(i)040X" storeName="My" '
+        'configurationLevel="System" />' % {"i": i} for i in range(entries))
+    resources = "".join(
+        '<Resource name="Resource%(i)d" type="directory" '
+        'size="%(i)d" />' % {"i": i} for i in range(entries))
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<HostingEnvironmentConfig version="1.0.0.0" '
+            'goalStateIncarnation="1">'
+            '<StoredCertificates>%s</StoredCertificates>'
+            '<LocalResources>%s</LocalResources>'
+            '</HostingEnvironmentConfig>' %
+            (certificates, resources)).encode()
+
+
+def _measure(parse, data, runs):
+    best_time = None
+    for _ in range(runs):
+        start = time.time()
+        parse(data)
+        elapsed = time.time() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    tracemalloc.start()
+    try:
+        result = parse(data)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return best_time, peak_memory
+
+
+def _parse_untangle(data):
+    return untangle.parse(six.StringIO(data.decode()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000,
+                        help="The number of plugins and of certificates")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = [
+        ("ExtensionsConfig", get_extensions_config(args.entries),
+         azuremodel.parse_extensions_config),
+        ("HostingEnvironmentConfig", get_hosting_environment(args.entries),
+         azuremodel.parse_hosting_environment),
+    ]
+    print("%-25s %10s %-10s %12s %14s" % (
+        "document", "size (KiB)", "parser", "best (ms)", "peak mem (KiB)"))
+    for name, data, parse in documents:
+        parsers = [("azuremodel", parse)]
+        if untangle:
+            parsers.append(("untangle", _parse_untangle))
+        for parser_name, parser_function in parsers:
+            best_time, peak_memory = _measure(parser_function, data,
+                                              args.runs)
+            print("%-25s %10.1f %-10s %12.2f %14.1f" % (
+                name, len(data) / 1024., parser_name, best_time * 1000,
+                peak_memory / 1024.))
+    if not untangle:
+        print("untangle is not installed, so it was not measured.")
+
+
+if __name__ == "__main__":
+    main()
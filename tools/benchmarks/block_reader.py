@@ -0,0 +1,125 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the throughput of the block readers on an image file.
+
+The buffered reader from cloudbaseinit.utils.blockio is measured
+against the former device reads, which allocated a sector aligned
+buffer on each call and returned a slice copy of it. A random image
+is created, unless one is given. Example:
+
+    python tools/benchmarks/block_reader.py --size 64 --chunks 512,65536
+"""
+
+from __future__ import print_function
+
+import argparse
+import ctypes
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Use the cloudbaseinit package from this checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from cloudbaseinit.utils import blockio  # noqa
+
+SECTOR_SIZE = 512
+
+
+def _read_per_call(stream, size, chunk):
+    # The former BaseDevice.seek and BaseDevice.read.
+    offset = 0
+    while offset < size:
+        safe_offset = offset // SECTOR_SIZE * SECTOR_SIZE
+        stream.seek(safe_offset)
+        skip = offset - safe_offset
+        total = chunk + skip
+        safe_size = -(-total // SECTOR_SIZE) * SECTOR_SIZE
+        buff = ctypes.create_string_buffer(safe_size)
+        bytes_read = stream.readinto(buff)
+        data = buff.raw[:bytes_read][skip:total]
+        if not data:
+            break
+        offset += len(data)
+
+
+def _read_block_reader(stream, size, chunk):
+    reader = blockio.FileBlockReader(stream, SECTOR_SIZE)
+    while reader.read(chunk):
+        pass
+
+
+def _readinto_block_reader(stream, size, chunk):
+    reader = blockio.FileBlockReader(stream, SECTOR_SIZE)
+    buffer = bytearray(chunk)
+    while reader.readinto(buffer):
+        pass
+
+
+def _measure(read, path, size, chunk, runs):
+    best_time = None
+    for _ in range(runs):
+        with open(path, "rb", buffering=0) as stream:
+            start = time.time()
+            read(stream, size, chunk)
+            elapsed = time.time() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", help="The image file to read")
+    parser.add_argument("--size", type=int, default=64,
+                        help="The size in MiB of the generated image")
+    parser.add_argument("--chunks", default="100,512,4096,65536",
+                        help="The comma separated sizes of the reads")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.image
+    if not path:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "image")
+        with open(path, "wb") as stream:
+            for _ in range(args.size):
+                stream.write(os.urandom(1024 * 1024))
+
+    try:
+        size = os.path.getsize(path)
+        readers = [
+            ("per call", _read_per_call),
+            ("blockio read", _read_block_reader),
+            ("blockio readinto", _readinto_block_reader),
+        ]
+        print("%10s %-18s %12s %12s" % (
+            "chunk", "reader", "best (ms)", "MiB/s"))
+        for chunk in [int(chunk) for chunk in args.chunks.split(",")]:
+            for name, read in readers:
+                best_time = _measure(read, path, size, chunk, args.runs)
+                print("%10d %-18s %12.2f %12.1f" % (
+                    chunk, name, best_time * 1000,
+                    size / 1024. / 1024. / max(best_time, 1e-9)))
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark InitManager.configure_host end to end, on any platform.
+
+The metadata is served by a local stand-in (see metadata_server.py) and
+the plugins act on an in-memory FakeOSUtils. Each boot is executed in a
+new interpreter, reporting the wall time of each stage, the number of
+HTTP requests, the transferred bytes and the peak RSS. Examples:
+
+    python tools/benchmarks/boot.py --runs 5
+    python tools/benchmarks/boot.py --services ec2 maas --latency 0.02 \\
+        --error-rate 0.1 --missing 2009-04-04/user-data --json
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import metadata_server
+
+# Use the cloudbaseinit package from this checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+SERVICES = {
+    "openstack": "cloudbaseinit.metadata.services.httpservice.HttpService",
+    "ec2": "cloudbaseinit.metadata.services.ec2service.EC2Service",
+    "maas": "cloudbaseinit.metadata.services.maasservice.MaaSHttpService",
+    "cloudstack": "cloudbaseinit.metadata.services.cloudstack.CloudStack",
+}
+
+# The bundled plugins which don't need Windows.
+PLUGINS = [
+    "cloudbaseinit.plugins.common.mtu.MTUPlugin",
+    "cloudbaseinit.plugins.common.sethostname.SetHostNamePlugin",
+    "cloudbaseinit.plugins.common.networkconfig.NetworkConfigPlugin",
+    "cloudbaseinit.plugins.common.sshpublickeys.SetUserSSHPublicKeysPlugin",
+    "cloudbaseinit.plugins.common.userdata.UserDataPlugin",
+    "cloudbaseinit.plugins.common.localscripts.LocalScriptsPlugin",
+]
+
+STAGES = ("PRE_NETWORKING", "PRE_METADATA_DISCOVERY", "MAIN")
+
+
+def _get_peak_rss():
+    """Get the peak RSS of the current process, in KiB."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Expressed in bytes on OS X.
+        peak_rss //= 1024
+    return peak_rss
+
+
+def _configure(service, base_url, password_port, work_dir, plugins):
+    from cloudbaseinit import conf as cloudbaseinit_conf
+
+    conf = cloudbaseinit_conf.CONF
+    conf([], project="cloudbase-init")
+    overrides = {
+        None: {
+            "metadata_services": [SERVICES[service]],
+            "plugins": plugins,
+            "allow_reboot": False,
+            "stop_service_on_exit": False,
+            "check_latest_version": False,
+            "boot_trace_path": os.path.join(work_dir, "trace.json"),
+            "local_scripts_path": work_dir,
+            "retry_count_interval": 0.1,
+        },
+        "openstack": {"metadata_base_url": base_url,
+                      "add_metadata_private_ip_route": False},
+        "ec2": {"metadata_base_url": base_url,
+                "add_metadata_private_ip_route": False},
+        "maas": {"metadata_base_url": base_url,
+                 "oauth_consumer_key": "consumer_key",
+                 "oauth_consumer_secret": "consumer_secret",
+                 "oauth_token_key": "token_key",
+                 "oauth_token_secret": "token_secret"},
+        "cloudstack": {"metadata_base_url": base_url,
+                       "password_server_port": password_port},
+    }
+    for group, options in overrides.items():
+        for name, value in options.items():
+            conf.set_override(name, value, group)
+
+
+def run_boot(service, base_url, password_port, plugins):
+    """Execute a boot in the current process, returning its timings."""
+    work_dir = tempfile.mkdtemp(prefix="cloudbaseinit-bench-")
+    try:
+        _configure(service, base_url, password_port, work_dir, plugins)
+
+        from cloudbaseinit import init
+        from cloudbaseinit.osutils import factory as osutils_factory
+        from cloudbaseinit.tests import fake
+        from cloudbaseinit.utils import tracing
+
+        fake_osutils = fake.FakeOSUtils(user_home=work_dir)
+        osutils_factory.get_os_utils = lambda: fake_osutils
+
+        start = time.time()
+        init.InitManager().configure_host()
+        wall_time = time.time() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages = {}
+    for event in tracing.get_tracer().events:
+        if event["cat"] in ("stage", "metadata") and event.get("dur"):
+            stages[event["name"]] = (stages.get(event["name"], 0) +
+                                     event["dur"] / 1000000.)
+    return {"wall_time": wall_time,
+            "stages": stages,
+            "peak_rss_kib": _get_peak_rss(),
+            "os_calls": len(fake_osutils.calls)}
+
+
+def _run_child(service, base_url, password_port, plugins):
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--child", service,
+         "--child-url", base_url, "--child-password-port",
+         str(password_port), "--plugins"] + plugins,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+    if process.returncode:
+        raise Exception("The %(service)s boot failed: %(errors)s" %
+                        {"service": service, "errors": errors.decode()})
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def _print_results(results):
+    columns = ["wall", "get_metadata_service"] + list(STAGES)
+    print("%-11s %5s %9s %12s %9s %9s" % (
+        "service", "runs", "requests", "bytes", "rss (MiB)", "errors"))
+    for service, result in results.items():
+        print("%-11s %5d %9.1f %12.1f %9.1f %9.1f" % (
+            service, result["runs"], result["requests"], result["bytes"],
+            result["peak_rss_kib"] / 1024., result["errors"]))
+    print()
+    print("%-11s " % "service" +
+          " ".join("%22s" % column for column in columns) +
+          "   (best / median, ms)")
+    for service, result in results.items():
+        times = [result["times"].get(column, []) for column in columns]
+        print("%-11s " % service + " ".join(
+            "%22s" % ("%.1f / %.1f" % (min(t) * 1000,
+                                       sorted(t)[len(t) // 2] * 1000)
+                      if t else "-") for t in times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", nargs="*", default=sorted(SERVICES),
+                        choices=sorted(SERVICES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--plugins", nargs="*", default=PLUGINS)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Seconds added to every HTTP response")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Fraction of HTTP requests failing with 503")
+    parser.add_argument("--missing", nargs="*", default=[],
+                        help="Metadata paths answered with 404")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-url", help=argparse.SUPPRESS)
+    parser.add_argument("--child-password-port", type=int,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_boot(args.child, args.child_url,
+                          args.child_password_port, args.plugins)
+        print(json.dumps(result))
+        return
+
+    stand_in = metadata_server.MetadataStandIn(
+        latency=args.latency, error_rate=args.error_rate,
+        missing=args.missing, seed=args.seed)
+    metadata_port, password_port = stand_in.start()
+    base_url = "http://127.0.0.1:%d/" % metadata_port
+
+    results = collections.OrderedDict()
+    try:
+        for service in args.services:
+            runs = []
+            for _ in range(args.runs):
+                stand_in.reset_stats()
+                run = _run_child(service, base_url, password_port,
+                                 args.plugins)
+                run.update(stand_in.get_stats())
+                runs.append(run)
+
+            times = {"wall": [run["wall_time"] for run in runs]}
+            for run in runs:
+                for stage, seconds in run["stages"].items():
+                    times.setdefault(stage, []).append(seconds)
+            results[service] = {
+                "runs": len(runs),
+                "times": times,
+                "requests": sum(run["requests"] for run in runs) /
+                float(len(runs)),
+                "bytes": sum(run["bytes"] for run in runs) /
+                float(len(runs)),
+                "errors": sum(count for run in runs
+                              for status, count in run["statuses"].items()
+                              if int(status) >= 400) / float(len(runs)),
+                "peak_rss_kib": max(run["peak_rss_kib"] for run in runs),
+            }
+    finally:
+        stand_in.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        _print_results(results)
+
+
+if __name__ == "__main__":
+    main()
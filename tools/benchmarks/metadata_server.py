@@ -0,0 +1,215 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local stand-in for the HTTP metadata services.
+
+A single server answers the OpenStack, EC2 (including the IMDSv2 session
+tokens), MaaS and CloudStack metadata paths, as their layouts don't
+overlap. A second server emulates the CloudStack Password Server.
+Latency, missing paths (404) and server errors (5xx) can be injected,
+and the requests and transferred bytes are counted.
+"""
+
+import json
+import random
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+HOST_NAME = "bench-instance"
+INSTANCE_ID = "1b7f2a8e-3c4d-4e5f-9a0b-bench0000001"
+PUBLIC_KEY = ("ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC5benchmark "
+              "bench@cloudbase-init")
+USER_DATA = b"#!/bin/sh\necho benchmark\n"
+PASSWORD = "Passw0rd-bench"
+TOKEN = "AQAEAbenchmarktoken=="
+
+
+def get_metadata():
+    """Get the content served, by path, for all the emulated services."""
+    openstack_meta_data = {
+        "uuid": INSTANCE_ID,
+        "hostname": HOST_NAME,
+        "public_keys": {"bench": PUBLIC_KEY},
+    }
+    maas_meta_data = ["local-hostname", "instance-id", "public-keys", "x509"]
+
+    content = {
+        # OpenStack
+        "openstack/latest/meta_data.json": json.dumps(openstack_meta_data),
+        "openstack/latest/user_data": USER_DATA,
+        # EC2
+        "2009-04-04/meta-data/": "instance-id\nlocal-hostname\npublic-keys/",
+        "2009-04-04/meta-data/public-keys/": "0=bench",
+        "2009-04-04/meta-data/public-keys/0/": "openssh-key",
+        "2009-04-04/meta-data/local-hostname": HOST_NAME,
+        "2009-04-04/meta-data/instance-id": INSTANCE_ID,
+        "2009-04-04/meta-data/public-keys": "0=bench",
+        "2009-04-04/meta-data/public-keys/0/openssh-key": PUBLIC_KEY,
+        "2009-04-04/user-data": USER_DATA,
+        # MaaS
+        "2012-03-01/meta-data/": "\n".join(maas_meta_data),
+        "2012-03-01/meta-data/local-hostname": HOST_NAME,
+        "2012-03-01/meta-data/instance-id": INSTANCE_ID,
+        "2012-03-01/meta-data/public-keys": PUBLIC_KEY,
+        "2012-03-01/meta-data/x509": "",
+        "2012-03-01/user-data": USER_DATA,
+        # CloudStack
+        "latest/meta-data/service-offering": "bench-offering",
+        "latest/meta-data/local-hostname": HOST_NAME,
+        "latest/meta-data/instance-id": INSTANCE_ID,
+        "latest/meta-data/public-keys": PUBLIC_KEY,
+        "latest/user-data": USER_DATA,
+    }
+    return dict((path, data if isinstance(data, bytes) else data.encode())
+                for path, data in content.items())
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _MetadataRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately, which would
+    # otherwise add the delayed ACK timeout to each keep-alive request.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stand_in.record(status, len(body))
+
+    def _get_body(self):
+        return self.server.stand_in.get_content(self.path, self.headers)
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in.wait()
+        if stand_in.should_fail():
+            self._send(503, b"Service Unavailable")
+            return
+        body = self._get_body()
+        if body is None:
+            self._send(404, b"Not Found")
+        else:
+            self._send(200, body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.do_GET()
+
+    def do_PUT(self):
+        # Only the EC2 session tokens (IMDSv2) are requested with PUT.
+        self.do_POST()
+
+
+class MetadataStandIn(object):
+
+    """Serve the metadata of all the emulated services.
+
+    :param latency: Seconds to wait before answering each request.
+    :param error_rate: The fraction of requests answered with a 503.
+    :param missing: Paths answered with a 404, even if known.
+    :param seed: Seed for choosing the failing requests, so that the
+                 runs are reproducible.
+    """
+
+    def __init__(self, latency=0, error_rate=0, missing=(), seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._content = get_metadata()
+        self._missing = set(path.lstrip("/") for path in missing)
+        for path in self._missing:
+            self._content.pop(path, None)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._servers = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.statuses = {}
+
+    def record(self, status, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def get_stats(self):
+        with self._lock:
+            return {"requests": self.requests,
+                    "bytes": self.bytes_sent,
+                    "statuses": dict(self.statuses)}
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def get_content(self, path, headers):
+        path = path.split("?", 1)[0].lstrip("/")
+        if path == "latest/api/token" and path not in self._missing:
+            return TOKEN.encode()
+        return self._content.get(path)
+
+    def _start_server(self, handler_cls):
+        server = _ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+        server.stand_in = self
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self._servers.append(server)
+        return server.server_address[1]
+
+    def start(self):
+        """Start the servers, returning the metadata and password ports."""
+        return (self._start_server(_MetadataRequestHandler),
+                self._start_server(_PasswordRequestHandler))
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+
+class _PasswordRequestHandler(_MetadataRequestHandler):
+
+    """Emulate the CloudStack Password Server."""
+
+    def _get_body(self):
+        request = self.headers.get("DomU_Request")
+        if request == "send_my_password":
+            return PASSWORD.encode()
+        if request == "saved_password":
+            return b"saved_password"
+        return b"bad_request"
@@ -0,0 +1,112 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the OpenNebula context.sh parser on large contexts.
+
+The tokenizer from cloudbaseinit.metadata.services.opennebulaservice is
+compared with the previous regex based parser, on contexts with a
+USER_DATA value of the given sizes. Example:
+
+    python tools/benchmarks/opennebula_context.py --sizes 1 4 16 --runs 3
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import sys
+import time
+
+# Use the cloudbaseinit package from this checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from cloudbaseinit.metadata.services import opennebulaservice  # noqa
+
+_USER_DATA_LINE = b"  - echo 'line %d of the user data' >> /tmp/log\n"
+
+
+def get_context(size):
+    """Get a context.sh content with USER_DATA of about size bytes."""
+    lines = []
+    length = 0
+    while length < size:
+        line = _USER_DATA_LINE % len(lines)
+        lines.append(line)
+        length += len(line)
+    user_data = b"#cloud-config\nruncmd:\n" + b"".join(lines)
+    nics = b"".join(
+        b"ETH%(i)d_IP='10.0.%(i)d.10'\nETH%(i)d_MASK='255.255.255.0'\n"
+        b"ETH%(i)d_MAC='02:00:0a:00:%(i)02x:0a'\n"
+        b"ETH%(i)d_GATEWAY='10.0.%(i)d.1'\nETH%(i)d_DNS='8.8.8.8'\n" %
+        {b"i": i} for i in range(4))
+    return (b"# Context variables generated by OpenNebula\n"
+            b"DISK_ID='1'\n" + nics +
+            b"SET_HOSTNAME='bench-instance'\nTARGET='hdb'\n"
+            b"USER_DATA='" + user_data.replace(b"'", b"'\\''") + b"'\n")
+
+
+def parse_regex(content):
+    """The previous parser, kept as a reference."""
+    lines = []
+    for line in content.splitlines():
+        if not line or line.startswith(b"#"):
+            continue
+        lines.append(line)
+    lines.append(b"__REGEX_DUMMY__='__regex_dummy__'")
+    sep = b"\r\n" if b"\r\n" in content else b"\n"
+    new_content = sep.join(lines)
+    pairs = {}
+    pattern = (br"(?P<key>\w+)=(['\"](?P<str_value>[\s\S]+?)['\"]|"
+               br"(?P<int_value>\d+))(?=\s+\w+=)")
+    for match in re.finditer(pattern, new_content):
+        pairs[match.group("key")] = (match.group("str_value") or
+                                     int(match.group("int_value")))
+    return pairs
+
+
+def _measure(parse, content, runs):
+    best_time = None
+    for _ in range(runs):
+        start = time.time()
+        parse(content)
+        elapsed = time.time() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="*", type=float,
+                        default=[0.1, 1, 4, 16],
+                        help="The USER_DATA sizes, in MiB")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    parsers = [("tokenizer", opennebulaservice.parse_shell_variables),
+               ("regex", parse_regex)]
+    print("%10s %-10s %12s %12s" % (
+        "size (MiB)", "parser", "best (ms)", "MiB/s"))
+    for size in args.sizes:
+        content = get_context(int(size * 1024 * 1024))
+        for name, parse in parsers:
+            best_time = _measure(parse, content, args.runs)
+            print("%10.1f %-10s %12.2f %12.1f" % (
+                len(content) / 1048576., name, best_time * 1000,
+                len(content) / 1048576. / max(best_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
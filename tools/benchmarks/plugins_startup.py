@@ -0,0 +1,86 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the time and the imports needed for loading the plugins.
+
+Every measurement is done in a new interpreter, so that the modules
+imported by a previous run are not reused. Example:
+
+    python tools/benchmarks/plugins_startup.py --runs 10
+    python tools/benchmarks/plugins_startup.py --plugins \
+        cloudbaseinit.plugins.common.mtu.MTUPlugin \
+        cloudbaseinit.plugins.common.userdata.UserDataPlugin
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+_MEASURE_SCRIPT = """
+import json
+import sys
+import time
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.plugins import factory
+
+plugins = json.loads(sys.argv[1])
+if plugins:
+    cloudbaseinit_conf.CONF.set_override("plugins", plugins)
+
+modules = set(sys.modules)
+results = []
+for stage in sys.argv[2:]:
+    stage_start = time.time()
+    plugins = factory.load_plugins(stage)
+    results.append({"stage": stage, "plugins": len(plugins),
+                    "seconds": time.time() - stage_start,
+                    "modules": len(set(sys.modules) - modules)})
+print(json.dumps(results))
+"""
+
+STAGES = ("PRE_NETWORKING", "PRE_METADATA_DISCOVERY", "MAIN")
+
+
+def _measure(plugins):
+    output = subprocess.check_output(
+        [sys.executable, "-c", _MEASURE_SCRIPT, json.dumps(plugins)] +
+        list(STAGES))
+    return json.loads(output.decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--plugins", nargs="*", default=[],
+                        help="The plugin classes to be loaded, instead of "
+                             "the ones from the plugins config option")
+    args = parser.parse_args()
+
+    runs = [_measure(args.plugins) for _ in range(args.runs)]
+    print("%-24s %8s %12s %14s" % ("stage", "plugins", "best (ms)",
+                                   "new modules"))
+    for index, stage in enumerate(STAGES):
+        results = [run[index] for run in runs]
+        print("%-24s %8d %12.2f %14d" % (
+            stage, results[0]["plugins"],
+            min(result["seconds"] for result in results) * 1000,
+            results[0]["modules"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Copyright 2016 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the MIME parsers on large multipart user data.
+
+The parts from cloudbaseinit.utils.mime are measured against the
+email.message tree formerly built by the UserDataPlugin, walking all
+the parts and decoding their payloads, reporting the best time and the
+peak of the allocated memory. Example:
+
+    python tools/benchmarks/userdata_mime.py --parts 20 --part-size 512
+"""
+
+from __future__ import print_function
+
+import argparse
+import base64
+import email
+import email.mime.application
+import email.mime.multipart
+import email.mime.text
+import os
+import sys
+import time
+import tracemalloc
+
+# Use the cloudbaseinit package from this checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from cloudbaseinit.utils import encoding  # noqa
+from cloudbaseinit.utils import mime  # noqa
+
+
+def get_user_data(parts, part_size):
+    message = email.mime.multipart.MIMEMultipart()
+    for index in range(parts):
+        if index % 2:
+            part = email.mime.application.MIMEApplication(
+                os.urandom(part_size * 1024))
+        else:
+            script = base64.b64encode(os.urandom(part_size * 768)).decode()
+            part = email.mime.text.MIMEText(
+                "#!/bin/sh\necho %s\n" % script, "x-shellscript")
+        part.add_header("Content-Disposition", "attachment",
+                        filename="part%d" % index)
+        message.attach(part)
+    return message.as_string().encode()
+
+
+def _walk_email(user_data):
+    # The former UserDataPlugin._parse_mime.
+    parts = email.message_from_string(
+        encoding.get_as_string(user_data)).walk()
+    for part in parts:
+        if not part.is_multipart():
+            part.get_payload(decode=True)
+
+
+def _walk_mime(user_data):
+    for part in mime.walk(user_data):
+        if not part.is_multipart():
+            part.get_payload(decode=True)
+
+
+def _measure(walk, data, runs):
+    best_time = None
+    for _ in range(runs):
+        start = time.time()
+        walk(data)
+        elapsed = time.time() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    tracemalloc.start()
+    try:
+        walk(data)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best_time, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parts", type=int, default=20)
+    parser.add_argument("--part-size", type=int, default=256,
+                        help="The size in KiB of each part")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    user_data = get_user_data(args.parts, args.part_size)
+    print("%10s %-8s %12s %14s" % (
+        "size (KiB)", "parser", "best (ms)", "peak mem (KiB)"))
+    for name, walk in (("email", _walk_email), ("mime", _walk_mime)):
+        best_time, peak_memory = _measure(walk, user_data, args.runs)
+        print("%10.1f %-8s %12.2f %14.1f" % (
+            len(user_data) / 1024., name, best_time * 1000,
+            peak_memory / 1024.))
+
+
+if __name__ == "__main__":
+    main()